@@ -0,0 +1,129 @@
+"""
+自軍の合法手 (攻撃・移動) の列挙と、そのキャッシュ。
+
+合法手は自軍の潜水艦の配置 (HP は関係ない) だけで決まるので、配置のビットマスク (fleet_mask) をキーにキャッシュする。
+艦が移動するか撃沈されるまでは、何度問い合わせても同じ LegalActions を返す。
+
+手は一つの整数 (action) で表す:
+    0 <= action < CELL_COUNT             ... マス番号 action への攻撃
+    CELL_COUNT <= action < ACTION_COUNT  ... (action - CELL_COUNT) // MOVE_COUNT 番のマスの艦を
+                                             MOVE_DIRECTIONS[(action - CELL_COUNT) % MOVE_COUNT] の方向へ移動
+マス番号は codec.cell_index() と同じ (row * COL + col)。
+"""
+from functools import lru_cache
+from typing import Dict, FrozenSet, Tuple
+
+import numpy as np
+
+from .rule import Pos
+from .rule import ROW, COL
+from .rule import is_within_area
+
+# 移動の方向 (dy, dx)。上下左右に 1 または 2 マス。
+MOVE_DIRECTIONS = ((-2, 0), (-1, 0), (1, 0), (2, 0), (0, -2), (0, -1), (0, 1), (0, 2))
+MOVE_INDEX = {d: i for i, d in enumerate(MOVE_DIRECTIONS)}
+
+CELL_COUNT = ROW * COL
+MOVE_COUNT = len(MOVE_DIRECTIONS)
+ACTION_COUNT = CELL_COUNT * (1 + MOVE_COUNT)
+
+# キャッシュする配置の数 (自軍 4 隻以下の配置は全部で 15,276 通り)
+CACHE_SIZE = 4096
+
+_CELL_BITS = np.left_shift(1, np.arange(CELL_COUNT, dtype=np.int64))
+_AROUND = tuple((dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if (dy, dx) != (0, 0))
+
+
+def fleet_mask(my_grid: np.ndarray) -> int:
+    """
+    自軍の潜水艦がいるマスのビットマスク (ビット cell が立っていれば、マス番号 cell に艦がいる)。
+    """
+    return int(_CELL_BITS[my_grid.ravel() > 0].sum())
+
+
+def attack_action(p: Pos) -> int:
+    return p.row * COL + p.col
+
+
+def move_action(from_pos: Pos, dy: int, dx: int) -> int:
+    return CELL_COUNT + (from_pos.row * COL + from_pos.col) * MOVE_COUNT + MOVE_INDEX[(dy, dx)]
+
+
+def is_attack(action: int) -> bool:
+    return action < CELL_COUNT
+
+
+def attack_pos(action: int) -> Pos:
+    return Pos(action // COL, action % COL)
+
+
+def move_of(action: int) -> Tuple[Pos, int, int]:
+    """
+    移動の手を (移動元, dy, dx) にする。
+    """
+    cell, d = divmod(action - CELL_COUNT, MOVE_COUNT)
+    dy, dx = MOVE_DIRECTIONS[d]
+    return Pos(cell // COL, cell % COL), dy, dx
+
+
+class LegalActions:
+    """
+    ある配置での自軍の合法手。キャッシュで共有されるので、どの属性も書き換えないこと。
+
+    Attributes
+    ----------
+    actions: np.ndarray [np.int16]
+        全ての合法手 (攻撃、移動の順に昇順)。読み取り専用。
+    positions: FrozenSet[Pos]
+        自軍の潜水艦の位置。
+    attackable: FrozenSet[Pos]
+        攻撃可能なマス (BattleData.set_of_my_attackable_cells() と同じ)。
+    moves_from: Dict[Pos, FrozenSet[Pos]]
+        艦の位置 → その艦の移動先 (BattleData.set_of_my_movable_cells() と同じ)。
+    movers_to: Dict[Pos, FrozenSet[Pos]]
+        マス → そのマスへ移動できる艦の位置。
+    """
+
+    def __init__(self, mask: int):
+        self.mask = mask
+        self.positions: FrozenSet[Pos] = frozenset(
+            Pos(cell // COL, cell % COL) for cell in range(CELL_COUNT) if (mask >> cell) & 1)
+
+        attackable = set()
+        moves = []
+        moves_from: Dict[Pos, FrozenSet[Pos]] = dict()
+        movers_to: Dict[Pos, set] = dict()
+        for p in sorted(self.positions):
+            for dy, dx in _AROUND:
+                q = Pos(p.row + dy, p.col + dx)
+                if is_within_area(q) and q not in self.positions:
+                    attackable.add(q)
+            dests = set()
+            for dy, dx in MOVE_DIRECTIONS:
+                q = Pos(p.row + dy, p.col + dx)
+                if is_within_area(q) and q not in self.positions:
+                    dests.add(q)
+                    moves.append(move_action(p, dy, dx))
+                    movers_to.setdefault(q, set()).add(p)
+            moves_from[p] = frozenset(dests)
+
+        self.attackable: FrozenSet[Pos] = frozenset(attackable)
+        self.moves_from = moves_from
+        self.movers_to: Dict[Pos, FrozenSet[Pos]] = {q: frozenset(ps) for q, ps in movers_to.items()}
+        self.actions = np.array(sorted(attack_action(q) for q in attackable) + sorted(moves), dtype=np.int16)
+        self.actions.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.actions)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def legal_actions_of_mask(mask: int) -> LegalActions:
+    return LegalActions(mask)
+
+
+def legal_actions(my_grid: np.ndarray) -> LegalActions:
+    """
+    自軍の配置 my_grid での合法手。
+    """
+    return legal_actions_of_mask(fleet_mask(my_grid))
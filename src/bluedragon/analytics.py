@@ -0,0 +1,233 @@
+"""
+対戦結果のストリーミング集計。
+
+対戦結果 (codec.GAME_DTYPE のレコードと codec.TURN_DTYPE の配列の組) を一つずつ受け取り、
+敵軍の戦略と初期個数 (`-n`) の組ごとに、勝率・勝利までのターン数・分岐ごとの命中率・自軍の生存曲線を集計する。
+集計に使うメモリはゲーム数によらず一定で、対戦結果をリストに溜め込むことはない。
+"""
+import math
+import queue as _queue
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+from .model import Response
+from .telemetry import Branch
+
+# 生存曲線を記録するターン数の上限
+SURVIVAL_MAX_TURNS = 200
+
+_HIT_CODES = (Response.Hit.value, Response.Dead.value)
+
+
+class OnlineStats:
+    """
+    個数・平均・分散・最小値・最大値を逐次的に求める (Welford のアルゴリズム)。
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def push(self, x: float) -> None:
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other: 'OnlineStats') -> None:
+        """
+        other の集計結果を自分に合算する (Chan らの並列アルゴリズム)。
+        """
+        if other.count == 0:
+            return
+        n = self.count + other.count
+        delta = other.mean - self.mean
+        self._m2 += other._m2 + delta * delta * self.count * other.count / n
+        self.mean += delta * other.count / n
+        self.count = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def variance(self) -> float:
+        """
+        不偏分散。個数が 2 未満なら 0。
+        """
+        return self._m2 / (self.count - 1) if self.count >= 2 else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.variance)
+
+
+class Histogram:
+    """
+    等幅の階級 [lo, hi) を bins 個に分けたヒストグラム。範囲外の値は両端の階級に数える。
+    """
+
+    def __init__(self, lo: float, hi: float, bins: int):
+        self.lo = lo
+        self.hi = hi
+        self.counts = np.zeros(bins, dtype=np.int64)
+
+    def push(self, x: float) -> None:
+        i = int((x - self.lo) * len(self.counts) / (self.hi - self.lo))
+        self.counts[min(max(i, 0), len(self.counts) - 1)] += 1
+
+    def merge(self, other: 'Histogram') -> None:
+        assert (self.lo, self.hi, len(self.counts)) == (other.lo, other.hi, len(other.counts))
+        self.counts += other.counts
+
+    def quantile(self, q: float) -> float:
+        """
+        階級の中央値で近似した q 分位点。
+        """
+        total = int(self.counts.sum())
+        if total <= 0:
+            return math.nan
+        i = int(np.searchsorted(np.cumsum(self.counts), q * total))
+        width = (self.hi - self.lo) / len(self.counts)
+        return self.lo + (min(i, len(self.counts) - 1) + 0.5) * width
+
+
+class GroupStats:
+    """
+    (敵軍の戦略, 敵軍の初期個数) の組一つ分の集計。
+    """
+
+    def __init__(self):
+        self.games = 0
+        self.wins = 0
+        self.draws = 0
+        self.turns_to_win = OnlineStats()
+        self.turns_to_win_hist = Histogram(0, SURVIVAL_MAX_TURNS, SURVIVAL_MAX_TURNS // 5)
+        self.branch_attacks = np.zeros(len(Branch), dtype=np.int64)
+        self.branch_hits = np.zeros(len(Branch), dtype=np.int64)
+        # survival_sum[t] := 各ゲームの (t+1) ターン目開始時の自軍の生存数の総和
+        self.survival_sum = np.zeros(SURVIVAL_MAX_TURNS, dtype=np.int64)
+
+    def push(self, game: np.ndarray, turns: np.ndarray) -> None:
+        self.games += 1
+        winner = int(game['winner'][0])
+        if winner == codec.SIDE_ME:
+            self.wins += 1
+            self.turns_to_win.push(int(game['turns'][0]))
+            self.turns_to_win_hist.push(int(game['turns'][0]))
+        elif winner < 0:
+            self.draws += 1
+
+        mine = turns[turns['side'] == codec.SIDE_ME]
+        attacks = mine[mine['kind'] == codec.KIND_ATTACK]
+        self.branch_attacks += np.bincount(attacks['branch'], minlength=len(Branch))[:len(Branch)]
+        hits = attacks[np.isin(attacks['resp'], _HIT_CODES)]
+        self.branch_hits += np.bincount(hits['branch'], minlength=len(Branch))[:len(Branch)]
+
+        # 敵軍の手番のレコードでは、敵軍から見た敵軍 (=自軍) の生存数が opp_alive に入っている
+        alive = np.where(turns['side'] == codec.SIDE_ME, turns['my_alive'], turns['opp_alive'])[:SURVIVAL_MAX_TURNS]
+        self.survival_sum[:len(alive)] += alive
+        # ゲーム終了後は最終的な生存数が続くものとする
+        final = 0 if winner == codec.SIDE_OPPONENT else (int(alive[-1]) if len(alive) > 0 else 0)
+        self.survival_sum[len(alive):] += final
+
+    def merge(self, other: 'GroupStats') -> None:
+        self.games += other.games
+        self.wins += other.wins
+        self.draws += other.draws
+        self.turns_to_win.merge(other.turns_to_win)
+        self.turns_to_win_hist.merge(other.turns_to_win_hist)
+        self.branch_attacks += other.branch_attacks
+        self.branch_hits += other.branch_hits
+        self.survival_sum += other.survival_sum
+
+    @property
+    def win_rate(self) -> float:
+        return self.wins / self.games if self.games > 0 else math.nan
+
+    def hit_rates(self) -> Dict[Branch, float]:
+        """
+        攻撃したことのある分岐ごとの命中率 (Hit または Dead の割合)。
+        """
+        return {
+            branch: self.branch_hits[branch] / self.branch_attacks[branch]
+            for branch in Branch
+            if self.branch_attacks[branch] > 0
+        }
+
+    def survival_curve(self) -> np.ndarray:
+        """
+        各ターン開始時の自軍の平均生存数。
+        """
+        return self.survival_sum / self.games if self.games > 0 else np.zeros(SURVIVAL_MAX_TURNS)
+
+
+GroupKey = Tuple[int, int]
+
+
+class StreamingAggregator:
+    """
+    対戦結果を逐次的に集計する。
+    """
+
+    def __init__(self):
+        self.groups: Dict[GroupKey, GroupStats] = dict()
+        self.games = 0
+
+    def push(self, game: np.ndarray, turns: np.ndarray) -> None:
+        key = (int(game['opponent'][0]), int(game['n'][0]))
+        if key not in self.groups:
+            self.groups[key] = GroupStats()
+        self.groups[key].push(game, turns)
+        self.games += 1
+
+    def merge(self, other: 'StreamingAggregator') -> None:
+        for key, stats in other.groups.items():
+            if key not in self.groups:
+                self.groups[key] = GroupStats()
+            self.groups[key].merge(stats)
+        self.games += other.games
+
+    def consume(self, results: Iterable[Tuple[np.ndarray, np.ndarray]], flush_every: int = 0,
+                on_flush: Optional[Callable[['StreamingAggregator'], Any]] = None) -> 'StreamingAggregator':
+        """
+        results の対戦結果を終わったものから順に集計する。
+        flush_every > 0 なら、その個数のゲームを集計するたびに on_flush(self) を呼ぶ。
+        """
+        for game, turns in results:
+            self.push(game, turns)
+            if flush_every > 0 and on_flush is not None and self.games % flush_every == 0:
+                on_flush(self)
+        return self
+
+    def format_summary(self) -> str:
+        lines = ["games: %d" % self.games]
+        for (opponent, n), stats in sorted(self.groups.items()):
+            lines.append("[opponent=%d, n=%d] games: %d, win rate: %.3f, draws: %d, turns to win: %.1f ± %.1f" % (
+                opponent, n, stats.games, stats.win_rate, stats.draws, stats.turns_to_win.mean, stats.turns_to_win.std))
+            lines.append("    hit rate: " + ", ".join(
+                "%s=%.3f" % (branch.name, rate) for branch, rate in stats.hit_rates().items()))
+            curve = stats.survival_curve()
+            lines.append("    survival (turn 1, 10, 20, 40): " + ", ".join(
+                "%.2f" % curve[t] for t in (0, 9, 19, 39)))
+        return "\n".join(lines)
+
+
+def iter_queue(q, sentinel=None, timeout: Optional[float] = None) -> Iterator[Any]:
+    """
+    プロセス間キューから sentinel を受け取るまで要素を取り出し続ける。
+    timeout 秒以内に要素が届かなければ終了する。
+    """
+    while True:
+        try:
+            item = q.get(timeout=timeout)
+        except _queue.Empty:
+            return
+        if item is sentinel:
+            return
+        yield item
@@ -0,0 +1,371 @@
+"""
+自己対戦の棋譜のアーカイブ (追記専用・メモリマップ)。
+
+ディレクトリ構成:
+    <root>/
+        <shard>/
+            meta.json    ... レコード形式のバージョン
+            turns.bin    ... codec.TURN_DTYPE のレコードを追記していく生のバイナリ
+            games.bin    ... codec.GAME_DTYPE のレコードを追記していく生のバイナリ
+            idx/         ... INDEXED_COLUMNS の二次索引 (ArchiveWriter.close() 時に作成)
+
+シャードには同時に一つの ArchiveWriter しか書き込めない (ロックファイルで排他する)。
+複数のワーカーが並行して書き込む場合は、ワーカーごとに別のシャード名を使うこと。
+書き込み中に落ちたプロセスのロックファイル (書かれた pid のプロセスが存在しない) は、次に開いたときに削除する。
+また開いたときに、書き込みの途中で落ちた場合の不完全なレコードや、ゲームのレコードの無い手のレコードを切り詰める。
+
+読み出しは np.memmap で行うので、ゲームを一つずつ読み込んでパースすることはない。
+書き込み途中の不完全なレコードは読み出し時に無視される。
+"""
+import json
+import os
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+
+# 二次索引を作る列
+INDEXED_COLUMNS = ('turn', 'resp', 'my_alive', 'opp_alive', 'branch')
+
+_META_FILE = "meta.json"
+_TURNS_FILE = "turns.bin"
+_GAMES_FILE = "games.bin"
+_INDEX_DIR = "idx"
+_INDEX_META_FILE = "index.json"
+_LOCK_FILE = ".lock"
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def _atomic_write_bytes(path: str, data: bytes) -> None:
+    tmp = "%s.tmp.%d" % (path, os.getpid())
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _atomic_save_npy(path: str, array: np.ndarray) -> None:
+    tmp = "%s.tmp.%d.npy" % (path[:-len(".npy")], os.getpid())
+    np.save(tmp, array)
+    os.replace(tmp, path)
+
+
+def _map(path: str, dtype: np.dtype) -> np.ndarray:
+    """
+    path のファイルを dtype の1次元配列として読み取り専用でメモリマップする。
+    末尾の不完全なレコードは無視する。
+    """
+    if not os.path.exists(path):
+        return np.zeros(0, dtype=dtype)
+    n = os.path.getsize(path) // dtype.itemsize
+    if n <= 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode='r', shape=(n,))
+
+
+# pid を書き込む前に落ちたと思われるロックファイルを、作成からこの秒数が経てば削除する
+_UNREADABLE_LOCK_SECONDS = 60.0
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 別のユーザーのプロセスとして存在する
+        return True
+    return True
+
+
+def _is_stale_lock(lock_path: str) -> bool:
+    try:
+        with open(lock_path) as f:
+            text = f.read().strip()
+        mtime = os.path.getmtime(lock_path)
+    except FileNotFoundError:
+        return True
+    if not text.isdigit():
+        return time.time() - mtime >= _UNREADABLE_LOCK_SECONDS
+    return not _pid_alive(int(text))
+
+
+def _acquire_lock(lock_path: str) -> None:
+    """
+    ロックファイルを作り、自分の pid を書き込む。落ちたプロセスのロックファイルは削除してから作り直す。
+    """
+    for retry in (True, False):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            if retry and _is_stale_lock(lock_path):
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+                continue
+            raise ArchiveError("shard is locked by another writer: " + os.path.dirname(lock_path))
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        return
+
+
+def _truncate(path: str, size: int) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) <= size:
+        return False
+    with open(path, "r+b") as f:
+        f.truncate(size)
+    return True
+
+
+def _recover(shard_path: str) -> None:
+    """
+    書き込みの途中で落ちた ArchiveWriter が残したレコードを切り詰める。
+    games.bin は GAME_DTYPE のレコードの整数倍に、 turns.bin は games.bin のゲームの手の数の合計に揃える
+    (手のレコードを書き終える前に落ちた場合は、そのゲームのレコードも捨てる)。
+    切り詰めた行まで索引に含まれていれば、その索引は削除する (close() で作り直される)。
+    """
+    games_path = os.path.join(shard_path, _GAMES_FILE)
+    turns_path = os.path.join(shard_path, _TURNS_FILE)
+    # _map() は末尾の不完全なレコードを無視するので、ここで数えるのは完全なレコードだけ
+    ends = np.cumsum(_map(games_path, codec.GAME_DTYPE)['turns'], dtype=np.int64)
+    turn_count = len(_map(turns_path, codec.TURN_DTYPE))
+    complete = int(np.searchsorted(ends, turn_count, side='right'))
+    rows = int(ends[complete - 1]) if complete > 0 else 0
+    truncated = _truncate(games_path, complete * codec.GAME_DTYPE.itemsize)
+    truncated |= _truncate(turns_path, rows * codec.TURN_DTYPE.itemsize)
+
+    index_meta_path = os.path.join(shard_path, _INDEX_DIR, _INDEX_META_FILE)
+    if truncated and os.path.exists(index_meta_path):
+        with open(index_meta_path) as f:
+            indexed_rows = json.load(f)["indexed_rows"]
+        if indexed_rows > rows:
+            os.remove(index_meta_path)
+
+
+class ArchiveWriter:
+    """
+    一つのシャードへ対戦結果を追記する。
+    """
+
+    def __init__(self, root: str, shard: str):
+        self.path = os.path.join(root, shard)
+        os.makedirs(self.path, exist_ok=True)
+
+        self._lock_path = os.path.join(self.path, _LOCK_FILE)
+        _acquire_lock(self._lock_path)
+
+        meta_path = os.path.join(self.path, _META_FILE)
+        if os.path.exists(meta_path):
+            _check_meta(self.path)
+        else:
+            _atomic_write_bytes(meta_path, json.dumps({"format_version": codec.FORMAT_VERSION}).encode())
+
+        _recover(self.path)
+        self._turns = open(os.path.join(self.path, _TURNS_FILE), "ab")
+        self._games = open(os.path.join(self.path, _GAMES_FILE), "ab")
+
+    def append(self, game: np.ndarray, turns: np.ndarray) -> None:
+        """
+        1 ゲーム分のレコードを追記する。
+        game は codec.GAME_DTYPE のレコード、turns は codec.TURN_DTYPE の配列。
+        ゲームのレコードは手のレコードを書き終えてから書くので、games.bin にあるゲームの手は全て turns.bin にある。
+        """
+        assert game.dtype == codec.GAME_DTYPE and turns.dtype == codec.TURN_DTYPE
+        self._turns.write(turns.tobytes())
+        self._turns.flush()
+        self._games.write(game.tobytes())
+        self._games.flush()
+
+    def close(self, build_index: bool = True) -> None:
+        if self._turns.closed:
+            return
+        self._turns.close()
+        self._games.close()
+        if build_index:
+            build_shard_index(self.path)
+        os.remove(self._lock_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close(build_index=(exc_type is None))
+
+
+def _check_meta(shard_path: str) -> None:
+    with open(os.path.join(shard_path, _META_FILE)) as f:
+        meta = json.load(f)
+    if meta.get("format_version") != codec.FORMAT_VERSION:
+        raise ArchiveError("format version mismatch: %s (expected %d)" % (meta.get("format_version"),
+                                                                          codec.FORMAT_VERSION))
+
+
+def build_shard_index(shard_path: str) -> None:
+    """
+    シャードの turns.bin の INDEXED_COLUMNS それぞれについて二次索引を作る。
+    索引は「列の値でソートした行番号 (order)」と「値ごとの order 上の区間 (bounds)」の組。
+    値 v の行番号は order[bounds[v - lo]:bounds[v - lo + 1]] で、これはメモリマップのスライスなのでコピーは発生しない。
+    """
+    turns = _map(os.path.join(shard_path, _TURNS_FILE), codec.TURN_DTYPE)
+    index_dir = os.path.join(shard_path, _INDEX_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+
+    offsets: Dict[str, int] = dict()
+    for col in INDEXED_COLUMNS:
+        values = np.asarray(turns[col], dtype=np.int64)
+        lo = int(values.min()) if len(values) > 0 else 0
+        hi = int(values.max()) if len(values) > 0 else 0
+        order = np.argsort(values, kind='stable').astype(np.int64)
+        counts = np.bincount(values - lo, minlength=hi - lo + 1)
+        bounds = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        _atomic_save_npy(os.path.join(index_dir, col + ".order.npy"), order)
+        _atomic_save_npy(os.path.join(index_dir, col + ".bounds.npy"), bounds)
+        offsets[col] = lo
+
+    # 索引の本体を書き終えてから、索引がカバーする行数を書く
+    _atomic_write_bytes(os.path.join(index_dir, _INDEX_META_FILE),
+                        json.dumps({"indexed_rows": len(turns), "offsets": offsets}).encode())
+
+
+def _normalize_values(value) -> np.ndarray:
+    """
+    検索条件の値 (int, IntEnum, Enum, またはそれらのリスト・タプル・集合) を int64 配列に変換する。
+    """
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return np.array(sorted(_normalize_values(v)[0] for v in value), dtype=np.int64)
+    if hasattr(value, "value") and not isinstance(value, int):
+        value = value.value
+    return np.array([int(value)], dtype=np.int64)
+
+
+class Shard:
+    def __init__(self, path: str):
+        _check_meta(path)
+        self.path = path
+        self.turns = _map(os.path.join(path, _TURNS_FILE), codec.TURN_DTYPE)
+        self.games = _map(os.path.join(path, _GAMES_FILE), codec.GAME_DTYPE)
+
+        self.indexed_rows = 0
+        self._offsets: Dict[str, int] = dict()
+        index_meta_path = os.path.join(path, _INDEX_DIR, _INDEX_META_FILE)
+        if os.path.exists(index_meta_path):
+            with open(index_meta_path) as f:
+                index_meta = json.load(f)
+            self.indexed_rows = min(index_meta["indexed_rows"], len(self.turns))
+            self._offsets = index_meta["offsets"]
+
+    def _index(self, col: str):
+        index_dir = os.path.join(self.path, _INDEX_DIR)
+        order = np.load(os.path.join(index_dir, col + ".order.npy"), mmap_mode='r')
+        bounds = np.load(os.path.join(index_dir, col + ".bounds.npy"), mmap_mode='r')
+        return order, bounds
+
+    def _indexed_rows_of(self, col: str, values: np.ndarray) -> List[np.ndarray]:
+        """
+        索引を使って col の値が values のどれかである行番号の配列 (order のスライス) のリストを返す。
+        """
+        order, bounds = self._index(col)
+        lo = self._offsets[col]
+        slices = []
+        for v in values:
+            i = int(v) - lo
+            if 0 <= i < len(bounds) - 1 and bounds[i] < bounds[i + 1]:
+                slices.append(order[bounds[i]:bounds[i + 1]])
+        return slices
+
+    def _estimate(self, col: str, values: np.ndarray) -> int:
+        _, bounds = self._index(col)
+        lo = self._offsets[col]
+        return sum(int(bounds[int(v) - lo + 1] - bounds[int(v) - lo])
+                   for v in values if 0 <= int(v) - lo < len(bounds) - 1)
+
+    def rows_where(self, equals: Dict[str, np.ndarray],
+                   where: Optional[Callable[[np.ndarray], np.ndarray]] = None) -> np.ndarray:
+        """
+        条件を満たす行番号を昇順で返す。
+        equals は {列名: 値の配列}。 where はレコードの配列を受け取って bool 配列を返す関数。
+        """
+        indexed = [col for col in equals if col in self._offsets and self.indexed_rows > 0]
+
+        if len(indexed) > 0:
+            # 候補が一番少なくなる索引を使い、索引に含まれない末尾の行は別途走査する
+            col = min(indexed, key=lambda c: self._estimate(c, equals[c]))
+            slices = self._indexed_rows_of(col, equals[col])
+            head = np.sort(np.concatenate(slices)) if len(slices) > 0 else np.zeros(0, dtype=np.int64)
+            tail = np.arange(self.indexed_rows, len(self.turns), dtype=np.int64)
+            candidates = np.concatenate([head, tail])
+            records = self.turns[candidates]
+        else:
+            candidates = None
+            records = self.turns
+
+        mask = np.ones(len(records), dtype=bool)
+        for col, values in equals.items():
+            mask &= np.isin(records[col], values)
+        if where is not None:
+            mask &= where(records)
+
+        if candidates is None:
+            return np.flatnonzero(mask)
+        return candidates[mask]
+
+
+class Archive:
+    """
+    アーカイブ全体 (全シャード) に対する読み出し。
+
+    使用例: 敵艦の位置が明らかで、直前に敵が移動していた自軍の手
+        archive.select(side=codec.SIDE_ME, prev_opp_kind=codec.KIND_MOVE, where=lambda r: r['tracking'] >= 0)
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.shards: List[Shard] = [
+            Shard(os.path.join(root, name))
+            for name in sorted(os.listdir(root))
+            if os.path.exists(os.path.join(root, name, _META_FILE))
+        ] if os.path.isdir(root) else list()
+
+    def select(self, where: Optional[Callable[[np.ndarray], np.ndarray]] = None, **equals) -> Iterator[np.ndarray]:
+        """
+        条件を満たす手のレコードをシャードごとに返す。
+        キーワード引数は {列名: 値 (または値のリスト)} の等値条件。
+        """
+        conditions = {col: _normalize_values(v) for col, v in equals.items()}
+        for col in conditions:
+            if col not in codec.TURN_DTYPE.names:
+                raise ArchiveError("unknown column: " + col)
+        for shard in self.shards:
+            rows = shard.rows_where(conditions, where)
+            if len(rows) > 0:
+                yield shard.turns[rows]
+
+    def count(self, where: Optional[Callable[[np.ndarray], np.ndarray]] = None, **equals) -> int:
+        return sum(len(records) for records in self.select(where, **equals))
+
+    def iter_games(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (ゲームのレコード (shape (1,)), そのゲームの手のレコードの配列) の組を一つずつ返す。
+        どちらもメモリマップのビューで、コピーは発生しない。
+        """
+        for shard in self.shards:
+            ends = np.cumsum(shard.games['turns'], dtype=np.int64)
+            start = 0
+            for i, end in enumerate(ends):
+                if end > len(shard.turns):
+                    break
+                yield shard.games[i:i + 1], shard.turns[start:end]
+                start = end
+
+    def games(self) -> Iterator[np.ndarray]:
+        """
+        シャードごとにゲームのレコードの配列 (メモリマップ) を返す。
+        """
+        for shard in self.shards:
+            if len(shard.games) > 0:
+                yield shard.games
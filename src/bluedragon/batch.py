@@ -0,0 +1,584 @@
+"""
+N 個のゲームの状態を積み重ねた配列で持ち、全ゲームを一度の numpy 演算で 1 手ずつ進める (struct-of-arrays)。
+
+BattleData と logic の処理 (apply_my_op, apply_opponent_op, apply_attack_response, update_tracking_cell,
+suggest_my_op_with_branch) をそれぞれ N ゲーム分まとめて行う関数を提供する。
+ただし logic の簡略版で、同じ局面でも logic と同じ操作になるとは限らない。 logic との違いは次の通り。
+  - 位置が確定している敵艦の索引 (ConfirmedEnemies) を持たない。確率が 1 (1 - _EPS 以上) のマスを確定しているとみなし、
+    確率の更新は logic の低水準の更新処理に certain=None を渡したときと同じ計算をする (浮動小数点の誤差を除く)。
+  - 敵軍の移動の更新で、確定している敵艦がいるマスを移動先から除かない (logic の occupied に当たるものが無い)。
+  - 更新のたびの確率グリッドの正規化 (logic._normalize_prob) を行わないので、長いゲームでは logic の確率グリッドとずれる。
+  - 敵軍から見た自軍の存在確率 (exposure) を持たない。移動先の同点の比較に exposure を使わない (use_exposure は無視する)。
+  - 操作の決定には、マーク位置以外の確定している敵艦への攻撃 (Branch.Tracking の後半) が無い。
+  - 同点のマスの選び方とランダムな選択の乱数の使い方が異なる。
+分岐の種類と優先順位は logic と同じなので、分岐ごとの回数の傾向を大量のゲームで調べる用途に使う。
+
+内部ではマスを番号 (cell = row * COL + col、 codec.cell_index() と同じ) で扱う。
+各関数の引数 idx は、処理の対象とするゲームの番号の配列。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.batch -g 10000 --seed 0
+"""
+import sys
+import time
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from . import codec
+from . import io
+from . import placement
+from . import scorer
+from .model import Response
+from .params import DecisionParams, DEFAULT_PARAMS
+from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT
+from .telemetry import Branch
+
+CELLS = ROW * COL
+
+_EPS = 1e-7
+_HIT = Response.Hit.value
+_DEAD = Response.Dead.value
+_NEAR = Response.Near.value
+_NOTHING = Response.Nothing.value
+
+
+def _make_tables():
+    ys, xs = np.divmod(np.arange(CELLS), COL)
+    dy = ys[None, :] - ys[:, None]
+    dx = xs[None, :] - xs[:, None]
+    # AROUND[i, j] := j が i の周囲8マスのどれか
+    around = (np.maximum(abs(dy), abs(dx)) == 1)
+    # MOVE[i, j] := i から j へ上下左右に 1 または 2 マス移動できる (他の艦の有無は考慮しない)
+    move = ((dy == 0) | (dx == 0)) & (abs(dy) + abs(dx) >= 1) & (abs(dy) + abs(dx) <= 2)
+    # MANHATTAN[i, j] := i と j のマンハッタン距離
+    manhattan = abs(dy) + abs(dx)
+    return ys, xs, around, move, manhattan
+
+
+ROWS, COLS, AROUND, MOVE, MANHATTAN = _make_tables()
+AROUND_COUNT = AROUND.sum(axis=1)
+_AROUND_F = AROUND.astype(np.float32)
+_MOVE_F = MOVE.astype(np.float32)
+# 初手の攻撃先の候補 (logic と同じく外周を除いたマス)
+OPENING = (ROWS >= 1) & (ROWS < ROW - 1) & (COLS >= 1) & (COLS < COL - 1)
+
+
+class BatchOps(NamedTuple):
+    """
+    ゲームごとの操作。 kind は codec.KIND_ATTACK / codec.KIND_MOVE。
+    cell は攻撃位置、または移動元 (敵軍の移動では codec.NO_CELL)。 dy, dx は移動の向きと距離。
+    """
+    kind: np.ndarray
+    cell: np.ndarray
+    dy: np.ndarray
+    dx: np.ndarray
+
+
+class BatchBattleData:
+    """
+    N 個のゲームの、一方の陣営から見た BattleData を積み重ねたもの。
+
+    Attributes
+    ----------
+    my_grid: np.ndarray [np.int32] (N, ROW, COL)
+    prob: np.ndarray [np.float64] (N, ROW, COL)
+    my_alive_count, opponent_alive_count: np.ndarray [np.int32] (N,)
+    tracking: np.ndarray [np.int32] (N,)
+        tracking_cell のマス番号。 None の場合は codec.NO_CELL。
+
+    履歴はリストの代わりに、直前の操作と件数だけを持つ。
+    last_my_kind, last_my_cell, last_my_resp, last_opp_kind, last_opp_cell, last_opp_dy, last_opp_dx, last_opp_resp:
+        直前の自軍・敵軍の操作 (まだ無ければ kind が codec.KIND_NONE)。
+    my_op_count, opp_op_count: (N,)
+        自軍・敵軍の操作の回数。
+    opp_attack_stamp: np.ndarray [np.int32] (N, CELLS)
+        敵軍が最後に移動してから後の、マスごとの敵軍の最新の攻撃の通し番号 (攻撃されていなければ 0)。
+    """
+
+    def __init__(self, n: int, opponent_initial_submarine_count: int = INITIAL_SUBMARINE_COUNT):
+        self.n = n
+        self.my_grid = np.zeros((n, ROW, COL), dtype=np.int32)
+        self.prob = np.full((n, ROW, COL), opponent_initial_submarine_count / CELLS, dtype=np.float64)
+        self.my_alive_count = np.full(n, INITIAL_SUBMARINE_COUNT, dtype=np.int32)
+        self.opponent_alive_count = np.full(n, opponent_initial_submarine_count, dtype=np.int32)
+        self.tracking = np.full(n, codec.NO_CELL, dtype=np.int32)
+
+        self.last_my_kind = np.full(n, codec.KIND_NONE, dtype=np.int8)
+        self.last_my_cell = np.full(n, codec.NO_CELL, dtype=np.int32)
+        self.last_my_resp = np.full(n, codec.NO_RESPONSE, dtype=np.int8)
+        self.last_opp_kind = np.full(n, codec.KIND_NONE, dtype=np.int8)
+        self.last_opp_cell = np.full(n, codec.NO_CELL, dtype=np.int32)
+        self.last_opp_dy = np.zeros(n, dtype=np.int32)
+        self.last_opp_dx = np.zeros(n, dtype=np.int32)
+        self.last_opp_resp = np.full(n, codec.NO_RESPONSE, dtype=np.int8)
+        self.my_op_count = np.zeros(n, dtype=np.int32)
+        self.opp_op_count = np.zeros(n, dtype=np.int32)
+        self.opp_attack_stamp = np.zeros((n, CELLS), dtype=np.int32)
+
+    @property
+    def grid_cells(self) -> np.ndarray:
+        return self.my_grid.reshape(self.n, CELLS)
+
+    @property
+    def prob_cells(self) -> np.ndarray:
+        return self.prob.reshape(self.n, CELLS)
+
+    def has_game_finished(self) -> np.ndarray:
+        return (self.my_alive_count <= 0) | (self.opponent_alive_count <= 0)
+
+    def occupied(self, idx: np.ndarray) -> np.ndarray:
+        """
+        (len(idx), CELLS) の bool 配列。自軍の潜水艦がいるマスが True。
+        """
+        return self.grid_cells[idx] > 0
+
+    def attackable(self, idx: np.ndarray) -> np.ndarray:
+        """
+        BattleData.set_of_my_attackable_cells() のバッチ版。
+        """
+        occupied = self.occupied(idx)
+        return ((occupied.astype(np.float32) @ _AROUND_F) > 0) & ~occupied
+
+
+def _rows(k: int) -> np.ndarray:
+    return np.arange(k)
+
+
+def _random_pick(rng: np.random.Generator, mask: np.ndarray) -> np.ndarray:
+    """
+    mask (k, CELLS) の各行で True のマスから一様に一つ選んだマス番号を返す。 True が無い行は codec.NO_CELL。
+    """
+    keys = rng.random(mask.shape)
+    keys[~mask] = -1.0
+    picked = np.argmax(keys, axis=1).astype(np.int32)
+    return np.where(mask.any(axis=1), picked, codec.NO_CELL)
+
+
+##########################################################################################################
+# 確率グリッドの更新 (logic の _update_prob_* のバッチ版)。
+# P は対象のゲームの確率グリッドを (k, CELLS) に並べた配列で、その場で更新する。
+
+def _zero_or_one(P: np.ndarray) -> np.ndarray:
+    return (np.abs(P) <= _EPS) | (P >= 1.0 - _EPS)
+
+
+def _distribute(P: np.ndarray, value: np.ndarray, destinations: np.ndarray) -> None:
+    count = destinations.sum(axis=1)
+    add = np.where(count > 0, value / np.maximum(count, 1), 0.0)
+    P += destinations * add[:, None]
+
+
+def _destinations(P: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    logic._destinations() のバッチ版。確率が 0 と 1 のマスを除き、それが空なら 1 のマスだけを除く。
+    """
+    uncertain = candidates & (P < 1.0 - _EPS)
+    destinations = uncertain & (np.abs(P) > _EPS)
+    empty = ~destinations.any(axis=1)
+    destinations[empty] = uncertain[empty]
+    return destinations
+
+
+def _suck_spot(P: np.ndarray, cell: np.ndarray) -> None:
+    rows = _rows(len(P))
+    candidates = np.ones(P.shape, dtype=bool)
+    candidates[rows, cell] = False
+    destinations = _destinations(P, candidates)
+    _distribute(P, P[rows, cell].copy(), destinations)
+    P[rows, cell] = 0.0
+
+
+def _suck_one(P: np.ndarray, sources: np.ndarray, alive: np.ndarray) -> None:
+    known = (P >= 1.0 - _EPS).sum(axis=1)
+    active = known != alive
+    ratio = np.where(active, 1.0 / np.where(active, alive - known, 1), 0.0)
+    P -= P * (sources & ~_zero_or_one(P)) * ratio[:, None]
+
+
+def _hit(P: np.ndarray, cell: np.ndarray, alive: np.ndarray) -> None:
+    rows = _rows(len(P))
+    todo = P[rows, cell] < 1.0 - 1e-10
+    if not todo.any():
+        return
+    Q, c = P[todo], cell[todo]
+    _suck_spot(Q, c)
+    sources = np.ones(Q.shape, dtype=bool)
+    sources[_rows(len(Q)), c] = False
+    _suck_one(Q, sources, alive[todo])
+    Q[_rows(len(Q)), c] = 1.0
+    P[todo] = Q
+
+
+def _dead(P: np.ndarray, cell: np.ndarray, alive: np.ndarray) -> None:
+    _hit(P, cell, alive)
+    P[_rows(len(P)), cell] = 0.0
+
+
+def _near(P: np.ndarray, cell: np.ndarray, alive: np.ndarray) -> None:
+    todo = np.abs(P[_rows(len(P)), cell]) > _EPS
+    if not todo.any():
+        return
+    Q, c, a = P[todo], cell[todo], alive[todo]
+    _suck_spot(Q, c)
+    # 波高しの周囲に位置が明らかな敵艦が存在するゲームはここまで
+    go = ~(AROUND[c] & (Q >= 1.0 - _EPS)).any(axis=1)
+    R, c, a = Q[go], c[go], a[go]
+    destinations = _destinations(R, AROUND[c])
+    sources = np.ones(R.shape, dtype=bool)
+    sources[_rows(len(R)), c] = False
+    _suck_one(R, sources, a)
+    _distribute(R, np.ones(len(R)), destinations)
+    Q[go] = R
+    P[todo] = Q
+
+
+def _nothing(P: np.ndarray, cell: np.ndarray) -> None:
+    area = AROUND[cell].copy()
+    area[_rows(len(P)), cell] = True
+    s = (P * area).sum(axis=1)
+    P[area] = 0.0
+    _distribute(P, s, _destinations(P, ~area))
+
+
+def _opponent_move(P: np.ndarray, dy: np.ndarray, dx: np.ndarray, shift_ratio: float) -> None:
+    """
+    移動の向きと距離 (高々 8 通り) ごとにまとめて処理する。
+    """
+    for y, x in set(zip(dy.tolist(), dx.tolist())):
+        sel = (dy == y) & (dx == x)
+        src = (ROWS + y >= 0) & (ROWS + y < ROW) & (COLS + x >= 0) & (COLS + x < COL)
+        Q = P[sel]
+        prob_sum = (Q * src).sum(axis=1)
+        go = np.abs(prob_sum) > _EPS
+        v = np.zeros_like(Q)
+        v[go] = Q[go] * (Q[go] / prob_sum[go, None]) * shift_ratio * src
+        moved = np.zeros_like(Q)
+        moved[:, np.flatnonzero(src) + y * COL + x] = v[:, src]
+        P[sel] = Q - v + moved
+
+
+##########################################################################################################
+# 状態の更新 (logic の apply_* / update_tracking_cell のバッチ版)
+
+def initialize_my_placements(data: BatchBattleData, idx: np.ndarray, rng: np.random.Generator) -> None:
+    """
+    logic.initialize_my_placement() のバッチ版。 同じ分布から初期配置を選ぶ。
+    """
+    candidates, class_sizes = placement.top_candidates()
+    weights = np.array(class_sizes, dtype=np.float64)
+    chosen = rng.choice(len(candidates), size=len(idx), p=weights / weights.sum())
+    symmetry = rng.integers(placement.SYMMETRY_COUNT, size=len(idx))
+    grids = np.array([[placement.transform_grid(grid, s) for s in range(placement.SYMMETRY_COUNT)]
+                      for grid in candidates])
+    data.my_grid[idx] = grids[chosen, symmetry]
+    data.my_alive_count[idx] = INITIAL_SUBMARINE_COUNT
+
+
+def apply_my_ops(data: BatchBattleData, idx: np.ndarray, ops: BatchOps) -> None:
+    """
+    logic.apply_my_op() のバッチ版。
+    """
+    data.last_my_kind[idx] = ops.kind
+    data.last_my_cell[idx] = ops.cell
+    data.last_my_resp[idx] = codec.NO_RESPONSE
+    data.my_op_count[idx] += 1
+
+    move = ops.kind == codec.KIND_MOVE
+    g, src = idx[move], ops.cell[move]
+    dst = src + ops.dy[move] * COL + ops.dx[move]
+    cells = data.grid_cells
+    cells[g, dst] = cells[g, src]
+    cells[g, src] = 0
+
+
+def apply_attack_responses(data: BatchBattleData, idx: np.ndarray, resp: np.ndarray) -> None:
+    """
+    logic.apply_attack_response() のバッチ版。 idx は直前の自軍の操作が攻撃だったゲーム。
+    resp は Response.value の配列。
+    """
+    data.last_my_resp[idx] = resp
+    cell = data.last_my_cell[idx]
+    alive = data.opponent_alive_count[idx]
+    P = data.prob_cells[idx]
+    for code, update in ((_HIT, _hit), (_DEAD, _dead), (_NEAR, _near)):
+        sel = resp == code
+        if sel.any():
+            Q = P[sel]
+            update(Q, cell[sel], alive[sel])
+            P[sel] = Q
+    sel = resp == _NOTHING
+    if sel.any():
+        Q = P[sel]
+        _nothing(Q, cell[sel])
+        P[sel] = Q
+    data.prob_cells[idx] = P
+    data.opponent_alive_count[idx] -= (resp == _DEAD)
+
+
+def apply_opponent_ops(data: BatchBattleData, idx: np.ndarray, ops: BatchOps,
+                       params: DecisionParams = DEFAULT_PARAMS) -> np.ndarray:
+    """
+    logic.apply_opponent_op() のバッチ版。 ops.cell は攻撃位置 (移動の場合は無視する)。
+    攻撃に対する反応 (Response.value、移動の場合は codec.NO_RESPONSE) の配列を返す。
+    """
+    attack = ops.kind == codec.KIND_ATTACK
+    data.opp_op_count[idx] += 1
+    data.last_opp_kind[idx] = ops.kind
+    data.last_opp_cell[idx] = np.where(attack, ops.cell, codec.NO_CELL)
+    data.last_opp_dy[idx] = np.where(attack, 0, ops.dy)
+    data.last_opp_dx[idx] = np.where(attack, 0, ops.dx)
+
+    # 確率グリッドの更新
+    P = data.prob_cells[idx]
+    if attack.any():
+        Q = P[attack]
+        _near(Q, ops.cell[attack], data.opponent_alive_count[idx[attack]])
+        P[attack] = Q
+    if (~attack).any():
+        Q = P[~attack]
+        _opponent_move(Q, ops.dy[~attack], ops.dx[~attack], params.move_shift_ratio)
+        P[~attack] = Q
+    data.prob_cells[idx] = P
+
+    # 敵が移動したら攻撃の記録はリセットし、攻撃したらそのマスの通し番号を記録する
+    data.opp_attack_stamp[idx[~attack]] = 0
+    ga, ca = idx[attack], ops.cell[attack]
+    data.opp_attack_stamp[ga, ca] = data.opp_op_count[ga]
+
+    # 敵の攻撃を自軍の HP へ反映し、反応を求める
+    resp = np.full(len(idx), codec.NO_RESPONSE, dtype=np.int8)
+    cells = data.grid_cells
+    hp = cells[ga, ca]
+    hit = hp > 0
+    cells[ga[hit], ca[hit]] -= 1
+    dead = hit & (hp == 1)
+    data.my_alive_count[ga[dead]] -= 1
+    near = ~hit & (AROUND[ca] & (cells[ga] > 0)).any(axis=1)
+    resp[attack] = np.select([dead, hit, near], [_DEAD, _HIT, _NEAR], _NOTHING)
+    data.last_opp_resp[idx] = resp
+    return resp
+
+
+def _shift(cell: np.ndarray, dy: np.ndarray, dx: np.ndarray) -> np.ndarray:
+    return cell + dy * COL + dx
+
+
+def update_tracking_cells(data: BatchBattleData, idx: np.ndarray) -> None:
+    """
+    logic.update_tracking_cell() のバッチ版。
+    """
+    tracking = data.tracking[idx]
+    my_kind, my_cell, my_resp = data.last_my_kind[idx], data.last_my_cell[idx], data.last_my_resp[idx]
+    opp_kind = data.last_opp_kind[idx]
+    opp_move = opp_kind == codec.KIND_MOVE
+    moved = _shift(tracking, data.last_opp_dy[idx], data.last_opp_dx[idx])
+    has_tracking = tracking != codec.NO_CELL
+    my_attack = my_kind == codec.KIND_ATTACK
+
+    # 敵が1艦しかいなくて位置が明らかな場合は、敵の移動に追従するだけ
+    single = ~(my_attack & (my_resp == _DEAD)) & has_tracking & (data.opponent_alive_count[idx] == 1)
+
+    miss = my_attack & ((my_resp == _NEAR) | (my_resp == _NOTHING))
+    next_tracking = np.select(
+        [
+            my_attack & (my_resp == _DEAD),
+            my_attack & (my_resp == _HIT),
+            miss & has_tracking & opp_move & (my_cell == tracking),
+            miss & has_tracking & opp_move,
+            miss & has_tracking & (opp_kind != codec.KIND_NONE),
+            ~my_attack & has_tracking & ~opp_move,
+        ],
+        [codec.NO_CELL, my_cell, moved, tracking, tracking, tracking],
+        codec.NO_CELL)
+
+    data.tracking[idx] = np.where(single, np.where(opp_move, moved, tracking), next_tracking)
+
+    update = ~single & (next_tracking != codec.NO_CELL)
+    if update.any():
+        g = idx[update]
+        P = data.prob_cells[g]
+        _hit(P, next_tracking[update], data.opponent_alive_count[g])
+        data.prob_cells[g] = P
+
+
+##########################################################################################################
+# 操作の決定 (logic.suggest_my_op_with_branch のバッチ版)
+
+def suggest_my_ops(data: BatchBattleData, idx: np.ndarray, rng: np.random.Generator,
+                   params: DecisionParams = DEFAULT_PARAMS):
+    """
+    idx のゲームそれぞれについて自軍の操作を決めて (BatchOps, 分岐の識別子の配列) を返す。 data には書き込まない。
+    """
+    k = len(idx)
+    rows = _rows(k)
+    occupied = data.occupied(idx)
+    attackable = data.attackable(idx)
+    P = data.prob_cells[idx]
+    opp_alive = data.opponent_alive_count[idx]
+    vacant = ~occupied
+    # movers[r, i] := ゲーム r で i の艦がどこかへ移動できる, reachable[r, j] := ゲーム r でどれかの艦が j へ移動できる
+    movers = occupied & ((vacant.astype(np.float32) @ _MOVE_F.T) > 0)
+    reachable = vacant & ((occupied.astype(np.float32) @ _MOVE_F) > 0)
+
+    kind = np.full(k, codec.KIND_ATTACK, dtype=np.int8)
+    cell = np.full(k, codec.NO_CELL, dtype=np.int32)
+    dy = np.zeros(k, dtype=np.int32)
+    dx = np.zeros(k, dtype=np.int32)
+    branch = np.full(k, Branch.Unknown, dtype=np.int8)
+    undecided = np.ones(k, dtype=bool)
+
+    def decide(sel, b, c, move_to=None):
+        sel = sel & undecided
+        branch[sel] = b
+        cell[sel] = c[sel]
+        if move_to is not None:
+            kind[sel] = codec.KIND_MOVE
+            dy[sel] = (move_to[sel] // COL) - (c[sel] // COL)
+            dx[sel] = (move_to[sel] % COL) - (c[sel] % COL)
+        undecided[sel] = False
+
+    # 先手の初手
+    opening = (data.my_op_count[idx] == 0) & (data.opp_op_count[idx] == 0)
+    first_attack = _random_pick(rng, OPENING & attackable)
+    decide(opening & (first_attack != codec.NO_CELL), Branch.Opening, first_attack)
+
+    # 位置が明らかな敵艦への攻撃 (直前に敵が移動していれば移動先も候補)
+    tracking = data.tracking[idx]
+    has_tracking = tracking != codec.NO_CELL
+    candidates = np.zeros((k, CELLS), dtype=bool)
+    candidates[rows[has_tracking], tracking[has_tracking]] = True
+    opp_move = data.last_opp_kind[idx] == codec.KIND_MOVE
+    ty, tx = tracking // COL + data.last_opp_dy[idx], tracking % COL + data.last_opp_dx[idx]
+    follow = has_tracking & opp_move & (ty >= 0) & (ty < ROW) & (tx >= 0) & (tx < COL)
+    candidates[rows[follow], (ty * COL + tx)[follow]] = True
+    target = _random_pick(rng, candidates & attackable)
+    decide(target != codec.NO_CELL, Branch.Tracking, target)
+
+    # 確率最高値のマスが射程外でかなり高ければ、そちらへ移動する
+    top = np.argmax(P, axis=1)
+    top_value = P[rows, top]
+    far = (top_value > opp_alive * params.move_threshold_ratio) & ~attackable[rows, top]
+    #     確率最高値のマスに自軍がいればその艦を1マス動かす (移動先は logic と同じ評価式で選ぶ)
+    dodge_dest = MOVE[top] & vacant & (MANHATTAN[top] == 1)
+    spread = (np.abs(ROWS[:, None] + ROWS[None, :]) + np.abs(COLS[:, None] + COLS[None, :])) @ occupied.T.astype(np.int64)
+    dodge_score = np.where(dodge_dest, spread.T, -1)
+    dodge = far & occupied[rows, top] & dodge_dest.any(axis=1)
+    decide(dodge, Branch.DodgeOverlap, top, np.argmax(dodge_score, axis=1))
+    #     確率最高値のマスへの距離が最も近い艦を、最も近づくマスへ動かす
+    actor = np.argmin(np.where(occupied, MANHATTAN[top], 999), axis=1)
+    actor_dest = MOVE[actor] & vacant
+    dest_dist = np.where(actor_dest, np.where(np.arange(CELLS) == top[:, None], 999, MANHATTAN[top]), 1000)
+    toward = far & movers[rows, actor]
+    decide(toward, Branch.MoveTowardHighProb, actor, np.argmin(dest_dist, axis=1))
+
+    # 敵の攻撃が命中していたら、攻撃を食らったマスの周囲に反撃する
+    hit_back = (data.last_opp_kind[idx] == codec.KIND_ATTACK) & np.isin(data.last_opp_resp[idx], (_HIT, _DEAD))
+    around = AROUND[np.maximum(data.last_opp_cell[idx], 0)] & attackable
+    counter = np.argmax(np.where(around, P, -1.0), axis=1)
+    decide(hit_back & around.any(axis=1) & (np.abs(P[rows, counter]) > params.zero_prob_tol),
+           Branch.CounterAttack, counter)
+
+    # 攻撃可能なマスの確率最高値がしきい値より高ければ攻撃する
+    best = np.argmax(np.where(attackable, P, -1.0), axis=1)
+    decide(P[rows, best] > opp_alive * params.attack_threshold_ratio, Branch.ThresholdAttack, best)
+
+    # 敵が最後に移動してから後に攻撃した位置のうち、最も新しく、自軍が移動できる位置へ移動する
+    stamp = np.where(reachable, data.opp_attack_stamp[idx], 0)
+    attacked = np.argmax(stamp, axis=1)
+    can_reach = MOVE.T[attacked] & occupied
+    mover = np.argmin(np.where(can_reach, AROUND_COUNT, 999), axis=1)
+    decide(stamp[rows, attacked] > 0, Branch.MoveToAttackedPos, mover, attacked)
+
+    # 自軍の数が少なければ一定の確率でランダムに移動する
+    chance = (data.my_alive_count[idx] <= params.random_move_alive_count) & (rng.random(k) < params.random_move_chance)
+    random_actor = _random_pick(rng, movers)
+    random_dest = _random_pick(rng, MOVE[np.maximum(random_actor, 0)] & vacant)
+    decide(chance & (random_actor != codec.NO_CELL), Branch.RandomMove, random_actor, random_dest)
+
+    # 評価値最大のマスへ攻撃する
+    if undecided.any():
+        u = np.flatnonzero(undecided)
+        score = scorer.score_cells(P[u].reshape(-1, ROW, COL), attackable[u].reshape(-1, ROW, COL),
+                                   hit_weight=params.hit_weight, info_weight=params.info_weight)
+        fallback = np.full(k, codec.NO_CELL, dtype=np.int32)
+        fallback[u] = np.argmax(score.reshape(len(u), CELLS), axis=1)
+        decide(undecided.copy(), Branch.Fallback, fallback)
+
+    return BatchOps(kind=kind, cell=cell, dy=dy, dx=dx), branch
+
+
+##########################################################################################################
+# 自己対戦
+
+class BatchResult(NamedTuple):
+    winner: np.ndarray  # codec.SIDE_ME, codec.SIDE_OPPONENT, または引き分けなら -1
+    turns: np.ndarray
+    branch_counts: np.ndarray  # (2, len(Branch)) 陣営ごとの分岐の回数
+
+
+def play_batch(n: int, seed: int = 0, max_turns: int = 200, params: DecisionParams = DEFAULT_PARAMS,
+               opponent_params: Optional[DecisionParams] = None) -> BatchResult:
+    """
+    自軍のロジック同士の対戦を n ゲーム同時に進める。先手・後手はゲームごとに交互にする。
+    各ターンで、そのターンに手番のある側の全ゲームを一度に 1 手進める。
+    """
+    rng = np.random.default_rng(seed)
+    sides = (BatchBattleData(n), BatchBattleData(n))
+    side_params = (params, params if opponent_params is None else opponent_params)
+    everyone = np.arange(n)
+    for data in sides:
+        initialize_my_placements(data, everyone, rng)
+
+    first = np.where(everyone % 2 == 0, codec.SIDE_ME, codec.SIDE_OPPONENT)
+    turns = np.zeros(n, dtype=np.int32)
+    branch_counts = np.zeros((2, len(Branch)), dtype=np.int64)
+
+    for t in range(max_turns):
+        active = ~sides[codec.SIDE_ME].has_game_finished()
+        if not active.any():
+            break
+        acting = (first + t) % 2
+        for side in (codec.SIDE_ME, codec.SIDE_OPPONENT):
+            idx = np.flatnonzero(active & (acting == side))
+            if len(idx) <= 0:
+                continue
+            actor, target = sides[side], sides[1 - side]
+            ops, branch = suggest_my_ops(actor, idx, rng, side_params[side])
+            branch_counts[side] += np.bincount(branch, minlength=len(Branch))
+            apply_my_ops(actor, idx, ops)
+
+            resp = apply_opponent_ops(target, idx, BatchOps(ops.kind, np.where(ops.kind == codec.KIND_ATTACK,
+                                                                             ops.cell, codec.NO_CELL),
+                                                            ops.dy, ops.dx), side_params[1 - side])
+            attack = ops.kind == codec.KIND_ATTACK
+            apply_attack_responses(actor, idx[attack], resp[attack])
+            update_tracking_cells(actor, idx)
+        turns[active] += 1
+
+    me = sides[codec.SIDE_ME]
+    winner = np.select([me.opponent_alive_count <= 0, me.my_alive_count <= 0],
+                       [codec.SIDE_ME, codec.SIDE_OPPONENT], -1)
+    return BatchResult(winner=winner, turns=turns, branch_counts=branch_counts)
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 10000)
+    seed = io.int_option(argv, "--seed", 0)
+    max_turns = io.int_option(argv, "--max-turns", 200)
+
+    start = time.perf_counter()
+    result = play_batch(game_count, seed=seed, max_turns=max_turns)
+    elapsed = time.perf_counter() - start
+
+    io.success("%d ゲーム (%d 手) を %.2f 秒で対戦させました (%.3f ms/ゲーム)。" % (
+        game_count, int(result.turns.sum()), elapsed, elapsed * 1000 / game_count), None)
+    io.info("勝率: %.3f, 引き分け: %d, 平均ターン数: %.1f" % (
+        float(np.mean(result.winner == codec.SIDE_ME)), int(np.sum(result.winner < 0)), float(result.turns.mean())), None)
+    for branch in Branch:
+        io.info("%-18s %d" % (branch.name, int(result.branch_counts[codec.SIDE_ME, branch])), None)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,247 @@
+"""
+自己対戦中の確率グリッド (BattleData.prob) の推移の記録と、その較正 (calibration) の評価。
+
+各手の後の自軍の確率グリッドを、シミュレータだけが知っている敵艦の本当の配置と合わせて
+あらかじめ確保したバッファ (BELIEF_DTYPE, block_size 件) に記録する。バッファが一杯になるたびに
+`<root>/<shard>-<block 番号>.npz` へ圧縮して書き出すので、使うメモリはゲーム数によらず一定。
+Brier スコア・対数損失・信頼性図 (reliability diagram) の表は、書き出すブロックごとにまとめて計算する。
+
+確率グリッドは敵艦の個数の期待値なので、各マスの値を [0, 1] に切り詰めて「そのマスに敵艦がいる確率」とみなす。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.beliefs -g 1000 -j 4 --out ~/.submarine-destroyer/beliefs
+"""
+import glob
+import math
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+from . import io
+from . import selfplay
+from .model import OpInfo, BattleData
+from .selfplay import GameSpec, TurnCallback
+from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT
+
+DEFAULT_BLOCK_SIZE = 4096
+CALIBRATION_BINS = 10
+
+# 対数損失の計算で確率を [EPS, 1 - EPS] に切り詰める
+EPS = 1e-6
+
+# 1 手ごとのレコード。 prob はその手を適用した後の自軍の確率グリッド、 truth は敵艦の本当の HP (いなければ 0)。
+BELIEF_DTYPE = np.dtype([
+    ('game', '<i8'),
+    ('turn', '<i2'),
+    ('side', 'i1'),  # その手を指した側
+    ('kind', 'i1'),
+    ('opp_alive', 'i1'),
+    ('prob', '<f4', (ROW, COL)),
+    ('truth', 'i1', (ROW, COL)),
+])
+
+
+class CalibrationMetrics:
+    """
+    マスごとの (確率, 敵艦がいるかどうか) の組の Brier スコア・対数損失と、確率の区間ごとの実際の頻度。
+    """
+
+    def __init__(self, bins: int = CALIBRATION_BINS):
+        self.cells = 0
+        self.squared_error = 0.0
+        self.log_loss_sum = 0.0
+        self.bin_counts = np.zeros(bins, dtype=np.int64)
+        self.bin_prob_sums = np.zeros(bins, dtype=np.float64)
+        self.bin_hits = np.zeros(bins, dtype=np.int64)
+
+    def push(self, prob: np.ndarray, occupied: np.ndarray) -> None:
+        """
+        prob (任意の形の確率グリッドの配列) と、同じ形の occupied (敵艦がいれば True) を足し込む。
+        """
+        p = np.clip(prob.astype(np.float64).ravel(), 0.0, 1.0)
+        y = occupied.ravel().astype(np.float64)
+        q = np.clip(p, EPS, 1 - EPS)
+        self.cells += len(p)
+        self.squared_error += float(np.sum((p - y) ** 2))
+        self.log_loss_sum -= float(np.sum(y * np.log(q) + (1 - y) * np.log(1 - q)))
+
+        bins = len(self.bin_counts)
+        b = np.minimum((p * bins).astype(np.int64), bins - 1)
+        self.bin_counts += np.bincount(b, minlength=bins)
+        self.bin_prob_sums += np.bincount(b, weights=p, minlength=bins)
+        self.bin_hits += np.bincount(b, weights=y, minlength=bins).astype(np.int64)
+
+    def merge(self, other: 'CalibrationMetrics') -> None:
+        self.cells += other.cells
+        self.squared_error += other.squared_error
+        self.log_loss_sum += other.log_loss_sum
+        self.bin_counts += other.bin_counts
+        self.bin_prob_sums += other.bin_prob_sums
+        self.bin_hits += other.bin_hits
+
+    @property
+    def brier(self) -> float:
+        return self.squared_error / self.cells if self.cells > 0 else math.nan
+
+    @property
+    def log_loss(self) -> float:
+        return self.log_loss_sum / self.cells if self.cells > 0 else math.nan
+
+    def reliability(self) -> List[Tuple[float, float, int]]:
+        """
+        確率の区間ごとの (予測した確率の平均, 実際に敵艦がいた割合, マス数)。マス数が 0 の区間は除く。
+        """
+        return [
+            (self.bin_prob_sums[b] / n, self.bin_hits[b] / n, int(n))
+            for b, n in enumerate(self.bin_counts) if n > 0
+        ]
+
+    def format_summary(self) -> str:
+        lines = ["cells: %d, brier: %.4f, log loss: %.4f" % (self.cells, self.brier, self.log_loss),
+                 "%10s %10s %10s" % ("predicted", "observed", "cells")]
+        for predicted, observed, n in self.reliability():
+            lines.append("%10.3f %10.3f %10d" % (predicted, observed, n))
+        return "\n".join(lines)
+
+
+class BeliefRecorder:
+    """
+    確率グリッドの推移を記録する。 root が None なら書き出さずに較正の評価だけを行う。
+    """
+
+    def __init__(self, root: Optional[str], shard: str = "beliefs", block_size: int = DEFAULT_BLOCK_SIZE):
+        self.root = root
+        self.shard = shard
+        self.buffer = np.zeros(block_size, dtype=BELIEF_DTYPE)
+        self.size = 0
+        self.blocks = 0
+        self.records = 0
+        self._metrics = CalibrationMetrics()
+        # buffer[:_measured] は評価済み
+        self._measured = 0
+        if root is not None:
+            os.makedirs(root, exist_ok=True)
+
+    def record(self, game: int, turn: int, side: int, op: OpInfo, data: BattleData, truth: np.ndarray) -> None:
+        if self.size >= len(self.buffer):
+            self.flush()
+        rec = self.buffer[self.size]
+        rec['game'] = game
+        rec['turn'] = turn
+        rec['side'] = side
+        rec['kind'] = codec.op_kind(op)
+        rec['opp_alive'] = data.opponent_alive_count
+        rec['prob'] = data.prob
+        rec['truth'] = truth
+        self.size += 1
+        self.records += 1
+
+    def on_turn(self, spec: GameSpec) -> TurnCallback:
+        """
+        selfplay.play_game() に渡すコールバック。自軍の確率グリッドを敵軍側の配置と合わせて記録する。
+        """
+        side = [codec.SIDE_ME if spec.me_first else codec.SIDE_OPPONENT]
+
+        def callback(turn_count: int, me: BattleData, opponent: BattleData, op: OpInfo) -> None:
+            self.record(spec.game, turn_count, side[0], op, me, opponent.my_grid)
+            side[0] = 1 - side[0]
+
+        return callback
+
+    def _measure(self) -> None:
+        if self._measured < self.size:
+            block = self.buffer[self._measured:self.size]
+            self._metrics.push(block['prob'], block['truth'] > 0)
+            self._measured = self.size
+
+    @property
+    def metrics(self) -> CalibrationMetrics:
+        self._measure()
+        return self._metrics
+
+    def flush(self) -> None:
+        """
+        バッファの内容を評価し、 root が指定されていれば一つのブロックとして書き出す。
+        """
+        self._measure()
+        if self.size <= 0:
+            return
+        if self.root is not None:
+            path = os.path.join(self.root, "%s-%06d.npz" % (self.shard, self.blocks))
+            tmp = "%s.tmp.%d.npz" % (path[:-len(".npz")], os.getpid())
+            np.savez_compressed(tmp, beliefs=self.buffer[:self.size])
+            os.replace(tmp, path)
+        self.blocks += 1
+        self.size = 0
+        self._measured = 0
+
+    def close(self) -> None:
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def load_beliefs(root: str) -> np.ndarray:
+    """
+    root 以下の全てのブロックを読み込んで一つの配列にする。
+    """
+    paths = sorted(p for p in glob.glob(os.path.join(root, "*.npz")) if ".tmp." not in p)
+    blocks = []
+    for path in paths:
+        with np.load(path) as z:
+            blocks.append(z['beliefs'])
+    return np.concatenate(blocks) if len(blocks) > 0 else np.zeros(0, dtype=BELIEF_DTYPE)
+
+
+def _record_chunk(root: Optional[str], shard: str, specs: List[GameSpec]) -> CalibrationMetrics:
+    with io.silenced(), BeliefRecorder(root, shard) as recorder:
+        for spec in specs:
+            selfplay.play_game(spec, recorder.on_turn(spec))
+    return recorder.metrics
+
+
+def record_games(specs: List[GameSpec], root: Optional[str], workers: int = 1,
+                 chunk_size: int = 500) -> CalibrationMetrics:
+    """
+    specs のゲームを workers 個のプロセスで対戦させながら確率グリッドを記録し、全体の較正の評価を返す。
+    chunk_size 個のゲームごとに別のシャードへ書き込む。
+    """
+    chunks = [specs[i:i + chunk_size] for i in range(0, len(specs), chunk_size)]
+    shards = ["beliefs-%08d-%d" % (chunk[0].game, os.getpid()) for chunk in chunks]
+    metrics = CalibrationMetrics()
+    if workers <= 1:
+        results = [_record_chunk(root, shard, chunk) for shard, chunk in zip(shards, chunks)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=selfplay.configure_headless) as executor:
+            results = list(executor.map(_record_chunk, [root] * len(chunks), shards, chunks))
+    for m in results:
+        metrics.merge(m)
+    return metrics
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 100)
+    workers = io.int_option(argv, "-j", 1)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    root_seed = io.int_option(argv, "--seed", 0)
+    root = os.path.expanduser(argv[argv.index("--out") + 1]) if "--out" in argv else None
+
+    selfplay.configure_headless()
+    specs = selfplay.make_specs(game_count, root_seed, opponent_count=opponent_count)
+    metrics = record_games(specs, root, workers=workers)
+    print(metrics.format_summary())
+    if root is not None:
+        io.success("確率グリッドの推移を `%s` に書き込みました。" % root, None)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
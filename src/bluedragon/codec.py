@@ -0,0 +1,116 @@
+"""
+対戦データを numpy の構造化配列として保存するための、固定長レコードの定義と変換。
+"""
+from typing import Optional
+
+import numpy as np
+
+from .model import OpInfo, AttackInfo, MoveInfo, Response
+from .rule import Pos
+from .rule import COL
+
+# レコードの形式を変更したらインクリメントすること
+FORMAT_VERSION = 1
+
+# 操作の種類 (kind 列)
+KIND_NONE = 0
+KIND_ATTACK = 1
+KIND_MOVE = 2
+
+# 位置が不明・存在しないことを表すマス番号 (cell 列, tracking 列)
+NO_CELL = -1
+
+# 反応が無いことを表す値 (resp 列)。それ以外は Response.value を格納する。
+NO_RESPONSE = 0
+
+# 手番 (side 列)
+SIDE_ME = 0
+SIDE_OPPONENT = 1
+
+# 1 手ごとのレコード。 my_alive, opp_alive, tracking, prev_opp_kind は操作を決定する直前の値。
+TURN_DTYPE = np.dtype([
+    ('game', '<i8'),
+    ('turn', '<i2'),
+    ('side', 'i1'),
+    ('kind', 'i1'),
+    ('cell', 'i1'),  # 攻撃位置、または移動元
+    ('dy', 'i1'),
+    ('dx', 'i1'),
+    ('resp', 'i1'),
+    ('branch', 'i1'),
+    ('my_alive', 'i1'),
+    ('opp_alive', 'i1'),
+    ('tracking', 'i1'),
+    ('prev_opp_kind', 'i1'),
+])
+
+# 1 ゲームごとのレコード
+GAME_DTYPE = np.dtype([
+    ('game', '<i8'),
+    ('seed', '<i8'),
+    ('opponent', 'i1'),  # 敵軍の戦略の識別子
+    ('n', 'i1'),  # 敵軍の潜水艦の初期個数
+    ('me_first', 'i1'),
+    ('winner', 'i1'),  # SIDE_ME, SIDE_OPPONENT, または引き分けなら -1
+    ('turns', '<i2'),
+])
+
+
+def cell_index(p: Optional[Pos]) -> int:
+    """
+    マス位置を 0 <= index < ROW * COL の整数に変換する。 None なら NO_CELL を返す。
+    """
+    return NO_CELL if p is None else p.row * COL + p.col
+
+
+def pos_of(index: int) -> Optional[Pos]:
+    """
+    cell_index() の逆変換。
+    """
+    return None if index == NO_CELL else Pos(int(index) // COL, int(index) % COL)
+
+
+def op_kind(op: Optional[OpInfo]) -> int:
+    if op is None:
+        return KIND_NONE
+    return KIND_ATTACK if op.is_attack() else KIND_MOVE
+
+
+def response_code(resp: Optional[Response]) -> int:
+    return NO_RESPONSE if resp is None else resp.value
+
+
+def response_of(code: int) -> Optional[Response]:
+    return None if code == NO_RESPONSE else Response(int(code))
+
+
+def write_op(record: np.void, op: OpInfo) -> None:
+    """
+    op の内容を record (TURN_DTYPE) の kind, cell, dy, dx, resp 列に書き込む。
+    """
+    if op.is_attack():
+        record['kind'] = KIND_ATTACK
+        record['cell'] = cell_index(op.detail.attack_pos)
+        record['dy'] = 0
+        record['dx'] = 0
+        record['resp'] = response_code(op.detail.resp)
+    else:
+        record['kind'] = KIND_MOVE
+        record['cell'] = cell_index(op.detail.fromPos)
+        record['dy'] = op.detail.dirY
+        record['dx'] = op.detail.dirX
+        record['resp'] = NO_RESPONSE
+
+
+def read_op(record: np.void) -> OpInfo:
+    """
+    write_op() の逆変換。
+    """
+    turn_count = int(record['turn'])
+    if record['kind'] == KIND_ATTACK:
+        return OpInfo(AttackInfo(attack_pos=pos_of(record['cell']), resp=response_of(record['resp'])),
+                      turn_count=turn_count)
+    if record['kind'] == KIND_MOVE:
+        return OpInfo(MoveInfo(fromPos=pos_of(record['cell']), dirY=int(record['dy']), dirX=int(record['dx'])),
+                      turn_count=turn_count)
+    raise ValueError("record has no op")
@@ -0,0 +1,368 @@
+"""
+大量の対戦の状態を少ないメモリで保持するための、コンパクトな表現 (CompactArena)。
+
+BattleData は 1 ゲームあたり int32 のグリッド 2 枚・float64 のグリッド 2 枚と、
+操作の歴史 (OpInfo などの Python オブジェクトのリスト) を持つので、数万ゲームを同時に保持するとメモリが足りなくなる。
+CompactArena は全ゲームの状態を数個の numpy 配列 (アリーナ) にまとめて持つ:
+    state   ... (capacity,) の STATE_DTYPE。 HP のグリッドは int8、確率と exposure は float32
+    history ... (capacity, 2, max_history) の HISTORY_DTYPE。ゲームごと・陣営ごとの操作の歴史
+
+CompactBattleData はアリーナの 1 スロットのビューとしての BattleData で、 logic の関数にそのまま渡せる。
+ConfirmedEnemies の索引と最後の操作だけはビューの中の Python オブジェクトなので、ビューを手放す前に pack() でアリーナに書き戻すこと。
+
+確率と exposure は float32 なので、 BattleData (float64) と全く同じ値にはならない。
+確率の差は丸め誤差の程度だが、しきい値との比較や確率最高値のマスの同点の判定が逆になると、そこから先の手順は変わる。
+終盤ほど起こりやすく、例えば make_specs(300, root_seed=123) では 2 ゲームが 40 手目以降で BattleData での対戦と分かれる。
+対戦結果を float64 の対戦と手順ごとに比べる用途には使わないこと (勝率などの統計の比較には差し支えない)。
+
+使用例 (1 ゲームあたりのメモリ使用量を BattleData と比較する):
+    $ cd src/
+    $ python3 -m bluedragon.compact -g 1000
+"""
+import copy
+import sys
+import tracemalloc
+from typing import Iterator, List, NamedTuple, Optional, Union
+
+import numpy as np
+
+from . import codec
+from . import io
+from . import selfplay
+from . import snapshot
+from .model import OpInfo, AttackInfo, BattleData, ConfirmedEnemies, Response
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT
+
+# 陣営ごとの操作の歴史の長さの上限 (既定値)。自己対戦の 1 ゲームの上限のターン数を両軍で分け合うので、その半分。
+DEFAULT_MAX_HISTORY = selfplay.DEFAULT_MAX_TURNS // 2
+
+# 位置が確定している艦の索引 (見失った艦を含む) の上限
+MAX_CONFIRMED = 2 * INITIAL_SUBMARINE_COUNT
+
+# 操作の歴史の 1 手分。 codec.write_op() / codec.read_op() で読み書きできる (TURN_DTYPE の必要な列だけ)。
+HISTORY_DTYPE = np.dtype([
+    ('turn', '<i2'),
+    ('kind', 'i1'),
+    ('cell', 'i1'),
+    ('dy', 'i1'),
+    ('dx', 'i1'),
+    ('resp', 'i1'),
+])
+
+# 1 ゲーム分 (一方の陣営から見た) の状態。 confirmed, exposed の空きは cell 列が codec.NO_CELL。
+STATE_DTYPE = np.dtype([
+    ('my_grid', 'i1', (ROW, COL)),
+    ('opponent_grid', 'i1', (ROW, COL)),
+    ('prob', '<f4', (ROW, COL)),
+    ('exposure', '<f4', (ROW, COL)),
+    ('my_alive', 'i1'),
+    ('opp_alive', 'i1'),
+    ('tracking', 'i1'),  # codec.cell_index(tracking_cell)
+    ('history_len', '<i2', (2,)),  # [codec.SIDE_ME] が my_history、 [codec.SIDE_OPPONENT] が opponent_history の長さ
+    ('confirmed', snapshot.CONFIRMED_DTYPE, (MAX_CONFIRMED,)),
+    ('exposed', snapshot.CONFIRMED_DTYPE, (MAX_CONFIRMED,)),
+])
+
+
+class _PackedAttackInfo(AttackInfo):
+    """
+    アリーナのレコードのビューとしての AttackInfo。
+    logic は歴史の最後の攻撃の resp を後から書き換えるので、 resp の書き込みをレコードに反映する。
+    """
+
+    def __init__(self, record: np.void):
+        self._record = record
+        self.attack_pos = codec.pos_of(record['cell'])
+
+    @property
+    def resp(self) -> Optional[Response]:
+        return codec.response_of(self._record['resp'])
+
+    @resp.setter
+    def resp(self, value: Optional[Response]) -> None:
+        self._record['resp'] = codec.response_code(value)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, AttackInfo):
+            return NotImplemented
+        return (self.attack_pos, self.resp) == (other.attack_pos, other.resp)
+
+    def __repr__(self) -> str:
+        return "AttackInfo(attack_pos=%r, resp=%r)" % (self.attack_pos, self.resp)
+
+
+class PackedHistory:
+    """
+    アリーナ上の操作の歴史のビュー。 BattleData.my_history などのリストの代わりに使う。
+    append, len, 添字 (負の添字とスライスを含む), 反復, reversed, clear に対応する。
+
+    取り出した OpInfo は毎回レコードから作るが、攻撃の resp への書き込みはレコードに反映される。
+    ただし最後に append() した OpInfo はそのオブジェクト自体を返す (リストと同じく、呼び出し元が持っている op と
+    history[-1] は同じオブジェクト)。その resp は次の append() か flush() でレコードに書き込む。
+    """
+
+    def __init__(self, records: np.ndarray, length: np.ndarray):
+        """
+        records は HISTORY_DTYPE の 1 次元のビュー、 length は長さを格納する 0 次元のビュー。
+        """
+        self._records = records
+        self._length = length
+        # このビューで最後に append() した操作 (まだ resp をレコードに書き込んでいないかもしれない)
+        self._tail: Optional[OpInfo] = None
+
+    def __len__(self) -> int:
+        return int(self._length)
+
+    def _op(self, i: int) -> OpInfo:
+        if self._tail is not None and i == len(self) - 1:
+            return self._tail
+        rec = self._records[i]
+        if rec['kind'] == codec.KIND_ATTACK:
+            return OpInfo(_PackedAttackInfo(rec), turn_count=int(rec['turn']))
+        return codec.read_op(rec)
+
+    def __getitem__(self, i: Union[int, slice]) -> Union[OpInfo, List[OpInfo]]:
+        n = len(self)
+        if isinstance(i, slice):
+            return [self._op(j) for j in range(*i.indices(n))]
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("history index out of range")
+        return self._op(i)
+
+    def __iter__(self) -> Iterator[OpInfo]:
+        return (self._op(i) for i in range(len(self)))
+
+    def __reversed__(self) -> Iterator[OpInfo]:
+        return (self._op(i) for i in reversed(range(len(self))))
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (list, PackedHistory)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def flush(self) -> None:
+        """
+        最後に append() した攻撃の resp をレコードに書き込む。
+        """
+        if self._tail is not None and self._tail.is_attack():
+            self._records[len(self) - 1]['resp'] = codec.response_code(self._tail.detail.resp)
+
+    def append(self, op: OpInfo) -> None:
+        self.flush()
+        n = len(self)
+        if n >= len(self._records):
+            raise IndexError("history arena is full (max_history = %d)" % len(self._records))
+        rec = self._records[n]
+        rec['turn'] = op.turn_count
+        codec.write_op(rec, op)
+        self._length[...] = n + 1
+        self._tail = op
+
+    def extend(self, ops: List[OpInfo]) -> None:
+        for op in ops:
+            self.append(op)
+
+    def clear(self) -> None:
+        self._length[...] = 0
+        self._tail = None
+
+
+def _pack_confirmed(records: np.ndarray, confirmed: ConfirmedEnemies) -> None:
+    packed = snapshot.confirmed_records(confirmed)
+    if len(packed) > len(records):
+        raise ValueError("too many confirmed enemies to pack: %d" % len(packed))
+    records['cell'] = codec.NO_CELL
+    records[:len(packed)] = packed
+
+
+def _unpack_confirmed(confirmed: ConfirmedEnemies, records: np.ndarray) -> None:
+    snapshot.restore_confirmed(confirmed, records[records['cell'] != codec.NO_CELL])
+
+
+class CompactBattleData(BattleData):
+    """
+    CompactArena の 1 スロットのビューとしての BattleData (shmbatch.SharedBattleData と同じ考え方)。
+    盤面・確率・exposure・生存数・tracking_cell・操作の歴史の読み書きはそのままアリーナに反映される。
+    confirmed と exposed はビューを作ったときにアリーナから復元し、 pack() でアリーナに書き戻す (PackedHistory の最後の操作も同様)。
+    """
+
+    def __init__(self, state: np.ndarray, history: np.ndarray):
+        """
+        state は STATE_DTYPE の 0 次元のビュー、 history は HISTORY_DTYPE の (2, max_history) のビュー。
+        """
+        self._state = state
+        self.my_grid = state['my_grid']
+        self.opponent_grid = state['opponent_grid']
+        self.prob = state['prob']
+        self.exposure = state['exposure']
+        self.my_history = PackedHistory(history[codec.SIDE_ME], state['history_len'][codec.SIDE_ME, ...])
+        self.opponent_history = PackedHistory(history[codec.SIDE_OPPONENT],
+                                              state['history_len'][codec.SIDE_OPPONENT, ...])
+        self.confirmed = ConfirmedEnemies(self.opponent_grid)
+        self.exposed = ConfirmedEnemies()
+        _unpack_confirmed(self.confirmed, state['confirmed'])
+        _unpack_confirmed(self.exposed, state['exposed'])
+
+    def reset(self, opponent_initial_submarine_count: int) -> None:
+        """
+        BattleData(opponent_initial_submarine_count) と同じ初期状態にする。
+        """
+        self.my_grid[:, :] = 0
+        self.opponent_grid[:, :] = 0
+        self.prob[:, :] = opponent_initial_submarine_count / (ROW * COL)
+        self.exposure[:, :] = INITIAL_SUBMARINE_COUNT / (ROW * COL)
+        self.my_alive_count = INITIAL_SUBMARINE_COUNT
+        self.opponent_alive_count = opponent_initial_submarine_count
+        self.tracking_cell = None
+        self.my_history.clear()
+        self.opponent_history.clear()
+        self.confirmed.clear()
+        self.exposed.clear()
+        self.pack()
+
+    def pack(self) -> None:
+        """
+        confirmed と exposed、最後の操作の resp をアリーナに書き戻す。
+        """
+        self.my_history.flush()
+        self.opponent_history.flush()
+        _pack_confirmed(self._state['confirmed'], self.confirmed)
+        _pack_confirmed(self._state['exposed'], self.exposed)
+
+    @property
+    def my_alive_count(self) -> int:
+        return int(self._state['my_alive'])
+
+    @my_alive_count.setter
+    def my_alive_count(self, value: int) -> None:
+        self._state['my_alive'] = value
+
+    @property
+    def opponent_alive_count(self) -> int:
+        return int(self._state['opp_alive'])
+
+    @opponent_alive_count.setter
+    def opponent_alive_count(self, value: int) -> None:
+        self._state['opp_alive'] = value
+
+    @property
+    def tracking_cell(self) -> Optional[Pos]:
+        return codec.pos_of(int(self._state['tracking']))
+
+    @tracking_cell.setter
+    def tracking_cell(self, value: Optional[Pos]) -> None:
+        self._state['tracking'] = codec.cell_index(value)
+
+
+class CompactArena:
+    """
+    capacity 個のゲームの状態を持つアリーナ。スロットは allocate() で確保し、 release() で解放する。
+    """
+
+    def __init__(self, capacity: int, max_history: int = DEFAULT_MAX_HISTORY):
+        self.capacity = capacity
+        self.max_history = max_history
+        self.state = np.zeros(capacity, dtype=STATE_DTYPE)
+        self.history = np.zeros((capacity, 2, max_history), dtype=HISTORY_DTYPE)
+        self._free = list(range(capacity - 1, -1, -1))
+
+    @property
+    def nbytes(self) -> int:
+        return self.state.nbytes + self.history.nbytes
+
+    def __len__(self) -> int:
+        """
+        使用中のスロット数。
+        """
+        return self.capacity - len(self._free)
+
+    def allocate(self, opponent_initial_submarine_count: int) -> int:
+        """
+        空いているスロットを初期状態にして、その番号を返す。空きが無ければ IndexError を投げる。
+        """
+        if len(self._free) <= 0:
+            raise IndexError("arena is full (capacity = %d)" % self.capacity)
+        slot = self._free.pop()
+        self.view(slot).reset(opponent_initial_submarine_count)
+        return slot
+
+    def release(self, slot: int) -> None:
+        self._free.append(slot)
+
+    def view(self, slot: int) -> CompactBattleData:
+        return CompactBattleData(self.state[slot], self.history[slot])
+
+    def put(self, slot: int, data: BattleData) -> None:
+        """
+        通常の BattleData の内容を slot に書き込む。確率・exposure は float32 に丸められる。
+        """
+        view = self.view(slot)
+        view.my_grid[:, :] = data.my_grid
+        view.opponent_grid[:, :] = data.opponent_grid
+        view.prob[:, :] = data.prob
+        view.exposure[:, :] = data.exposure
+        view.my_alive_count = data.my_alive_count
+        view.opponent_alive_count = data.opponent_alive_count
+        view.tracking_cell = data.tracking_cell
+        view.my_history.clear()
+        view.my_history.extend(data.my_history)
+        view.opponent_history.clear()
+        view.opponent_history.extend(data.opponent_history)
+        view.confirmed = data.confirmed
+        view.exposed = data.exposed
+        view.pack()
+
+
+class MemoryReport(NamedTuple):
+    games: int
+    plain_bytes: int  # BattleData (自軍側) の合計
+    compact_bytes: int  # CompactArena の合計
+
+    def format_summary(self) -> str:
+        return ("%d games: BattleData %.0f bytes/game, CompactArena %.0f bytes/game (%.1fx smaller)" %
+                (self.games, self.plain_bytes / self.games, self.compact_bytes / self.games,
+                 self.plain_bytes / max(1, self.compact_bytes)))
+
+
+def measure_memory(specs: List[selfplay.GameSpec]) -> MemoryReport:
+    """
+    specs のゲームを最後まで対戦させ、終局時の自軍側の状態を保持するのに必要なメモリを比較する。
+    BattleData は tracemalloc で複製に要したメモリを、 CompactArena は配列のバイト数を数える。
+    """
+    finished = []
+    for spec in specs:
+        me = BattleData(spec.opponent_count)
+        turns = np.zeros(spec.max_turns, dtype=codec.TURN_DTYPE)
+        selfplay._play(spec, me, BattleData(INITIAL_SUBMARINE_COUNT), turns)
+        finished.append(me)
+
+    arena = CompactArena(len(finished), max(DEFAULT_MAX_HISTORY, max(s.max_turns for s in specs) // 2 + 1))
+    for data in finished:
+        arena.put(arena.allocate(data.opponent_alive_count), data)
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        copies = [copy.deepcopy(data) for data in finished]
+        plain_bytes = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    del copies
+    return MemoryReport(len(finished), plain_bytes, arena.nbytes)
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 1000)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    root_seed = io.int_option(argv, "--seed", 0)
+
+    selfplay.configure_headless()
+    report = measure_memory(selfplay.make_specs(game_count, root_seed, opponent_count=opponent_count))
+    print(report.format_summary())
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,14 @@
+import os
+import shutil
+import tempfile
+
+from . import tablecache
+
+# テストで構築した表のキャッシュはホームディレクトリではなく一時ディレクトリに書く
+# (ワーカープロセスにも引き継がれるように、環境変数で設定する)
+_cache_dir = tempfile.mkdtemp(prefix="submarine-destroyer-cache-")
+os.environ[tablecache.CACHE_DIR_ENV] = _cache_dir
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_cache_dir, ignore_errors=True)
@@ -0,0 +1,342 @@
+"""
+終盤 (敵軍が 1 隻、自軍が MAX_MY_COUNT 隻以下) の、完全情報ゲームとみなした近似解。
+
+状態は (自軍の潜水艦の位置と HP の組, 敵艦の位置と HP, 手番) で、全部で 2 * (FLEETS + 1) * (ENEMIES + 1) 通り。
+敵艦の位置が分かっている終盤では、お互いの位置を知っている完全情報ゲームとみなせる
+(敵軍に自軍の位置を知られているとみなすので、自軍にとっては悲観的な評価になる)。
+このゲームを後退解析 (全状態の minimax の値の反復) で解き、結果をディスクにキャッシュする。
+一度表ができれば、終盤の判断は表を引くだけで求まる。
+
+値は自軍から見たもので、 WIN - d は d 手後に勝つ (敵艦を沈める)、 -(WIN - d) は d 手後に負ける、 0 は引き分け
+(お互いに決着を避け続けられる) を表す。勝ちは早いほど、負けは遅いほど大きい値になる。
+
+実際の対戦では敵艦の正確な位置は分からないので、 suggest() は確率グリッドから求めた敵艦の位置の分布の下で、
+各操作の直後の値の期待値を比べる。敵艦の HP は、位置が確定している艦 (BattleData.confirmed) なら命中の回数から
+分かっている値、それ以外は 1..INITIAL_HP で一様とする。
+完全情報の仮定は近似なので、実際の対戦での最善手である保証は無い。
+自己対戦の A/B (sprt, 1500 組ずつ、敵軍 4 隻と 2 隻) では、この表に従っても全てのゲームの勝敗が変わらなかった
+(表が勝ちを見込む局面では、既存の「位置が明らかな敵艦への攻撃」と同じ結果になる) ので、
+logic.suggest_my_op() と server からは使わない。信念状態のゲームとして解くなどして改善を確認できたら組み込むこと。
+"""
+from itertools import combinations, product
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import tablecache
+from .model import OpInfo, AttackInfo, MoveInfo, BattleData, ConfirmedEnemies
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_HP
+from .rule import set_of_around_cells
+
+# 表を作る自軍の潜水艦の数の上限
+MAX_MY_COUNT = 2
+# 解き方や状態の表し方を変更したらインクリメントすること (キャッシュが無効になる)
+SOLVER_VERSION = 1
+
+# 勝ちの値 (WIN - 手数)。手数は必ず WIN より小さい。
+WIN = 1000
+# 値の反復の回数の上限
+MAX_ITERATIONS = 500
+
+CELLS = ROW * COL
+# 敵艦の状態の数 (位置 * HP) と、敵艦が沈んだことを表す番号
+ENEMIES = CELLS * INITIAL_HP
+ENEMY_DEAD = ENEMIES
+
+Fleet = Tuple[Tuple[int, int], ...]  # 自軍の潜水艦の (マス番号, HP) の組をマス番号の昇順に並べたもの
+
+
+def _around(cell: int) -> List[int]:
+    return sorted(p.row * COL + p.col for p in set_of_around_cells(Pos(cell // COL, cell % COL)))
+
+
+def _move_targets(cell: int) -> List[int]:
+    """
+    cell から上下左右に 1 または 2 マス移動した先のマス番号 (盤面外を除く)。
+    """
+    y, x = divmod(cell, COL)
+    targets = []
+    for d in (-2, -1, 1, 2):
+        for dy, dx in ((d, 0), (0, d)):
+            if 0 <= y + dy < ROW and 0 <= x + dx < COL:
+                targets.append((y + dy) * COL + (x + dx))
+    return sorted(targets)
+
+
+def enemy_index(cell: int, hp: int) -> int:
+    return cell * INITIAL_HP + (hp - 1)
+
+
+def all_fleets() -> List[Fleet]:
+    """
+    1 隻以上 MAX_MY_COUNT 隻以下の自軍の潜水艦の位置と HP の組を全て列挙する。
+    """
+    return [
+        tuple(zip(cells, hps))
+        for n in range(1, MAX_MY_COUNT + 1)
+        for cells in combinations(range(CELLS), n)
+        for hps in product(range(1, INITIAL_HP + 1), repeat=n)
+    ]
+
+
+def _pad(rows: List[List[int]], fill: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    長さの異なるリストのリストを fill で詰めた 2 次元配列と、有効な要素を表す bool 配列にする。
+    """
+    width = max(len(r) for r in rows)
+    padded = np.full((len(rows), width), fill, dtype=np.int64)
+    valid = np.zeros((len(rows), width), dtype=bool)
+    for i, r in enumerate(rows):
+        padded[i, :len(r)] = r
+        valid[i, :len(r)] = True
+    return padded, valid
+
+
+class _Moves(NamedTuple):
+    """
+    各状態からの合法手と遷移先。
+    """
+    my_move_from: np.ndarray  # (F, Km) 自軍の移動元のマス番号
+    my_move_to: np.ndarray  # (F, Km) 自軍の移動先のマス番号
+    my_move_next: np.ndarray  # (F, Km) 移動後の自軍の番号
+    my_move_valid: np.ndarray
+    my_attack: np.ndarray  # (F, Ka) 自軍の攻撃先のマス番号
+    my_attack_valid: np.ndarray
+    enemy_move: np.ndarray  # (E, Km') 移動後の敵艦の番号
+    enemy_move_valid: np.ndarray
+    enemy_attack: np.ndarray  # (E, Ka') 敵艦の攻撃先のマス番号
+    enemy_attack_valid: np.ndarray
+    hit_fleet: np.ndarray  # (F + 1, CELLS) 敵艦にマスを攻撃された後の自軍の番号
+    hit_enemy: np.ndarray  # (E + 1, CELLS) 自軍にマスを攻撃された後の敵艦の番号
+
+
+def _build_moves(fleets: List[Fleet], index: Dict[Fleet, int]) -> _Moves:
+    lost = len(fleets)
+    around = [_around(c) for c in range(CELLS)]
+    targets = [_move_targets(c) for c in range(CELLS)]
+
+    move_from, move_to, move_next, attacks = [], [], [], []
+    hit_fleet = np.empty((lost + 1, CELLS), dtype=np.int64)
+    hit_fleet[lost] = lost
+    for f, fleet in enumerate(fleets):
+        cells = [c for c, _ in fleet]
+        froms, tos, nexts = [], [], []
+        for i, (c, hp) in enumerate(fleet):
+            for d in targets[c]:
+                if d not in cells:
+                    froms.append(c)
+                    tos.append(d)
+                    nexts.append(index[tuple(sorted(fleet[:i] + ((d, hp),) + fleet[i + 1:]))])
+        move_from.append(froms)
+        move_to.append(tos)
+        move_next.append(nexts)
+        attacks.append(sorted(set(a for c in cells for a in around[c]) - set(cells)))
+
+        hit_fleet[f] = f
+        for i, (c, hp) in enumerate(fleet):
+            rest = fleet[:i] + fleet[i + 1:]
+            damaged = rest if hp <= 1 else tuple(sorted(rest + ((c, hp - 1),)))
+            hit_fleet[f, c] = index[damaged] if len(damaged) > 0 else lost
+
+    enemy_moves, enemy_attacks = [], []
+    hit_enemy = np.empty((ENEMIES + 1, CELLS), dtype=np.int64)
+    hit_enemy[ENEMY_DEAD] = ENEMY_DEAD
+    for c, hp in product(range(CELLS), range(1, INITIAL_HP + 1)):
+        e = enemy_index(c, hp)
+        enemy_moves.append([enemy_index(d, hp) for d in targets[c]])
+        enemy_attacks.append(around[c])
+        hit_enemy[e] = e
+        hit_enemy[e, c] = e - 1 if hp > 1 else ENEMY_DEAD
+
+    my_move_from, my_move_valid = _pad(move_from, 0)
+    my_move_to, _ = _pad(move_to, 0)
+    my_move_next, _ = _pad(move_next, lost)
+    my_attack, my_attack_valid = _pad(attacks, 0)
+    enemy_move, enemy_move_valid = _pad(enemy_moves, ENEMY_DEAD)
+    enemy_attack, enemy_attack_valid = _pad(enemy_attacks, 0)
+    return _Moves(my_move_from, my_move_to, my_move_next, my_move_valid, my_attack, my_attack_valid,
+                  enemy_move, enemy_move_valid, enemy_attack, enemy_attack_valid, hit_fleet, hit_enemy)
+
+
+def _decay(v: np.ndarray) -> np.ndarray:
+    """
+    1 手前の状態から見た値にする (勝ち・負けまでの手数を 1 増やす)。
+    """
+    return v - np.sign(v)
+
+
+def solve(moves: _Moves, fleet_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    全状態の値を求める。戻り値は (自軍の手番の値, 敵軍の手番の値) で、どちらも shape (F + 1, E + 1) の int32 配列。
+    添字 F は自軍の全滅、 E (= ENEMY_DEAD) は敵艦の撃沈を表す。
+    """
+    lost = fleet_count
+    shape = (fleet_count + 1, ENEMIES + 1)
+    mine = np.zeros(shape, dtype=np.int32)
+    theirs = np.zeros(shape, dtype=np.int32)
+    for v in (mine, theirs):
+        v[lost, :] = -WIN
+        v[:, ENEMY_DEAD] = WIN
+
+    f_idx = np.arange(fleet_count)[:, None, None]
+    e_idx = np.arange(ENEMIES)[None, :, None]
+    # 自軍の攻撃後の敵艦の番号: (F, Ka, E)
+    attacked_enemy = moves.hit_enemy[:ENEMIES].T[moves.my_attack]
+    # 敵艦の攻撃後の自軍の番号: (F, E, Ka')
+    attacked_fleet = moves.hit_fleet[:fleet_count][:, moves.enemy_attack]
+
+    for _ in range(MAX_ITERATIONS):
+        # 自軍の手番: 移動と攻撃の遷移先 (敵軍の手番) の最大値
+        move_values = np.where(moves.my_move_valid[:, :, None], theirs[moves.my_move_next][:, :, :ENEMIES], -WIN - 1)
+        attack_values = np.where(moves.my_attack_valid[:, :, None], theirs[f_idx, attacked_enemy], -WIN - 1)
+        new_mine = _decay(np.maximum(move_values.max(axis=1), attack_values.max(axis=1)))
+
+        # 敵軍の手番: 移動と攻撃の遷移先 (自軍の手番) の最小値
+        move_values = np.where(moves.enemy_move_valid[None], mine[:fleet_count][:, moves.enemy_move], WIN + 1)
+        attack_values = np.where(moves.enemy_attack_valid[None], mine[attacked_fleet, e_idx], WIN + 1)
+        new_theirs = _decay(np.minimum(move_values.min(axis=2), attack_values.min(axis=2)))
+
+        if np.array_equal(new_mine, mine[:lost, :ENEMIES]) and np.array_equal(new_theirs, theirs[:lost, :ENEMIES]):
+            break
+        mine[:lost, :ENEMIES] = new_mine
+        theirs[:lost, :ENEMIES] = new_theirs
+    return mine, theirs
+
+
+class EndgameTable:
+    """
+    終盤の全状態の値の表。
+    """
+
+    def __init__(self, mine: np.ndarray, theirs: np.ndarray, moves: Optional[_Moves] = None):
+        """
+        moves (遷移表) を省略すると作り直す。
+        """
+        self.fleets = all_fleets()
+        self.index: Dict[Fleet, int] = {fleet: i for i, fleet in enumerate(self.fleets)}
+        self.moves = moves if moves is not None else _build_moves(self.fleets, self.index)
+        self.mine = mine
+        self.theirs = theirs
+
+    @staticmethod
+    def build() -> 'EndgameTable':
+        fleets = all_fleets()
+        moves = _build_moves(fleets, {fleet: i for i, fleet in enumerate(fleets)})
+        return EndgameTable(*solve(moves, len(fleets)), moves)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        キャッシュに保存する配列 (値の表と遷移表)。
+        """
+        return dict(self.moves._asdict(), mine=self.mine, theirs=self.theirs)
+
+    def fleet_of(self, my_grid: np.ndarray) -> Optional[int]:
+        """
+        自軍の配置グリッドに対応する番号。表の範囲外 (隻数が多すぎるなど) なら None。
+        """
+        fleet = tuple((int(c), int(hp)) for c, hp in enumerate(np.asarray(my_grid).ravel()) if hp > 0)
+        return self.index.get(fleet)
+
+    def value(self, my_grid: np.ndarray, enemy_cell: Pos, enemy_hp: int, my_turn: bool = True) -> int:
+        f = self.fleet_of(my_grid)
+        if f is None:
+            raise ValueError("fleet is out of the endgame table")
+        e = enemy_index(enemy_cell.row * COL + enemy_cell.col, enemy_hp)
+        return int((self.mine if my_turn else self.theirs)[f, e])
+
+    def evaluate_ops(self, my_grid: np.ndarray, enemy_dist: np.ndarray) -> List[Tuple[OpInfo, float, float]]:
+        """
+        自軍の手番で、自軍の各合法手について (操作, 勝率, 値の期待値) を返す。
+        enemy_dist は (ENEMIES,) の敵艦の状態の分布。勝率は操作の後にお互いが最善を尽くしたとき勝つ確率。
+        操作の turn_count は 0 にしてある。
+        """
+        f = self.fleet_of(my_grid)
+        if f is None:
+            raise ValueError("fleet is out of the endgame table")
+        m = self.moves
+        support = np.flatnonzero(enemy_dist > 0)
+        weights = enemy_dist[support]
+
+        results = []
+        for k in np.flatnonzero(m.my_attack_valid[f]):
+            cell = int(m.my_attack[f, k])
+            values = self.theirs[f, m.hit_enemy[support, cell]]
+            op = OpInfo(AttackInfo(attack_pos=Pos(cell // COL, cell % COL)), turn_count=0)
+            results.append((op, float(weights @ (values > 0)), float(weights @ values)))
+        for k in np.flatnonzero(m.my_move_valid[f]):
+            src, dst = int(m.my_move_from[f, k]), int(m.my_move_to[f, k])
+            values = self.theirs[m.my_move_next[f, k], support]
+            op = OpInfo(MoveInfo(fromPos=Pos(src // COL, src % COL), dirY=dst // COL - src // COL,
+                                 dirX=dst % COL - src % COL), turn_count=0)
+            results.append((op, float(weights @ (values > 0)), float(weights @ values)))
+        return results
+
+
+def load_table(cache_dir: tablecache.CacheDir = tablecache.CONFIGURED) -> EndgameTable:
+    """
+    キャッシュ (tablecache) があればメモリマップし、無ければ EndgameTable.build() で作ってキャッシュに保存する。
+    値の表と一緒に遷移表もキャッシュするので、読み込み時に _build_moves() を行う必要は無い。
+    cache_dir が None ならキャッシュを使わない。指定しなければ tablecache.configured_cache_dir() を使う。
+    """
+    arrays = tablecache.load("endgame", SOLVER_VERSION, lambda: EndgameTable.build().arrays(),
+                             {"max_my_count": MAX_MY_COUNT, "win": WIN}, cache_dir)
+    return EndgameTable(arrays["mine"], arrays["theirs"], _Moves(**{f: arrays[f] for f in _Moves._fields}))
+
+
+_table: Optional[EndgameTable] = None
+
+
+def table() -> EndgameTable:
+    """
+    load_table() の結果。読み込みはプロセス内で一度だけ行う。
+    """
+    global _table
+    if _table is None:
+        _table = load_table()
+    return _table
+
+
+def applies(data: BattleData) -> bool:
+    """
+    data が終盤の表で扱える状態 (敵艦の位置が明らかで、敵軍が 1 隻、自軍が MAX_MY_COUNT 隻以下) なら True。
+    """
+    return (data.tracking_cell is not None and data.opponent_alive_count == 1
+            and 1 <= data.my_alive_count <= MAX_MY_COUNT)
+
+
+def enemy_distribution(prob: np.ndarray, confirmed: Optional[ConfirmedEnemies] = None) -> np.ndarray:
+    """
+    確率グリッド (敵艦が 1 隻のときの各マスの存在確率) から、敵艦の状態 (位置, HP) の分布を作る。
+    confirmed に登録されている (位置が確定している) マスの HP は、命中の回数から分かっているその艦の HP とする。
+    それ以外のマスの HP は 1..INITIAL_HP で一様とする。
+    """
+    p = np.clip(np.asarray(prob, dtype=np.float64).ravel(), 0.0, None)
+    total = p.sum()
+    if total <= 0.0:
+        raise ValueError("prob has no mass")
+    dist = np.repeat(p / total / INITIAL_HP, INITIAL_HP)
+    for enemy in (confirmed if confirmed is not None else ()):
+        cell = enemy.pos.row * COL + enemy.pos.col
+        dist[enemy_index(cell, 1):enemy_index(cell, INITIAL_HP) + 1] = 0.0
+        dist[enemy_index(cell, enemy.hp)] = p[cell] / total
+    return dist
+
+
+def suggest(data: BattleData, cur_turn_count: int) -> Optional[Tuple[OpInfo, float]]:
+    """
+    終盤の表に基づいて (操作, 勝率) を返す。
+    勝率が最も高い操作を選び、同じなら値の期待値 (早く勝てる・負けるのが遅い) が大きい操作を選ぶ。
+    表で扱えない状態や、どの操作でも勝ちが見込めない (引き分けか負けしかない) 状態なら None を返す。
+    完全情報ゲームとしての終盤はほとんどが引き分け (逃げ続けられる) なので、その中での手の選択は既存のロジックに任せる。
+    """
+    if not applies(data) or data.prob.sum() <= 0.0:
+        return None
+    t = table()
+    if t.fleet_of(data.my_grid) is None:
+        return None
+    ops = t.evaluate_ops(data.my_grid, enemy_distribution(data.prob, data.confirmed))
+    op, win_prob, _ = max(ops, key=lambda r: (round(r[1], 9), r[2]))
+    if win_prob <= 0.0:
+        return None
+    return OpInfo(op.detail, turn_count=cur_turn_count), win_prob
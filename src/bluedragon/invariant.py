@@ -0,0 +1,173 @@
+"""
+対戦データの不変条件の検査。
+
+検査の頻度は ValidationLevel で切り替える。
+    Full    ... 全ての呼び出しで検査する。テスト・デバッグ用 (デフォルト)。
+    Sampled ... 呼び出しのうち sample_rate の割合だけ検査する。カナリア用。
+    Off     ... 一切検査しない。本番のシミュレーション用。
+"""
+import enum
+import hashlib
+import math
+import random
+from typing import Iterable, List, Sequence, Set
+
+import numpy as np
+
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_HP, INITIAL_SUBMARINE_COUNT
+
+
+class ValidationLevel(enum.Enum):
+    Full = enum.auto()
+    Sampled = enum.auto()
+    Off = enum.auto()
+
+
+class InvariantError(AssertionError):
+    """
+    不変条件が破られていた場合に送出される。
+    """
+    pass
+
+
+DEFAULT_SAMPLE_RATE = 0.01
+
+_level: ValidationLevel = ValidationLevel.Full
+_sample_rate: float = DEFAULT_SAMPLE_RATE
+# Sampled で検査するかどうかを決めるための乱数。対戦の乱数列には影響させない。
+_sampler = random.Random()
+# 検査済みの初期配置候補 (内容のハッシュの集合)
+_validated_placements: Set[str] = set()
+
+
+def set_validation_level(level: ValidationLevel, sample_rate: float = DEFAULT_SAMPLE_RATE) -> None:
+    global _level, _sample_rate
+    assert 0.0 <= sample_rate <= 1.0
+    _level = level
+    _sample_rate = sample_rate
+
+
+def get_validation_level() -> ValidationLevel:
+    return _level
+
+
+def parse_validation_level(s: str) -> ValidationLevel:
+    """
+    "full" "sampled" "off" (大文字小文字は区別しない) を ValidationLevel に変換する。
+    """
+    for level in ValidationLevel:
+        if level.name.lower() == s.strip().lower():
+            return level
+    raise ValueError("Unknown validation level: " + s)
+
+
+def should_check() -> bool:
+    """
+    現在の検査レベルにおいて、今回の呼び出しで検査を行うべきなら True を返す。
+    """
+    if _level is ValidationLevel.Full:
+        return True
+    if _level is ValidationLevel.Off:
+        return False
+    return _sampler.random() < _sample_rate
+
+
+def _fail(msg: str) -> None:
+    raise InvariantError(msg)
+
+
+def _tolerance(prob: np.ndarray) -> float:
+    """
+    確率グリッド全体の総和の許容誤差。 float64 では 1e-7 で、
+    float32 など精度の低い確率グリッドでも誤検出しないように、 dtype の精度とマス数に合わせて広げる。
+    """
+    return max(1e-7, float(np.finfo(prob.dtype).eps) * prob.size * 4)
+
+
+def check_prob_sum(prob: np.ndarray, expected: float) -> None:
+    """
+    全マスの確率の総和は敵軍の生きている隻数に等しいはず。
+    """
+    if not should_check():
+        return
+    rel_tol = _tolerance(prob)
+    s = float(np.sum(prob))
+    if not math.isclose(s, expected, rel_tol=rel_tol, abs_tol=rel_tol):
+        _fail("sum of prob (%g) != %g" % (s, expected))
+
+
+def check_sucked_one_submarine(prob_sum: float, prob: np.ndarray) -> None:
+    """
+    prob から一隻分の確率を吸い出したとき、その総和は 1.0 に等しいはず。
+    許容誤差は check_prob_sum() と同じく prob の dtype に合わせる (float64 なら 1e-7)。
+    """
+    if not should_check():
+        return
+    if not math.isclose(1.0, prob_sum, rel_tol=_tolerance(prob)):
+        _fail("sucked prob (%g) != 1.0" % prob_sum)
+
+
+def check_no_prob_lost(value: float) -> None:
+    """
+    確率を分配する先のマスが無いとき、分配するはずだった確率は 0 のはず。
+    """
+    if not should_check():
+        return
+    if not math.isclose(0.0, value, abs_tol=1e-7):
+        _fail("no destination for prob (%g)" % value)
+
+
+def check_attackable(attack_to: Pos, attackable_cells: Iterable[Pos]) -> None:
+    if not should_check():
+        return
+    if attack_to not in attackable_cells:
+        _fail("%s is not attackable" % attack_to.code())
+
+
+def check_my_move(my_grid: np.ndarray, from_pos: Pos, dirY: int, dirX: int) -> None:
+    """
+    自軍の移動の正当性: 移動元に自軍がいて、移動先が空いていて、縦横に1〜2マスの移動であること。
+    """
+    if not should_check():
+        return
+    row, col = from_pos
+    if not (dirY == 0 or dirX == 0) or (abs(dirY) + abs(dirX)) not in (1, 2):
+        _fail("illegal move direction: (%d, %d)" % (dirY, dirX))
+    if my_grid[row, col] <= 0:
+        _fail("no submarine at %s" % from_pos.code())
+    if not (0 <= row + dirY < ROW and 0 <= col + dirX < COL) or my_grid[row + dirY, col + dirX] != 0:
+        _fail("cannot move from %s by (%d, %d)" % (from_pos.code(), dirY, dirX))
+
+
+def validate_placement(matrix: Sequence[Sequence[int]]) -> None:
+    """
+    初期配置の行列が ROW x COL で、各マスが 0 か INITIAL_HP で、隻数が INITIAL_SUBMARINE_COUNT であることを検査する。
+    """
+    if len(matrix) != ROW or not all(len(row) == COL for row in matrix):
+        _fail("placement must be %dx%d" % (ROW, COL))
+    hp_sum = 0
+    for row in matrix:
+        for cell in row:
+            if not (cell == 0 or cell == INITIAL_HP):
+                _fail("illegal HP in placement: %d" % cell)
+            hp_sum += cell
+    if hp_sum != (INITIAL_HP * INITIAL_SUBMARINE_COUNT):
+        _fail("illegal number of submarines in placement")
+
+
+def validate_placements_once(candidates: List) -> bool:
+    """
+    初期配置候補のリストを検査する。同じ内容のリストはプロセス内で一度だけ検査する。
+    (リストの id() は破棄された後に別のリストで再利用されうるので、内容のハッシュで覚えておく)
+    検査を行った場合は True を返す。
+    """
+    if _level is ValidationLevel.Off:
+        return False
+    key = hashlib.sha1(np.ascontiguousarray(np.asarray(candidates, dtype=np.int64)).tobytes()).hexdigest()
+    if key in _validated_placements:
+        return False
+    for mat in candidates:
+        validate_placement(mat)
+    _validated_placements.add(key)
+    return True
@@ -1,5 +1,10 @@
+from contextlib import contextmanager
 from logging import getLogger, Logger
-from typing import Any, Optional
+import sys
+import threading
+from typing import Any, Iterator, List, NamedTuple, Optional
+
+import numpy as np
 
 from .model import OpInfo, AttackInfo, MoveInfo, Response, BattleData
 from .rule import Pos
@@ -7,6 +12,74 @@ from .rule import ROW, COL
 
 thisFileLogger = getLogger(__name__)
 
+# True の間は端末への出力を抑制する (ログファイルへの書き込みは行う)。 自己対戦などで使う。
+_is_silent = False
+
+
+def set_silent(silent: bool) -> None:
+    global _is_silent
+    _is_silent = silent
+
+
+@contextmanager
+def silenced():
+    """
+    with ブロックの中だけ端末への出力を抑制する。
+    """
+    global _is_silent
+    prev = _is_silent
+    _is_silent = True
+    try:
+        yield
+    finally:
+        _is_silent = prev
+
+
+# captured() の中で貯めている出力 (スレッドごと)
+_thread_local = threading.local()
+
+
+class Message(NamedTuple):
+    """
+    captured() で貯めた出力の 1 件。 kind は "info", "success", "warn", "fail" のいずれか。
+    """
+    kind: str
+    msg: Any
+    logger: Optional[Logger]
+    end: str
+
+
+@contextmanager
+def captured() -> Iterator[List[Message]]:
+    """
+    with ブロックの中では、このスレッドからの info(), success(), warn(), fail() の出力を
+    端末にもログにも書かずにリストに貯める (他のスレッドには影響しない)。貯めた出力は replay() で書き出せる。
+    バックグラウンドのスレッドで、結果を使うかどうか分からない計算をするときに使う。
+    """
+    prev = getattr(_thread_local, "messages", None)
+    messages: List[Message] = list()
+    _thread_local.messages = messages
+    try:
+        yield messages
+    finally:
+        _thread_local.messages = prev
+
+
+def _capture(kind: str, msg: Any, logger: Optional[Logger], end: str) -> bool:
+    messages = getattr(_thread_local, "messages", None)
+    if messages is None:
+        return False
+    messages.append(Message(kind, msg, logger, end))
+    return True
+
+
+def replay(messages: List[Message]) -> None:
+    """
+    captured() で貯めた出力を、このスレッドから改めて書き出す。
+    """
+    for m in messages:
+        _WRITERS[m.kind](m.msg, m.logger, end=m.end)
+
 
 class Color:
     HEADER = '\033[95m'
@@ -41,27 +114,42 @@ class Color:
 
 
 def info(msg: Any, logger: Optional[Logger], end='\n'):
+    if _capture("info", msg, logger, end):
+        return
     if logger is not None:
         logger.info("%s", msg)
-    print(Color.INFO_CYAN + Color.BOLD + "[Info] " + Color.END + str(msg), end=end)
+    if not _is_silent:
+        print(Color.INFO_CYAN + Color.BOLD + "[Info] " + Color.END + str(msg), end=end)
 
 
 def success(msg: Any, logger: Optional[Logger], end='\n'):
+    if _capture("success", msg, logger, end):
+        return
     if logger is not None:
         logger.info("%s", msg)
-    print(Color.OK_GREEN + Color.BOLD + "[Success] " + Color.END + str(msg), end=end)
+    if not _is_silent:
+        print(Color.OK_GREEN + Color.BOLD + "[Success] " + Color.END + str(msg), end=end)
 
 
 def warn(msg: Any, logger: Optional[Logger], end='\n'):
+    if _capture("warn", msg, logger, end):
+        return
     if logger is not None:
         logger.warning("%s", msg)
-    print(Color.WARNING + Color.BOLD + "[Warn] " + Color.END + str(msg), end=end)
+    if not _is_silent:
+        print(Color.WARNING + Color.BOLD + "[Warn] " + Color.END + str(msg), end=end)
 
 
 def fail(msg: Any, logger: Optional[Logger], end='\n'):
+    if _capture("fail", msg, logger, end):
+        return
     if logger is not None:
         logger.error("%s", msg)
-    print(Color.FAIL + Color.BOLD + "[Fail] " + Color.END + str(msg), end=end)
+    if not _is_silent:
+        print(Color.FAIL + Color.BOLD + "[Fail] " + Color.END + str(msg), end=end)
+
+
+_WRITERS = {"info": info, "success": success, "warn": warn, "fail": fail}
 
 
 def ask_yesno(message: str) -> bool:
@@ -86,62 +174,105 @@ def ask_yesno(message: str) -> bool:
             fail("Cannot parse to yes/no.", logger=None)
 
 
+def int_option(argv: List[str], name: str, default: int) -> int:
+    """
+    コマンドライン引数 argv から `name <integer>` 形式のオプションの値を取り出す。
+    オプションが無ければ default を返し、値が不正ならエラーを表示して終了する。
+    """
+    if name not in argv:
+        return default
+    i = argv.index(name) + 1
+    if i >= len(argv) or not argv[i].isdigit():
+        fail("`%s` オプションの値が不正です" % name, logger=None)
+        sys.exit(1)
+    return int(argv[i])
+
+
+def choice_option(argv: List[str], name: str, choices: List[str], default: str) -> str:
+    """
+    コマンドライン引数 argv から `name <value>` 形式のオプションの値を取り出す。 value は choices のどれか (小文字で比較する)。
+    オプションが無ければ default を返し、値が無いか choices に無ければエラーを表示して終了する。
+    """
+    if name not in argv:
+        return default
+    i = argv.index(name) + 1
+    if i >= len(argv) or argv[i].lower() not in choices:
+        fail("`%s` オプションの値が不正です (%s のどれかを指定してください)" % (name, " / ".join(choices)), logger=None)
+        sys.exit(1)
+    return argv[i].lower()
+
+
+def str_option(argv: List[str], name: str, default: Optional[str] = None) -> Optional[str]:
+    """
+    コマンドライン引数 argv から `name <value>` 形式のオプションの値を取り出す。
+    オプションが無ければ default を返し、値が無ければ (次の引数が別のオプションなら) エラーを表示して終了する。
+    """
+    if name not in argv:
+        return default
+    i = argv.index(name) + 1
+    if i >= len(argv) or argv[i].startswith("-"):
+        fail("`%s` オプションの値がありません" % name, logger=None)
+        sys.exit(1)
+    return argv[i]
+
+
 def newline():
     print()
 
 
-def dump_my_grid(data: BattleData):
-    grid = data.my_grid
-    gridString: str = ""
-
-    print(Color.HEADER + "   1  2  3  4  5" + Color.END)
-    gridString = gridString + "   1  2  3  4  5\n"
+def format_my_grid(grid: np.ndarray, color: bool = True) -> str:
+    """
+    自軍の配置グリッドを表示用の文字列 (末尾の改行を含む) にする。 color が False なら色の制御文字を含めない。
+    """
+    def header(s: str) -> str:
+        return Color.magenta(s) if color else s
 
+    lines = [header("   1  2  3  4  5")]
     for row in range(ROW):
-        print(Color.HEADER + chr(ord('A') + row) + Color.END, end='')
-        gridString = gridString + chr(ord('A') + row)
-        for col in range(COL):
-            c = (grid[row, col] if grid[row, col] > 0 else ".")
-            print(" ", c, end="")
-            gridString = gridString + "  " + str(c)
-        newline()
-        gridString = gridString + "\n"
+        lines.append(header(chr(ord('A') + row)) + "".join(
+            "  " + str(grid[row, col] if grid[row, col] > 0 else ".") for col in range(COL)))
+    return "\n".join(lines) + "\n"
 
-    thisFileLogger.info("\n" + gridString)
 
-
-def dump_my_submarine_pos_codes(data: BattleData):
-    print(Color.INFO_CYAN + "自軍の潜水艦の位置: " + Color.END, end='')
-    msg = "自軍の潜水艦の位置: "
-    for pos in data.set_of_my_submarine_positions():
-        print(pos.code(), end=' ')
-        msg = msg + pos.code() + " "
-    newline()
-    thisFileLogger.info(msg)
+def format_prob_grid(prob: np.ndarray) -> str:
+    return str(prob)
 
 
-def dump_battle_data(data: BattleData, should_show_my_positions: bool):
-    newline()
-    print("--------- Battle Data ---------")
-    # 確率グリッドの表示
-    print(data.prob)
-    thisFileLogger.info("\n%s", data.prob)
+def dump_my_grid(data: BattleData):
+    if not _is_silent:
+        sys.stdout.write(format_my_grid(data.my_grid))
+    thisFileLogger.info("\n" + format_my_grid(data.my_grid, color=False))
 
-    if should_show_my_positions:
-        # 自軍の配置グリッドの表示
-        dump_my_grid(data)
 
-        # 自軍の潜水艦の位置の表示
-        dump_my_submarine_pos_codes(data)
+def dump_my_submarine_pos_codes(data: BattleData):
+    codes = " ".join(pos.code() for pos in sorted(data.set_of_my_submarine_positions()))
+    if not _is_silent:
+        print(Color.INFO_CYAN + "自軍の潜水艦の位置: " + Color.END + codes)
+    thisFileLogger.info("自軍の潜水艦の位置: " + codes)
 
-    # tracking_cell の表示
-    print(Color.INFO_CYAN + "位置が明らかな敵艦:" + Color.END,
-          "None" if (data.tracking_cell is None) else data.tracking_cell.code())
-    thisFileLogger.info("位置が明らかな敵艦: %s", ("None" if (data.tracking_cell is None) else data.tracking_cell.code()))
 
-    # 敵軍の生きている潜水艦数と自軍の生きている潜水艦数 の表示
-    print(Color.INFO_CYAN + "自軍の生き残り艦数:" + Color.END, data.my_alive_count)
-    print(Color.INFO_CYAN + "敵軍の生き残り艦数:" + Color.END, data.opponent_alive_count)
+def dump_battle_data(data: BattleData, should_show_my_positions: bool):
+    """
+    対戦データを表示する。表示内容は一つのバッファにまとめてから一度に出力する。
+    """
+    tracking = "None" if (data.tracking_cell is None) else data.tracking_cell.code()
+    prob = format_prob_grid(data.prob)
+    buf = ["", "--------- Battle Data ---------", prob]
+    if should_show_my_positions:
+        codes = " ".join(pos.code() for pos in sorted(data.set_of_my_submarine_positions()))
+        buf.append(format_my_grid(data.my_grid).rstrip("\n"))
+        buf.append(Color.INFO_CYAN + "自軍の潜水艦の位置: " + Color.END + codes)
+    buf.append(Color.INFO_CYAN + "位置が明らかな敵艦:" + Color.END + " " + tracking)
+    buf.append(Color.INFO_CYAN + "自軍の生き残り艦数:" + Color.END + " %d" % data.my_alive_count)
+    buf.append(Color.INFO_CYAN + "敵軍の生き残り艦数:" + Color.END + " %d" % data.opponent_alive_count)
+    if not _is_silent:
+        sys.stdout.write("\n".join(buf) + "\n")
+
+    thisFileLogger.info("\n%s", prob)
+    if should_show_my_positions:
+        thisFileLogger.info("\n" + format_my_grid(data.my_grid, color=False))
+        thisFileLogger.info("自軍の潜水艦の位置: " + codes)
+    thisFileLogger.info("位置が明らかな敵艦: %s", tracking)
     thisFileLogger.info("自軍の生き残り艦数: %d", data.my_alive_count)
     thisFileLogger.info("敵軍の生き残り艦数: %d", data.opponent_alive_count)
 
@@ -0,0 +1,373 @@
+"""
+自軍の判断の経路 (suggest_my_op() と apply_* / update_tracking_cell()) の負荷試験。
+
+対戦の記録 (自己対戦で生成したもの、またはアーカイブに記録されたもの) を自軍側から再生し、
+1 手を 1 リクエストとして、指定した並列度 (スレッド数) とリクエストレートで処理させる。
+
+- 自軍の手番: suggest_my_op() で判断した後、記録された操作を適用する (反応も記録されたものを使う)。
+  判断の結果は捨てるが、同じ版のロジックで記録したゲームなら記録された操作と一致する (一致しなかった数も報告する)。
+- 敵軍の手番: 記録された操作を (移動元を伏せて) apply_opponent_op() で適用する。
+- ゲームの記録の最後まで再生したら、初期配置から再生し直す (これも 1 リクエストとして数える)。
+
+レートを指定した場合、各リクエストの予定時刻は一定間隔で決まっていて、所要時間は予定時刻から処理が終わるまでを測る。
+処理が追いつかずに遅れた分も所要時間に含まれるので、飽和するとレイテンシが急に伸び、スループットがレートに届かなくなる。
+レートを 0 にすると、各スレッドは前のリクエストが終わったらすぐ次を処理する (その場合のスループットが上限)。
+
+スレッドは GIL を共有するので、並列度を上げても 1 プロセスのスループットは 1 コア分を超えない。
+1 コアあたりの飽和点は -j 1 で --sweep の各レートを試して求め、複数のコアでは -j でプロセスを増やす。
+-c の並列度は -j のプロセスに等分する (各プロセスに 1 スレッドは必要なので、 -c は -j 以上にする)。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.loadtest -g 20 -c 4 --rate 200 -r 5000
+    $ python3 -m bluedragon.loadtest -g 20 -c 4 --sweep 50,100,200,400,800
+    $ python3 -m bluedragon.loadtest --archive ~/.submarine-destroyer/archive -g 100 -c 8 -j 2
+"""
+import enum
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from . import codec
+from . import io
+from . import logic
+from . import selfplay
+from .archive import Archive
+from .model import OpInfo, AttackInfo, MoveInfo, BattleData
+from .params import DecisionParams, DEFAULT_PARAMS
+from .rule import INITIAL_SUBMARINE_COUNT
+
+# スループットがレートのこの割合に届かなければ飽和しているとみなす
+SATURATION_RATIO = 0.95
+
+
+class Stream(NamedTuple):
+    """
+    再生する 1 ゲームの記録。自軍側の初期配置と乱数生成器は seed から selfplay と同じ方法で作る。
+    """
+    seed: int
+    opponent_count: int
+    turns: np.ndarray  # codec.TURN_DTYPE の配列
+
+
+def streams_from_specs(specs: Sequence[selfplay.GameSpec]) -> List[Stream]:
+    """
+    specs のゲームを自己対戦させ、その記録を返す。
+    """
+    return [Stream(spec.seed, spec.opponent_count, selfplay.play_game(spec).turns) for spec in specs]
+
+
+def streams_from_archive(root: str, limit: Optional[int] = None) -> List[Stream]:
+    """
+    アーカイブに記録されたゲームを最大 limit 個返す。
+    logimport で取り込んだ実戦のゲームは自軍側の初期配置を seed から再現できないので除く。
+    """
+    streams = []
+    for game, turns in Archive(root).iter_games():
+        if limit is not None and len(streams) >= limit:
+            break
+        if game['opponent'][0] == selfplay.Strategy.Human or len(turns) == 0:
+            continue
+        # プロセス間で受け渡せるように、メモリマップのビューではなく複製を持つ
+        streams.append(Stream(int(game['seed'][0]), int(game['n'][0]), np.array(turns)))
+    return streams
+
+
+class RequestKind(enum.IntEnum):
+    Start = 0  # 初期配置 (新しい対戦)
+    Suggest = 1  # 自軍の手番
+    Opponent = 2  # 敵軍の手番
+
+
+def _same_op(a: OpInfo, b: OpInfo) -> bool:
+    if a.is_attack() != b.is_attack():
+        return False
+    if a.is_attack():
+        return a.detail.attack_pos == b.detail.attack_pos
+    return (a.detail.fromPos, a.detail.dirY, a.detail.dirX) == (b.detail.fromPos, b.detail.dirY, b.detail.dirX)
+
+
+class _Replay:
+    """
+    1 ゲームの記録を自軍側から繰り返し再生する。
+    """
+
+    def __init__(self, stream: Stream, params: DecisionParams):
+        self.stream = stream
+        self.params = params
+        self.data: Optional[BattleData] = None
+        self.rng: Optional[np.random.Generator] = None
+        self.index = -1  # 次に再生する手の添字。 -1 なら次は初期配置
+        self.mismatches = 0
+
+    def step(self) -> RequestKind:
+        """
+        次の 1 リクエストを処理して、その種類を返す。
+        """
+        if self.index < 0:
+            self.data = BattleData(self.stream.opponent_count)
+            self.rng = selfplay.game_rngs(self.stream.seed)[codec.SIDE_ME]
+            logic.initialize_my_placement(self.data, self.rng)
+            self.index = 0
+            return RequestKind.Start
+
+        rec = self.stream.turns[self.index]
+        self.index = self.index + 1 if self.index + 1 < len(self.stream.turns) else -1
+        turn_count = int(rec['turn'])
+        recorded = codec.read_op(rec)
+
+        if rec['side'] == codec.SIDE_ME:
+            op = logic.suggest_my_op(self.data, turn_count, self.params, self.rng)
+            if not _same_op(op, recorded):
+                self.mismatches += 1
+            if recorded.is_attack():
+                logic.apply_my_op(self.data, OpInfo(AttackInfo(attack_pos=recorded.detail.attack_pos),
+                                                    turn_count=turn_count), self.params)
+                logic.apply_attack_response(self.data, recorded.detail.resp)
+            else:
+                logic.apply_my_op(self.data, recorded, self.params)
+            logic.update_tracking_cell(self.data)
+            return RequestKind.Suggest
+
+        if recorded.is_attack():
+            op = OpInfo(AttackInfo(attack_pos=recorded.detail.attack_pos), turn_count=turn_count)
+        else:
+            op = OpInfo(MoveInfo(fromPos=None, dirY=recorded.detail.dirY, dirX=recorded.detail.dirX),
+                        turn_count=turn_count)
+        logic.apply_opponent_op(self.data, op, self.params)
+        return RequestKind.Opponent
+
+
+class LoadResult(NamedTuple):
+    rate: float  # 指定したリクエストレート [req/s] (0 なら待たずに処理した)
+    concurrency: int
+    kinds: np.ndarray  # リクエストごとの RequestKind
+    latency_ns: np.ndarray  # リクエストごとの所要時間 (レートを指定した場合は予定時刻から)
+    elapsed_s: float
+    rss_growth: int  # 処理の前後での常駐メモリの増加 [bytes] (プロセスの合計)
+    mismatches: int  # 判断が記録された操作と一致しなかった数
+
+    @property
+    def requests(self) -> int:
+        return len(self.latency_ns)
+
+    @property
+    def throughput(self) -> float:
+        return self.requests / self.elapsed_s if self.elapsed_s > 0 else 0.0
+
+    def is_saturated(self) -> bool:
+        return self.rate > 0 and self.throughput < self.rate * SATURATION_RATIO
+
+    def quantile_us(self, q: float, kind: Optional[RequestKind] = None) -> float:
+        latency = self.latency_ns if kind is None else self.latency_ns[self.kinds == kind]
+        if len(latency) == 0:
+            return 0.0
+        return float(np.quantile(latency, q, method='higher')) / 1000
+
+    def format_summary(self) -> str:
+        lines = ["rate %s, concurrency %d: %d requests in %.2f s, %.1f req/s%s, rss +%.1f MiB, %d mismatches" % (
+            "%.0f req/s" % self.rate if self.rate > 0 else "unlimited", self.concurrency, self.requests,
+            self.elapsed_s, self.throughput, " (saturated)" if self.is_saturated() else "",
+            self.rss_growth / 2 ** 20, self.mismatches)]
+        lines.append("%-10s %8s %10s %10s %10s %10s" % ("kind", "count", "p50[us]", "p99[us]", "p999[us]", "max[us]"))
+        for kind in [None] + list(RequestKind):
+            count = self.requests if kind is None else int(np.count_nonzero(self.kinds == kind))
+            if count == 0:
+                continue
+            lines.append("%-10s %8d %10.1f %10.1f %10.1f %10.1f" % (
+                "all" if kind is None else kind.name, count, self.quantile_us(0.5, kind),
+                self.quantile_us(0.99, kind), self.quantile_us(0.999, kind), self.quantile_us(1.0, kind)))
+        return "\n".join(lines)
+
+
+def merge(results: Sequence[LoadResult]) -> LoadResult:
+    """
+    同時に実行した (別のプロセスの) 結果をまとめる。
+    """
+    return LoadResult(
+        rate=sum(r.rate for r in results),
+        concurrency=sum(r.concurrency for r in results),
+        kinds=np.concatenate([r.kinds for r in results]),
+        latency_ns=np.concatenate([r.latency_ns for r in results]),
+        elapsed_s=max(r.elapsed_s for r in results),
+        rss_growth=sum(r.rss_growth for r in results),
+        mismatches=sum(r.mismatches for r in results),
+    )
+
+
+def rss_bytes() -> int:
+    """
+    このプロセスの常駐メモリ [bytes]。 /proc が無ければ最大常駐メモリで代用する。
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _run_thread(replays: List[_Replay], first: int, count: int, start_ns: int, interval_ns: int,
+                kinds: np.ndarray, latency_ns: np.ndarray, errors: List[BaseException]) -> None:
+    """
+    replays を順に 1 リクエストずつ処理し、 kinds[first:first + count], latency_ns[first:first + count] に記録する。
+    interval_ns が 0 より大きければ、 k 番目のリクエストは start_ns + k * interval_ns まで待ってから処理する。
+    例外が送出されたら errors に追加して終了する (呼び出し元が join() の後で送出し直す)。
+    """
+    try:
+        for k in range(count):
+            replay = replays[k % len(replays)]
+            if interval_ns > 0:
+                scheduled = start_ns + k * interval_ns
+                wait_ns = scheduled - time.perf_counter_ns()
+                if wait_ns > 0:
+                    time.sleep(wait_ns / 1e9)
+            else:
+                scheduled = time.perf_counter_ns()
+            kinds[first + k] = replay.step()
+            latency_ns[first + k] = time.perf_counter_ns() - scheduled
+    except BaseException as e:
+        errors.append(e)
+
+
+def run_load(streams: Sequence[Stream], requests: int, concurrency: int = 1, rate: float = 0,
+             params: DecisionParams = DEFAULT_PARAMS) -> LoadResult:
+    """
+    streams を concurrency 個のスレッドに分けて再生し、合計 requests 個のリクエストを rate [req/s] で処理させる。
+    各スレッドは担当するゲームを 1 手ずつ交互に進める (一つのゲームのリクエストが同時に処理されることはない)。
+    rate が 0 なら待たずに処理する。端末への出力は抑制する。
+    いずれかのスレッドで例外が送出されたら、全てのスレッドの終了を待ってから最初の例外を送出する
+    (処理されなかったリクエストの所要時間を 0 として集計しないように)。
+    """
+    assert len(streams) > 0 and concurrency > 0
+    with io.silenced():
+        # 表の読み込みなど初回だけの処理を計測に含めない
+        warmup = _Replay(streams[0], params)
+        for _ in range(len(streams[0].turns) + 1):
+            warmup.step()
+
+        threads_replays = [
+            [_Replay(streams[j % len(streams)], params) for j in range(i, max(len(streams), concurrency), concurrency)]
+            for i in range(concurrency)
+        ]
+        counts = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+        firsts = np.concatenate([[0], np.cumsum(counts)[:-1]]).astype(int)
+        kinds = np.zeros(requests, dtype=np.int8)
+        latency_ns = np.zeros(requests, dtype=np.int64)
+        interval_ns = int(concurrency * 1e9 / rate) if rate > 0 else 0
+        errors: List[BaseException] = []
+
+        rss_before = rss_bytes()
+        start_ns = time.perf_counter_ns()
+        threads = [
+            # 各スレッドの予定時刻はずらして、リクエストが全体で一定間隔になるようにする
+            threading.Thread(target=_run_thread, args=(threads_replays[i], int(firsts[i]), counts[i],
+                                                        start_ns + i * interval_ns // concurrency, interval_ns,
+                                                        kinds, latency_ns, errors))
+            for i in range(concurrency)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if len(errors) > 0:
+            raise errors[0]
+        elapsed_s = (time.perf_counter_ns() - start_ns) / 1e9
+        rss_growth = rss_bytes() - rss_before
+
+    return LoadResult(rate=rate, concurrency=concurrency, kinds=kinds, latency_ns=latency_ns, elapsed_s=elapsed_s,
+                      rss_growth=rss_growth,
+                      mismatches=sum(r.mismatches for replays in threads_replays for r in replays))
+
+
+def run_load_parallel(streams: Sequence[Stream], requests: int, workers: int, concurrency: int = 1,
+                      rate: float = 0, params: DecisionParams = DEFAULT_PARAMS) -> LoadResult:
+    """
+    workers 個のプロセスのそれぞれで run_load() を実行し、結果をまとめる。
+    リクエスト数・並列度・レートは各プロセスに等分し、ゲームも各プロセスで別のものから再生する。
+    各プロセスに 1 スレッドは必要なので、 concurrency が workers より小さければ ValueError を送出する。
+    """
+    if workers <= 1:
+        return run_load(streams, requests, concurrency, rate, params)
+    if concurrency < workers:
+        raise ValueError("並列度 (%d) がプロセス数 (%d) より小さいです" % (concurrency, workers))
+    streams = list(streams)
+
+    def split(total: int, i: int) -> int:
+        return total // workers + (1 if i < total % workers else 0)
+
+    shares = [(list(streams[i % len(streams):]) + list(streams[:i % len(streams)]),
+               split(requests, i), split(concurrency, i)) for i in range(workers)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=selfplay.configure_headless) as executor:
+        futures = [executor.submit(run_load, s, n, c, rate / workers, params) for s, n, c in shares]
+        return merge([f.result() for f in futures])
+
+
+def sweep(streams: Sequence[Stream], rates: Sequence[float], requests: int, workers: int = 1, concurrency: int = 1,
+          params: DecisionParams = DEFAULT_PARAMS) -> List[LoadResult]:
+    """
+    rates の各レートで順に負荷をかけ、最初に飽和したレートまでの結果を返す。
+    """
+    results = []
+    for rate in rates:
+        results.append(run_load_parallel(streams, requests, workers, concurrency, rate, params))
+        if results[-1].is_saturated():
+            break
+    return results
+
+
+def saturation_rate(results: Sequence[LoadResult]) -> Optional[float]:
+    """
+    sweep() の結果のうち、飽和しなかった最大のレート。全て飽和していれば None。
+    """
+    rates = [r.rate for r in results if not r.is_saturated()]
+    return max(rates) if len(rates) > 0 else None
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 20)
+    requests = io.int_option(argv, "-r", 2000)
+    concurrency = io.int_option(argv, "-c", 1)
+    workers = io.int_option(argv, "-j", 1)
+    rate = io.int_option(argv, "--rate", 0)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    root_seed = io.int_option(argv, "--seed", 0)
+    archive_root = io.str_option(argv, "--archive")
+    archive_root = os.path.expanduser(archive_root) if archive_root is not None else None
+
+    if concurrency < workers:
+        io.fail("-c (%d) は -j (%d) 以上にしてください" % (concurrency, workers), logger=None)
+        sys.exit(1)
+
+    selfplay.configure_headless()
+    if archive_root is not None:
+        streams = streams_from_archive(archive_root, game_count)
+    else:
+        streams = streams_from_specs(selfplay.make_specs(game_count, root_seed, opponent_count=opponent_count))
+    if len(streams) == 0:
+        io.set_silent(False)
+        io.fail("再生できるゲームがありません", logger=None)
+        sys.exit(1)
+
+    if "--sweep" not in argv:
+        print(run_load_parallel(streams, requests, workers, concurrency, rate).format_summary())
+        return
+
+    rates = [float(r) for r in argv[argv.index("--sweep") + 1].split(",")]
+    results = sweep(streams, rates, requests, workers, concurrency)
+    for result in results:
+        print(result.format_summary(), flush=True)
+    saturation = saturation_rate(results)
+    if saturation is None:
+        print("saturated at every rate (%d workers)" % workers)
+    else:
+        print("highest unsaturated rate: %.0f req/s (%.0f req/s per worker)" % (saturation, saturation / workers))
+
+
+if __name__ == "__main__":
+    main(sys.argv)
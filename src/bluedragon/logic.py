@@ -1,22 +1,77 @@
 import math
+import time
 from logging import getLogger
-from random import randint, choice
-from typing import List, Optional, Set
+from typing import Iterable, Optional, Set, Tuple, TypeVar
 
 import numpy as np
 
+from . import actions
+from . import invariant
 from . import io
-from .model import OpInfo, AttackInfo, Response, BattleData, MoveInfo
+from . import placement
+from . import scorer
+from . import telemetry
+from .model import OpInfo, AttackInfo, Response, BattleData, MoveInfo, ConfirmedEnemies
+from .params import DecisionParams, DEFAULT_PARAMS
 from .rule import Pos
-from .rule import ROW, COL, INITIAL_HP, INITIAL_SUBMARINE_COUNT
+from .rule import ROW, COL
 from .rule import set_of_around_cells, all_cell_set, is_within_area
+from .telemetry import Branch
 
 thisFileLogger = getLogger(__name__)
 
+# rng を指定しない呼び出し (対話的な対戦など) で使う乱数生成器
+_default_rng = np.random.default_rng()
 
-def apply_my_op(data: BattleData, op_info: OpInfo) -> None:
+T = TypeVar('T')
+
+
+def _choice(rng: np.random.Generator, items: Iterable[T]) -> T:
+    """
+    items からランダムに一つ選ぶ。
+    集合の列挙順に依存しないよう、ソートしてから選ぶ (同じ rng の状態なら必ず同じ要素が選ばれる)。
+    """
+    candidates = sorted(items)
+    return candidates[int(rng.integers(len(candidates)))]
+
+
+def _exposure_danger(data: BattleData, params: DecisionParams) -> Optional[np.ndarray]:
     """
-    自軍の操作を data に適用する
+    params.use_exposure なら scorer.move_danger() の結果を、そうでなければ None を返す。
+    """
+    return scorer.move_danger(data.exposure, data.my_grid) if params.use_exposure else None
+
+
+def _danger_of_move(danger: Optional[np.ndarray], from_pos: Pos, dest: Pos) -> float:
+    """
+    from_pos の艦を dest へ移動した後の、敵軍から見た自軍の存在確率の総和。 danger が None なら 0 。
+    """
+    if danger is None:
+        return 0.0
+    d = actions.MOVE_INDEX[(dest.row - from_pos.row, dest.col - from_pos.col)]
+    return float(danger[d, from_pos.row, from_pos.col])
+
+
+# suggest_my_op() の分岐ごとの回数と所要時間 (常に計測する)
+branch_counters = telemetry.BranchCounters([b.name for b in Branch])
+
+# 直近の判断の記録。 enable_decision_trace() で有効にする。
+decision_trace: Optional[telemetry.DecisionTrace] = None
+
+
+def enable_decision_trace(capacity: int) -> telemetry.DecisionTrace:
+    """
+    suggest_my_op() の直近 capacity 回の判断を記録するようにする。 capacity が 0 なら記録をやめる。
+    """
+    global decision_trace
+    decision_trace = telemetry.DecisionTrace(capacity) if capacity > 0 else None
+    return decision_trace
+
+
+def apply_my_op(data: BattleData, op_info: OpInfo, params: DecisionParams = DEFAULT_PARAMS) -> None:
+    """
+    自軍の操作を data に適用する。
+    params.use_exposure が 0 なら、敵軍から見た自軍の存在確率 (exposure) は更新しない。
     """
     data.my_history.append(op_info)
 
@@ -24,11 +79,23 @@ def apply_my_op(data: BattleData, op_info: OpInfo) -> None:
         row, col = op_info.detail.fromPos
         dirY = op_info.detail.dirY
         dirX = op_info.detail.dirX
-        assert data.my_grid[row, col] > 0
-        assert data.my_grid[row + dirY, col + dirX] == 0
+        invariant.check_my_move(data.my_grid, Pos(row, col), dirY, dirX)
         data.my_grid[row + dirY, col + dirX] = data.my_grid[row, col]
         data.my_grid[row, col] = 0
 
+    # 敵軍から見た自軍の存在確率の更新 (敵軍には移動元は知らされない)
+    if not params.use_exposure:
+        return
+    if op_info.is_attack():
+        _update_prob_for_opponent_attack(data.exposure, op_info.detail.attack_pos, data.my_alive_count,
+                                         data.exposed.cells)
+        data.exposed.discard(op_info.detail.attack_pos)
+    else:
+        _update_prob_and_confirmed_for_move(data.exposure, data.exposed,
+                                            MoveInfo(fromPos=None, dirY=op_info.detail.dirY, dirX=op_info.detail.dirX),
+                                            data.my_alive_count, op_info.turn_count)
+    _normalize_prob(data.exposure, data.exposed.cells, data.my_alive_count)
+
 
 def apply_attack_response(data: BattleData, resp: Response) -> None:
     """
@@ -37,37 +104,39 @@ def apply_attack_response(data: BattleData, resp: Response) -> None:
     assert data.my_history[-1].is_attack()
     data.my_history[-1].detail.resp = resp
 
-    # 確率グリッドの更新
+    # 確率グリッドと、位置が確定している敵艦の索引の更新
     attacked_pos = data.my_history[-1].detail.attack_pos
-    if resp is Response.Hit:
-        _update_prob_for_my_attack_hit(data.prob, attacked_pos, data.opponent_alive_count)
-    elif resp is Response.Dead:
-        _update_prob_for_my_attack_dead(data.prob, attacked_pos, data.opponent_alive_count)
-    elif resp is Response.Near:
-        _update_prob_for_my_attack_near(data.prob, attacked_pos, data.opponent_alive_count)
-    elif resp is Response.Nothing:
-        _update_prob_for_my_attack_nothing(data.prob, attacked_pos)
+    _update_prob_for_my_attack_response(data.prob, attacked_pos, resp, data.opponent_alive_count,
+                                        data.confirmed.cells)
+    _update_confirmed_for_attack_response(data.confirmed, attacked_pos, resp, data.my_history[-1].turn_count)
 
     if resp is Response.Dead:
         data.opponent_alive_count -= 1
+    _normalize_prob(data.prob, data.confirmed.cells, data.opponent_alive_count)
 
 
-def apply_opponent_op(data: BattleData, op: OpInfo) -> Optional[Response]:
+def apply_opponent_op(data: BattleData, op: OpInfo, params: DecisionParams = DEFAULT_PARAMS) -> Optional[Response]:
     """
     敵軍の操作を data に適用する。
     敵軍の操作が攻撃だった場合はそれに対するレスポンスを返す。 そうでなければ None を返す。
+    params.use_exposure が 0 なら、敵軍から見た自軍の存在確率 (exposure) は更新しない。
     """
     data.opponent_history.append(op)
 
-    # 確率グリッドの更新
+    # 確率グリッドと、位置が確定している敵艦の索引の更新 (敵艦は自分のいるマスを攻撃できない)
     if op.is_attack():
-        _update_prob_for_opponent_attack(data.prob, op.detail.attack_pos, data.opponent_alive_count)
+        _update_prob_for_opponent_attack(data.prob, op.detail.attack_pos, data.opponent_alive_count,
+                                         data.confirmed.cells)
+        data.confirmed.discard(op.detail.attack_pos)
     elif op.is_move():
-        _update_prob_for_opponent_move(data.prob, op.detail)
+        _update_prob_and_confirmed_for_move(data.prob, data.confirmed, op.detail, data.opponent_alive_count,
+                                            op.turn_count, params.move_shift_ratio)
+    _normalize_prob(data.prob, data.confirmed.cells, data.opponent_alive_count)
 
     # 敵の攻撃を自軍のHPへ反映・レスポンスを返す。
     if op.is_attack():
         ay, ax = op.detail.attack_pos
+        alive_count = data.my_alive_count
 
         # 敵が攻撃した位置に自軍が存在していたならHPを減算する。
         if data.my_grid[ay, ax] > 0:
@@ -75,22 +144,26 @@ def apply_opponent_op(data: BattleData, op: OpInfo) -> Optional[Response]:
             # HPが0なら自軍の潜水艦が死んだので Dead を返し、そうでなければ Hit を返す。
             if data.my_grid[ay, ax] <= 0:
                 data.my_alive_count -= 1
-                data.opponent_history[-1].detail.resp = Response.Dead
-                return Response.Dead
+                resp = Response.Dead
             else:
-                data.opponent_history[-1].detail.resp = Response.Hit
-                return Response.Hit
+                resp = Response.Hit
         # 敵が攻撃した位置の周囲に自軍が一隻以上存在していたなら Near。
         elif any(data.my_grid[i, j] > 0 for i, j in set_of_around_cells(Pos(ay, ax))):
-            data.opponent_history[-1].detail.resp = Response.Near
-            return Response.Near
+            resp = Response.Near
         # 反応なし。
         else:
-            data.opponent_history[-1].detail.resp = Response.Nothing
-            return Response.Nothing
+            resp = Response.Nothing
 
-    elif op.is_move():
-        return None
+        data.opponent_history[-1].detail.resp = resp
+        # 敵軍は自軍の反応を見て、自軍が敵軍の反応を見たときと同じように確率グリッドを更新するとみなす
+        if params.use_exposure:
+            _update_prob_for_my_attack_response(data.exposure, op.detail.attack_pos, resp, alive_count,
+                                                data.exposed.cells)
+            _update_confirmed_for_attack_response(data.exposed, op.detail.attack_pos, resp, op.turn_count)
+            _normalize_prob(data.exposure, data.exposed.cells, data.my_alive_count)
+        return resp
+
+    return None
 
 
 def update_tracking_cell(data: BattleData) -> None:
@@ -111,10 +184,13 @@ def update_tracking_cell(data: BattleData) -> None:
             sy, sx = current_tracking_cell
             dirY = last_opponent_op.detail.dirY
             dirX = last_opponent_op.detail.dirX
-            data.tracking_cell = Pos(sy + dirY, sx + dirX)
-            io.info("敵の位置が明らか かつ 敵が1艦しかいない 状態で敵が移動しました。 tracking_cell を移動先の %s にします。" %
-                    data.tracking_cell.code(), thisFileLogger)
-            return
+            # 移動先が盤面の外なら、マーク位置の推論が誤っていたので、以下の通常の更新に任せる
+            if is_within_area(Pos(sy + dirY, sx + dirX)):
+                data.tracking_cell = Pos(sy + dirY, sx + dirX)
+                data.confirmed.sight(data.tracking_cell, last_my_op.turn_count, origin=current_tracking_cell)
+                io.info("敵の位置が明らか かつ 敵が1艦しかいない 状態で敵が移動しました。 tracking_cell を移動先の %s にします。" %
+                        data.tracking_cell.code(), thisFileLogger)
+                return
         else:
             io.info("敵の位置が明らか かつ 敵が1艦しかいない 状態で敵は移動していません。 tracking_cell はそのまま %s を維持します。" %
                     data.tracking_cell.code(), thisFileLogger)
@@ -126,16 +202,68 @@ def update_tracking_cell(data: BattleData) -> None:
         last_opponent_op=last_opponent_op)
 
     if data.tracking_cell is not None:
-        _update_prob_for_my_attack_hit(data.prob, data.tracking_cell, data.opponent_alive_count)
+        _update_prob_for_my_attack_hit(data.prob, data.tracking_cell, data.opponent_alive_count, data.confirmed.cells)
+        data.confirmed.sight(data.tracking_cell, last_my_op.turn_count, origin=current_tracking_cell)
+        _normalize_prob(data.prob, data.confirmed.cells, data.opponent_alive_count)
+        return
 
+    # マーク位置の敵艦を見失っても (撃沈しても)、位置が確定している他の敵艦がいればそれをマークする
+    enemy = data.confirmed.most_recent()
+    if enemy is not None:
+        data.tracking_cell = enemy.pos
+        io.info("位置が確定している他の敵艦があるので tracking_cell を %s にします。" % enemy.pos.code(), thisFileLogger)
 
-def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
+
+def suggest_my_op(data: BattleData, cur_turn_count: int, params: DecisionParams = DEFAULT_PARAMS,
+                  rng: Optional[np.random.Generator] = None) -> OpInfo:
     """
     対戦データをもとに自軍の操作を提案して返す。
     この関数は data に一切書込をしない。
+    ランダムな選択には rng を使う。 rng が None ならモジュール共通の乱数生成器を使う。
+    """
+    return suggest_my_op_with_branch(data, cur_turn_count, params, rng)[0]
+
+
+def suggest_my_op_with_branch(data: BattleData, cur_turn_count: int, params: DecisionParams = DEFAULT_PARAMS,
+                              rng: Optional[np.random.Generator] = None) -> Tuple[OpInfo, Branch]:
+    """
+    suggest_my_op() と同じだが、操作を決定した分岐の識別子も合わせて返す。
+    分岐ごとの回数と所要時間を branch_counters に数え、有効なら decision_trace に記録する。
+    """
+    op, branch, elapsed = decide_my_op(data, cur_turn_count, params, rng)
+    record_decision(data, op, branch, elapsed)
+    return op, branch
+
+
+def decide_my_op(data: BattleData, cur_turn_count: int, params: DecisionParams = DEFAULT_PARAMS,
+                 rng: Optional[np.random.Generator] = None) -> Tuple[OpInfo, Branch, int]:
+    """
+    suggest_my_op_with_branch() と同じだが、 branch_counters と decision_trace には記録せず、所要時間 (ns) も返す。
+    結果を使うかどうか分からない投機的な計算 (speculate) 用。使うことになったら record_decision() で記録する。
+    """
+    start = time.perf_counter_ns()
+    op, branch = _suggest_my_op_with_branch(data, cur_turn_count, params, rng)
+    return op, branch, time.perf_counter_ns() - start
+
+
+def record_decision(data: BattleData, op: OpInfo, branch: Branch, elapsed_ns: int) -> None:
+    """
+    判断を branch_counters に数え、有効なら decision_trace に記録する。 data は判断した時点の (操作を適用する前の) 状態。
     """
+    branch_counters.record(branch, elapsed_ns)
+    if decision_trace is not None:
+        decision_trace.record(data, op, branch, elapsed_ns)
+
+
+def _suggest_my_op_with_branch(data: BattleData, cur_turn_count: int, params: DecisionParams,
+                               rng: Optional[np.random.Generator]) -> Tuple[OpInfo, Branch]:
+    if rng is None:
+        rng = _default_rng
+
+    # 自軍の合法手 (自軍の配置が変わらない限りキャッシュされる)
+    legal = actions.legal_actions(data.my_grid)
     # 自軍の射程内にあるマス位置の集合
-    attackable_cells = data.set_of_my_attackable_cells()
+    attackable_cells = legal.attackable
 
     # 敵軍の直前の操作
     last_opponent_op = None if (len(data.opponent_history) <= 0) else data.opponent_history[-1]
@@ -145,10 +273,10 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
     if len(data.my_history) <= 0 and len(data.opponent_history) <= 0:
         # 攻撃先候補 と attackable_cells の積集合をとって確実に攻撃可能な位置を得る。
         candidates = set(Pos(y, x) for y in range(1, ROW - 1) for x in range(1, COL - 1)) & attackable_cells
-        attack_to = choice(list(candidates))
+        attack_to = _choice(rng, candidates)
         io.info("初手 " + attack_to.code() + " への攻撃を選択しました", thisFileLogger)
-        assert attack_to in attackable_cells
-        return OpInfo(AttackInfo(attack_pos=attack_to), turn_count=cur_turn_count)
+        invariant.check_attackable(attack_to, attackable_cells)
+        return (OpInfo(AttackInfo(attack_pos=attack_to), turn_count=cur_turn_count), Branch.Opening)
 
     ######################################################################################################
     # 位置が明らかな敵艦があれば、そいつを攻撃し続けたい
@@ -166,10 +294,18 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
         # 候補の中で攻撃可能なマスがあればその中からランダムに抽出してそれを攻撃先とする
         candidates = candidates_unsafe & attackable_cells
         if len(candidates) > 0:
-            attack_to = choice(list(candidates))
-            assert attack_to in attackable_cells
+            attack_to = _choice(rng, candidates)
+            invariant.check_attackable(attack_to, attackable_cells)
             io.info("tracking_cell と 敵の移動情報に基づいて " + attack_to.code() + " の攻撃を選択しました", thisFileLogger)
-            return OpInfo(AttackInfo(attack_pos=attack_to), turn_count=cur_turn_count)
+            return (OpInfo(AttackInfo(attack_pos=attack_to), turn_count=cur_turn_count), Branch.Tracking)
+
+    # マーク位置以外にも位置が確定している敵艦が射程内にいれば、HP が最も小さいものを攻撃する
+    reachable = [enemy for enemy in data.confirmed if enemy.pos in attackable_cells]
+    if len(reachable) > 0:
+        enemy = min(reachable, key=lambda e: (e.hp, -e.last_seen, e.pos))
+        io.info("位置が確定している敵艦 (HP %d 以下) がいる %s の攻撃を選択しました" % (enemy.hp, enemy.pos.code()),
+                thisFileLogger)
+        return (OpInfo(AttackInfo(attack_pos=enemy.pos), turn_count=cur_turn_count), Branch.Tracking)
 
     ######################################################################################################
     # 攻撃可能かどうかを考慮しない確率最高値のマスを求める。
@@ -179,38 +315,44 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
             (true_highest_prob_cell.code(), true_highest_prob_value), thisFileLogger)
 
     # 確率最高値のマスの確率がかなり高く、それにもかかわらず自軍の射程にない場合は自軍をその方角へ移動させる
-    probability_threshold_high = (data.opponent_alive_count * 0.1)
+    probability_threshold_high = (data.opponent_alive_count * params.move_threshold_ratio)
     if true_highest_prob_value > probability_threshold_high and true_highest_prob_cell not in attackable_cells:
         # 確率最高値のマスが自軍の位置とかぶっている場合はその自軍の艦を移動させる
-        if true_highest_prob_cell in data.set_of_my_submarine_positions():
+        if true_highest_prob_cell in legal.positions:
             from_pos = true_highest_prob_cell
             move_dest_candidates = set(
                 Pos(y, x)
-                for y, x in data.set_of_my_movable_cells(from_pos)
+                for y, x in legal.moves_from[from_pos]
                 if abs(y - from_pos.row) + abs(x - from_pos.col) == 1
             )
             if len(move_dest_candidates) > 0:
                 # 自軍の他の艦とのマンハッタン距離の総和が一番大きくなるような位置へ移動する
+                # (同じなら敵軍から見た自軍の存在確率が小さくなる方)
+                danger = _exposure_danger(data, params)
                 dest = max(move_dest_candidates,
-                           key=lambda p: sum(
+                           key=lambda p: (sum(
                                abs(p.row + q.row) + abs(p.col + q.col)
-                               for q in data.set_of_my_submarine_positions()))
+                               for q in legal.positions),
+                               -_danger_of_move(danger, from_pos, p)))
                 io.info("確率最高セルと自軍がかぶっているので自軍を %s から %s へ移動させます" % (from_pos.code(), dest.code()), thisFileLogger)
-                return OpInfo(MoveInfo(fromPos=from_pos, dirY=dest.row - from_pos.row, dirX=dest.col - from_pos.col),
-                              turn_count=cur_turn_count)
+                return (OpInfo(MoveInfo(fromPos=from_pos, dirY=dest.row - from_pos.row, dirX=dest.col - from_pos.col),
+                               turn_count=cur_turn_count), Branch.DodgeOverlap)
 
         # 確率最高マスへの距離が最も近い艦を動かす
-        actor: Pos = min(data.set_of_my_submarine_positions(),
+        actor: Pos = min(legal.positions,
                          key=lambda p: (abs(true_highest_prob_cell.row - p.row)
                                         + abs(true_highest_prob_cell.col - p.col)))
         # 移動可能なマスのうち最も確率最高マスへの距離が近いマスを移動先とする
-        dest = min(data.set_of_my_movable_cells(actor),
+        # (同じなら敵軍から見た自軍の存在確率が小さくなる方)
+        danger = _exposure_danger(data, params)
+        dest = min(legal.moves_from[actor],
                    key=lambda p: (
                        999 if (p == true_highest_prob_cell)
-                       else abs(true_highest_prob_cell.row - p.row) + abs(true_highest_prob_cell.col - p.col)))
+                       else abs(true_highest_prob_cell.row - p.row) + abs(true_highest_prob_cell.col - p.col),
+                       _danger_of_move(danger, actor, p)))
         io.info("確率最高セルへ向けて自軍を %s から %s へ移動させます" % (actor.code(), dest.code()), thisFileLogger)
-        return OpInfo(MoveInfo(fromPos=actor, dirY=dest.row - actor.row, dirX=dest.col - actor.col),
-                      turn_count=cur_turn_count)
+        return (OpInfo(MoveInfo(fromPos=actor, dirY=dest.row - actor.row, dirX=dest.col - actor.col),
+                       turn_count=cur_turn_count), Branch.MoveTowardHighProb)
 
     if ((last_opponent_op is not None)
             and last_opponent_op.is_attack()
@@ -222,11 +364,11 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
             io.info("攻撃を食らっているマスの周囲に攻撃可能なマスはありませんでした。", thisFileLogger)
         else:
             dest = max(candidates, key=lambda p: data.prob[p.row, p.col])
-            if math.isclose(0, data.prob[dest.row, dest.col], abs_tol=1e-7):
+            if math.isclose(0, data.prob[dest.row, dest.col], abs_tol=params.zero_prob_tol):
                 io.info("「攻撃を食らっているマスの周囲 && 攻撃可能マス の中で最高確率のマス」の確率が ゼロ なので攻撃しません。", thisFileLogger)
             else:
                 io.info("「攻撃を食らっているマスの周囲 && 攻撃可能マス の中で最高確率のマス」である %s を攻撃します。" % dest.code(), thisFileLogger)
-                return OpInfo(AttackInfo(attack_pos=dest), turn_count=cur_turn_count)
+                return (OpInfo(AttackInfo(attack_pos=dest), turn_count=cur_turn_count), Branch.CounterAttack)
 
     ######################################################################################################
     # 攻撃可能なマスの中で確率最高値のマスを求める。
@@ -236,12 +378,13 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
             (attackable_highest_prob_cell.code(), attackable_highest_prob_value), thisFileLogger)
 
     # 最高確率値がしきい値より確率が高ければ攻撃する
-    probability_threshold_high = (data.opponent_alive_count * 0.1)
+    probability_threshold_high = (data.opponent_alive_count * params.attack_threshold_ratio)
     if attackable_highest_prob_value > probability_threshold_high:
         io.info("確率値がしきい値 %g より高いので %s を攻撃します" %
                 (probability_threshold_high, attackable_highest_prob_cell.code()), thisFileLogger)
-        assert attackable_highest_prob_cell in attackable_cells
-        return OpInfo(AttackInfo(attack_pos=attackable_highest_prob_cell), turn_count=cur_turn_count)
+        invariant.check_attackable(attackable_highest_prob_cell, attackable_cells)
+        return (OpInfo(AttackInfo(attack_pos=attackable_highest_prob_cell), turn_count=cur_turn_count),
+                Branch.ThresholdAttack)
 
     ######################################################################################################
     # 敵の攻撃位置を遡り、その攻撃位置へ移動可能なら移動する
@@ -250,101 +393,76 @@ def suggest_my_op(data: BattleData, cur_turn_count: int) -> OpInfo:
             break
         assert op.is_attack()
         attacked_pos = op.detail.attack_pos
-        my_movable_submarines = set(
-            p
-            for p in data.set_of_my_submarine_positions()
-            if attacked_pos in data.set_of_my_movable_cells(from_pos=p)
-        )
+        my_movable_submarines = legal.movers_to.get(attacked_pos, frozenset())
 
         # 敵が攻撃した位置へ移動可能な自軍の潜水艦のうち、攻撃可能範囲の個数が一番小さい艦を移動させる
+        # (同じなら敵軍から見た自軍の存在確率が小さくなる方)
         if len(my_movable_submarines) > 0:
-            actor: Pos = min(my_movable_submarines, key=lambda p: len(set_of_around_cells(p)))
+            danger = _exposure_danger(data, params)
+            actor: Pos = min(my_movable_submarines,
+                             key=lambda p: (len(set_of_around_cells(p)), _danger_of_move(danger, p, attacked_pos)))
             io.info("%s に位置する自軍の艦を、過去に敵が攻撃した位置 %s へ移動させます" % (actor.code(), attacked_pos.code()), thisFileLogger)
             dirY = attacked_pos.row - actor.row
             dirX = attacked_pos.col - actor.col
-            assert (abs(dirY) + abs(dirX)) in (1, 2)
-            assert dirY == 0 or dirX == 0
-            return OpInfo(MoveInfo(fromPos=actor, dirY=dirY, dirX=dirX), turn_count=cur_turn_count)
-
-    # 自軍の数が2以下の場合は50%の確率でランダムに移動
-    if data.my_alive_count <= 2 and randint(0, 99) < 50:
-        actor = choice(list(data.set_of_my_submarine_positions()))
-        dest = choice(list(data.set_of_my_movable_cells(actor)))
-        io.info("確率が高いマスが見当たらず自軍の数が2以下の場合は5割の確率でランダムに移動します...選ばれたのは移動でした (%s -> %s)。" %
-                (actor.code(), dest.code()), thisFileLogger)
-        return OpInfo(MoveInfo(fromPos=actor, dirY=dest.row - actor.row, dirX=dest.col - actor.col),
-                      turn_count=cur_turn_count)
-
-    io.info("しきい値より高くはないもののこれ以外に行動パターンが無いので最高確率値のマス %s に攻撃します" %
-            attackable_highest_prob_cell.code(), thisFileLogger)
-    return OpInfo(AttackInfo(attack_pos=attackable_highest_prob_cell), turn_count=cur_turn_count)
-
-
-def initialize_my_placement(data: BattleData) -> None:
+            invariant.check_my_move(data.my_grid, actor, dirY, dirX)
+            return (OpInfo(MoveInfo(fromPos=actor, dirY=dirY, dirX=dirX), turn_count=cur_turn_count), Branch.MoveToAttackedPos)
+
+    # 自軍の数が2以下の場合は50%の確率でランダムに移動 (数と確率は params で変更できる)
+    if data.my_alive_count <= params.random_move_alive_count and rng.random() < params.random_move_chance:
+        actor = _choice(rng, legal.positions)
+        # 移動先は、敵軍から見た自軍の存在確率が小さくなる方の半分からランダムに選ぶ
+        danger = _exposure_danger(data, params)
+        dests = sorted(legal.moves_from[actor], key=lambda p: (_danger_of_move(danger, actor, p), p))
+        dest = _choice(rng, dests[:(len(dests) + 1) // 2] if danger is not None else dests)
+        io.info("確率が高いマスが見当たらず自軍の数が%d以下の場合は%g割の確率でランダムに移動します...選ばれたのは移動でした (%s -> %s)。" %
+                (params.random_move_alive_count, params.random_move_chance * 10, actor.code(), dest.code()),
+                thisFileLogger)
+        return (OpInfo(MoveInfo(fromPos=actor, dirY=dest.row - actor.row, dirX=dest.col - actor.col),
+                       turn_count=cur_turn_count), Branch.RandomMove)
+
+    # 確率が高いマスが無いので、命中の期待値と反応から得られる情報量の和が最大のマスを攻撃する
+    score = scorer.score_cells(data.prob, scorer.attackable_mask(data.my_grid),
+                               hit_weight=params.hit_weight, info_weight=params.info_weight)
+    attack_to = scorer.best_cell(score)
+    invariant.check_attackable(attack_to, attackable_cells)
+    io.info("しきい値より高くはないもののこれ以外に行動パターンが無いので評価値が最大のマス %s (評価値 %g) に攻撃します" %
+            (attack_to.code(), score[attack_to.row, attack_to.col]), thisFileLogger)
+    return (OpInfo(AttackInfo(attack_pos=attack_to), turn_count=cur_turn_count), Branch.Fallback)
+
+
+def initialize_my_placement(data: BattleData, rng: Optional[np.random.Generator] = None) -> None:
     """
     自軍の初期配置を決定して data に書き込む。
+    placement モジュールで評価した上位の配置の類から、類の大きさに比例した確率で一つ選び、
+    ランダムに回転・反転させたものを使う (上位の配置全体から一様に選ぶのと同じ)。
     """
-    X = INITIAL_HP
-    candidates = [
-        [
-            [0, 0, 0, 0, 0],
-            [X, 0, X, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, X, 0, 0, X],
-            [0, 0, 0, 0, 0],
-        ],
-
-        [
-            [0, 0, 0, X, 0],
-            [X, 0, 0, 0, 0],
-            [0, 0, 0, 0, 0],
-            [0, X, 0, 0, X],
-            [0, 0, 0, 0, 0],
-        ],
-
-        [
-            [0, 0, 0, 0, 0],
-            [0, X, 0, 0, X],
-            [0, 0, 0, 0, 0],
-            [X, 0, 0, 0, 0],
-            [0, 0, 0, X, 0],
-        ],
-
-        [
-            [0, 0, 0, 0, 0],
-            [0, 0, X, 0, 0],
-            [X, 0, 0, 0, X],
-            [0, 0, X, 0, 0],
-            [0, 0, 0, 0, 0],
-        ],
-    ]
+    if rng is None:
+        rng = _default_rng
 
-    def validate(matrix: List[List[int]]) -> None:
-        assert len(matrix) == ROW
-        assert all(len(row) == COL for row in matrix)
-        hp_sum = 0
-        for row in matrix:
-            for cell in row:
-                assert cell == 0 or cell == INITIAL_HP
-                hp_sum += cell
-        assert hp_sum == (INITIAL_HP * INITIAL_SUBMARINE_COUNT)
+    candidates, class_sizes = placement.top_candidates()
 
-    io.info("%d 個の初期配置候補を validate しています..." % len(candidates), thisFileLogger)
-    for mat in candidates:
-        validate(mat)
-    io.success("どの初期配置候補も不正はありませんでした。", thisFileLogger)
+    # 候補の検査はプロセス内で一度だけ行う
+    if invariant.validate_placements_once(candidates):
+        io.success("%d 個の初期配置候補を validate しました。どの初期配置候補も不正はありませんでした。" % len(candidates),
+                   thisFileLogger)
 
-    # TODO selectID は乱数にするか定数にするか
-    candidate_id = randint(0, len(candidates) - 1)
+    weights = np.array(class_sizes, dtype=np.float64)
+    candidate_id = int(rng.choice(len(candidates), p=weights / weights.sum()))
+    symmetry = int(rng.integers(placement.SYMMETRY_COUNT))
 
-    io.info("候補のうち %d 番目 (0-indexed) の初期配置を選択します。" % candidate_id, thisFileLogger)
-    data.my_grid = np.array(candidates[candidate_id])
+    io.info("候補のうち %d 番目 (0-indexed) の初期配置を、%d 番目の回転・反転をして選択します。" % (candidate_id, symmetry),
+            thisFileLogger)
+    data.my_grid[:, :] = placement.transform_grid(candidates[candidate_id], symmetry)
 
 
 def _distribute_prob(prob: np.ndarray, value: float, destinations: Set[Pos]) -> None:
     """
     destinations に含まれるマスそれぞれに、(value / len(destinations)) を加算する。
+    destinations が空の場合は何もしない (value は 0 のはず。そうでなければ確率が失われるので不変条件の違反)。
     """
+    if len(destinations) <= 0:
+        invariant.check_no_prob_lost(value)
+        return
     value /= len(destinations)
     for y, x in destinations:
         prob[y, x] += value
@@ -366,25 +484,42 @@ def _set_of_cells_greater_eq_one(prob: np.ndarray) -> Set[Pos]:
     )
 
 
-def _set_of_zero_union_greater_eq_one(prob: np.ndarray) -> Set[Pos]:
-    return _set_of_zero_cells(prob) | _set_of_cells_greater_eq_one(prob)
+def _certain_cells(prob: np.ndarray, certain: Optional[Set[Pos]]) -> Set[Pos]:
+    """
+    敵艦の位置が確定しているマスの集合。
+    以下の確率グリッドの更新処理の certain には ConfirmedEnemies.cells を渡す。 None なら確率 1 以上のマスを走査して求める。
+    """
+    return certain if certain is not None else _set_of_cells_greater_eq_one(prob)
+
 
+def _set_of_zero_union_greater_eq_one(prob: np.ndarray, certain: Optional[Set[Pos]] = None) -> Set[Pos]:
+    return _set_of_zero_cells(prob) | _certain_cells(prob, certain)
 
-def _suck_spot_and_distribute_prob(prob: np.ndarray, src_pos: Pos) -> None:
+
+def _destinations(prob: np.ndarray, candidates: Set[Pos], certain: Optional[Set[Pos]] = None) -> Set[Pos]:
+    """
+    candidates のうち、確率を分配する先のマス (確率が 0 のマスと 1 のマスを除いたもの)。
+    それが空なら (確率が残っているマスが無く、反応と矛盾している)、確率が 1 のマスだけを除いたものにする。
+    """
+    uncertain = candidates - _certain_cells(prob, certain)
+    destinations = uncertain - _set_of_zero_cells(prob)
+    return destinations if len(destinations) > 0 else uncertain
+
+
+def _suck_spot_and_distribute_prob(prob: np.ndarray, src_pos: Pos, certain: Optional[Set[Pos]] = None) -> None:
     """
     prob[src_pos] の確率をゼロにしてそれ以外のマスに分散させる。
     ただし、確率が 0 のマスと 1 のマスには分散させない。
     """
-    destinations = all_cell_set()
-    destinations.discard(src_pos)
-    destinations = destinations - _set_of_zero_union_greater_eq_one(prob)
+    destinations = _destinations(prob, all_cell_set() - {src_pos}, certain)
 
     sy, sx = src_pos
     _distribute_prob(prob, prob[sy, sx], destinations)
     prob[sy, sx] = 0
 
 
-def _suck_one_submarine_prob(prob: np.ndarray, source_candidates: Set[Pos], opponent_alive_count: int) -> float:
+def _suck_one_submarine_prob(prob: np.ndarray, source_candidates: Set[Pos], opponent_alive_count: int,
+                             certain: Optional[Set[Pos]] = None) -> float:
     """
     「source_candidate のうち 確率0のマスと確率1以上のマスを除いたマス群」から合計一隻分の確率 (=1.0) を減算して返す。
     すなわち戻り値は理論上は1.0に等しいはず (浮動小数点誤差はある)。
@@ -392,73 +527,136 @@ def _suck_one_submarine_prob(prob: np.ndarray, source_candidates: Set[Pos], oppo
     ただし、N は敵の残機数、k は 全マスの中での確率1の個数(すなわち位置が明らかな敵艦の個数)
     """
     N = opponent_alive_count
-    k = len(_set_of_cells_greater_eq_one(prob))
+    k = len(_certain_cells(prob, certain))
     if k == N:
         return 0
-    sources = source_candidates - _set_of_zero_union_greater_eq_one(prob)
+    sources = source_candidates - _set_of_zero_union_greater_eq_one(prob, certain)
     prob_sum = 0
     for y, x in sources:
         v = prob[y, x] * (1 / (N - k))
         prob[y, x] -= v
         prob_sum += v
-    assert math.isclose(1.0, prob_sum, rel_tol=1e-7)
+    invariant.check_sucked_one_submarine(prob_sum, prob)
     return prob_sum
 
 
-def _update_prob_for_my_attack_hit(prob: np.ndarray, hit_pos: Pos, opponent_alive_count: int) -> None:
+def _normalize_prob(prob: np.ndarray, certain: Set[Pos], alive_count: int) -> None:
+    """
+    確率グリッドの更新は近似なので、更新を重ねると確率が 1 を超えるマスや、総和が生存数と合わないグリッドができる。
+    そのままでは次の更新で総和が合わなくなる (確率 1 を超えたマスへの撃沈で 1 隻分より多く消えるなど) ので、
+    更新のたびに次のように直す。
+      - certain (位置が確定しているマス) の確率は 1 にする。
+      - それ以外のマスの確率は 1 以下に抑え、総和が (alive_count - 確定している艦の数) になるように比例配分する。
+      - 配分するマスが無ければ (全て確率 0 なら)、確定していないマスに一様に配分し直す。
+    直した結果が浮動小数点誤差の程度しか違わなければ、 prob は書き換えない
+    (丸め方が変わるだけで、しきい値との比較や同点の判定の結果が変わってしまうので)。
+    """
+    normalized = prob.copy()
+    free = np.ones((ROW, COL), dtype=bool)
+    for p in certain:
+        free[p.row, p.col] = False
+    normalized[~free] = 1.0
+    np.clip(normalized, 0.0, None, out=normalized)
+    remaining = alive_count - (ROW * COL - np.count_nonzero(free))
+    if remaining <= 0:
+        normalized[free] = 0.0
+    else:
+        _rescale_free_cells(normalized, free, remaining)
+    tol = max(1e-9, float(np.finfo(prob.dtype).eps) * 16)
+    if not np.allclose(normalized, prob, rtol=0.0, atol=tol):
+        prob[:, :] = normalized
+
+
+def _rescale_free_cells(prob: np.ndarray, free: np.ndarray, remaining: int) -> None:
+    """
+    free のマスの確率を、それぞれ 1 以下で総和が remaining になるように比例配分する。
+    確率 1 を超えたマスを 1 に固定して、残りのマスに配分し直すことを、 1 を超えるマスが無くなるまで繰り返す。
+    """
+    capped = np.zeros((ROW, COL), dtype=bool)
+    while True:
+        rest = free & ~capped
+        if not rest.any():
+            return
+        need = remaining - np.count_nonzero(capped)
+        s = float(prob[rest].sum())
+        if s <= 1e-12:
+            # 残りの艦がいそうなマスが無い (反応と矛盾している) ので、一様に配分し直す
+            prob[rest] = need / np.count_nonzero(rest)
+        else:
+            prob[rest] *= need / s
+        over = rest & (prob > 1.0)
+        if not over.any():
+            return
+        prob[over] = 1.0
+        capped |= over
+
+
+def _update_prob_for_my_attack_hit(prob: np.ndarray, hit_pos: Pos, opponent_alive_count: int,
+                                   certain: Optional[Set[Pos]] = None) -> None:
     """
     自軍の攻撃がヒットしたとき用の確率グリッド更新処理。
     opponent_alive_count は敵軍が死ぬ前の隻数。
     """
-    # 既に確率が 1 になっているので early return
-    if prob[hit_pos.row, hit_pos.col] >= (1.0 - 1e-10):
+    # 既に位置が確定している (確率が 1 になっている) ので early return
+    # (certain に無くても、他のマスの確率が全て 0 になって確率 1 になったマスは確定しているのと同じ)
+    if certain is not None and (hit_pos in certain or prob[hit_pos.row, hit_pos.col] >= (1.0 - 1e-7)):
+        return
+    if certain is None and prob[hit_pos.row, hit_pos.col] >= (1.0 - 1e-10):
         return
 
     # ヒットマスの確率をゼロにして他のマスへ分散
-    _suck_spot_and_distribute_prob(prob, hit_pos)
+    _suck_spot_and_distribute_prob(prob, hit_pos, certain)
 
-    _suck_one_submarine_prob(prob, all_cell_set() - {hit_pos}, opponent_alive_count)
+    _suck_one_submarine_prob(prob, all_cell_set() - {hit_pos}, opponent_alive_count, certain)
 
     prob[hit_pos.row, hit_pos.col] = 1.0
 
 
-def _update_prob_for_my_attack_dead(prob: np.ndarray, dead_pos: Pos, opponent_alive_count: int) -> None:
+def _update_prob_for_my_attack_dead(prob: np.ndarray, dead_pos: Pos, opponent_alive_count: int,
+                                    certain: Optional[Set[Pos]] = None) -> None:
     """
     自軍の攻撃がヒットして敵軍が死んだ用の確率グリッド更新処理。
     opponent_alive_count は敵軍が死ぬ前の隻数。
     """
-    _update_prob_for_my_attack_hit(prob, dead_pos, opponent_alive_count)
+    _update_prob_for_my_attack_hit(prob, dead_pos, opponent_alive_count, certain)
     prob[dead_pos.row, dead_pos.col] = 0.0
-    assert math.isclose(np.sum(prob), opponent_alive_count - 1, rel_tol=1e-7)  # 全マスの確率の総和は敵軍の(死んだ後の)隻数に等しいはず
+    invariant.check_prob_sum(prob, opponent_alive_count - 1)  # 全マスの確率の総和は敵軍の(死んだ後の)隻数に等しいはず
 
 
-def _update_prob_for_my_attack_near(prob: np.ndarray, attacked_pos: Pos, opponent_alive_count: int) -> None:
+def _update_prob_for_my_attack_near(prob: np.ndarray, attacked_pos: Pos, opponent_alive_count: int,
+                                    certain: Optional[Set[Pos]] = None) -> None:
     """
     自軍の攻撃が波高しだった用の確率グリッド更新処理。
     """
     # もし敵が攻撃してきた位置が既に確率ゼロなら何もしない。
     if math.isclose(0.0, prob[attacked_pos.row, attacked_pos.col], abs_tol=1e-7):
         return
+    # 攻撃した位置に艦がいると確定していたなら、その推論は誤りだった
+    if certain is not None:
+        certain = certain - {attacked_pos}
 
     # 攻撃マスの確率をゼロにして他のマスへ分散 (ヒットはしてないので攻撃した位置には確実に居ない)
-    _suck_spot_and_distribute_prob(prob, attacked_pos)
+    _suck_spot_and_distribute_prob(prob, attacked_pos, certain)
 
     # もし波高しの周囲に、位置が明らかな敵艦が存在する場合は何もしない。
-    if len(set_of_around_cells(attacked_pos) & _set_of_cells_greater_eq_one(prob)) > 0:
+    if len(set_of_around_cells(attacked_pos) & _certain_cells(prob, certain)) > 0:
         return
 
     # 1隻分の確率を各マスから奪って波高しの周囲マスに分配
     # !!! destinations は suck する前に得ること！
-    destinations = set_of_around_cells(attacked_pos) - _set_of_zero_union_greater_eq_one(prob)
-    _suck_one_submarine_prob(prob, all_cell_set() - {attacked_pos}, opponent_alive_count)
+    destinations = _destinations(prob, set_of_around_cells(attacked_pos), certain)
+    _suck_one_submarine_prob(prob, all_cell_set() - {attacked_pos}, opponent_alive_count, certain)
     _distribute_prob(prob, 1.0, destinations)
 
 
-def _update_prob_for_my_attack_nothing(prob: np.ndarray, attacked_pos: Pos) -> None:
+def _update_prob_for_my_attack_nothing(prob: np.ndarray, attacked_pos: Pos, certain: Optional[Set[Pos]] = None) -> None:
     """
     自軍の攻撃が反応なしだった用の確率グリッド更新処理。
     """
     nothing_area = set_of_around_cells(attacked_pos).union({attacked_pos})
+    # 反応なしの範囲に艦がいると確定していたなら、その推論は誤りだった
+    if certain is not None:
+        certain = certain - nothing_area
 
     # 反応なしだったマスとその周囲の確率をゼロにし、総和を s に格納
     s = 0
@@ -466,28 +664,64 @@ def _update_prob_for_my_attack_nothing(prob: np.ndarray, attacked_pos: Pos) -> N
         s += prob[y, x]
         prob[y, x] = 0
 
-    destinations = all_cell_set() - nothing_area - _set_of_zero_union_greater_eq_one(prob)
+    destinations = _destinations(prob, all_cell_set() - nothing_area, certain)
     _distribute_prob(prob, s, destinations)
 
 
-def _update_prob_for_opponent_attack(prob: np.ndarray, attacked_pos: Pos, opponent_alive_count: int) -> None:
+def _update_prob_for_my_attack_response(prob: np.ndarray, attacked_pos: Pos, resp: Response,
+                                        opponent_alive_count: int, certain: Optional[Set[Pos]] = None) -> None:
+    """
+    攻撃に対する反応 resp を確率グリッドに反映する。 opponent_alive_count は攻撃を受けた側の攻撃前の隻数。
+    """
+    if resp is Response.Hit:
+        _update_prob_for_my_attack_hit(prob, attacked_pos, opponent_alive_count, certain)
+    elif resp is Response.Dead:
+        _update_prob_for_my_attack_dead(prob, attacked_pos, opponent_alive_count, certain)
+    elif resp is Response.Near:
+        _update_prob_for_my_attack_near(prob, attacked_pos, opponent_alive_count, certain)
+    elif resp is Response.Nothing:
+        _update_prob_for_my_attack_nothing(prob, attacked_pos, certain)
+
+
+def _update_confirmed_for_attack_response(confirmed: ConfirmedEnemies, attacked_pos: Pos, resp: Response,
+                                          turn: int) -> None:
+    """
+    攻撃に対する反応 resp を、攻撃を受けた側の艦の索引に反映する。
+    """
+    if resp is Response.Hit:
+        confirmed.hit(attacked_pos, turn)
+    elif resp is Response.Dead:
+        confirmed.kill(attacked_pos)
+    elif resp is Response.Nothing:
+        for p in set_of_around_cells(attacked_pos) | {attacked_pos}:
+            confirmed.discard(p)
+    else:
+        confirmed.discard(attacked_pos)
+
+
+def _update_prob_for_opponent_attack(prob: np.ndarray, attacked_pos: Pos, opponent_alive_count: int,
+                                     certain: Optional[Set[Pos]] = None) -> None:
     """
     敵が attacked_pos に攻撃した場合の確率グリッド更新処理。
     """
-    return _update_prob_for_my_attack_near(prob, attacked_pos, opponent_alive_count)
+    return _update_prob_for_my_attack_near(prob, attacked_pos, opponent_alive_count, certain)
 
 
-def _update_prob_for_opponent_move(prob: np.ndarray, moving_info: MoveInfo) -> None:
+def _update_prob_for_opponent_move(prob: np.ndarray, moving_info: MoveInfo, shift_ratio: float = 1.0,
+                                   occupied: Iterable[Pos] = ()) -> None:
     """
     敵が移動した場合の確率グリッド更新処理。
     各マスの確率値を少し移動させる。 確率値が0や1のマスに対して特別処理を行うことはしない。
+    各マスから移動させる量は p * (p / 移動元の確率の総和) * shift_ratio 。 (0 <= shift_ratio <= 1)
+    occupied は艦がいると確定しているマスで、そこへの移動はできないので移動先にしない。
     """
     dirY = moving_info.dirY
     dirX = moving_info.dirX
+    occupied = set(occupied)
     from_cells = [
         Pos(y, x)
         for y in range(ROW) for x in range(COL)
-        if is_within_area(Pos(y + dirY, x + dirX))
+        if is_within_area(Pos(y + dirY, x + dirX)) and Pos(y + dirY, x + dirX) not in occupied
     ]
     prob_sum = sum(prob[y, x] for y, x in from_cells)
 
@@ -501,13 +735,32 @@ def _update_prob_for_opponent_move(prob: np.ndarray, moving_info: MoveInfo) -> N
     a = np.zeros((ROW, COL), dtype=np.float64)
 
     for y, x in from_cells:
-        v = prob[y, x] * (prob[y, x] / prob_sum)
+        v = prob[y, x] * (prob[y, x] / prob_sum) * shift_ratio
         prob[y, x] -= v
         a[y + dirY, x + dirX] = v
 
     prob += a
 
 
+def _update_prob_and_confirmed_for_move(prob: np.ndarray, confirmed: ConfirmedEnemies, moving_info: MoveInfo,
+                                        alive_count: int, turn: int, shift_ratio: float = 1.0) -> None:
+    """
+    移動を確率グリッドと、移動した側の艦の索引に反映する。 alive_count は移動した側の生存数。
+    生存数が 1 隻で位置が確定していれば、移動先も確定する。そうでなければどの艦が移動したか分からないので、
+    その移動ができた艦 (移動先が盤面の内側の艦) を全て見失う。
+    """
+    _update_prob_for_opponent_move(prob, moving_info, shift_ratio, confirmed.cells)
+    enemy = next(iter(confirmed), None)
+    if alive_count == 1 and enemy is not None and \
+            is_within_area(Pos(enemy.pos.row + moving_info.dirY, enemy.pos.col + moving_info.dirX)):
+        confirmed.shift(moving_info.dirY, moving_info.dirX, turn)
+        prob[:, :] = 0
+        for p in confirmed.cells:
+            prob[p.row, p.col] = 1.0
+    else:
+        confirmed.lose_movers(moving_info.dirY, moving_info.dirX)
+
+
 def _calculate_next_tracking_cell(
         current_tracking_cell: Optional[Pos],
         last_my_op: OpInfo,
@@ -553,6 +806,10 @@ def _calculate_next_tracking_cell(
                 dirX = last_opponent_op.detail.dirX
                 ret = Pos(y + dirY, x + dirX)
                 io.info("敵の移動に追従ぜず もとの位置に撃ったものの命中しませんでした。", thisFileLogger)
+                if not is_within_area(ret):
+                    # マーク位置の艦はその移動をできないので、マーク位置の推論が誤っていた
+                    io.info("移動先 %s は盤面の外なので tracking_cell を None にします。" % str(ret), thisFileLogger)
+                    return None
                 io.info("敵の移動はフェイントではなかったので tracking_cell を敵の移動に従って %s -> %s にします。" %
                         (current_tracking_cell.code(), ret.code()), thisFileLogger)
                 return ret
@@ -0,0 +1,379 @@
+"""
+main.py が書き出した対戦ログ (~/.submarine-destroyer/log/*.log) を、自己対戦と同じ構造化された棋譜に変換する。
+
+ログは logging のテキスト形式 ("%H:%M:%S <logger> <level> <message>") で、色の制御文字や複数行のグリッドの出力を含む。
+ファイルは一行ずつ読みながら状態機械で解釈するので、ファイル全体をメモリに載せることはない。
+ファイルごとの解釈はプロセスプールで並列に行い、結果は codec.GAME_DTYPE / codec.TURN_DTYPE のレコード
+(selfplay.GameResult) として返すか、アーカイブに書き込む。
+
+ログから分かるのは自軍側から見た情報だけなので、敵軍の手のレコードは次のように埋める:
+    my_alive, opp_alive ... 敵軍から見た値 (自軍から見た敵軍・自軍の生存数)
+    tracking ............. 常に codec.NO_CELL
+    cell ................. 敵軍の移動の移動元は不明なので codec.NO_CELL
+自軍の手の branch は、直前に logic が出力したメッセージから推定する (推定できなければ Branch.Unknown)。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.logimport -j 4 --archive ~/.submarine-destroyer/archive
+    $ python3 -m bluedragon.logimport ~/.submarine-destroyer/log/2020-11-*.log
+"""
+import glob
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from logging import getLogger
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from . import analytics
+from . import codec
+from . import io
+from .archive import ArchiveWriter
+from .model import OpInfo, AttackInfo, MoveInfo, Response
+from .rule import Pos
+from .rule import INITIAL_SUBMARINE_COUNT
+from .selfplay import GameResult, Strategy
+from .telemetry import Branch
+
+thisFileLogger = getLogger(__name__)
+
+DEFAULT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".submarine-destroyer", "log")
+
+_ANSI_PATTERN = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+_RECORD_PATTERN = re.compile(r"^\d{2}:\d{2}:\d{2} (\S+)\s+(DEBUG|INFO|WARNING|ERROR|CRITICAL)\s+(.*)$")
+
+_GAME_START = "main() called"
+_OPPONENT_COUNT_PATTERNS = (
+    re.compile(r"敵艦の初期個数が (\d+) に設定されました"),
+    re.compile(r"デフォルト値である (\d+) に設定します"),
+)
+_ME_FIRST_PATTERN = re.compile(r"^is_me_first = (True|False)$")
+_TURN_PATTERN = re.compile(r"\[Turn(\d+)\] (My|Opponent) turn")
+_MY_OP_PREFIX = "自軍の操作: "
+_RECEIVED_PREFIX = "次の入力を受け取りました: "
+_MY_RESPONSE_PREFIX = "敵が攻撃しました。 自軍への命中状況: "
+_ATTACK_PATTERN = re.compile(r"^Attack\(to: ([A-E][1-5])\)")
+_MOVE_PATTERN = re.compile(r"^Move\(from: ([A-E][1-5]|None), dir: (\w+)\(\w+\), dist: (\d+)\)")
+_RESPONSE_PATTERN = re.compile(r"^Response\.(\w+)$")
+_TRACKING_PATTERN = re.compile(r"^位置が明らかな敵艦: ([A-E][1-5]|None)$")
+_MY_ALIVE_PATTERN = re.compile(r"^自軍の生き残り艦数: (\d+)$")
+_OPP_ALIVE_PATTERN = re.compile(r"^敵軍の生き残り艦数: (\d+)$")
+_WIN = "We win!!"
+_LOSE = "We lose..."
+
+_DIRECTIONS = {"Up": (-1, 0), "Down": (1, 0), "Left": (0, -1), "Right": (0, 1)}
+
+# logic.suggest_my_op() が各分岐で出力するメッセージの一部。自軍の手の直前に出力された最後のものを採用する。
+_BRANCH_MARKERS = (
+    ("への攻撃を選択しました", Branch.Opening),
+    ("tracking_cell と 敵の移動情報に基づいて", Branch.Tracking),
+    ("位置が確定している敵艦 (HP", Branch.Tracking),
+    ("確率最高セルと自軍がかぶっているので", Branch.DodgeOverlap),
+    ("確率最高セルへ向けて自軍を", Branch.MoveTowardHighProb),
+    ("の中で最高確率のマス」である", Branch.CounterAttack),
+    ("より高いので", Branch.ThresholdAttack),
+    ("過去に敵が攻撃した位置", Branch.MoveToAttackedPos),
+    ("選ばれたのは移動でした", Branch.RandomMove),
+    ("これ以外に行動パターンが無いので", Branch.Fallback),
+    ("終盤の表に基づいて", Branch.Endgame),
+    ("終盤の厳密解に基づいて", Branch.Endgame),  # 以前のログの表記
+)
+
+
+class LogImportError(Exception):
+    pass
+
+
+def _parse_pos(code: str) -> Optional[Pos]:
+    if code == "None":
+        return None
+    return Pos(ord(code[0]) - ord('A'), int(code[1]) - 1)
+
+
+def parse_op(text: str, turn_count: int) -> OpInfo:
+    """
+    OpInfo.__str__() の出力を OpInfo に戻す。
+    """
+    m = _ATTACK_PATTERN.match(text)
+    if m is not None:
+        return OpInfo(AttackInfo(attack_pos=_parse_pos(m.group(1))), turn_count=turn_count)
+    m = _MOVE_PATTERN.match(text)
+    if m is not None and m.group(2) in _DIRECTIONS:
+        dy, dx = _DIRECTIONS[m.group(2)]
+        dist = int(m.group(3))
+        return OpInfo(MoveInfo(fromPos=_parse_pos(m.group(1)), dirY=dy * dist, dirX=dx * dist), turn_count=turn_count)
+    raise LogImportError("cannot parse op: " + text)
+
+
+def parse_response(text: str) -> Response:
+    m = _RESPONSE_PATTERN.match(text)
+    if m is None or m.group(1) not in Response.__members__:
+        raise LogImportError("cannot parse response: " + text)
+    return Response[m.group(1)]
+
+
+class _Turn:
+    """
+    解釈中の 1 手。
+    """
+
+    def __init__(self, turn_count: int, side: int):
+        self.turn_count = turn_count
+        self.side = side
+        self.op: Optional[OpInfo] = None
+        self.branch = Branch.Unknown
+
+    def is_complete(self) -> bool:
+        return self.op is not None and (self.op.is_move() or self.op.detail.resp is not None)
+
+
+class LogParser:
+    """
+    ログを一行ずつ受け取り、ゲームが終わるごとに GameResult を返す状態機械。
+    一つのログには通常 1 ゲームだけが含まれるが、 main() の開始のメッセージごとに新しいゲームとして扱う。
+    """
+
+    def __init__(self, first_game_id: int = 0):
+        self._next_game_id = first_game_id
+        self._in_game = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self._opponent_count = INITIAL_SUBMARINE_COUNT
+        self._me_first: Optional[bool] = None
+        self._winner = -1
+        self._my_alive = INITIAL_SUBMARINE_COUNT
+        self._opp_alive = INITIAL_SUBMARINE_COUNT
+        self._tracking = codec.NO_CELL
+        self._last_kinds = [codec.KIND_NONE, codec.KIND_NONE]  # 陣営ごとの直前の操作の種類
+        self._branch = Branch.Unknown
+        self._turn: Optional[_Turn] = None
+        self._records: List[np.void] = list()
+
+    def feed(self, line: str) -> Optional[GameResult]:
+        """
+        一行を解釈する。ゲームの終わりに達したらそのゲームの結果を返す。
+        """
+        m = _RECORD_PATTERN.match(line.rstrip("\n"))
+        if m is None:
+            # 複数行のメッセージ (グリッドの出力) の続きの行
+            return None
+        message = _ANSI_PATTERN.sub("", m.group(3)).strip()
+
+        if message == _GAME_START:
+            result = self.finish()
+            self._in_game = True
+            return result
+        if not self._in_game:
+            return None
+
+        if message in (_WIN, _LOSE):
+            self._winner = codec.SIDE_ME if message == _WIN else codec.SIDE_OPPONENT
+            return self.finish()
+        self._feed_message(message)
+        return None
+
+    def _feed_message(self, message: str) -> None:
+        for pattern in _OPPONENT_COUNT_PATTERNS:
+            m = pattern.search(message)
+            if m is not None:
+                self._opponent_count = self._opp_alive = int(m.group(1))
+                return
+
+        m = _ME_FIRST_PATTERN.match(message)
+        if m is not None:
+            self._me_first = (m.group(1) == "True")
+            return
+
+        m = _TURN_PATTERN.search(message)
+        if m is not None:
+            self._end_turn()
+            side = codec.SIDE_ME if m.group(2) == "My" else codec.SIDE_OPPONENT
+            self._turn = _Turn(int(m.group(1)), side)
+            self._branch = Branch.Unknown
+            return
+
+        if self._turn is not None:
+            self._feed_turn_message(message)
+
+        m = _TRACKING_PATTERN.match(message)
+        if m is not None:
+            self._tracking = codec.cell_index(_parse_pos(m.group(1)))
+            return
+        m = _MY_ALIVE_PATTERN.match(message)
+        if m is not None:
+            self._my_alive = int(m.group(1))
+            return
+        m = _OPP_ALIVE_PATTERN.match(message)
+        if m is not None:
+            self._opp_alive = int(m.group(1))
+
+    def _feed_turn_message(self, message: str) -> None:
+        turn = self._turn
+        if turn.side == codec.SIDE_ME:
+            if message.startswith(_MY_OP_PREFIX):
+                turn.op = parse_op(message[len(_MY_OP_PREFIX):], turn.turn_count)
+                turn.branch = self._branch
+            elif message.startswith(_RECEIVED_PREFIX) and turn.op is not None and turn.op.is_attack():
+                turn.op.detail.resp = parse_response(message[len(_RECEIVED_PREFIX):])
+            elif turn.op is None:
+                for marker, branch in _BRANCH_MARKERS:
+                    if marker in message:
+                        self._branch = branch
+        else:
+            if message.startswith(_RECEIVED_PREFIX):
+                turn.op = parse_op(message[len(_RECEIVED_PREFIX):], turn.turn_count)
+            elif message.startswith(_MY_RESPONSE_PREFIX) and turn.op is not None and turn.op.is_attack():
+                turn.op.detail.resp = parse_response(message[len(_MY_RESPONSE_PREFIX):])
+
+    def _end_turn(self) -> None:
+        """
+        解釈中の手をレコードにする。操作の入力の途中でログが途切れている手は捨てる。
+        手の前の生存数と tracking は、直前の手の後に出力された対戦データの値。
+        """
+        turn, self._turn = self._turn, None
+        if turn is None or not turn.is_complete():
+            return
+
+        rec = np.zeros((), dtype=codec.TURN_DTYPE)
+        rec['game'] = self._next_game_id
+        rec['turn'] = turn.turn_count
+        rec['side'] = turn.side
+        if turn.side == codec.SIDE_ME:
+            rec['my_alive'] = self._my_alive
+            rec['opp_alive'] = self._opp_alive
+            rec['tracking'] = self._tracking
+        else:
+            rec['my_alive'] = self._opp_alive
+            rec['opp_alive'] = self._my_alive
+            rec['tracking'] = codec.NO_CELL
+        rec['prev_opp_kind'] = self._last_kinds[1 - turn.side]
+        codec.write_op(rec, turn.op)
+        rec['branch'] = turn.branch
+        self._last_kinds[turn.side] = codec.op_kind(turn.op)
+        self._records.append(rec)
+
+    def finish(self) -> Optional[GameResult]:
+        """
+        解釈中のゲームを終わらせて結果を返す。手が一つも無ければ None を返す。
+        勝敗のメッセージが無いまま終わったゲーム (中断されたゲーム) は引き分け (-1) として扱う。
+        """
+        self._end_turn()
+        records, me_first, winner = self._records, self._me_first, self._winner
+        opponent_count = self._opponent_count
+        self._in_game = False
+        self._reset()
+        if len(records) <= 0:
+            return None
+
+        turns = np.array(records, dtype=codec.TURN_DTYPE)
+        if me_first is None:
+            me_first = bool(turns['side'][0] == codec.SIDE_ME)
+        game = np.zeros(1, dtype=codec.GAME_DTYPE)
+        game['game'] = self._next_game_id
+        game['seed'] = 0
+        game['opponent'] = Strategy.Human
+        game['n'] = opponent_count
+        game['me_first'] = me_first
+        game['winner'] = winner
+        game['turns'] = len(turns)
+        self._next_game_id += 1
+        return GameResult(game=game, turns=turns)
+
+
+def parse_lines(lines: Iterable[str], first_game_id: int = 0) -> Iterator[GameResult]:
+    """
+    ログの行を順に解釈し、ゲームごとの結果を返す。
+    """
+    parser = LogParser(first_game_id)
+    for line in lines:
+        result = parser.feed(line)
+        if result is not None:
+            yield result
+    result = parser.finish()
+    if result is not None:
+        yield result
+
+
+def parse_file(path: str) -> List[GameResult]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return list(parse_lines(f))
+
+
+def _parse_file_safely(path: str) -> Tuple[str, List[GameResult], Optional[str]]:
+    """
+    ワーカーで実行する。解釈できないファイルは例外にせず、エラーメッセージを返す。
+    """
+    try:
+        return path, parse_file(path), None
+    except (LogImportError, OSError) as e:
+        return path, list(), str(e)
+
+
+def import_logs(paths: List[str], workers: int = 1, first_game_id: int = 0) -> Iterator[GameResult]:
+    """
+    paths のログを workers 個のプロセスで並列に解釈し、ゲームの結果を paths の順に返す。
+    ゲームの番号は first_game_id からの連番で振り直すので、ワーカー数によらず結果は同じ。
+    解釈できなかったファイルは警告を出して読み飛ばす。
+    """
+    if workers <= 1:
+        parsed = map(_parse_file_safely, paths)
+        return _renumber(parsed, first_game_id)
+
+    def run() -> Iterator[GameResult]:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunk_size = max(1, len(paths) // (workers * 8))
+            yield from _renumber(executor.map(_parse_file_safely, paths, chunksize=chunk_size), first_game_id)
+
+    return run()
+
+
+def _renumber(parsed: Iterable[Tuple[str, List[GameResult], Optional[str]]], first_game_id: int) -> Iterator[GameResult]:
+    game_id = first_game_id
+    for path, results, error in parsed:
+        if error is not None:
+            io.warn("ログ `%s` を取り込めませんでした: %s" % (path, error), thisFileLogger)
+            continue
+        for result in results:
+            result.game['game'] = game_id
+            result.turns['game'] = game_id
+            game_id += 1
+            yield result
+
+
+def import_to_archive(paths: List[str], archive_root: str, workers: int = 1, shard: Optional[str] = None) -> int:
+    """
+    paths のログを取り込んでアーカイブの一つのシャードに書き込む。書き込んだゲーム数を返す。
+    """
+    if shard is None:
+        shard = "import-%d" % os.getpid()
+    count = 0
+    with ArchiveWriter(archive_root, shard) as writer:
+        for result in import_logs(paths, workers):
+            writer.append(result.game, result.turns)
+            count += 1
+    return count
+
+
+def main(argv: List[str]):
+    workers = io.int_option(argv, "-j", 1)
+    archive_root = io.str_option(argv, "--archive")
+    archive_root = os.path.expanduser(archive_root) if archive_root is not None else None
+
+    # オプションでない引数をログのパスとみなす。無ければ DEFAULT_LOG_DIR の全てのログを取り込む。
+    option_values = {argv.index(name) + 1 for name in ("-j", "--archive") if name in argv}
+    paths = [arg for i, arg in enumerate(argv[1:], start=1) if not arg.startswith("-") and i not in option_values]
+    if len(paths) <= 0:
+        paths = sorted(glob.glob(os.path.join(DEFAULT_LOG_DIR, "*.log")))
+
+    if archive_root is not None:
+        n = import_to_archive(paths, archive_root, workers=workers)
+        io.success("%d 個のログから %d ゲームを `%s` に書き込みました。" % (len(paths), n, archive_root), logger=None)
+        return
+    print(analytics.StreamingAggregator().consume(import_logs(paths, workers)).format_summary())
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -1,12 +1,12 @@
 import enum
 from dataclasses import dataclass
-from typing import NamedTuple, Union, Optional, List, Set
+from typing import Dict, Iterator, NamedTuple, Union, Optional, List, Set
 
 import numpy as np
 
-from .rule import Pos
-from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT
-from .rule import is_within_area
+from . import actions
+from .rule import Pos, is_within_area
+from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT, INITIAL_HP
 
 
 class Response(enum.Enum):
@@ -73,6 +73,125 @@ class OpInfo(NamedTuple):
         raise Exception("type of `detail` is illegal")
 
 
+class ConfirmedEnemy(NamedTuple):
+    pos: Pos
+    hp: int  # HP の上界 (命中させた回数から求める)
+    last_seen: int  # 最後に位置が確定したターン数
+
+
+class ConfirmedEnemies:
+    """
+    位置が確定している艦の索引。
+    自軍の攻撃の命中で登録し、撃沈で削除する。移動した艦を特定できない場合は「見失った艦」(lost) に移す。
+    grid を渡すと、確定している艦の HP を grid (BattleData.opponent_grid) にも書き込む。
+
+    確率グリッドを走査して確率 1 のマスを探す代わりに、 `pos in confirmed` や len(confirmed) で O(1) で問い合わせる。
+    """
+
+    def __init__(self, grid: Optional[np.ndarray] = None):
+        self._grid = grid
+        self._entries: Dict[Pos, ConfirmedEnemy] = dict()
+        self._lost: Dict[Pos, ConfirmedEnemy] = dict()
+        # 確率の更新処理に渡す、確定している位置の集合 (_entries のキーと常に等しい)
+        self.cells: Set[Pos] = set()
+
+    def __contains__(self, pos: Pos) -> bool:
+        return pos in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[ConfirmedEnemy]:
+        return iter(self._entries.values())
+
+    def get(self, pos: Pos) -> Optional[ConfirmedEnemy]:
+        return self._entries.get(pos)
+
+    def lost(self) -> List[ConfirmedEnemy]:
+        """
+        見失った艦の、最後に確定していたときの情報。
+        """
+        return list(self._lost.values())
+
+    def put(self, enemy: ConfirmedEnemy) -> None:
+        """
+        enemy をそのまま登録する (スナップショットからの復元用)。
+        """
+        self._lost.pop(enemy.pos, None)
+        self._entries[enemy.pos] = enemy
+        self.cells.add(enemy.pos)
+        if self._grid is not None:
+            self._grid[enemy.pos.row, enemy.pos.col] = enemy.hp
+
+    def put_lost(self, enemy: ConfirmedEnemy) -> None:
+        self._lost[enemy.pos] = enemy
+
+    def discard(self, pos: Pos) -> None:
+        """
+        pos に艦はいないことが分かった。
+        """
+        if self._entries.pop(pos, None) is not None:
+            self.cells.discard(pos)
+            if self._grid is not None:
+                self._grid[pos.row, pos.col] = 0
+
+    def kill(self, pos: Pos) -> None:
+        """
+        pos の艦を撃沈した。
+        """
+        self.discard(pos)
+        self._lost.pop(pos, None)
+
+    def _known_hp(self, pos: Pos, origin: Optional[Pos]) -> int:
+        for key in (pos, origin):
+            for entries in (self._entries, self._lost):
+                if key is not None and key in entries:
+                    return entries[key].hp
+        return INITIAL_HP
+
+    def hit(self, pos: Pos, turn: int) -> None:
+        """
+        pos の艦に命中した (撃沈はしていない)。
+        """
+        self.put(ConfirmedEnemy(pos, max(1, self._known_hp(pos, None) - 1), turn))
+
+    def sight(self, pos: Pos, turn: int, origin: Optional[Pos] = None) -> None:
+        """
+        命中以外の推論で pos に艦がいることが分かった。 origin はその艦が以前いたと分かっている位置。
+        """
+        self.put(ConfirmedEnemy(pos, self._known_hp(pos, origin), turn))
+        if origin is not None and origin != pos:
+            self._lost.pop(origin, None)
+
+    def shift(self, dy: int, dx: int, turn: int) -> None:
+        """
+        確定している艦が全て (dy, dx) だけ移動した (生存している艦が 1 隻だけの場合)。
+        """
+        moved = [ConfirmedEnemy(Pos(e.pos.row + dy, e.pos.col + dx), e.hp, turn) for e in self._entries.values()]
+        self.clear()
+        for enemy in moved:
+            self.put(enemy)
+
+    def lose_movers(self, dy: int, dx: int) -> None:
+        """
+        どの艦が (dy, dx) だけ移動したか分からないので、移動できた艦を全て見失った艦にする。
+        移動先が盤面の外になる艦はその移動をできないので、確定したまま残す。
+        """
+        movers = [e for e in self._entries.values() if is_within_area(Pos(e.pos.row + dy, e.pos.col + dx))]
+        for enemy in movers:
+            self.discard(enemy.pos)
+        for enemy in movers:
+            self.put_lost(enemy)
+
+    def clear(self) -> None:
+        for pos in list(self._entries):
+            self.discard(pos)
+        self._lost.clear()
+
+    def most_recent(self) -> Optional[ConfirmedEnemy]:
+        return max(self._entries.values(), key=lambda e: (e.last_seen, -e.hp), default=None)
+
+
 class BattleData:
     """
 
@@ -92,7 +211,7 @@ class BattleData:
     opponent_grid: np.ndarray [np.int32]
         my_grid[row, col] := (row, col) マスの敵軍の潜水艦のHP。
         潜水艦が存在しない場合は 0。
-        位置が確定している敵軍の潜水艦はこのフィールドに記録される。
+        位置が確定している敵軍の潜水艦はこのフィールドに記録される (confirmed が書き込む)。
         0 <= row < 5, 0 <= col < 5
 
     prob: np.ndarray [np.float64]
@@ -111,6 +230,17 @@ class BattleData:
         攻撃をし続ける対象のセル位置。
         自軍の攻撃がヒットしたときに 非None になる。
         敵の移動情報 と 移動後に攻撃が当たったかどうか によって変動する。見失った場合は None になる。
+
+    exposure: np.ndarray [np.float64]
+        敵軍から見た自軍の潜水艦の存在確率 (prob の鏡像)。
+        敵軍が自軍と同じ方法で確率グリッドを更新していると仮定して、敵軍の攻撃・それへの自軍の反応・自軍の操作から更新する。
+        各セルの初期値は INITIAL_SUBMARINE_COUNT/25 で、総和は自軍の生存数に等しい。
+
+    confirmed: ConfirmedEnemies
+        位置が確定している敵艦の索引。 tracking_cell はこの中の一隻 (次も攻撃する対象)。
+
+    exposed: ConfirmedEnemies
+        敵軍から見て位置が確定している自軍の艦の索引 (exposure の更新に使う)。
     """
 
     def __init__(self, opponent_initial_submarine_count: int):
@@ -123,14 +253,13 @@ class BattleData:
         self.my_history: List[OpInfo] = list()
         self.opponent_history: List[OpInfo] = list()
         self.tracking_cell: Optional[Pos] = None
+        self.exposure: np.ndarray = np.full((ROW, COL), fill_value=INITIAL_SUBMARINE_COUNT / (ROW * COL),
+                                            dtype=np.float64)
+        self.confirmed = ConfirmedEnemies(self.opponent_grid)
+        self.exposed = ConfirmedEnemies()
 
     def set_of_my_submarine_positions(self) -> Set[Pos]:
-        grid = self.my_grid
-        return set(
-            Pos(row, col)
-            for row in range(ROW) for col in range(COL)
-            if grid[row, col] > 0
-        )
+        return set(actions.legal_actions(self.my_grid).positions)
 
     def has_game_finished(self) -> bool:
         return self.my_alive_count <= 0 or self.opponent_alive_count <= 0
@@ -139,30 +268,11 @@ class BattleData:
         """
         自軍が攻撃可能なマスを列挙して set として返す。
         """
-        attackable_cells: Set[Pos] = set()
-        submarine_poses = self.set_of_my_submarine_positions()
-
-        # 各潜水艦の周囲8マスを集合に追加 (dy=dx=0 の場合も追加してしまうけど後で取り除くのでOK)
-        for p in submarine_poses:
-            for dy in [-1, 0, +1]:
-                for dx in [-1, 0, +1]:
-                    attack_to = Pos(row=p.row + dy, col=p.col + dx)
-                    if is_within_area(attack_to):
-                        attackable_cells.add(attack_to)
-
-        # 自軍の潜水艦マスには攻撃できないので除く
-        return attackable_cells.difference(set(submarine_poses))
+        return set(actions.legal_actions(self.my_grid).attackable)
 
     def set_of_my_movable_cells(self, from_pos: Pos) -> Set[Pos]:
         """
         指定した位置から移動可能なマスを列挙する。
         """
         assert self.my_grid[from_pos.row, from_pos.col] > 0
-        my_submarine_poses = self.set_of_my_submarine_positions()
-        movable_cells: Set[Pos] = set()
-        for d in [-2, -1, +1, +2]:
-            for dy, dx in [(d, 0), (0, d)]:
-                to = Pos(row=from_pos.row + dy, col=from_pos.col + dx)
-                if is_within_area(to) and (to not in my_submarine_poses):
-                    movable_cells.add(to)
-        return movable_cells
+        return set(actions.legal_actions(self.my_grid).moves_from[from_pos])
@@ -0,0 +1,63 @@
+"""
+自軍の操作の決定や確率グリッドの更新に使う、調整可能なパラメータ。
+"""
+from dataclasses import dataclass, fields, replace
+from typing import Dict
+
+
+@dataclass(frozen=True)
+class DecisionParams:
+    """
+    Attributes
+    ----------
+    move_threshold_ratio: float
+        確率最高値のマスへ向けて移動するかどうかのしきい値の、敵軍の生存数に対する比。
+        (しきい値 = 敵軍の生存数 * move_threshold_ratio)
+
+    attack_threshold_ratio: float
+        攻撃可能なマスの最高確率値がこれを超えたら攻撃する、というしきい値の敵軍の生存数に対する比。
+
+    random_move_alive_count: int
+        自軍の生存数がこれ以下になったら、一定の確率でランダムに移動する。
+
+    random_move_chance: float
+        上記の場合にランダムに移動する確率。
+
+    zero_prob_tol: float
+        確率をゼロとみなす許容誤差 (反撃するかどうかの判定に使う)。
+
+    move_shift_ratio: float
+        敵軍が移動したときに、各マスの確率のうち移動先へずらす割合の係数 (0 以上 1 以下)。
+
+    hit_weight: float, info_weight: float
+        scorer.score_cells() に渡す、期待命中値と期待情報量の重み。
+
+    use_exposure: int
+        1 なら、移動先や移動する艦を選ぶときに、敵軍から見た自軍の存在確率 (BattleData.exposure) が小さくなる方を優先する。
+    """
+    move_threshold_ratio: float = 0.1
+    attack_threshold_ratio: float = 0.1
+    random_move_alive_count: int = 2
+    random_move_chance: float = 0.5
+    zero_prob_tol: float = 1e-7
+    move_shift_ratio: float = 1.0
+    hit_weight: float = 1.0
+    info_weight: float = 0.5
+    use_exposure: int = 1
+
+    def to_dict(self) -> Dict[str, float]:
+        return {f.name: getattr(self, f.name) for f in fields(self)}
+
+    @staticmethod
+    def from_dict(d: Dict[str, float]) -> 'DecisionParams':
+        """
+        d に含まれない項目はデフォルト値のままにする。int の項目は丸める。
+        """
+        kwargs = dict()
+        for f in fields(DecisionParams):
+            if f.name in d:
+                kwargs[f.name] = int(round(d[f.name])) if f.type in (int, 'int') else float(d[f.name])
+        return replace(DEFAULT_PARAMS, **kwargs)
+
+
+DEFAULT_PARAMS = DecisionParams()
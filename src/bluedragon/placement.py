@@ -0,0 +1,200 @@
+"""
+自軍の初期配置の評価。
+
+5x5 のマスに INITIAL_SUBMARINE_COUNT 隻を置く全ての配置 (C(25, 4) = 12650 通り) を、
+盤面の対称性 (回転・反転の 8 通り) で同一視した類ごとに、複数の攻撃者モデルに対して評価する。
+評価はプロセスプールでバッチごとに行い、結果はディスクにキャッシュする。
+
+攻撃者モデルは「序盤の攻撃先の分布」で、攻撃は各ターン独立にその分布に従うとする。
+配置の評価値は、SHOTS 回の攻撃を受けたときの
+    (期待被弾数) + DETECTION_WEIGHT * (Hit または Near で位置を知られる確率)
+の攻撃者モデルに関する平均に -1 をかけたもの (大きいほど良い)。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import tablecache
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_HP, INITIAL_SUBMARINE_COUNT
+from .rule import set_of_around_cells
+
+# 評価に使う攻撃回数
+SHOTS = 8
+# 位置を知られる確率の重み
+DETECTION_WEIGHT = 2.0
+# initialize_my_placement() で抽選する上位の類の個数
+TOP_K = 16
+# 評価方法を変更したらインクリメントすること (キャッシュが無効になる)
+EVALUATOR_VERSION = 1
+
+DEFAULT_CACHE_DIR = tablecache.DEFAULT_CACHE_DIR
+
+CELLS = ROW * COL
+SYMMETRY_COUNT = 8
+
+
+class PlacementTable(NamedTuple):
+    """
+    対称性で同一視した配置の類の評価結果。評価値の降順に並んでいる。
+    masks[i] は類の代表の配置 (bit (row * COL + col) が立っているマスに潜水艦がいる)。
+    """
+    masks: np.ndarray  # (C,) int64
+    scores: np.ndarray  # (C,) float64
+    class_sizes: np.ndarray  # (C,) int64
+
+
+def _symmetry_permutations() -> np.ndarray:
+    """
+    盤面の回転・反転 8 通りそれぞれについて、変換後のマス番号 perm[k, cell] を返す。
+    """
+    assert ROW == COL
+    ys, xs = np.divmod(np.arange(CELLS), COL)
+    n = ROW - 1
+    transforms = [
+        (ys, xs), (xs, n - ys), (n - ys, n - xs), (n - xs, ys),
+        (ys, n - xs), (n - ys, xs), (xs, ys), (n - xs, n - ys),
+    ]
+    return np.array([ty * COL + tx for ty, tx in transforms], dtype=np.int64)
+
+
+def _cover_matrix() -> np.ndarray:
+    """
+    A[i, j] := マス j を攻撃したとき、マス i の潜水艦について Hit または Near が返るなら 1。
+    """
+    a = np.zeros((CELLS, CELLS), dtype=np.float64)
+    for i in range(CELLS):
+        p = Pos(i // COL, i % COL)
+        a[i, i] = 1.0
+        for q in set_of_around_cells(p):
+            a[i, q.row * COL + q.col] = 1.0
+    return a
+
+
+def all_placements() -> np.ndarray:
+    """
+    全ての配置を (M, CELLS) の bool 配列で返す。
+    """
+    combos = np.array(list(combinations(range(CELLS), INITIAL_SUBMARINE_COUNT)), dtype=np.int64)
+    placements = np.zeros((len(combos), CELLS), dtype=bool)
+    placements[np.arange(len(combos))[:, None], combos] = True
+    return placements
+
+
+def to_masks(placements: np.ndarray) -> np.ndarray:
+    return placements.astype(np.int64) @ (np.int64(1) << np.arange(CELLS, dtype=np.int64))
+
+
+def from_masks(masks: np.ndarray) -> np.ndarray:
+    return ((masks[:, None] >> np.arange(CELLS, dtype=np.int64)) & 1).astype(bool)
+
+
+def canonical_masks(placements: np.ndarray) -> np.ndarray:
+    """
+    各配置を、回転・反転した 8 通りの bit マスクのうち最小のもの (類の代表) に変換する。
+    """
+    weights = np.int64(1) << np.arange(CELLS, dtype=np.int64)
+    result = None
+    for perm in _symmetry_permutations():
+        transformed = np.zeros(CELLS, dtype=np.int64)
+        transformed[perm] = weights
+        masks = placements.astype(np.int64) @ transformed
+        result = masks if result is None else np.minimum(result, masks)
+    return result
+
+
+def attacker_models() -> Dict[str, np.ndarray]:
+    """
+    攻撃者モデル (攻撃先のマスの分布) の一覧。
+    """
+    ys, xs = np.divmod(np.arange(CELLS), COL)
+    cover_counts = _cover_matrix().sum(axis=1)
+
+    uniform = np.ones(CELLS)
+    # 中央付近を好む攻撃者 (logic.suggest_my_op の初手と同じく中央 3x3 を狙う)
+    center = np.where((ys >= 1) & (ys < ROW - 1) & (xs >= 1) & (xs < COL - 1), 4.0, 1.0)
+    # 波高しで多くのマスを調べられる位置 (周囲のマスが多い位置) を好む攻撃者
+    coverage = cover_counts ** 2
+    return {name: q / q.sum() for name, q in [("uniform", uniform), ("center", center), ("coverage", coverage)]}
+
+
+def evaluate_batch(placements: np.ndarray, models: np.ndarray) -> np.ndarray:
+    """
+    placements (B, CELLS) の各配置を、攻撃者モデル models (K, CELLS) に対して評価した (B,) 配列を返す。
+    """
+    p = placements.astype(np.float64)
+    cover = (p @ _cover_matrix().T) > 0  # cover[b, j]: 配置 b に対してマス j を攻撃すると Hit または Near
+    expected_hits = SHOTS * (p @ models.T)
+    detection = 1.0 - (1.0 - cover.astype(np.float64) @ models.T) ** SHOTS
+    return -(expected_hits + DETECTION_WEIGHT * detection).mean(axis=1)
+
+
+def _cache_params(models: Dict[str, np.ndarray]) -> Dict[str, Any]:
+    return {"shots": SHOTS, "detection_weight": DETECTION_WEIGHT, "models": sorted(models)}
+
+
+def build_table(workers: int = 1, batch_size: int = 512) -> PlacementTable:
+    """
+    全ての配置の類を評価して PlacementTable を作る。
+    """
+    placements = all_placements()
+    canon = canonical_masks(placements)
+    reps, class_sizes = np.unique(canon, return_counts=True)
+    rep_placements = from_masks(reps)
+
+    models = np.array(list(attacker_models().values()))
+    batches = [rep_placements[i:i + batch_size] for i in range(0, len(rep_placements), batch_size)]
+    if workers <= 1:
+        scores = np.concatenate([evaluate_batch(b, models) for b in batches])
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scores = np.concatenate(list(executor.map(evaluate_batch, batches, [models] * len(batches))))
+
+    order = np.argsort(-scores, kind='stable')
+    return PlacementTable(masks=reps[order], scores=scores[order], class_sizes=class_sizes[order])
+
+
+def load_table(cache_dir: tablecache.CacheDir = tablecache.CONFIGURED, workers: int = 1) -> PlacementTable:
+    """
+    キャッシュ (tablecache) があればメモリマップし、無ければ build_table() で作ってキャッシュに保存する。
+    cache_dir が None ならキャッシュを使わない。指定しなければ tablecache.configured_cache_dir() を使う。
+    """
+    def build() -> Dict[str, np.ndarray]:
+        return build_table(workers)._asdict()
+
+    table = tablecache.load("placement", EVALUATOR_VERSION, build, _cache_params(attacker_models()), cache_dir)
+    return PlacementTable(masks=table["masks"], scores=table["scores"], class_sizes=table["class_sizes"])
+
+
+def placement_grid(mask: int) -> np.ndarray:
+    """
+    bit マスクの配置を (ROW, COL) の HP グリッドに変換する。
+    """
+    return (from_masks(np.array([mask], dtype=np.int64))[0] * INITIAL_HP).astype(np.int32).reshape(ROW, COL)
+
+
+def transform_grid(grid: np.ndarray, symmetry: int) -> np.ndarray:
+    """
+    grid に symmetry 番目 (0 <= symmetry < SYMMETRY_COUNT) の回転・反転を施したグリッドを返す。
+    """
+    result = np.zeros(CELLS, dtype=grid.dtype)
+    result[_symmetry_permutations()[symmetry]] = np.asarray(grid).ravel()
+    return result.reshape(ROW, COL)
+
+
+_top_candidates: Optional[Tuple[List[np.ndarray], List[int]]] = None
+
+
+def top_candidates(k: int = TOP_K) -> Tuple[List[np.ndarray], List[int]]:
+    """
+    評価値が上位 k 個の類の (代表の配置のグリッドのリスト, 類に属する配置の個数のリスト) を返す。
+    load_table() はプロセス内で一度だけ行う。
+    """
+    global _top_candidates
+    if _top_candidates is None or len(_top_candidates[0]) != k:
+        table = load_table()
+        _top_candidates = ([placement_grid(int(mask)) for mask in table.masks[:k]],
+                           [int(size) for size in table.class_sizes[:k]])
+    return _top_candidates
@@ -0,0 +1,191 @@
+"""
+端末に対戦の様子を描画する、差分描画のレンダラ。
+
+1 フレームは「画面上の位置 → 文字列」のフィールドの集合 (Screen) で表す。
+Renderer は前回描画したフレームと比べて変化したフィールドだけを、ANSI のカーソル移動で上書きする。
+1 フレーム分の出力は一つのバッファにまとめてから一度に書き込み、描画の頻度は fps で制限する。
+そのため自己対戦を毎秒数百ターンで観戦しても、端末への出力がボトルネックにならない。
+"""
+import math
+import re
+import sys
+import time
+import unicodedata
+from typing import Callable, Dict, Optional, TextIO, Tuple
+
+import numpy as np
+
+from .io import Color
+from .model import BattleData, OpInfo
+from .rule import ROW, COL
+
+_ANSI_PATTERN = re.compile(r"\033\[[0-9;]*[A-Za-z]")
+
+CLEAR_SCREEN = "\033[2J"
+HIDE_CURSOR = "\033[?25l"
+SHOW_CURSOR = "\033[?25h"
+
+
+def visible_width(text: str) -> int:
+    """
+    制御文字を除いた文字列の、端末上での幅 (全角文字は 2)。
+    """
+    return sum(2 if unicodedata.east_asian_width(c) in "WF" else 1 for c in _ANSI_PATTERN.sub("", text))
+
+
+def move_cursor(row: int, col: int) -> str:
+    """
+    0-indexed の (row, col) へカーソルを移動する制御文字列。
+    """
+    return "\033[%d;%dH" % (row + 1, col + 1)
+
+
+class Screen:
+    """
+    1 フレームの内容。 fields[(row, col)] はその位置から書く文字列 (色の制御文字を含んでもよい)。
+    """
+
+    def __init__(self):
+        self.fields: Dict[Tuple[int, int], str] = dict()
+
+    def put(self, row: int, col: int, text: str) -> None:
+        self.fields[(row, col)] = text
+
+    @property
+    def height(self) -> int:
+        return max((row for row, _ in self.fields), default=-1) + 1
+
+
+class Renderer:
+    """
+    Screen を差分描画する。
+
+    fps が正なら、前回の描画から 1/fps 秒経っていないフレームは描画せずに保留し、
+    次に描画するとき (または flush() したとき) に最新のフレームだけを描画する。
+    """
+
+    def __init__(self, out: Optional[TextIO] = None, fps: float = 30.0,
+                 clock: Callable[[], float] = time.monotonic):
+        self._out = out if out is not None else sys.stdout
+        self._interval = 1.0 / fps if fps > 0 else 0.0
+        self._clock = clock
+        self._last_drawn = -math.inf
+        # 描画済みのフィールド: 位置 → (文字列, 幅)
+        self._drawn: Dict[Tuple[int, int], Tuple[str, int]] = dict()
+        self._pending: Optional[Screen] = None
+        self._started = False
+        self._height = 0
+        self.frames_drawn = 0
+        self.frames_skipped = 0
+        self.bytes_written = 0
+
+    def draw(self, screen: Screen, force: bool = False) -> bool:
+        """
+        screen を描画する。描画の頻度の制限で保留した場合は False を返す。
+        """
+        now = self._clock()
+        if not force and now - self._last_drawn < self._interval:
+            self._pending = screen
+            self.frames_skipped += 1
+            return False
+        self._pending = None
+        self._last_drawn = now
+
+        buf = []
+        if not self._started:
+            buf.append(HIDE_CURSOR + CLEAR_SCREEN)
+            self._started = True
+
+        # 前のフレームにあって今回のフレームに無いフィールドは空白で消す
+        for pos, (_, width) in list(self._drawn.items()):
+            if pos not in screen.fields:
+                buf.append(move_cursor(*pos) + " " * width)
+                del self._drawn[pos]
+
+        for pos, text in sorted(screen.fields.items()):
+            prev = self._drawn.get(pos)
+            if prev is not None and prev[0] == text:
+                continue
+            width = visible_width(text)
+            # 前の文字列の方が長ければ、はみ出した部分を空白で消す
+            padding = " " * max(0, (prev[1] if prev is not None else 0) - width)
+            buf.append(move_cursor(*pos) + text + padding)
+            self._drawn[pos] = (text, width)
+
+        self._height = max(self._height, screen.height)
+        self._write("".join(buf))
+        self.frames_drawn += 1
+        return True
+
+    def flush(self) -> None:
+        """
+        保留しているフレームがあれば描画する。
+        """
+        if self._pending is not None:
+            self.draw(self._pending, force=True)
+
+    def close(self) -> None:
+        """
+        保留しているフレームを描画し、カーソルを描画領域の下へ移動して表示を元に戻す。
+        """
+        self.flush()
+        if self._started:
+            self._write(move_cursor(self._height, 0) + SHOW_CURSOR + "\n")
+
+    def _write(self, s: str) -> None:
+        self._out.write(s)
+        self._out.flush()
+        self.bytes_written += len(s)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# 盤面の表示位置 (列): 自軍の配置, 敵軍の配置, 自軍から見た確率
+_GRID_LEFT = (0, 22, 44)
+_GRID_TOP = 3
+_CELL_WIDTH = 3
+
+
+def _prob_cell(p: float) -> str:
+    text = "%3d" % int(round(p * 100))
+    if p >= 1.0 - 1e-7:
+        return Color.red(text)
+    if p >= 0.3:
+        return Color.yellow(text)
+    if p <= 1e-7:
+        return Color.cyan("  .")
+    return text
+
+
+def _hp_cell(hp: int) -> str:
+    return "%3s" % (hp if hp > 0 else ".")
+
+
+def _put_grid(screen: Screen, left: int, title: str, cells: np.ndarray, fmt: Callable) -> None:
+    screen.put(_GRID_TOP - 2, left, Color.magenta(title))
+    screen.put(_GRID_TOP - 1, left, Color.magenta("  " + "".join("%3d" % (c + 1) for c in range(COL))))
+    for row in range(ROW):
+        screen.put(_GRID_TOP + row, left, Color.magenta(" " + chr(ord('A') + row)))
+        for col in range(COL):
+            screen.put(_GRID_TOP + row, left + 2 + col * _CELL_WIDTH, fmt(cells[row, col]))
+
+
+def battle_screen(me: BattleData, opponent: BattleData, turn_count: int, last_op: Optional[OpInfo] = None,
+                  caption: str = "") -> Screen:
+    """
+    自己対戦の観戦用のフレーム。両軍の配置と、自軍から見た確率グリッドを並べて表示する。
+    """
+    screen = Screen()
+    screen.put(0, 0, Color.green("[Turn%03d]" % turn_count) + " " + caption)
+    _put_grid(screen, _GRID_LEFT[0], "自軍 (%d)" % me.my_alive_count, me.my_grid, _hp_cell)
+    _put_grid(screen, _GRID_LEFT[1], "敵軍 (%d)" % opponent.my_alive_count, opponent.my_grid, _hp_cell)
+    _put_grid(screen, _GRID_LEFT[2], "敵艦の存在確率 [%]", me.prob, _prob_cell)
+    status_row = _GRID_TOP + ROW + 1
+    screen.put(status_row, 0, "直前の操作: " + (Color.yellow(last_op) if last_op is not None else "-"))
+    screen.put(status_row + 1, 0, "位置が明らかな敵艦: " +
+               ("None" if me.tracking_cell is None else me.tracking_cell.code()))
+    return screen
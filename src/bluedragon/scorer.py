@@ -0,0 +1,151 @@
+"""
+攻撃先マスの評価 (期待命中値 + 期待情報量)。
+
+確率グリッド prob を「各マスに敵艦が独立に存在する確率」とみなして、
+全マスに対する Hit/Dead/Near/Nothing の反応の確率分布を一度の numpy 演算でまとめて求める。
+反応は真の配置から一意に決まるので、攻撃によって得られる期待情報量は反応分布のエントロピーに等しい。
+
+どの関数も、末尾の2軸が (ROW, COL) であれば、先頭にバッチ軸を持つ配列 (例えば (N, ROW, COL)) をそのまま受け付ける。
+"""
+import numpy as np
+
+from .actions import MOVE_DIRECTIONS
+from .model import Response
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_HP
+
+# response_distribution() の戻り値の第0軸の並び
+RESPONSES = (Response.Hit, Response.Dead, Response.Near, Response.Nothing)
+
+# HP が分からない敵艦に命中したとき、それが撃沈になる確率 (HP が 1..INITIAL_HP で一様と仮定)
+DEAD_RATIO_UNKNOWN_HP = 1.0 / INITIAL_HP
+
+
+def _padded(grid: np.ndarray, fill) -> np.ndarray:
+    """
+    grid の周囲を fill で1マス分パディングした配列を返す。 (np.pad より軽い)
+    """
+    padded = np.full(grid.shape[:-2] + (ROW + 2, COL + 2), fill, dtype=grid.dtype)
+    padded[..., 1:-1, 1:-1] = grid
+    return padded
+
+
+def _shifted_views(padded: np.ndarray):
+    """
+    1マス分パディングした配列から、周囲8方向それぞれにずらした (ROW, COL) のビューを列挙する。
+    """
+    for dy in (0, 1, 2):
+        for dx in (0, 1, 2):
+            if (dy, dx) != (1, 1):
+                yield padded[..., dy:dy + ROW, dx:dx + COL]
+
+
+def attackable_mask(my_grid: np.ndarray) -> np.ndarray:
+    """
+    BattleData.set_of_my_attackable_cells() の numpy 版。
+    自軍の潜水艦の周囲8マスを True とし、自軍の潜水艦のマスを False とした bool 配列を返す。
+    """
+    occupied = my_grid > 0
+    padded = _padded(occupied, False)
+    mask = np.zeros(occupied.shape, dtype=bool)
+    for view in _shifted_views(padded):
+        mask |= view
+    return mask & ~occupied
+
+
+def response_distribution(prob: np.ndarray, dead_ratio: float = DEAD_RATIO_UNKNOWN_HP) -> np.ndarray:
+    """
+    各マスを攻撃したときの反応の確率分布を返す。
+    戻り値 dist は shape (4, ..., ROW, COL) で、dist[i, y, x] は (y, x) を攻撃したときに RESPONSES[i] が返る確率。
+    dist.sum(axis=0) は全マスで 1 になる。
+    """
+    p = np.clip(prob, 0.0, 1.0)
+    q = 1.0 - p
+
+    # 周囲8マスのどこにも敵艦がいない確率
+    padded = _padded(q, 1.0)
+    around_empty = np.ones(p.shape, dtype=np.float64)
+    for view in _shifted_views(padded):
+        around_empty *= view
+
+    dist = np.empty((len(RESPONSES),) + p.shape, dtype=np.float64)
+    dist[0] = p * (1.0 - dead_ratio)
+    dist[1] = p * dead_ratio
+    dist[2] = q * (1.0 - around_empty)
+    dist[3] = q * around_empty
+    return dist
+
+
+def response_entropy(dist: np.ndarray) -> np.ndarray:
+    """
+    反応分布のエントロピー [bit] を各マスについて求める。
+    """
+    # 0 * log(0) = 0 として扱うため、log の引数には 0 の代わりに 1 を渡す
+    return -(dist * np.log2(np.where(dist > 0.0, dist, 1.0))).sum(axis=0)
+
+
+def score_cells(prob: np.ndarray, attackable: np.ndarray,
+                hit_weight: float = 1.0, info_weight: float = 0.5) -> np.ndarray:
+    """
+    攻撃可能な全マスを 「hit_weight * 期待命中値 + info_weight * 期待情報量」 で評価した prob と同じ shape の配列を返す。
+    期待命中値は Hit または Dead が返る確率。攻撃できないマスの評価値は -inf 。
+    """
+    dist = response_distribution(prob)
+    score = hit_weight * (dist[0] + dist[1]) + info_weight * response_entropy(dist)
+    return np.where(attackable, score, -np.inf)
+
+
+def best_cell(score: np.ndarray) -> Pos:
+    """
+    score_cells() の結果から評価値が最大のマスを返す。同点の場合は row, col が小さいマスを優先する。
+    """
+    y, x = np.unravel_index(int(np.argmax(score)), score.shape)
+    return Pos(int(y), int(x))
+
+
+def _move_slices(dy: int, dx: int):
+    """
+    (dy, dx) の移動で、移動元として盤面内に移動先があるマスの範囲と、その移動先の範囲のスライスの組。
+    """
+    src = (slice(max(0, -dy), ROW - max(0, dy)), slice(max(0, -dx), COL - max(0, dx)))
+    dst = (slice(max(0, dy), ROW + min(0, dy)), slice(max(0, dx), COL + min(0, dx)))
+    return src, dst
+
+
+def shifted_beliefs(prob: np.ndarray, shift_ratio: float = 1.0) -> np.ndarray:
+    """
+    MOVE_DIRECTIONS のそれぞれの方向へ移動したと知らされた後の確率グリッドを、全方向まとめて求める。
+    logic._update_prob_for_opponent_move() と同じ更新 (各マスから p * (p / 移動元の確率の総和) * shift_ratio を移動先へ動かす)
+    の numpy 版で、戻り値は shape (len(MOVE_DIRECTIONS), ..., ROW, COL)。
+    """
+    out = np.empty((len(MOVE_DIRECTIONS),) + prob.shape, dtype=np.float64)
+    for i, (dy, dx) in enumerate(MOVE_DIRECTIONS):
+        (sy, sx), (ty, tx) = _move_slices(dy, dx)
+        src = prob[..., sy, sx]
+        total = src.sum(axis=(-2, -1), keepdims=True)
+        moved = np.where(total > 1e-7, src * src / np.where(total > 1e-7, total, 1.0) * shift_ratio, 0.0)
+        out[i] = prob
+        out[i][..., sy, sx] -= moved
+        out[i][..., ty, tx] += moved
+    return out
+
+
+def move_danger(exposure: np.ndarray, my_grid: np.ndarray, shift_ratio: float = 1.0) -> np.ndarray:
+    """
+    自軍の各移動の後に、敵軍から見て自軍の潜水艦がいるマスの確率 (exposure を移動で更新したもの) の総和。
+    小さいほど移動後の自軍の位置を敵軍に見つけられにくい。
+    戻り値 danger は shape (len(MOVE_DIRECTIONS), ..., ROW, COL) で、
+    danger[d, y, x] は (y, x) の艦を MOVE_DIRECTIONS[d] の方向へ動かしたときの値。移動できない場合は inf。
+    """
+    occupied = my_grid > 0
+    shifted = shifted_beliefs(exposure, shift_ratio)
+    danger = np.full(shifted.shape, np.inf)
+    for i, (dy, dx) in enumerate(MOVE_DIRECTIONS):
+        (sy, sx), (ty, tx) = _move_slices(dy, dx)
+        s = shifted[i]
+        base = (s * occupied).sum(axis=(-2, -1), keepdims=True)
+        # 移動する艦の分を移動元から移動先へ付け替える
+        value = base - s[..., sy, sx] + s[..., ty, tx]
+        movable = occupied[..., sy, sx] & ~occupied[..., ty, tx]
+        danger[i][..., sy, sx] = np.where(movable, value, np.inf)
+    return danger
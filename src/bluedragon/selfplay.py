@@ -0,0 +1,401 @@
+"""
+端末の入出力を行わずに、自軍のロジック同士 (または他の戦略と) を対戦させる。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.selfplay -g 1000 -j 4 --opponent random --archive ~/.submarine-destroyer/archive
+    $ python3 -m bluedragon.selfplay -g 10 --watch --fps 30     # 観戦モード
+"""
+import enum
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import analytics
+from . import codec
+from . import invariant
+from . import io
+from . import logic
+from . import render
+from .archive import ArchiveWriter
+from .model import OpInfo, AttackInfo, MoveInfo, BattleData
+from .params import DecisionParams, DEFAULT_PARAMS
+from .shmbatch import BatchLayout, SharedBatch
+from .rule import ROW, COL, INITIAL_HP, INITIAL_SUBMARINE_COUNT
+from .telemetry import Branch
+
+DEFAULT_MAX_TURNS = 200
+
+
+class Strategy(enum.IntEnum):
+    """
+    対戦相手の戦略。
+    """
+    Logic = 0  # logic.suggest_my_op()
+    Random = 1  # ランダムな合法手
+    Human = 2  # 人間 (logimport で過去の実戦のログから取り込んだゲームの記録用。対戦には使えない)
+
+
+@dataclass(frozen=True)
+class GameSpec:
+    """
+    1 ゲームの設定。
+    opponent_count は敵軍の潜水艦の初期個数 (main.py の `-n` に相当)。
+    seed はこのゲームで使う全ての乱数の元になる。 同じ spec なら、どのプロセスでどの順に対戦させても結果は同じ。
+    params は自軍側のパラメータ。敵軍側が Strategy.Logic の場合は常に DEFAULT_PARAMS を使う。
+    """
+    game: int
+    seed: int
+    opponent: Strategy = Strategy.Logic
+    opponent_count: int = INITIAL_SUBMARINE_COUNT
+    me_first: bool = True
+    max_turns: int = DEFAULT_MAX_TURNS
+    params: DecisionParams = DEFAULT_PARAMS
+
+
+class GameResult(NamedTuple):
+    game: np.ndarray  # codec.GAME_DTYPE のレコード (shape (1,))
+    turns: np.ndarray  # codec.TURN_DTYPE の配列
+
+
+def game_seed(root_seed: int, game: int) -> int:
+    """
+    root_seed から派生させた、game 番目のゲームのシード。
+    numpy の SeedSequence の spawn と同じ方法で派生させるので、ゲームごとの乱数列は互いに独立とみなせる。
+    """
+    seq = np.random.SeedSequence(root_seed, spawn_key=(game,))
+    return int(seq.generate_state(1, np.uint64)[0] >> np.uint64(1))
+
+
+def game_rngs(seed: int) -> Tuple[np.random.Generator, np.random.Generator]:
+    """
+    ゲームのシードから、(自軍側の乱数生成器, 敵軍側の乱数生成器) を作る。
+    両軍で乱数列を分けるので、一方のパラメータを変えても他方の乱数列は変わらない。
+    """
+    mine, opponent = np.random.SeedSequence(seed).spawn(2)
+    return np.random.default_rng(mine), np.random.default_rng(opponent)
+
+
+def strategy_option(argv: List[str], default: Strategy = Strategy.Logic) -> Strategy:
+    """
+    コマンドライン引数の `--opponent <logic|random>` から対戦相手の戦略を取り出す。
+    """
+    choices = [s.name.lower() for s in (Strategy.Logic, Strategy.Random)]
+    return Strategy[io.choice_option(argv, "--opponent", choices, default.name.lower()).capitalize()]
+
+
+def _suggest_random_op(data: BattleData, cur_turn_count: int, rng: np.random.Generator) -> OpInfo:
+    """
+    ランダムな合法手を返す。攻撃可能なマスがあれば 7 割の確率で攻撃する。
+    """
+    attackable_cells = sorted(data.set_of_my_attackable_cells())
+    if len(attackable_cells) > 0 and rng.random() < 0.7:
+        return OpInfo(AttackInfo(attack_pos=attackable_cells[rng.integers(len(attackable_cells))]),
+                      turn_count=cur_turn_count)
+
+    moves = [
+        (p, dest)
+        for p in sorted(data.set_of_my_submarine_positions())
+        for dest in sorted(data.set_of_my_movable_cells(p))
+    ]
+    if len(moves) <= 0:
+        return OpInfo(AttackInfo(attack_pos=attackable_cells[rng.integers(len(attackable_cells))]),
+                      turn_count=cur_turn_count)
+    actor, dest = moves[rng.integers(len(moves))]
+    return OpInfo(MoveInfo(fromPos=actor, dirY=dest.row - actor.row, dirX=dest.col - actor.col),
+                  turn_count=cur_turn_count)
+
+
+def suggest(strategy: Strategy, data: BattleData, cur_turn_count: int, rng: np.random.Generator,
+            params: DecisionParams = DEFAULT_PARAMS) -> Tuple[OpInfo, Branch]:
+    if strategy is Strategy.Logic:
+        return logic.suggest_my_op_with_branch(data, cur_turn_count, params, rng)
+    if strategy is Strategy.Random:
+        return _suggest_random_op(data, cur_turn_count, rng), Branch.Unknown
+    raise ValueError("unknown strategy: %s" % strategy)
+
+
+def _place_randomly(data: BattleData, count: int, rng: np.random.Generator) -> None:
+    cells = rng.choice(ROW * COL, size=count, replace=False)
+    data.my_grid[:, :] = 0
+    for cell in cells:
+        data.my_grid[cell // COL, cell % COL] = INITIAL_HP
+    data.my_alive_count = count
+    # 敵軍から見た自軍の存在確率も、実際の隻数に合わせる
+    data.exposure[:, :] = count / (ROW * COL)
+
+
+# 1 手ごとに呼ばれるコールバック: (ターン数, 自軍側の対戦データ, 敵軍側の対戦データ, その手の操作)
+TurnCallback = Callable[[int, BattleData, BattleData, OpInfo], None]
+
+
+def _play(spec: GameSpec, me: BattleData, opponent: BattleData, turns: np.ndarray,
+          on_turn: Optional[TurnCallback] = None) -> Tuple[int, int]:
+    """
+    初期状態の me と opponent で 1 ゲームを最後まで (またはターン数の上限まで) 進め、
+    各手を turns (codec.TURN_DTYPE の長さ spec.max_turns 以上の配列) に記録する。
+    on_turn が指定されていれば、各手を適用した後に呼ぶ。
+    (勝者, ターン数) を返す。勝者は codec.SIDE_ME, codec.SIDE_OPPONENT, または引き分けなら -1。
+    """
+    rngs = game_rngs(spec.seed)
+
+    logic.initialize_my_placement(me, rngs[codec.SIDE_ME])
+    if spec.opponent is Strategy.Logic and spec.opponent_count == INITIAL_SUBMARINE_COUNT:
+        logic.initialize_my_placement(opponent, rngs[codec.SIDE_OPPONENT])
+    else:
+        _place_randomly(opponent, spec.opponent_count, rngs[codec.SIDE_OPPONENT])
+
+    sides = (me, opponent)
+    strategies = (Strategy.Logic, spec.opponent)
+    params = (spec.params, DEFAULT_PARAMS)
+    turns[:spec.max_turns] = 0
+    turns['game'] = spec.game
+
+    side = codec.SIDE_ME if spec.me_first else codec.SIDE_OPPONENT
+    turn_count = 0
+    while not me.has_game_finished() and turn_count < spec.max_turns:
+        turn_count += 1
+        actor, target = sides[side], sides[1 - side]
+
+        rec = turns[turn_count - 1]
+        rec['turn'] = turn_count
+        rec['side'] = side
+        rec['my_alive'] = actor.my_alive_count
+        rec['opp_alive'] = actor.opponent_alive_count
+        rec['tracking'] = codec.cell_index(actor.tracking_cell)
+        rec['prev_opp_kind'] = codec.op_kind(actor.opponent_history[-1] if len(actor.opponent_history) > 0 else None)
+
+        op, branch = suggest(strategies[side], actor, turn_count, rngs[side], params[side])
+        logic.apply_my_op(actor, op, params[side])
+
+        # 相手側には、移動元を伏せた状態で操作を伝える
+        if op.is_attack():
+            resp = logic.apply_opponent_op(target, OpInfo(AttackInfo(attack_pos=op.detail.attack_pos),
+                                                          turn_count=turn_count), params[1 - side])
+            logic.apply_attack_response(actor, resp)
+        else:
+            logic.apply_opponent_op(target, OpInfo(MoveInfo(fromPos=None, dirY=op.detail.dirY, dirX=op.detail.dirX),
+                                                   turn_count=turn_count), params[1 - side])
+        logic.update_tracking_cell(actor)
+
+        codec.write_op(rec, op)
+        rec['branch'] = branch
+        side = 1 - side
+        if on_turn is not None:
+            on_turn(turn_count, me, opponent, op)
+
+    if me.opponent_alive_count <= 0:
+        winner = codec.SIDE_ME
+    elif me.my_alive_count <= 0:
+        winner = codec.SIDE_OPPONENT
+    else:
+        winner = -1
+    return winner, turn_count
+
+
+def _write_game_record(rec: np.ndarray, spec: GameSpec, winner: int, turn_count: int) -> None:
+    rec['game'] = spec.game
+    rec['seed'] = spec.seed
+    rec['opponent'] = spec.opponent
+    rec['n'] = spec.opponent_count
+    rec['me_first'] = spec.me_first
+    rec['winner'] = winner
+    rec['turns'] = turn_count
+
+
+def play_game(spec: GameSpec, on_turn: Optional[TurnCallback] = None) -> GameResult:
+    """
+    1 ゲームを最後まで (またはターン数の上限まで) 進めて結果を返す。
+    自軍側は常に logic.suggest_my_op() で操作する。
+    """
+    turns = np.zeros(spec.max_turns, dtype=codec.TURN_DTYPE)
+    winner, turn_count = _play(spec, BattleData(spec.opponent_count), BattleData(INITIAL_SUBMARINE_COUNT), turns,
+                               on_turn)
+    game = np.zeros(1, dtype=codec.GAME_DTYPE)
+    _write_game_record(game, spec, winner, turn_count)
+    return GameResult(game=game, turns=turns[:turn_count].copy())
+
+
+def play_games(specs: Iterable[GameSpec]) -> Iterator[GameResult]:
+    """
+    specs のゲームを順に対戦させ、終わったものから結果を返す。
+    """
+    for spec in specs:
+        yield play_game(spec)
+
+
+class _SharedTask(NamedTuple):
+    """
+    ワーカーに渡すタスク記述子。共有メモリ name の [lo, hi) のスロットのゲームを対戦させる。
+    各スロットのゲームの設定は共有メモリの games に書かれている。
+    """
+    name: str
+    layout: BatchLayout
+    lo: int
+    hi: int
+    max_turns: int
+    params: DecisionParams
+
+
+def _play_shared(task: _SharedTask) -> int:
+    """
+    task のスロットのゲームを、共有メモリ上の状態をその場で更新しながら対戦させる。
+    """
+    batch = SharedBatch.attach(task.name, task.layout)
+    try:
+        for slot in range(task.lo, task.hi):
+            rec = batch.games[slot:slot + 1]
+            spec = GameSpec(game=int(rec['game'][0]), seed=int(rec['seed'][0]), opponent=Strategy(rec['opponent'][0]),
+                            opponent_count=int(rec['n'][0]), me_first=bool(rec['me_first'][0]),
+                            max_turns=task.max_turns, params=task.params)
+            me = batch.battle_data(slot, codec.SIDE_ME)
+            me.reset(spec.opponent_count)
+            opponent = batch.battle_data(slot, codec.SIDE_OPPONENT)
+            opponent.reset(INITIAL_SUBMARINE_COUNT)
+            winner, turn_count = _play(spec, me, opponent, batch.turns[slot])
+            _write_game_record(rec, spec, winner, turn_count)
+            del rec, me, opponent
+    finally:
+        batch.close()
+    return task.hi - task.lo
+
+
+def _shared_tasks(name: str, layout: BatchLayout, specs: List[GameSpec], chunk_size: int) -> List[_SharedTask]:
+    """
+    specs を、params と max_turns が同じで chunk_size 個以下の連続した区間に分けてタスクにする。
+    """
+    tasks = []
+    lo = 0
+    for i in range(1, len(specs) + 1):
+        if (i == len(specs) or i - lo >= chunk_size or
+                (specs[i].params, specs[i].max_turns) != (specs[lo].params, specs[lo].max_turns)):
+            tasks.append(_SharedTask(name, layout, lo, i, specs[lo].max_turns, specs[lo].params))
+            lo = i
+    return tasks
+
+
+def play_games_parallel(specs: List[GameSpec], workers: int, capacity: int = 4096,
+                        chunk_size: int = 64) -> Iterator[GameResult]:
+    """
+    specs のゲームを workers 個のプロセスで対戦させ、結果を返す。
+    ゲームの状態と結果は capacity 個のスロットを持つ共有メモリ (shmbatch) に置き、
+    ワーカーとの間では小さなタスク記述子だけをやりとりする。
+    capacity 個ずつのゲームを対戦させ終えるたびに、その分の結果を (共有メモリからコピーして) 返す。
+    """
+    if workers <= 1:
+        yield from play_games(specs)
+        return
+
+    max_turns = max((spec.max_turns for spec in specs), default=1)
+    layout = BatchLayout(capacity=min(capacity, max(1, len(specs))), max_turns=max_turns)
+    batch = SharedBatch.create(layout)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=configure_headless) as executor:
+            for start in range(0, len(specs), layout.capacity):
+                round_specs = specs[start:start + layout.capacity]
+                for slot, spec in enumerate(round_specs):
+                    _write_game_record(batch.games[slot:slot + 1], spec, -1, 0)
+                list(executor.map(_play_shared, _shared_tasks(batch.name, layout, round_specs, chunk_size)))
+                for slot in range(len(round_specs)):
+                    yield GameResult(game=batch.games[slot:slot + 1].copy(), turns=batch.turns_of(slot).copy())
+    finally:
+        batch.close()
+        batch.unlink()
+
+
+def configure_headless() -> None:
+    """
+    自己対戦用のプロセスの設定: 端末への出力を抑制し、不変条件の検査は行わない。
+    """
+    io.set_silent(True)
+    invariant.set_validation_level(invariant.ValidationLevel.Off)
+
+
+def make_specs(game_count: int, root_seed: int, opponent: Strategy = Strategy.Logic,
+               opponent_count: int = INITIAL_SUBMARINE_COUNT, max_turns: int = DEFAULT_MAX_TURNS,
+               params: DecisionParams = DEFAULT_PARAMS) -> List[GameSpec]:
+    """
+    game_count 個のゲームの設定を作る。先手・後手は交互にする。
+    各ゲームのシードは game_seed(root_seed, i) なので、ワーカー数や対戦の順序によらず結果は再現できる。
+    """
+    return [
+        GameSpec(game=i, seed=game_seed(root_seed, i), opponent=opponent, opponent_count=opponent_count,
+                 me_first=(i % 2 == 0), max_turns=max_turns, params=params)
+        for i in range(game_count)
+    ]
+
+
+def _play_chunk_to_archive(archive_root: str, shard: str, specs: List[GameSpec]) -> int:
+    with ArchiveWriter(archive_root, shard) as writer:
+        for result in play_games(specs):
+            writer.append(result.game, result.turns)
+    return len(specs)
+
+
+def run_to_archive(specs: List[GameSpec], archive_root: str, workers: int = 1, chunk_size: int = 1000) -> int:
+    """
+    specs のゲームを workers 個のプロセスで対戦させ、アーカイブに書き込む。
+    chunk_size 個のゲームごとに別のシャードへ書き込むので、ワーカー同士が書き込みで衝突することはない。
+    書き込んだゲーム数を返す。
+    """
+    chunks = [specs[i:i + chunk_size] for i in range(0, len(specs), chunk_size)]
+    shards = ["games-%08d-%d" % (chunk[0].game, os.getpid()) for chunk in chunks]
+    if workers <= 1:
+        return sum(_play_chunk_to_archive(archive_root, shard, chunk) for shard, chunk in zip(shards, chunks))
+    with ProcessPoolExecutor(max_workers=workers, initializer=configure_headless) as executor:
+        return sum(executor.map(_play_chunk_to_archive, [archive_root] * len(chunks), shards, chunks))
+
+
+def watch(specs: Iterable[GameSpec], fps: float = 30.0) -> Iterator[GameResult]:
+    """
+    specs のゲームを順に対戦させながら、盤面を端末に差分描画する (観戦モード)。
+    play_games() と同じく、終わったものから結果を返す (結果を溜め込まないので、長時間の観戦でもメモリは増えない)。
+    """
+    with render.Renderer(fps=fps) as renderer:
+        for spec in specs:
+            caption = "game %d (%s)" % (spec.game, "先手" if spec.me_first else "後手")
+
+            def on_turn(turn_count: int, me: BattleData, opponent: BattleData, op: OpInfo) -> None:
+                renderer.draw(render.battle_screen(me, opponent, turn_count, op, caption=caption))
+
+            result = play_game(spec, on_turn)
+            renderer.flush()
+            yield result
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 100)
+    workers = io.int_option(argv, "-j", 1)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    root_seed = io.int_option(argv, "--seed", 0)
+    opponent = strategy_option(argv)
+    archive_root = io.str_option(argv, "--archive")
+    archive_root = os.path.expanduser(archive_root) if archive_root is not None else None
+
+    specs = make_specs(game_count, root_seed, opponent=opponent, opponent_count=opponent_count)
+    configure_headless()
+    if "--watch" in argv:
+        results = watch(specs, fps=io.int_option(argv, "--fps", 30))
+        print(analytics.StreamingAggregator().consume(results).format_summary())
+        return
+    if archive_root is not None:
+        n = run_to_archive(specs, archive_root, workers=workers)
+        io.success("%d ゲームを `%s` に書き込みました。" % (n, archive_root), logger=None)
+        return
+
+    def flush(aggregator: analytics.StreamingAggregator):
+        print(aggregator.format_summary(), flush=True)
+
+    flush_every = io.int_option(argv, "--flush", 100)
+    aggregator = analytics.StreamingAggregator().consume(
+        play_games_parallel(specs, workers), flush_every=flush_every, on_flush=flush)
+    if aggregator.games % flush_every != 0:
+        flush(aggregator)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,416 @@
+"""
+複数の対戦を一つのプロセスで同時に扱う、ローカル (127.0.0.1) の HTTP サービス。
+
+対戦ごとにセッション (BattleData と乱数生成器) をメモリ上に持ち、main.py の対話の代わりに JSON で
+イベント (敵軍の操作、自軍の攻撃への反応) を受け取り、 suggest_my_op() の判断を返す。
+初期配置の表や終盤の表などはプロセス内で一度だけ読み込めば、全てのセッションで共有される。
+一定時間使われていないセッションと、上限を超えたときの最も長く使われていないセッションは破棄する (LRU)。
+
+API (リクエスト・レスポンスの本文は JSON):
+    POST   /sessions                  {"n": 4, "me_first": true, "seed": 0}  → 新しいセッション (自軍の初期配置を含む)
+    GET    /sessions/<id>             → セッションの状態
+    DELETE /sessions/<id>             → セッションを破棄
+    POST   /sessions/<id>/suggest     → 自軍の操作を決めて適用し、その操作を返す
+    POST   /sessions/<id>/response    {"response": "hit"}  → 自軍の攻撃に対する敵軍の反応を適用
+    POST   /sessions/<id>/opponent    {"op": {"kind": "attack", "cell": "E2"}}  → 敵軍の操作を適用し、自軍の反応を返す
+                                      {"op": {"kind": "move", "dy": 0, "dx": -1}}
+    GET    /stats                     → セッション数と suggest_my_op() の分岐ごとの統計
+
+エラーは {"error": "..."} で返す。 400: 値が不正、 404: セッションが無い、
+409: 手番や進行の順序に合わない (敵軍の手番での suggest、反応を待っている間の操作、終局後の操作など)、
+422: これまでの入力と明らかに矛盾している (残り 1 隻で位置が確定している敵艦がその移動をできないなど)、
+500: エンジンの内部エラー (不変条件の違反など。ログに記録する)。
+422 と 500 の場合、セッションの状態は適用する前のまま変わらない。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.server --port 8765 --capacity 256 --idle 3600
+"""
+import copy
+import json
+import re
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from . import io
+from . import logic
+from . import placement
+from .model import OpInfo, AttackInfo, MoveInfo, Response, BattleData
+from .rule import Pos
+from .rule import INITIAL_SUBMARINE_COUNT, is_within_area
+
+thisFileLogger = getLogger(__name__)
+
+DEFAULT_PORT = 8765
+DEFAULT_CAPACITY = 256
+DEFAULT_IDLE_SECONDS = 3600.0
+
+T = TypeVar('T')
+
+
+class SessionError(Exception):
+    """
+    リクエストが不正 (値が不正、または対戦の進行と矛盾している)。
+    """
+    status = 400
+
+
+class SessionConflict(SessionError):
+    """
+    対戦の進行の順序に合わないリクエスト (手番でない側の操作、終局後の操作など)。
+    """
+    status = 409
+
+
+class SessionRejected(SessionError):
+    """
+    これまでの入力と明らかに矛盾していて、対戦データに適用できないイベント。
+    適用する前に明示的に検査できるものだけで、エンジンの内部エラー (不変条件の違反など) はこれにしない。
+    セッションの状態は適用する前のまま変わらない。
+    """
+    status = 422
+
+
+def _pos_of_code(code: Any) -> Pos:
+    if not isinstance(code, str) or not re.fullmatch(r"[A-Ea-e][1-5]", code):
+        raise SessionError("invalid cell code: %r" % (code,))
+    return Pos(ord(code[0].upper()) - ord('A'), int(code[1]) - 1)
+
+
+def op_to_json(op: OpInfo) -> Dict[str, Any]:
+    if op.is_attack():
+        d = {"kind": "attack", "cell": op.detail.attack_pos.code()}
+        if op.detail.resp is not None:
+            d["response"] = op.detail.resp.name
+        return d
+    return {"kind": "move", "from": op.detail.fromPos.code() if op.detail.fromPos is not None else None,
+            "dy": op.detail.dirY, "dx": op.detail.dirX}
+
+
+def _is_int(v: Any) -> bool:
+    # JSON の true/false は Python では int の派生型 bool になるので除く
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def op_from_json(d: Any, turn_count: int) -> OpInfo:
+    """
+    敵軍の操作を OpInfo にする。移動は縦横に 1 または 2 マス (移動元は不要)。
+    """
+    if not isinstance(d, dict):
+        raise SessionError("op must be an object")
+    if d.get("kind") == "attack":
+        return OpInfo(AttackInfo(attack_pos=_pos_of_code(d.get("cell"))), turn_count=turn_count)
+    if d.get("kind") == "move":
+        dy, dx = d.get("dy", 0), d.get("dx", 0)
+        if not (_is_int(dy) and _is_int(dx)) or (dy != 0 and dx != 0) or abs(dy + dx) not in (1, 2):
+            raise SessionError("invalid move: %r" % (d,))
+        return OpInfo(MoveInfo(fromPos=None, dirY=dy, dirX=dx), turn_count=turn_count)
+    raise SessionError("unknown op kind: %r" % (d.get("kind"),))
+
+
+def response_from_json(s: Any) -> Response:
+    """
+    "hit" "dead" "near" "nothing" (大文字小文字は区別しない。 main.py と同じく "x" は Nothing)。
+    """
+    if isinstance(s, str):
+        key = "nothing" if s.lower() == "x" else s.lower()
+        for resp in Response:
+            if resp.name.lower() == key:
+                return resp
+    raise SessionError("invalid response: %r" % (s,))
+
+
+class Session:
+    """
+    一つの対戦。 main.py の my_turn() / opponent_turn() と同じ順序で BattleData を更新する。
+    """
+
+    def __init__(self, session_id: str, opponent_count: int, me_first: bool, seed: Optional[int]):
+        self.id = session_id
+        self.data = BattleData(opponent_count)
+        self.rng = np.random.default_rng(seed)
+        self.me_first = me_first
+        self.turn_count = 0
+        # 自軍が攻撃して、敵軍の反応を待っている状態なら True
+        self.awaiting_response = False
+        self.lock = threading.Lock()
+        self.last_used = 0.0
+        logic.initialize_my_placement(self.data, self.rng)
+
+    def is_my_turn(self) -> bool:
+        """
+        次のターン (turn_count + 1) が自軍の手番なら True。
+        """
+        return ((self.turn_count + 1) % 2 == 1) == self.me_first
+
+    def _check_turn(self, mine: bool) -> None:
+        if self.data.has_game_finished():
+            raise SessionConflict("game has finished")
+        if self.awaiting_response:
+            raise SessionConflict("waiting for the response to our attack")
+        if self.is_my_turn() != mine:
+            raise SessionConflict("not %s turn" % ("our" if mine else "the opponent's"))
+
+    def _check_opponent_move(self, op: OpInfo) -> None:
+        """
+        敵艦が残り 1 隻でその位置が確定していれば、移動先が盤面の外になる移動はできない。
+        """
+        data = self.data
+        enemy = next(iter(data.confirmed), None)
+        if data.opponent_alive_count != 1 or enemy is None:
+            return
+        if not is_within_area(Pos(enemy.pos.row + op.detail.dirY, enemy.pos.col + op.detail.dirX)):
+            raise SessionRejected("the last opponent submarine at %s cannot move by (%d, %d)" %
+                                  (enemy.pos.code(), op.detail.dirY, op.detail.dirX))
+
+    def _transact(self, event: Callable[[BattleData, np.random.Generator], T]) -> T:
+        """
+        event を対戦データと乱数生成器の複製に適用し、成功したときだけ置き換える。
+        event が例外を送出した場合 (エンジンの内部エラー) は、状態を変えずにそのまま送出する。
+        """
+        data, rng = copy.deepcopy(self.data), copy.deepcopy(self.rng)
+        result = event(data, rng)
+        self.data, self.rng = data, rng
+        return result
+
+    def suggest(self) -> Tuple[OpInfo, logic.Branch]:
+        self._check_turn(mine=True)
+        turn_count = self.turn_count + 1
+
+        def event(data: BattleData, rng: np.random.Generator) -> Tuple[OpInfo, logic.Branch]:
+            op, branch = logic.suggest_my_op_with_branch(data, turn_count, rng=rng)
+            logic.apply_my_op(data, op)
+            if not op.is_attack():
+                logic.update_tracking_cell(data)
+            return op, branch
+
+        op, branch = self._transact(event)
+        self.turn_count = turn_count
+        self.awaiting_response = op.is_attack()
+        return op, branch
+
+    def respond(self, resp: Response) -> None:
+        if not self.awaiting_response:
+            raise SessionConflict("no attack is waiting for a response")
+
+        def event(data: BattleData, rng: np.random.Generator) -> None:
+            logic.apply_attack_response(data, resp)
+            logic.update_tracking_cell(data)
+
+        self._transact(event)
+        self.awaiting_response = False
+
+    def opponent(self, op_json: Any) -> Optional[Response]:
+        op = op_from_json(op_json, self.turn_count + 1)
+        self._check_turn(mine=False)
+        if op.is_move():
+            self._check_opponent_move(op)
+        resp = self._transact(lambda data, rng: logic.apply_opponent_op(data, op))
+        self.turn_count += 1
+        return resp
+
+    def to_json(self) -> Dict[str, Any]:
+        data = self.data
+        return {
+            "session": self.id,
+            "turn": self.turn_count,
+            "me_first": self.me_first,
+            "awaiting_response": self.awaiting_response,
+            "finished": data.has_game_finished(),
+            "my_alive": data.my_alive_count,
+            "opponent_alive": data.opponent_alive_count,
+            "tracking": data.tracking_cell.code() if data.tracking_cell is not None else None,
+            "my_grid": data.my_grid.tolist(),
+            "positions": [p.code() for p in sorted(data.set_of_my_submarine_positions())],
+            "prob": np.round(data.prob, 6).tolist(),
+        }
+
+
+class SessionStore:
+    """
+    セッションの集合。 capacity を超えたら最も長く使われていないセッションを、
+    idle_seconds 以上使われていないセッションはアクセスのたびに破棄する。
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY, idle_seconds: float = DEFAULT_IDLE_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.idle_seconds = idle_seconds
+        self._clock = clock
+        self._sessions: 'OrderedDict[str, Session]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float) -> None:
+        while len(self._sessions) > 0:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used < self.idle_seconds:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+            io.info("セッション %s を一定時間使われなかったので破棄しました" % session_id, thisFileLogger)
+
+    def create(self, opponent_count: int = INITIAL_SUBMARINE_COUNT, me_first: bool = True,
+               seed: Optional[int] = None) -> Session:
+        session = Session(secrets.token_hex(8), opponent_count, me_first, seed)
+        with self._lock:
+            now = self._clock()
+            self._evict_idle(now)
+            while len(self._sessions) >= self.capacity:
+                session_id, _ = self._sessions.popitem(last=False)
+                self.evicted += 1
+                io.info("セッション数の上限を超えたのでセッション %s を破棄しました" % session_id, thisFileLogger)
+            session.last_used = now
+            self._sessions[session.id] = session
+            self.created += 1
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            now = self._clock()
+            self._evict_idle(now)
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    store: SessionStore  # make_server() で設定する
+
+    def log_message(self, fmt: str, *args) -> None:
+        thisFileLogger.debug("%s - %s", self.address_string(), fmt % args)
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        payload = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if length <= 0:
+            return dict()
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise SessionError("body is not JSON")
+        if not isinstance(body, dict):
+            raise SessionError("body must be an object")
+        return body
+
+    def _route(self, method: str) -> None:
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        try:
+            if parts == ["stats"] and method == "GET":
+                return self._send(200, self._stats())
+            if parts == ["sessions"] and method == "POST":
+                body = self._body()
+                n = body.get("n", INITIAL_SUBMARINE_COUNT)
+                seed = body.get("seed")
+                if not _is_int(n) or n <= 0 or (seed is not None and not _is_int(seed)):
+                    raise SessionError("invalid n or seed")
+                session = self.store.create(n, bool(body.get("me_first", True)), seed)
+                return self._send(201, session.to_json())
+            if len(parts) >= 2 and parts[0] == "sessions":
+                session = self.store.get(parts[1])
+                if session is None:
+                    return self._send(404, {"error": "no such session: " + parts[1]})
+                with session.lock:
+                    return self._session_route(session, method, parts[2:])
+            return self._send(404, {"error": "not found"})
+        except SessionError as e:
+            return self._send(e.status, {"error": str(e)})
+        except Exception as e:
+            thisFileLogger.exception("unexpected error: %s %s", method, self.path)
+            return self._send(500, {"error": "internal error: %r" % (e,)})
+
+    def _session_route(self, session: Session, method: str, rest: List[str]) -> None:
+        if rest == [] and method == "GET":
+            return self._send(200, session.to_json())
+        if rest == [] and method == "DELETE":
+            self.store.delete(session.id)
+            return self._send(200, {"session": session.id, "deleted": True})
+        if rest == ["suggest"] and method == "POST":
+            op, branch = session.suggest()
+            return self._send(200, {"op": op_to_json(op), "branch": branch.name, "turn": op.turn_count})
+        if rest == ["response"] and method == "POST":
+            session.respond(response_from_json(self._body().get("response")))
+            return self._send(200, session.to_json())
+        if rest == ["opponent"] and method == "POST":
+            resp = session.opponent(self._body().get("op"))
+            return self._send(200, {"response": resp.name if resp is not None else None,
+                                    "finished": session.data.has_game_finished()})
+        return self._send(404, {"error": "not found"})
+
+    def _stats(self) -> Dict[str, Any]:
+        return {"sessions": len(self.store), "created": self.store.created, "evicted": self.store.evicted,
+                "branches": logic.branch_counters.snapshot()}
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_DELETE(self):
+        self._route("DELETE")
+
+
+def make_server(port: int = DEFAULT_PORT, store: Optional[SessionStore] = None) -> ThreadingHTTPServer:
+    """
+    127.0.0.1:port で待ち受けるサーバを作る (port が 0 なら空いているポート)。 serve_forever() で開始する。
+    """
+    handler = type("Handler", (_Handler,), {"store": store if store is not None else SessionStore()})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def warm_up() -> None:
+    """
+    全セッションで共有する表を、最初のリクエストの前に読み込んでおく。
+    """
+    placement.top_candidates()
+
+
+def main(argv: List[str]):
+    port = io.int_option(argv, "--port", DEFAULT_PORT)
+    capacity = io.int_option(argv, "--capacity", DEFAULT_CAPACITY)
+    idle_seconds = io.int_option(argv, "--idle", int(DEFAULT_IDLE_SECONDS))
+
+    warm_up()
+    server = make_server(port, SessionStore(capacity, idle_seconds))
+    io.success("http://127.0.0.1:%d で待ち受けます (セッション数の上限 %d, 破棄までの時間 %d 秒)" %
+               (server.server_address[1], capacity, idle_seconds), thisFileLogger)
+    # 以降、判断の過程は端末には表示しない (ログには書き込む)
+    io.set_silent(True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
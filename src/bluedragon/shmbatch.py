@@ -0,0 +1,176 @@
+"""
+複数のゲームの状態を一つの共有メモリ (multiprocessing.shared_memory) にまとめて置くためのレイアウト。
+
+共有メモリの中身 (先頭から順に):
+    state ... (capacity, 2) の STATE_DTYPE。ゲームごと・陣営ごと (codec.SIDE_ME / codec.SIDE_OPPONENT) の盤面の状態
+    games ... (capacity,) の codec.GAME_DTYPE。ゲームの設定と結果
+    turns ... (capacity, max_turns) の codec.TURN_DTYPE。ゲームごとの手の記録 (圧縮した履歴)
+
+親プロセスとワーカーは同じ共有メモリをそれぞれ numpy のビューとして参照するので、
+プロセス間でやりとりするのは共有メモリの名前とスロットの範囲などの小さなタスク記述子だけになる。
+BattleData の my_grid, opponent_grid, prob, exposure, 生存数, tracking_cell も共有メモリ上のビュー (SharedBattleData) にできる。
+"""
+from multiprocessing import shared_memory
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from . import codec
+from .model import BattleData, ConfirmedEnemies
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_SUBMARINE_COUNT
+
+STATE_DTYPE = np.dtype([
+    ('my_grid', np.int32, (ROW, COL)),
+    ('opponent_grid', np.int32, (ROW, COL)),
+    ('prob', np.float64, (ROW, COL)),
+    ('exposure', np.float64, (ROW, COL)),
+    ('my_alive', np.int32),
+    ('opp_alive', np.int32),
+    ('tracking', np.int32),  # codec.cell_index(tracking_cell)
+], align=True)
+
+_ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+class BatchLayout(NamedTuple):
+    """
+    共有メモリのレイアウト。 capacity はゲームのスロット数、 max_turns はゲームあたりの手の記録数の上限。
+    """
+    capacity: int
+    max_turns: int
+
+    @property
+    def state_offset(self) -> int:
+        return 0
+
+    @property
+    def games_offset(self) -> int:
+        return _align(self.state_offset + self.capacity * 2 * STATE_DTYPE.itemsize)
+
+    @property
+    def turns_offset(self) -> int:
+        return _align(self.games_offset + self.capacity * codec.GAME_DTYPE.itemsize)
+
+    @property
+    def size(self) -> int:
+        return max(1, self.turns_offset + self.capacity * self.max_turns * codec.TURN_DTYPE.itemsize)
+
+
+class SharedBattleData(BattleData):
+    """
+    共有メモリ上の状態のビューとしての BattleData。
+    盤面・確率・exposure・生存数・tracking_cell の読み書きはそのまま共有メモリに反映される。
+    操作の履歴 (my_history, opponent_history) はプロセス内のリストのまま。
+    """
+
+    def __init__(self, state: np.ndarray):
+        """
+        state は STATE_DTYPE の 0 次元のビュー (SharedBatch.state[slot, side])。
+        """
+        self._state = state
+        self.my_grid = state['my_grid']
+        self.opponent_grid = state['opponent_grid']
+        self.prob = state['prob']
+        self.exposure = state['exposure']
+        self.my_history = list()
+        self.opponent_history = list()
+        self.confirmed = ConfirmedEnemies(self.opponent_grid)
+        self.exposed = ConfirmedEnemies()
+
+    def reset(self, opponent_initial_submarine_count: int) -> None:
+        """
+        BattleData(opponent_initial_submarine_count) と同じ初期状態にする。
+        """
+        self.my_grid[:, :] = 0
+        self.opponent_grid[:, :] = 0
+        self.prob[:, :] = opponent_initial_submarine_count / (ROW * COL)
+        self.exposure[:, :] = INITIAL_SUBMARINE_COUNT / (ROW * COL)
+        self.my_alive_count = INITIAL_SUBMARINE_COUNT
+        self.opponent_alive_count = opponent_initial_submarine_count
+        self.tracking_cell = None
+        self.my_history.clear()
+        self.opponent_history.clear()
+        self.confirmed.clear()
+        self.exposed.clear()
+
+    @property
+    def my_alive_count(self) -> int:
+        return int(self._state['my_alive'])
+
+    @my_alive_count.setter
+    def my_alive_count(self, value: int) -> None:
+        self._state['my_alive'] = value
+
+    @property
+    def opponent_alive_count(self) -> int:
+        return int(self._state['opp_alive'])
+
+    @opponent_alive_count.setter
+    def opponent_alive_count(self, value: int) -> None:
+        self._state['opp_alive'] = value
+
+    @property
+    def tracking_cell(self) -> Optional[Pos]:
+        return codec.pos_of(int(self._state['tracking']))
+
+    @tracking_cell.setter
+    def tracking_cell(self, value: Optional[Pos]) -> None:
+        self._state['tracking'] = codec.cell_index(value)
+
+
+class SharedBatch:
+    """
+    BatchLayout に従った共有メモリのブロック。
+    create() で作成したプロセスが unlink() の責任を持ち、他のプロセスは attach() して close() する。
+
+    close() の前に、このオブジェクトから取り出したビューへの参照を全て手放すこと
+    (ビューが残っていると共有メモリを閉じられない)。
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, layout: BatchLayout):
+        self.shm = shm
+        self.layout = layout
+        buf = shm.buf
+        self.state = np.ndarray((layout.capacity, 2), dtype=STATE_DTYPE, buffer=buf, offset=layout.state_offset)
+        self.games = np.ndarray((layout.capacity,), dtype=codec.GAME_DTYPE, buffer=buf, offset=layout.games_offset)
+        self.turns = np.ndarray((layout.capacity, layout.max_turns), dtype=codec.TURN_DTYPE, buffer=buf,
+                                offset=layout.turns_offset)
+
+    @staticmethod
+    def create(layout: BatchLayout) -> 'SharedBatch':
+        return SharedBatch(shared_memory.SharedMemory(create=True, size=layout.size), layout)
+
+    @staticmethod
+    def attach(name: str, layout: BatchLayout) -> 'SharedBatch':
+        return SharedBatch(shared_memory.SharedMemory(name=name), layout)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def battle_data(self, slot: int, side: int) -> SharedBattleData:
+        return SharedBattleData(self.state[slot, side])
+
+    def turns_of(self, slot: int) -> np.ndarray:
+        """
+        slot のゲームの手の記録のビュー。
+        """
+        return self.turns[slot, :int(self.games['turns'][slot])]
+
+    def close(self) -> None:
+        self.state = self.games = self.turns = None
+        self.shm.close()
+
+    def unlink(self) -> None:
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
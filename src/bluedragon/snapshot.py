@@ -0,0 +1,126 @@
+"""
+対戦途中の状態 (BattleData・乱数生成器の状態・手番) のスナップショット。
+
+main.py は 1 ターン終わるごとにスナップショットを書き込み、異常終了した場合は `--resume` で続きから再開できる。
+書き込みは一時ファイルに書いてから os.replace() で置き換えるので、途中で落ちても直前のスナップショットが残る。
+自軍・敵軍の操作の歴史は codec.TURN_DTYPE の、位置が確定している艦の索引は CONFIRMED_DTYPE の固定長レコードとして保存する。
+"""
+import json
+import os
+from typing import List, NamedTuple
+
+import numpy as np
+
+from . import codec
+from .model import OpInfo, BattleData, ConfirmedEnemy, ConfirmedEnemies
+
+# スナップショットの形式を変更したらインクリメントすること
+SNAPSHOT_VERSION = 2
+
+DEFAULT_SNAPSHOT_PATH = os.path.join(os.path.expanduser("~"), ".submarine-destroyer", "snapshot.npz")
+
+# ConfirmedEnemies の 1 隻分のレコード。 lost が 1 なら見失った艦。
+CONFIRMED_DTYPE = np.dtype([
+    ('cell', 'i1'),
+    ('hp', 'i1'),
+    ('last_seen', '<i2'),
+    ('lost', 'i1'),
+])
+
+
+class Snapshot(NamedTuple):
+    data: BattleData
+    rng: np.random.Generator
+    is_me_first: bool
+    # 終了したターン数
+    turn_count: int
+
+
+def history_records(history: List[OpInfo], side: int) -> np.ndarray:
+    records = np.zeros(len(history), dtype=codec.TURN_DTYPE)
+    for rec, op in zip(records, history):
+        rec['turn'] = op.turn_count
+        rec['side'] = side
+        codec.write_op(rec, op)
+    return records
+
+
+def history_of(records: np.ndarray) -> List[OpInfo]:
+    return [codec.read_op(rec) for rec in records]
+
+
+def confirmed_records(confirmed: ConfirmedEnemies) -> np.ndarray:
+    enemies = [(e, 0) for e in confirmed] + [(e, 1) for e in confirmed.lost()]
+    records = np.zeros(len(enemies), dtype=CONFIRMED_DTYPE)
+    for rec, (enemy, lost) in zip(records, enemies):
+        rec['cell'] = codec.cell_index(enemy.pos)
+        rec['hp'] = enemy.hp
+        rec['last_seen'] = enemy.last_seen
+        rec['lost'] = lost
+    return records
+
+
+def restore_confirmed(confirmed: ConfirmedEnemies, records: np.ndarray) -> None:
+    confirmed.clear()
+    for rec in records:
+        enemy = ConfirmedEnemy(codec.pos_of(rec['cell']), int(rec['hp']), int(rec['last_seen']))
+        if rec['lost']:
+            confirmed.put_lost(enemy)
+        else:
+            confirmed.put(enemy)
+
+
+def save(path: str, data: BattleData, rng: np.random.Generator, is_me_first: bool, turn_count: int) -> None:
+    """
+    スナップショットを path にアトミックに書き込む。
+    """
+    meta = np.array([SNAPSHOT_VERSION, data.my_alive_count, data.opponent_alive_count,
+                     codec.cell_index(data.tracking_cell), int(is_me_first), turn_count], dtype=np.int64)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = "%s.tmp.%d.npz" % (path[:-len(".npz")] if path.endswith(".npz") else path, os.getpid())
+    with open(tmp, "wb") as f:
+        np.savez(f, meta=meta, my_grid=data.my_grid, opponent_grid=data.opponent_grid,
+                 prob=data.prob, exposure=data.exposure,
+                 my_history=history_records(data.my_history, codec.SIDE_ME),
+                 opponent_history=history_records(data.opponent_history, codec.SIDE_OPPONENT),
+                 confirmed=confirmed_records(data.confirmed), exposed=confirmed_records(data.exposed),
+                 rng_state=np.array(json.dumps(rng.bit_generator.state)))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def load(path: str) -> Snapshot:
+    """
+    save() で書き込んだスナップショットを読み込む。形式が異なれば ValueError を投げる。
+    """
+    with np.load(path) as z:
+        meta = z['meta']
+        if len(meta) < 1 or meta[0] != SNAPSHOT_VERSION:
+            raise ValueError("unsupported snapshot version: " + path)
+        _, my_alive, opponent_alive, tracking, is_me_first, turn_count = (int(x) for x in meta)
+
+        data = BattleData(opponent_alive)
+        data.my_alive_count = my_alive
+        data.my_grid[:, :] = z['my_grid']
+        data.opponent_grid[:, :] = z['opponent_grid']
+        data.prob[:, :] = z['prob']
+        data.exposure[:, :] = z['exposure']
+        data.my_history = history_of(z['my_history'])
+        data.opponent_history = history_of(z['opponent_history'])
+        data.tracking_cell = codec.pos_of(tracking)
+        restore_confirmed(data.confirmed, z['confirmed'])
+        restore_confirmed(data.exposed, z['exposed'])
+
+        state = json.loads(str(z['rng_state']))
+    bit_generator = getattr(np.random, state['bit_generator'])()
+    bit_generator.state = state
+    return Snapshot(data, np.random.Generator(bit_generator), bool(is_me_first), turn_count)
+
+
+def discard(path: str) -> None:
+    """
+    対戦が終了したのでスナップショットを削除する。
+    """
+    if os.path.exists(path):
+        os.remove(path)
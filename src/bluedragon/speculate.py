@@ -0,0 +1,264 @@
+"""
+入力待ちの間に、次の自軍の判断を投機的に計算しておく。
+
+main.py は自軍の攻撃の後は敵軍の反応 (io.read_response())、敵軍のターンでは敵軍の操作 (io.read_opponent_op()) の
+入力を待っていて、その間 CPU は空いている。 Speculator はその間にバックグラウンドのスレッドで、
+ありうる入力 (反応は Hit/Dead/Near/Nothing の全て、敵軍の操作は可能性の高い順) のそれぞれについて
+対戦データの複製に入力を適用し、次の自軍のターンの suggest_my_op() の結果を求めておく。
+
+結果は「判断する直前の状態 (対戦データ・ターン数・乱数生成器の状態)」のハッシュをキーにして持つので、
+実際の入力を適用した状態と一致するものがあればそれをそのまま使い (乱数生成器の状態も判断した後の状態に進める)、
+無ければ普通に計算する。どちらでも返す操作は同じになる。
+
+投機的な計算の出力 (端末・ログ) は io.captured() で貯めておき、結果を使うときに replay() で書き出す。
+分岐ごとの統計 (logic.branch_counters, decision_trace) にも、結果を使ったときだけ記録する。
+"""
+import copy
+import hashlib
+import json
+import threading
+from collections import deque
+from logging import getLogger
+from typing import Callable, Deque, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+from . import io
+from . import logic
+from . import snapshot
+from .model import OpInfo, AttackInfo, MoveInfo, Response, BattleData
+from .params import DecisionParams, DEFAULT_PARAMS
+from .rule import Pos
+from .rule import COL
+from .telemetry import Branch
+
+thisFileLogger = getLogger(__name__)
+
+# 敵軍の反応を待っている間に、反応ごとに投機的に計算する敵軍の操作の数
+RESPONSE_BRANCH_LIMIT = 8
+# 保持する投機的な計算の結果の数の上限
+MAX_RESULTS = 256
+
+# 敵軍の移動の方向 (移動元は自軍には伏せられる)
+_OPPONENT_MOVES = tuple((dy, dx) for d in (-2, -1, 1, 2) for dy, dx in ((d, 0), (0, d)))
+
+
+def state_key(data: BattleData, cur_turn_count: int, rng: np.random.Generator,
+              params: DecisionParams = DEFAULT_PARAMS) -> str:
+    """
+    suggest_my_op(data, cur_turn_count, params, rng) の結果を決める全ての値のハッシュ。
+    """
+    h = hashlib.sha1()
+    for a in (data.my_grid, data.opponent_grid, data.prob, data.exposure):
+        h.update(np.ascontiguousarray(a).tobytes())
+    h.update(snapshot.history_records(data.my_history, codec.SIDE_ME).tobytes())
+    h.update(snapshot.history_records(data.opponent_history, codec.SIDE_OPPONENT).tobytes())
+    h.update(snapshot.confirmed_records(data.confirmed).tobytes())
+    h.update(snapshot.confirmed_records(data.exposed).tobytes())
+    h.update(json.dumps([data.my_alive_count, data.opponent_alive_count, codec.cell_index(data.tracking_cell),
+                         cur_turn_count, params.to_dict(), rng.bit_generator.state], sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def opponent_candidates(data: BattleData, turn_count: int) -> List[OpInfo]:
+    """
+    敵軍の次の操作の候補を、可能性の高いと思われる順に返す。
+    攻撃は自軍の位置が敵軍に知られていそうなマス (exposure の大きいマス) から順に、その後に移動。
+    """
+    order = np.argsort(-data.exposure.ravel(), kind='stable')
+    attacks = [OpInfo(AttackInfo(attack_pos=Pos(int(c) // COL, int(c) % COL)), turn_count=turn_count) for c in order]
+    moves = [OpInfo(MoveInfo(fromPos=None, dirY=dy, dirX=dx), turn_count=turn_count) for dy, dx in _OPPONENT_MOVES]
+    return attacks + moves
+
+
+class Speculation(NamedTuple):
+    op: OpInfo
+    branch: Branch
+    elapsed_ns: int
+    rng_state: dict  # 判断した後の乱数生成器の状態
+    messages: List[io.Message]
+
+
+# 投機的に計算する分岐: (対戦データの複製に入力を適用する関数, 判断するターン数) を順に返す
+Branches = Iterator[Tuple[Callable[[BattleData], None], int]]
+
+
+class _Task(NamedTuple):
+    generation: int
+    data: BattleData
+    rng: np.random.Generator
+    branches: Callable[[BattleData], Branches]
+
+
+class Speculator:
+    """
+    投機的な計算を行うバックグラウンドのスレッドと、その結果。
+    expect_response() / expect_opponent_op() で計算を始め、 suggest() で結果を使う (または普通に計算する)。
+    新しく計算を始めると、それまでの計算は (計算中の分岐が終わった時点で) 打ち切る。
+    """
+
+    def __init__(self, params: DecisionParams = DEFAULT_PARAMS, max_results: int = MAX_RESULTS):
+        self.params = params
+        self.max_results = max_results
+        self.hits = 0
+        self.misses = 0
+        self._results: Dict[str, Speculation] = dict()
+        self._tasks: Deque[_Task] = deque()
+        self._generation = 0
+        self._busy = False
+        self._closed = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="speculate", daemon=True)
+        self._thread.start()
+
+    def _start(self, data: BattleData, rng: np.random.Generator,
+               branches: Callable[[BattleData], Branches]) -> None:
+        # 複製はこのスレッドで行う (呼び出し元はこの後 data と rng を更新するので)
+        task_data, task_rng = copy.deepcopy(data), copy.deepcopy(rng)
+        with self._cond:
+            self._generation += 1
+            self._tasks.clear()
+            self._tasks.append(_Task(self._generation, task_data, task_rng, branches))
+            self._cond.notify_all()
+
+    def expect_response(self, data: BattleData, rng: np.random.Generator, next_turn_count: int) -> None:
+        """
+        自軍の攻撃を apply_my_op() した後、敵軍の反応を待つ間に呼ぶ。
+        各反応について、それを適用した後に敵軍が可能性の高い操作をした場合の、 next_turn_count での判断を計算する。
+        """
+        def branches(base: BattleData) -> Branches:
+            for resp in Response:
+                after = copy.deepcopy(base)
+                logic.apply_attack_response(after, resp)
+                logic.update_tracking_cell(after)
+                for op in opponent_candidates(after, next_turn_count - 1)[:RESPONSE_BRANCH_LIMIT]:
+                    yield _then(_respond(resp), _opponent(op)), next_turn_count
+
+        self._start(data, rng, branches)
+
+    def expect_opponent_op(self, data: BattleData, rng: np.random.Generator, next_turn_count: int) -> None:
+        """
+        敵軍の操作を待つ間に呼ぶ。敵軍の操作の各候補について、それを適用した後の next_turn_count での判断を計算する。
+        """
+        def branches(base: BattleData) -> Branches:
+            for op in opponent_candidates(base, next_turn_count - 1):
+                yield _opponent(op), next_turn_count
+
+        self._start(data, rng, branches)
+
+    def cancel(self) -> None:
+        with self._cond:
+            self._generation += 1
+            self._tasks.clear()
+
+    def wait_idle(self, timeout: Optional[float] = None) -> bool:
+        """
+        投機的な計算が全て終わるまで待つ (テスト用)。
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._busy and len(self._tasks) == 0, timeout)
+
+    def suggest(self, data: BattleData, cur_turn_count: int, rng: np.random.Generator) -> OpInfo:
+        """
+        logic.suggest_my_op(data, cur_turn_count, self.params, rng) と同じ操作を返す。
+        投機的に計算した結果があればそれを使い、 rng をその判断の後の状態に進める。
+        """
+        self.cancel()
+        key = state_key(data, cur_turn_count, rng, self.params)
+        with self._cond:
+            speculation = self._results.pop(key, None)
+            self._results.clear()
+
+        if speculation is None:
+            self.misses += 1
+            return logic.suggest_my_op(data, cur_turn_count, self.params, rng)
+
+        self.hits += 1
+        io.replay(speculation.messages)
+        io.info("(入力待ちの間に計算済みの判断を使います)", thisFileLogger)
+        rng.bit_generator.state = speculation.rng_state
+        logic.record_decision(data, speculation.op, speculation.branch, speculation.elapsed_ns)
+        return speculation.op
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._generation += 1
+            self._tasks.clear()
+            self._cond.notify_all()
+        self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _is_current(self, generation: int) -> bool:
+        with self._cond:
+            return generation == self._generation and not self._closed
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+                self._cond.wait_for(lambda: self._closed or len(self._tasks) > 0)
+                if self._closed:
+                    return
+                task = self._tasks.popleft()
+                self._busy = True
+            try:
+                self._run_task(task)
+            except Exception as e:
+                thisFileLogger.debug("speculation failed: %r", e)
+
+    def _run_task(self, task: _Task) -> None:
+        with io.captured():
+            branches = list(task.branches(task.data))
+        for apply, turn_count in branches:
+            if not self._is_current(task.generation):
+                return
+            with self._cond:
+                if len(self._results) >= self.max_results:
+                    return
+            data = copy.deepcopy(task.data)
+            rng = copy.deepcopy(task.rng)
+            try:
+                with io.captured():
+                    apply(data)
+                key = state_key(data, turn_count, rng, self.params)
+                with self._cond:
+                    if key in self._results:
+                        continue
+                with io.captured() as messages:
+                    op, branch, elapsed = logic.decide_my_op(data, turn_count, self.params, rng)
+            except Exception as e:
+                # 投機的な計算の失敗は対戦に影響させない (実際にその入力が来たら、普通に計算したときに失敗が報告される)
+                thisFileLogger.debug("speculation failed: %r", e)
+                continue
+            with self._cond:
+                # 結果は状態のハッシュで引くので、古い世代の計算の結果でも正しい
+                self._results[key] = Speculation(op, branch, elapsed, rng.bit_generator.state, messages)
+
+
+def _respond(resp: Response) -> Callable[[BattleData], None]:
+    def apply(data: BattleData) -> None:
+        logic.apply_attack_response(data, resp)
+        logic.update_tracking_cell(data)
+    return apply
+
+
+def _opponent(op: OpInfo) -> Callable[[BattleData], None]:
+    def apply(data: BattleData) -> None:
+        # 候補の OpInfo を複製してから適用する (apply_opponent_op は攻撃の resp を書き込む)
+        logic.apply_opponent_op(data, copy.deepcopy(op))
+    return apply
+
+
+def _then(*steps: Callable[[BattleData], None]) -> Callable[[BattleData], None]:
+    def apply(data: BattleData) -> None:
+        for step in steps:
+            step(data)
+    return apply
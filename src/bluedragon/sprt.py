@@ -0,0 +1,220 @@
+"""
+二つのパラメータ (A: 基準, B: 候補) の強さを、逐次確率比検定 (SPRT) で比較する。
+
+同じシードのゲームを A と B のそれぞれで対戦させ (同じ初期配置・同じ敵軍の乱数列になる)、その組の勝敗を比べる。
+勝敗が分かれた組のうち B が勝った割合を p として、 H0: p = p0 と H1: p = p1 の対数尤度比を組ごとに足し込み、
+どちらかの境界を越えた時点で打ち切る。差がはっきりしていれば、固定のゲーム数を対戦させるよりずっと早く決着する。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.sprt --b use_exposure=0 -g 2000 -j 4
+    $ python3 -m bluedragon.sprt --a hit_weight=1.0 --b hit_weight=1.5,info_weight=0.3 --p1 60
+"""
+import enum
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+from . import invariant
+from . import io
+from . import selfplay
+from .analytics import OnlineStats
+from .params import DecisionParams, DEFAULT_PARAMS
+from .selfplay import GameSpec, Strategy
+from .rule import INITIAL_SUBMARINE_COUNT
+
+
+class Decision(enum.Enum):
+    Continue = 0
+    AcceptH0 = 1  # B が A より強いとは言えない
+    AcceptH1 = 2  # B は A より強い
+
+
+class SequentialTest:
+    """
+    成功確率 p についての SPRT (H0: p = p0, H1: p = p1, p0 < p1)。
+    alpha は H0 が正しいのに H1 を採択する確率、 beta は H1 が正しいのに H0 を採択する確率の上限。
+    """
+
+    def __init__(self, p0: float = 0.5, p1: float = 0.6, alpha: float = 0.05, beta: float = 0.05):
+        assert 0 < p0 < p1 < 1
+        self.p0 = p0
+        self.p1 = p1
+        self.lower = math.log(beta / (1 - alpha))
+        self.upper = math.log((1 - beta) / alpha)
+        self._success_llr = math.log(p1 / p0)
+        self._failure_llr = math.log((1 - p1) / (1 - p0))
+        self.llr = 0.0
+        self.successes = 0
+        self.failures = 0
+
+    @property
+    def decision(self) -> Decision:
+        if self.llr >= self.upper:
+            return Decision.AcceptH1
+        if self.llr <= self.lower:
+            return Decision.AcceptH0
+        return Decision.Continue
+
+    def push(self, success: bool) -> Decision:
+        if success:
+            self.successes += 1
+            self.llr += self._success_llr
+        else:
+            self.failures += 1
+            self.llr += self._failure_llr
+        return self.decision
+
+
+class PairedComparison:
+    """
+    組ごとの勝ち点 (勝ちは 1、引き分けは 0.5) を集計し、勝敗が分かれた組を test に渡す。
+    """
+
+    def __init__(self, test: SequentialTest):
+        self.test = test
+        self.a = OnlineStats()
+        self.b = OnlineStats()
+        self.diff = OnlineStats()
+
+    @property
+    def pairs(self) -> int:
+        return self.diff.count
+
+    def push(self, a_points: float, b_points: float) -> Decision:
+        self.a.push(a_points)
+        self.b.push(b_points)
+        self.diff.push(b_points - a_points)
+        if a_points != b_points:
+            return self.test.push(b_points > a_points)
+        return self.test.decision
+
+    def confidence_interval(self, z: float = 1.96) -> Tuple[float, float]:
+        """
+        勝率の差 (B - A) の信頼区間 (正規近似。 z = 1.96 なら 95%)。
+        """
+        if self.pairs <= 0:
+            return -1.0, 1.0
+        half = z * self.diff.std / math.sqrt(self.pairs)
+        return self.diff.mean - half, self.diff.mean + half
+
+
+class ComparisonResult(NamedTuple):
+    decision: Decision
+    pairs: int  # 判定に使った組の数
+    games: int  # 実際に対戦させたゲーム数 (並列に対戦させた分、判定に使ったゲーム数より多いことがある)
+    win_rate_a: float
+    win_rate_b: float
+    ci: Tuple[float, float]
+    llr: float
+
+    def format_summary(self) -> str:
+        return "%s (%d 組で判定, %d ゲーム対戦): 勝率 A %.3f, B %.3f, 差 (B - A) の 95%% 信頼区間 [%+.3f, %+.3f], LLR %.2f" % (
+            self.decision.name, self.pairs, self.games, self.win_rate_a, self.win_rate_b, self.ci[0], self.ci[1],
+            self.llr)
+
+
+def game_points(game: np.ndarray) -> float:
+    winner = int(game['winner'][0])
+    if winner == codec.SIDE_ME:
+        return 1.0
+    return 0.5 if winner == -1 else 0.0
+
+
+def _play_pairs(params_a: DecisionParams, params_b: DecisionParams,
+                specs: List[GameSpec]) -> List[Tuple[float, float]]:
+    """
+    specs の各ゲームを A と B のそれぞれで対戦させ、 (A の勝ち点, B の勝ち点) のリストを返す。
+    """
+    with io.silenced():
+        return [
+            (game_points(selfplay.play_game(replace(spec, params=params_a)).game),
+             game_points(selfplay.play_game(replace(spec, params=params_b)).game))
+            for spec in specs
+        ]
+
+
+def compare(params_a: DecisionParams, params_b: DecisionParams, max_pairs: int = 2000, root_seed: int = 0,
+            opponent: Strategy = Strategy.Logic, opponent_count: int = INITIAL_SUBMARINE_COUNT,
+            test: Optional[SequentialTest] = None, workers: int = 1, chunk_size: int = 8) -> ComparisonResult:
+    """
+    A と B を、決着がつくか max_pairs 組を対戦させるまで比較する。
+    workers > 1 なら、 chunk_size 組ずつ workers 個のプロセスで並列に対戦させ、組の順に検定に渡す。
+    """
+    comparison = PairedComparison(test if test is not None else SequentialTest())
+    specs = selfplay.make_specs(max_pairs, root_seed, opponent=opponent, opponent_count=opponent_count)
+    if workers <= 1:
+        # 並列に対戦させないなら、 1 組ごとに判定すれば余分なゲームを対戦させずに済む
+        chunk_size = 1
+    round_size = chunk_size * max(1, workers)
+    games = 0
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=selfplay.configure_headless) \
+        if workers > 1 else None
+    try:
+        for start in range(0, len(specs), round_size):
+            round_specs = specs[start:start + round_size]
+            chunks = [round_specs[i:i + chunk_size] for i in range(0, len(round_specs), chunk_size)]
+            if executor is None:
+                results = [_play_pairs(params_a, params_b, chunk) for chunk in chunks]
+            else:
+                results = list(executor.map(_play_pairs, [params_a] * len(chunks), [params_b] * len(chunks), chunks))
+            games += 2 * len(round_specs)
+
+            decision = Decision.Continue
+            for a_points, b_points in (pair for chunk in results for pair in chunk):
+                decision = comparison.push(a_points, b_points)
+                if decision is not Decision.Continue:
+                    break
+            if decision is not Decision.Continue:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return ComparisonResult(decision=comparison.test.decision, pairs=comparison.pairs, games=games,
+                            win_rate_a=comparison.a.mean, win_rate_b=comparison.b.mean,
+                            ci=comparison.confidence_interval(), llr=comparison.test.llr)
+
+
+def parse_params(s: str) -> DecisionParams:
+    """
+    "hit_weight=1.5,use_exposure=0" のような文字列を DecisionParams にする。指定のない項目はデフォルト値。
+    """
+    names = DEFAULT_PARAMS.to_dict().keys()
+    d = dict()
+    for item in filter(None, s.split(",")):
+        name, _, value = item.partition("=")
+        if name not in names:
+            raise ValueError("unknown parameter: " + name)
+        d[name] = float(value)
+    return DecisionParams.from_dict(d)
+
+
+def main(argv: List[str]):
+    max_pairs = io.int_option(argv, "-g", 2000)
+    workers = io.int_option(argv, "-j", 1)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    root_seed = io.int_option(argv, "--seed", 0)
+    p1 = io.int_option(argv, "--p1", 60) / 100
+    opponent = selfplay.strategy_option(argv)
+    try:
+        params_a = parse_params(argv[argv.index("--a") + 1]) if "--a" in argv else DEFAULT_PARAMS
+        params_b = parse_params(argv[argv.index("--b") + 1]) if "--b" in argv else DEFAULT_PARAMS
+    except (IndexError, ValueError) as e:
+        io.fail("パラメータの指定が不正です: %s" % e, None)
+        io.info("Usage: `--a name=value,...` `--b name=value,...`", None)
+        sys.exit(1)
+
+    invariant.set_validation_level(invariant.ValidationLevel.Off)
+    result = compare(params_a, params_b, max_pairs=max_pairs, root_seed=root_seed, opponent=opponent,
+                     opponent_count=opponent_count, test=SequentialTest(p1=p1), workers=workers)
+    io.success(result.format_summary(), None)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,167 @@
+"""
+構築に時間のかかる表 (初期配置の評価、終盤の表とその遷移表など) のディスクキャッシュ。
+
+表は名前付きの numpy 配列の組で、一度構築したら以下のディレクトリに保存し、以降のプロセスは np.load(mmap_mode='r') で
+メモリマップするだけで使える (読み込み時にパースやコピーは発生しない)。
+
+    <cache_dir>/<name>-<key>/
+        meta.json     ... キーの元になった値 (ルールのパラメータ・表のバージョンなど) と配列名の一覧
+        <array>.npy   ... 配列ごとのファイル
+
+key はルールのパラメータ (ROW, COL, 艦数, HP)、キャッシュの形式のバージョン、表ごとのバージョン、
+その他の表の構築に影響するパラメータのハッシュなので、どれかが変われば別のキャッシュになる (古いものは削除する)。
+構築は一時ディレクトリで行ってから rename するので、複数のプロセスが同時に構築しても壊れたキャッシュは残らない。
+
+cache_dir を指定しなければ、 set_cache_dir() で設定したディレクトリ、環境変数 SUBMARINE_DESTROYER_CACHE、
+DEFAULT_CACHE_DIR の順に使う (テストではホームディレクトリを汚さないように一時ディレクトリを設定する)。
+"""
+import hashlib
+import json
+import os
+import shutil
+from typing import Any, Callable, Dict, Optional, Union
+
+import numpy as np
+
+from .rule import ROW, COL, INITIAL_HP, INITIAL_SUBMARINE_COUNT
+
+# キャッシュの形式を変更したらインクリメントすること
+CACHE_FORMAT_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".submarine-destroyer", "cache")
+CACHE_DIR_ENV = "SUBMARINE_DESTROYER_CACHE"
+
+_META_FILE = "meta.json"
+
+Table = Dict[str, np.ndarray]
+
+
+class _Configured:
+    """
+    cache_dir 引数の既定値。 configured_cache_dir() のディレクトリを使う。
+    """
+
+    def __repr__(self) -> str:
+        return "CONFIGURED"
+
+
+CONFIGURED = _Configured()
+
+# cache_dir 引数の型: ディレクトリ、 None (キャッシュを使わない)、または CONFIGURED
+CacheDir = Union[str, None, _Configured]
+
+_cache_dir_override: Optional[str] = None
+
+
+def set_cache_dir(cache_dir: Optional[str]) -> None:
+    """
+    cache_dir を指定しない場合に使うディレクトリを設定する。 None なら設定を解除する。
+    """
+    global _cache_dir_override
+    _cache_dir_override = cache_dir
+
+
+def configured_cache_dir() -> str:
+    if _cache_dir_override is not None:
+        return _cache_dir_override
+    return os.environ.get(CACHE_DIR_ENV) or DEFAULT_CACHE_DIR
+
+
+def key_fields(name: str, version: int, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    キャッシュのキーの元になる値。 params は表ごとの構築に影響するパラメータ (JSON にできる値)。
+    """
+    return {
+        "name": name, "version": version, "format": CACHE_FORMAT_VERSION,
+        "row": ROW, "col": COL, "count": INITIAL_SUBMARINE_COUNT, "hp": INITIAL_HP,
+        "params": params if params is not None else dict(),
+    }
+
+
+def cache_key(name: str, version: int, params: Optional[Dict[str, Any]] = None) -> str:
+    key = json.dumps(key_fields(name, version, params), sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def table_path(cache_dir: str, name: str, version: int, params: Optional[Dict[str, Any]] = None) -> str:
+    return os.path.join(cache_dir, "%s-%s" % (name, cache_key(name, version, params)))
+
+
+def _map(path: str) -> Optional[Table]:
+    """
+    path のキャッシュをメモリマップする。無ければ (または書きかけなら) None。
+    """
+    meta_path = os.path.join(path, _META_FILE)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    return {array: np.load(os.path.join(path, array + ".npy"), mmap_mode='r') for array in meta["arrays"]}
+
+
+def _save(path: str, fields: Dict[str, Any], table: Table) -> None:
+    """
+    table を一時ディレクトリに書いてから path に rename する。
+    他のプロセスが先に書き込んでいた場合は、そちらを残す。
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = "%s.tmp.%d" % (path, os.getpid())
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    try:
+        for array, value in table.items():
+            np.save(os.path.join(tmp, array + ".npy"), np.ascontiguousarray(value))
+        with open(os.path.join(tmp, _META_FILE), "w") as f:
+            json.dump(dict(fields, arrays=sorted(table)), f, sort_keys=True)
+        os.rename(tmp, path)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not os.path.exists(os.path.join(path, _META_FILE)):
+            raise
+
+
+def prune(cache_dir: str, name: str, keep: str) -> int:
+    """
+    name の表のキャッシュのうち、パスが keep でないもの (古いバージョンなど) を削除する。削除した個数を返す。
+    """
+    removed = 0
+    for entry in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, entry)
+        if not entry.startswith(name + "-") or ".tmp." in entry or path == keep:
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            # 以前の形式 (<name>-<key>.npz) のキャッシュ
+            os.remove(path)
+        removed += 1
+    return removed
+
+
+def load(name: str, version: int, build: Callable[[], Table], params: Optional[Dict[str, Any]] = None,
+         cache_dir: CacheDir = CONFIGURED) -> Table:
+    """
+    name の表のキャッシュがあればメモリマップして返し、無ければ build() で構築してキャッシュに保存する。
+    どちらの場合も、 name の表の古いキャッシュは削除する。
+    返す配列は読み取り専用。 cache_dir が None ならキャッシュを使わない (build() の結果をそのまま返す)。
+    """
+    if cache_dir is None:
+        return build()
+    if isinstance(cache_dir, _Configured):
+        cache_dir = configured_cache_dir()
+
+    path = table_path(cache_dir, name, version, params)
+    table = _map(path)
+    if table is None:
+        built = build()
+        try:
+            _save(path, key_fields(name, version, params), built)
+        except OSError:
+            # キャッシュに書き込めなくても表は使える
+            return built
+        table = _map(path)
+    try:
+        prune(cache_dir, name, keep=path)
+    except OSError:
+        pass
+    return table
@@ -0,0 +1,225 @@
+"""
+自軍の操作の決定 (logic.suggest_my_op) の分岐ごとの回数・所要時間の計測と、直近の判断の記録。
+
+Branch は suggest_my_op() が操作を決定した分岐の識別子で、計測・記録・アーカイブの branch 列はこれで分岐を区別する。
+
+BranchCounters は分岐ごとの回数・合計時間・最大時間・所要時間のヒストグラムを、あらかじめ確保した int のリストで数える。
+1 回の記録は数回のリストの加算だけなので、対話的な対戦でも自己対戦でも常に有効にしておける。
+server のリクエストを処理するスレッドや loadtest のスレッドから同時に記録されるので、どちらもロックで排他する。
+
+DecisionTrace は直近 capacity 回の判断を、その入力 (確率グリッド・自軍の配置・生存数など) と合わせて
+あらかじめ確保したリングバッファに記録する。不具合の調査のために必要なときだけ有効にする。
+"""
+import enum
+import threading
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from . import codec
+from .model import OpInfo, BattleData
+from .rule import ROW, COL
+
+# 所要時間のヒストグラムのビン数。ビン b には bit 長が b の所要時間 [ns] (2^(b-1) 以上 2^b 未満) を数える。
+LATENCY_BUCKETS = 40
+
+# DecisionTrace の 1 レコード。 resp 列は常に codec.NO_RESPONSE (判断の時点では反応は分からない)。
+TRACE_DTYPE = np.dtype([
+    ('seq', '<i8'),  # 記録を始めてからの通し番号
+    ('turn', '<i2'),
+    ('branch', 'i1'),
+    ('kind', 'i1'),
+    ('cell', 'i1'),
+    ('dy', 'i1'),
+    ('dx', 'i1'),
+    ('resp', 'i1'),
+    ('my_alive', 'i1'),
+    ('opp_alive', 'i1'),
+    ('tracking', 'i1'),
+    ('prev_opp_kind', 'i1'),
+    ('latency_ns', '<i8'),
+    ('my_grid', 'i1', (ROW, COL)),
+    ('prob', '<f4', (ROW, COL)),
+])
+
+
+class Branch(enum.IntEnum):
+    """
+    suggest_my_op() が操作を決定した分岐の識別子。
+    0 は不明 (自作ロジック以外の操作や、過去ログから取り込んだ操作など)。
+    """
+    Unknown = 0
+    Opening = 1  # 先手の初手攻撃
+    Tracking = 2  # 位置が明らかな敵艦への攻撃
+    DodgeOverlap = 3  # 確率最高セルと自軍がかぶっているので回避移動
+    MoveTowardHighProb = 4  # 確率最高セルへ向けて移動
+    CounterAttack = 5  # 攻撃を食らっているマスの周囲への反撃
+    ThresholdAttack = 6  # しきい値より確率が高いマスへの攻撃
+    MoveToAttackedPos = 7  # 過去に敵が攻撃した位置へ移動
+    RandomMove = 8  # ランダムに移動
+    Fallback = 9  # 他に行動パターンが無いので評価値最大のマスへ攻撃
+    Endgame = 10  # 終盤の表 (endgame) に従う (現在は使わない。記録済みの branch 列と番号を合わせるために残す)
+
+
+class BranchCounters:
+    """
+    分岐ごとの回数と所要時間。 names[i] は分岐の識別子 i の名前。
+    """
+
+    def __init__(self, names: Sequence[str]):
+        self.names = tuple(names)
+        n = len(self.names)
+        self.counts: List[int] = [0] * n
+        self.total_ns: List[int] = [0] * n
+        self.max_ns: List[int] = [0] * n
+        self.histogram: List[List[int]] = [[0] * LATENCY_BUCKETS for _ in range(n)]
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # ロックは別のプロセスへ渡せないので、状態から除く
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def record(self, branch: int, elapsed_ns: int) -> None:
+        with self._lock:
+            self.counts[branch] += 1
+            self.total_ns[branch] += elapsed_ns
+            if elapsed_ns > self.max_ns[branch]:
+                self.max_ns[branch] = elapsed_ns
+            self.histogram[branch][min(elapsed_ns.bit_length(), LATENCY_BUCKETS - 1)] += 1
+
+    def reset(self) -> None:
+        with self._lock:
+            for i in range(len(self.names)):
+                self.counts[i] = self.total_ns[i] = self.max_ns[i] = 0
+                self.histogram[i][:] = [0] * LATENCY_BUCKETS
+
+    def merge(self, other: 'BranchCounters') -> None:
+        """
+        別のプロセスなどで数えた other を足し込む。
+        """
+        assert self.names == other.names
+        with self._lock:
+            for i in range(len(self.names)):
+                self.counts[i] += other.counts[i]
+                self.total_ns[i] += other.total_ns[i]
+                self.max_ns[i] = max(self.max_ns[i], other.max_ns[i])
+                for b in range(LATENCY_BUCKETS):
+                    self.histogram[i][b] += other.histogram[i][b]
+
+    def quantile_ns(self, branch: int, q: float) -> int:
+        """
+        分岐 branch の所要時間の q 分位点 [ns] の上界 (ヒストグラムのビンの上端)。
+        """
+        hist = self.histogram[branch]
+        rank = q * self.counts[branch]
+        acc = 0
+        for b, c in enumerate(hist):
+            acc += c
+            if c > 0 and acc >= rank:
+                return 1 << b
+        return 0
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """
+        回数が 1 以上の分岐について {名前: {count, mean_us, p50_us, p99_us, max_us}} を返す。
+        """
+        with self._lock:
+            return self._snapshot()
+
+    def _snapshot(self) -> Dict[str, Dict[str, float]]:
+        return {
+            name: {
+                "count": self.counts[i],
+                "mean_us": self.total_ns[i] / self.counts[i] / 1000,
+                "p50_us": self.quantile_ns(i, 0.5) / 1000,
+                "p99_us": self.quantile_ns(i, 0.99) / 1000,
+                "max_us": self.max_ns[i] / 1000,
+            }
+            for i, name in enumerate(self.names)
+            if self.counts[i] > 0
+        }
+
+    def format_summary(self) -> str:
+        lines = ["%-20s %8s %10s %10s %10s %10s" % ("branch", "count", "mean[us]", "p50[us]", "p99[us]", "max[us]")]
+        for name, s in self.snapshot().items():
+            lines.append("%-20s %8d %10.1f %10.1f %10.1f %10.1f" % (
+                name, s["count"], s["mean_us"], s["p50_us"], s["p99_us"], s["max_us"]))
+        return "\n".join(lines)
+
+
+class DecisionTrace:
+    """
+    直近 capacity 回の判断を記録するリングバッファ。
+    """
+
+    def __init__(self, capacity: int):
+        assert capacity > 0
+        self.buffer = np.zeros(capacity, dtype=TRACE_DTYPE)
+        self.recorded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def capacity(self) -> int:
+        return len(self.buffer)
+
+    def record(self, data: BattleData, op: OpInfo, branch: int, elapsed_ns: int) -> None:
+        """
+        data (判断の入力) と、それに対する判断の結果 op, branch を記録する。
+        """
+        with self._lock:
+            self._record(data, op, branch, elapsed_ns)
+
+    def _record(self, data: BattleData, op: OpInfo, branch: int, elapsed_ns: int) -> None:
+        rec = self.buffer[self.recorded % len(self.buffer)]
+        rec['seq'] = self.recorded
+        rec['turn'] = op.turn_count
+        rec['branch'] = branch
+        codec.write_op(rec, op)
+        rec['resp'] = codec.NO_RESPONSE
+        rec['my_alive'] = data.my_alive_count
+        rec['opp_alive'] = data.opponent_alive_count
+        rec['tracking'] = codec.cell_index(data.tracking_cell)
+        rec['prev_opp_kind'] = codec.op_kind(data.opponent_history[-1] if len(data.opponent_history) > 0 else None)
+        rec['latency_ns'] = elapsed_ns
+        rec['my_grid'] = data.my_grid
+        rec['prob'] = data.prob
+        self.recorded += 1
+
+    def records(self) -> np.ndarray:
+        """
+        記録されている判断を古い順に並べたコピーを返す。
+        """
+        with self._lock:
+            n = min(self.recorded, len(self.buffer))
+            start = self.recorded % len(self.buffer) if self.recorded > len(self.buffer) else 0
+            return np.roll(self.buffer, -start)[:n].copy()
+
+    def save(self, path: str) -> None:
+        np.save(path, self.records())
+
+
+def load_trace(path: str) -> np.ndarray:
+    records = np.load(path)
+    if records.dtype != TRACE_DTYPE:
+        raise ValueError("not a decision trace: " + path)
+    return records
+
+
+def format_trace(records: np.ndarray, names: Optional[Sequence[str]] = None) -> str:
+    """
+    DecisionTrace.records() の内容を一行一判断の文字列にする。 names は分岐の名前の一覧。
+    """
+    lines = []
+    for rec in records:
+        branch = int(rec['branch'])
+        name = names[branch] if names is not None and 0 <= branch < len(names) else str(branch)
+        lines.append("#%d %s (%s, %.1fus) alive: %d/%d, tracking: %s" % (
+            rec['seq'], codec.read_op(rec), name, rec['latency_ns'] / 1000, rec['my_alive'], rec['opp_alive'],
+            "None" if rec['tracking'] == codec.NO_CELL else codec.pos_of(rec['tracking']).code()))
+    return "\n".join(lines)
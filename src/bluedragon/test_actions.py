@@ -0,0 +1,82 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import actions
+from .model import BattleData
+from .rule import Pos
+from .rule import is_within_area
+
+
+def random_fleet(rng: np.random.Generator, count: int) -> BattleData:
+    data = BattleData(4)
+    for cell in rng.choice(25, size=count, replace=False):
+        data.my_grid[cell // 5, cell % 5] = int(rng.integers(1, 4))
+    return data
+
+
+class TestActions(TestCase):
+    def test_legal_actions_01(self):
+        """
+        旧来の素朴な列挙と同じ合法手になるはず。
+        """
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            data = random_fleet(rng, int(rng.integers(1, 5)))
+            legal = actions.legal_actions(data.my_grid)
+            positions = set(Pos(y, x) for y in range(5) for x in range(5) if data.my_grid[y, x] > 0)
+            attackable = set(
+                Pos(p.row + dy, p.col + dx)
+                for p in positions for dy in (-1, 0, 1) for dx in (-1, 0, 1)
+                if is_within_area(Pos(p.row + dy, p.col + dx))) - positions
+            self.assertEqual(legal.positions, positions)
+            self.assertEqual(legal.attackable, attackable)
+
+            moves = set()
+            for p in positions:
+                for dy, dx in actions.MOVE_DIRECTIONS:
+                    q = Pos(p.row + dy, p.col + dx)
+                    if is_within_area(q) and q not in positions:
+                        moves.add((p, q))
+                self.assertEqual(legal.moves_from[p], set(q for r, q in moves if r == p))
+            for q, movers in legal.movers_to.items():
+                self.assertEqual(movers, set(p for p, r in moves if r == q))
+
+            self.assertEqual(len(legal.actions), len(attackable) + len(moves))
+            decoded = set()
+            for a in legal.actions:
+                if actions.is_attack(a):
+                    self.assertIn(actions.attack_pos(a), attackable)
+                else:
+                    p, dy, dx = actions.move_of(a)
+                    decoded.add((p, Pos(p.row + dy, p.col + dx)))
+            self.assertEqual(decoded, moves)
+
+    def test_encode_01(self):
+        for cell in range(25):
+            p = Pos(cell // 5, cell % 5)
+            self.assertEqual(actions.attack_pos(actions.attack_action(p)), p)
+            for dy, dx in actions.MOVE_DIRECTIONS:
+                a = actions.move_action(p, dy, dx)
+                self.assertFalse(actions.is_attack(a))
+                self.assertTrue(actions.CELL_COUNT <= a < actions.ACTION_COUNT)
+                self.assertEqual(actions.move_of(a), (p, dy, dx))
+
+    def test_cache_01(self):
+        """
+        HP が変わっても配置が同じなら同じ LegalActions が返り、艦が移動すれば別のものになるはず。
+        """
+        data = BattleData(4)
+        data.my_grid[0, 0] = 3
+        data.my_grid[2, 2] = 3
+        legal = actions.legal_actions(data.my_grid)
+        data.my_grid[2, 2] = 1
+        self.assertIs(actions.legal_actions(data.my_grid), legal)
+        self.assertFalse(legal.actions.flags.writeable)
+
+        data.my_grid[2, 2] = 0
+        data.my_grid[2, 3] = 1
+        self.assertIsNot(actions.legal_actions(data.my_grid), legal)
+        # BattleData が返す集合はコピーなので、書き換えてもキャッシュには影響しない
+        data.set_of_my_attackable_cells().clear()
+        self.assertTrue(len(actions.legal_actions(data.my_grid).attackable) > 0)
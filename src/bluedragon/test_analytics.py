@@ -0,0 +1,73 @@
+import multiprocessing
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import analytics
+from . import codec
+from . import selfplay
+from .archive import Archive, ArchiveWriter
+
+
+class TestOnlineStats(TestCase):
+    def test_push_and_merge(self):
+        xs = np.random.default_rng(0).normal(10, 3, size=1000)
+        a = analytics.OnlineStats()
+        b = analytics.OnlineStats()
+        for x in xs[:300]:
+            a.push(x)
+        for x in xs[300:]:
+            b.push(x)
+        a.merge(b)
+        self.assertEqual(1000, a.count)
+        self.assertAlmostEqual(xs.mean(), a.mean)
+        self.assertAlmostEqual(xs.var(ddof=1), a.variance)
+        self.assertEqual(xs.min(), a.min)
+
+    def test_histogram(self):
+        h = analytics.Histogram(0, 10, 10)
+        for x in [-5, 0, 1.5, 9.9, 100]:
+            h.push(x)
+        self.assertEqual([2, 1, 0, 0, 0, 0, 0, 0, 0, 2], h.counts.tolist())
+
+
+class TestStreamingAggregator(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.results = list(selfplay.play_games(selfplay.make_specs(10, root_seed=3, max_turns=80)))
+
+    def test_consume(self):
+        flushed = []
+        aggregator = analytics.StreamingAggregator().consume(
+            iter(self.results), flush_every=4, on_flush=lambda agg: flushed.append(agg.games))
+        self.assertEqual([4, 8], flushed)
+
+        stats = aggregator.groups[(selfplay.Strategy.Logic, 4)]
+        self.assertEqual(10, stats.games)
+        wins = sum(1 for r in self.results if r.game['winner'][0] == codec.SIDE_ME)
+        self.assertEqual(wins, stats.wins)
+        attacks = sum(np.count_nonzero((r.turns['side'] == codec.SIDE_ME) & (r.turns['kind'] == codec.KIND_ATTACK))
+                      for r in self.results)
+        self.assertEqual(attacks, stats.branch_attacks.sum())
+        self.assertEqual(4.0, stats.survival_curve()[0])
+        self.assertIn("games: 10", aggregator.format_summary())
+
+    def test_consume_from_archive(self):
+        with tempfile.TemporaryDirectory() as root:
+            with ArchiveWriter(root, "shard") as writer:
+                for r in self.results:
+                    writer.append(r.game, r.turns)
+            from_archive = analytics.StreamingAggregator().consume(Archive(root).iter_games())
+        direct = analytics.StreamingAggregator().consume(iter(self.results))
+        a = from_archive.groups[(0, 4)]
+        b = direct.groups[(0, 4)]
+        self.assertEqual(b.wins, a.wins)
+        self.assertTrue(np.array_equal(b.survival_sum, a.survival_sum))
+
+    def test_iter_queue(self):
+        q = multiprocessing.Queue()
+        for i in range(3):
+            q.put(i)
+        q.put(None)
+        self.assertEqual([0, 1, 2], list(analytics.iter_queue(q)))
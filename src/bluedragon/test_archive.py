@@ -0,0 +1,114 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import codec
+from . import selfplay
+from .archive import Archive, ArchiveWriter, ArchiveError, Shard
+from .model import Response
+
+
+class TestArchive(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = self.tmp.name
+        specs = selfplay.make_specs(20, root_seed=1, max_turns=60)
+        results = list(selfplay.play_games(specs))
+        for i in range(0, len(results), 8):
+            with ArchiveWriter(self.root, "shard-%d" % i) as writer:
+                for result in results[i:i + 8]:
+                    writer.append(result.game, result.turns)
+        self.all_turns = np.concatenate([r.turns for r in results])
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_run_to_archive(self):
+        specs = selfplay.make_specs(3, root_seed=2, max_turns=20)
+        self.assertEqual(3, selfplay.run_to_archive(specs, self.root + "/other", chunk_size=2))
+        self.assertEqual(2, len(Archive(self.root + "/other").shards))
+
+    def test_shards(self):
+        archive = Archive(self.root)
+        self.assertEqual(3, len(archive.shards))
+        self.assertEqual(20, sum(len(games) for games in archive.games()))
+        self.assertEqual(len(self.all_turns), archive.count())
+
+    def test_select_indexed(self):
+        archive = Archive(self.root)
+        expected = np.count_nonzero(self.all_turns['resp'] == Response.Hit.value)
+        self.assertEqual(expected, archive.count(resp=Response.Hit))
+
+        expected = np.count_nonzero(np.isin(self.all_turns['turn'], [1, 2]) & (self.all_turns['my_alive'] == 4))
+        self.assertEqual(expected, archive.count(turn=(1, 2), my_alive=4))
+
+    def test_select_with_predicate(self):
+        archive = Archive(self.root)
+        t = self.all_turns
+        expected = np.count_nonzero((t['tracking'] >= 0) & (t['prev_opp_kind'] == codec.KIND_MOVE))
+        actual = archive.count(prev_opp_kind=codec.KIND_MOVE, where=lambda r: r['tracking'] >= 0)
+        self.assertEqual(expected, actual)
+
+    def test_unindexed_tail(self):
+        """
+        索引を作った後に追記された行も検索結果に含まれるはず。
+        """
+        result = selfplay.play_game(selfplay.GameSpec(game=100, seed=5, max_turns=60))
+        shard = Archive(self.root).shards[0]
+        name = shard.path.rsplit("/", 1)[-1]
+        writer = ArchiveWriter(self.root, name)
+        writer.append(result.game, result.turns)
+        writer.close(build_index=False)
+
+        archive = Archive(self.root)
+        self.assertEqual(len(self.all_turns) + len(result.turns), archive.count())
+        self.assertEqual(len(result.turns), archive.count(game=100))
+        self.assertEqual(np.count_nonzero(result.turns['turn'] == 1) + np.count_nonzero(self.all_turns['turn'] == 1),
+                         archive.count(turn=1))
+
+    def test_lock(self):
+        with ArchiveWriter(self.root, "locked"):
+            with self.assertRaises(ArchiveError):
+                ArchiveWriter(self.root, "locked")
+
+    def test_recover_01(self):
+        """
+        追記の途中で落ちたシャードを開き直したら、不完全なレコードは切り詰められ、以降の追記は正しく読めるはず。
+        """
+        first, second, third = selfplay.play_games(selfplay.make_specs(3, root_seed=7, max_turns=60))
+        with ArchiveWriter(self.root, "torn") as writer:
+            writer.append(first.game, first.turns)
+        path = os.path.join(self.root, "torn")
+        # second の手のレコードの一部まで書いたところで落ちたライター (ロックファイルも残る)
+        with open(os.path.join(path, "turns.bin"), "ab") as f:
+            f.write(second.turns.tobytes()[:-5])
+        with open(os.path.join(path, ".lock"), "w") as f:
+            f.write(str(2 ** 22 + 1))
+
+        with ArchiveWriter(self.root, "torn") as writer:
+            writer.append(third.game, third.turns)
+        shard = Shard(path)
+        np.testing.assert_array_equal(shard.games, np.concatenate([first.game, third.game]))
+        np.testing.assert_array_equal(shard.turns, np.concatenate([first.turns, third.turns]))
+        self.assertEqual(Archive(self.root).count(), len(self.all_turns) + len(first.turns) + len(third.turns))
+        self.assertEqual(shard.indexed_rows, len(shard.turns))
+
+    def test_recover_02(self):
+        """
+        ゲームのレコードの途中まで書いて落ちた場合も、そのゲームは捨てられるはず。
+        """
+        first, second = selfplay.play_games(selfplay.make_specs(2, root_seed=8, max_turns=60))
+        with ArchiveWriter(self.root, "torn") as writer:
+            writer.append(first.game, first.turns)
+        path = os.path.join(self.root, "torn")
+        with open(os.path.join(path, "turns.bin"), "ab") as f:
+            f.write(second.turns.tobytes())
+        with open(os.path.join(path, "games.bin"), "ab") as f:
+            f.write(second.game.tobytes()[:-3])
+
+        ArchiveWriter(self.root, "torn").close()
+        shard = Shard(path)
+        np.testing.assert_array_equal(shard.games, first.game)
+        np.testing.assert_array_equal(shard.turns, first.turns)
@@ -0,0 +1,117 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import batch
+from . import codec
+from . import invariant
+from . import logic
+from .batch import BatchBattleData, BatchOps
+from .model import *
+
+
+class TestBatch(TestCase):
+    def test_prob_updates_01(self):
+        """
+        確率グリッドの更新は、ランダムな更新の列のどの時点でも logic の結果と一致するはず。
+        batch は確定している敵艦の索引を持たないので、 logic の更新処理には certain=None (確率 1 のマスを確定とみなす) を渡して
+        比べる。 ConfirmedEnemies を使う logic.apply_*() や正規化を通した結果とは一致しない (batch のモジュールの説明を参照)。
+        """
+        # ランダムな更新の列は互いに矛盾する (実際の対戦では起こらない) ので、不変条件は検査しない
+        invariant.set_validation_level(invariant.ValidationLevel.Off)
+        self.addCleanup(invariant.set_validation_level, invariant.ValidationLevel.Full)
+        rng = np.random.default_rng(0)
+        n = 40
+        probs = [np.full((5, 5), 4 / 25) for _ in range(n)]
+        alive = np.full(n, 4)
+        for step in range(30):
+            P = np.array([p.ravel() for p in probs])
+            kind = rng.integers(5, size=n)
+            cell = rng.integers(25, size=n)
+            dy, dx = np.zeros(n, dtype=int), np.zeros(n, dtype=int)
+            for i in range(n):
+                pos = Pos(int(cell[i]) // 5, int(cell[i]) % 5)
+                if kind[i] == 0:
+                    logic._update_prob_for_my_attack_hit(probs[i], pos, int(alive[i]))
+                elif kind[i] == 1:
+                    logic._update_prob_for_my_attack_near(probs[i], pos, int(alive[i]))
+                elif kind[i] == 2:
+                    logic._update_prob_for_my_attack_nothing(probs[i], pos)
+                else:
+                    d = [(1, 0), (-2, 0), (0, 1), (0, -2)][int(rng.integers(4))]
+                    dy[i], dx[i] = d
+                    logic._update_prob_for_opponent_move(probs[i], MoveInfo(None, *d))
+            for k, update in ((0, batch._hit), (1, batch._near)):
+                sel = kind == k
+                Q = P[sel]
+                update(Q, cell[sel], alive[sel])
+                P[sel] = Q
+            sel = kind == 2
+            Q = P[sel]
+            batch._nothing(Q, cell[sel])
+            P[sel] = Q
+            sel = kind >= 3
+            Q = P[sel]
+            batch._opponent_move(Q, dy[sel], dx[sel], 1.0)
+            P[sel] = Q
+            expected = np.array([p.ravel() for p in probs])
+            self.assertTrue(np.allclose(expected, P, atol=1e-9), "step %d" % step)
+
+    def test_apply_opponent_ops_01(self):
+        """
+        敵軍の攻撃に対する反応と HP の変化は logic.apply_opponent_op() と一致するはず。
+        """
+        rng = np.random.default_rng(1)
+        n = 200
+        data = BatchBattleData(n)
+        batch.initialize_my_placements(data, np.arange(n), rng)
+        scalar = []
+        for i in range(n):
+            d = BattleData(4)
+            d.my_grid[:, :] = data.my_grid[i]
+            scalar.append(d)
+
+        for _ in range(3):
+            cell = rng.integers(25, size=n)
+            resp = batch.apply_opponent_ops(data, np.arange(n), BatchOps(
+                np.full(n, codec.KIND_ATTACK), cell, np.zeros(n, dtype=int), np.zeros(n, dtype=int)))
+            for i, d in enumerate(scalar):
+                op = OpInfo(AttackInfo(attack_pos=Pos(int(cell[i]) // 5, int(cell[i]) % 5)), turn_count=1)
+                self.assertEqual(logic.apply_opponent_op(d, op).value, resp[i])
+                self.assertTrue(np.array_equal(d.my_grid, data.my_grid[i]))
+                self.assertEqual(d.my_alive_count, data.my_alive_count[i])
+
+    def test_suggest_my_ops_01(self):
+        """
+        提案される操作は合法なはず。
+        """
+        rng = np.random.default_rng(2)
+        n = 300
+        data = BatchBattleData(n)
+        idx = np.arange(n)
+        batch.initialize_my_placements(data, idx, rng)
+        for turn in range(20):
+            ops, branch = batch.suggest_my_ops(data, idx, rng)
+            attackable = data.attackable(idx)
+            self.assertTrue(np.all(branch != logic.Branch.Unknown))
+            for i in range(n):
+                if ops.kind[i] == codec.KIND_ATTACK:
+                    self.assertTrue(attackable[i, ops.cell[i]])
+                else:
+                    invariant.check_my_move(data.my_grid[i], codec.pos_of(ops.cell[i]), int(ops.dy[i]), int(ops.dx[i]))
+            batch.apply_my_ops(data, idx, ops)
+            attack = ops.kind == codec.KIND_ATTACK
+            batch.apply_attack_responses(data, idx[attack], rng.choice([1, 3, 4], size=int(attack.sum())))
+            batch.apply_opponent_ops(data, idx, BatchOps(
+                np.full(n, codec.KIND_ATTACK), rng.integers(25, size=n), np.zeros(n, dtype=int), np.zeros(n, dtype=int)))
+            batch.update_tracking_cells(data, idx)
+
+    def test_play_batch_01(self):
+        a = batch.play_batch(50, seed=4, max_turns=100)
+        b = batch.play_batch(50, seed=4, max_turns=100)
+        self.assertTrue(np.array_equal(a.winner, b.winner))
+        self.assertTrue(np.array_equal(a.turns, b.turns))
+        self.assertTrue(np.all((a.turns > 0) & (a.turns <= 100)))
+        self.assertTrue(np.all(np.isin(a.winner, [-1, codec.SIDE_ME, codec.SIDE_OPPONENT])))
+        # 全ゲームの手数の合計と分岐の回数の合計は一致するはず
+        self.assertEqual(a.turns.sum(), a.branch_counts.sum())
@@ -0,0 +1,54 @@
+import math
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import beliefs
+from . import io
+from . import selfplay
+from .beliefs import BeliefRecorder, CalibrationMetrics
+
+
+class TestCalibrationMetrics(TestCase):
+    def test_metrics_01(self):
+        metrics = CalibrationMetrics(bins=2)
+        metrics.push(np.array([0.0, 1.0, 0.25, 1.5]), np.array([False, True, True, True]))
+        # 1.5 は 1 に切り詰められる
+        self.assertAlmostEqual(metrics.brier, 0.75 ** 2 / 4)
+        self.assertAlmostEqual(metrics.log_loss, -(3 * math.log(1 - beliefs.EPS) + math.log(0.25)) / 4)
+        self.assertEqual(metrics.reliability(), [(0.125, 0.5, 2), (1.0, 1.0, 2)])
+
+        other = CalibrationMetrics(bins=2)
+        other.merge(metrics)
+        self.assertEqual(other.cells, 4)
+        self.assertAlmostEqual(other.brier, metrics.brier)
+
+
+class TestBeliefRecorder(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_record_01(self):
+        """
+        ブロックに分けて書き出しても、全ての手が順に記録されるはず。
+        """
+        spec = selfplay.make_specs(1, root_seed=4, max_turns=40)[0]
+        with io.silenced(), BeliefRecorder(self.tmpdir.name, block_size=8) as recorder:
+            result = selfplay.play_game(spec, recorder.on_turn(spec))
+        turn_count = len(result.turns)
+
+        records = beliefs.load_beliefs(self.tmpdir.name)
+        self.assertEqual(len(records), turn_count)
+        self.assertEqual(recorder.blocks, math.ceil(turn_count / 8))
+        self.assertEqual(len(os.listdir(self.tmpdir.name)), recorder.blocks)
+        np.testing.assert_array_equal(records['turn'], np.arange(1, turn_count + 1))
+        np.testing.assert_array_equal(records['side'], result.turns['side'])
+        # 最初の手の時点では敵艦は 4 隻とも残っている
+        self.assertEqual(np.count_nonzero(records['truth'][0]), 4)
+        self.assertEqual(recorder.metrics.cells, turn_count * 25)
+        self.assertTrue(0 <= recorder.metrics.brier <= 1)
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import codec
+from . import compact
+from . import io
+from . import selfplay
+from .compact import CompactArena
+from .model import OpInfo, AttackInfo, Response, BattleData
+from .rule import Pos
+from .rule import INITIAL_SUBMARINE_COUNT
+
+
+class TestCompact(TestCase):
+    def test_play_on_view_01(self):
+        """
+        短いゲームなら、アリーナのビューで対戦させても通常の BattleData と同じ手順になるはず。
+        (確率は float32 なので、長いゲームでは終盤の同点の判定が変わって手順が分かれることがある)
+        """
+        arena = CompactArena(4)
+        for spec in selfplay.make_specs(2, root_seed=5, max_turns=60):
+            with io.silenced():
+                expected = selfplay.play_game(spec)
+                me = arena.view(arena.allocate(spec.opponent_count))
+                opponent = arena.view(arena.allocate(INITIAL_SUBMARINE_COUNT))
+                turns = np.zeros(spec.max_turns, dtype=codec.TURN_DTYPE)
+                _, turn_count = selfplay._play(spec, me, opponent, turns)
+            np.testing.assert_array_equal(turns[:turn_count], expected.turns)
+            self.assertEqual(len(me.my_history) + len(me.opponent_history), turn_count)
+        self.assertEqual(len(arena), 4)
+        with self.assertRaises(IndexError):
+            arena.allocate(4)
+
+    def test_put_01(self):
+        spec = selfplay.make_specs(1, root_seed=2, max_turns=30)[0]
+        data = BattleData(spec.opponent_count)
+        with io.silenced():
+            selfplay._play(spec, data, BattleData(INITIAL_SUBMARINE_COUNT), np.zeros(30, dtype=codec.TURN_DTYPE))
+
+        arena = CompactArena(1)
+        slot = arena.allocate(spec.opponent_count)
+        arena.put(slot, data)
+        view = arena.view(slot)
+        np.testing.assert_array_equal(view.my_grid, data.my_grid)
+        np.testing.assert_allclose(view.prob, data.prob, rtol=1e-6, atol=1e-7)
+        self.assertEqual(view.my_alive_count, data.my_alive_count)
+        self.assertEqual(view.tracking_cell, data.tracking_cell)
+        self.assertEqual(view.my_history, data.my_history)
+        self.assertEqual(view.opponent_history, data.opponent_history)
+        self.assertEqual(view.opponent_history[-2:], data.opponent_history[-2:])
+        self.assertEqual(list(reversed(view.my_history)), list(reversed(data.my_history)))
+        self.assertEqual(list(view.confirmed), list(data.confirmed))
+        self.assertEqual(view.confirmed.lost(), data.confirmed.lost())
+
+        arena.release(slot)
+        self.assertEqual(len(arena), 0)
+
+    def test_response_01(self):
+        """
+        ビューを作り直した後でも、最後の攻撃の resp の書き換えはアリーナに反映されるはず。
+        """
+        arena = CompactArena(1)
+        slot = arena.allocate(4)
+        view = arena.view(slot)
+        op = OpInfo(AttackInfo(attack_pos=Pos(1, 2)), turn_count=1)
+        view.my_history.append(op)
+        self.assertIs(view.my_history[-1], op)
+        op.detail.resp = Response.Near
+        view.pack()
+
+        view = arena.view(slot)
+        self.assertEqual(view.my_history[-1].detail.resp, Response.Near)
+        view.my_history[-1].detail.resp = Response.Hit
+        self.assertEqual(arena.view(slot).my_history[0], OpInfo(AttackInfo(Pos(1, 2), Response.Hit), turn_count=1))
+
+    def test_measure_memory_01(self):
+        with io.silenced():
+            report = compact.measure_memory(selfplay.make_specs(2, root_seed=0, max_turns=40))
+        self.assertEqual(report.games, 2)
+        self.assertLess(report.compact_bytes, report.plain_bytes)
@@ -0,0 +1,93 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import endgame
+from .model import BattleData
+from .rule import Pos
+from .rule import ROW, COL, INITIAL_HP
+
+
+class TestEndgame(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.table = endgame.load_table(cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_load_table_01(self):
+        self.assertEqual(1, len([f for f in os.listdir(self.tmp.name) if f.startswith("endgame-")]))
+        cached = endgame.load_table(self.tmp.name)
+        self.assertTrue(np.array_equal(self.table.mine, cached.mine))
+        self.assertTrue(np.array_equal(self.table.theirs, cached.theirs))
+
+    def test_value_01(self):
+        grid = np.zeros((ROW, COL), dtype=np.int32)
+        grid[2, 2] = 3
+        # 隣の HP 1 の敵艦は自軍の手番なら次の手で沈められる
+        self.assertEqual(endgame.WIN - 1, self.table.value(grid, Pos(2, 3), 1))
+        # 敵軍の手番なら逃げられる
+        self.assertEqual(0, self.table.value(grid, Pos(2, 3), 1, my_turn=False))
+
+        # HP 1 の自軍が HP 3 の敵艦の隣にいて敵軍の手番なら、次の手で沈められる
+        grid[2, 2] = 1
+        self.assertEqual(-(endgame.WIN - 1), self.table.value(grid, Pos(2, 3), 3, my_turn=False))
+
+    def test_bellman_01(self):
+        # 表の値は、自軍の手番では遷移先の最大値、敵軍の手番では遷移先の最小値 (を 1 手分減衰させたもの)
+        t = self.table
+        m = t.moves
+        rng = np.random.default_rng(0)
+        for f, e in zip(rng.integers(len(t.fleets), size=200), rng.integers(endgame.ENEMIES, size=200)):
+            successors = [t.theirs[m.my_move_next[f, k], e] for k in np.flatnonzero(m.my_move_valid[f])]
+            successors += [t.theirs[f, m.hit_enemy[e, m.my_attack[f, k]]] for k in np.flatnonzero(m.my_attack_valid[f])]
+            best = max(successors)
+            self.assertEqual(best - np.sign(best), t.mine[f, e])
+
+            successors = [t.mine[f, m.enemy_move[e, k]] for k in np.flatnonzero(m.enemy_move_valid[e])]
+            successors += [t.mine[m.hit_fleet[f, m.enemy_attack[e, k]], e]
+                           for k in np.flatnonzero(m.enemy_attack_valid[e])]
+            worst = min(successors)
+            self.assertEqual(worst - np.sign(worst), t.theirs[f, e])
+
+    def test_enemy_distribution_01(self):
+        """
+        位置が確定している艦の HP は、命中の回数から分かっている値になるはず。
+        """
+        data = BattleData(1)
+        data.prob[:, :] = 0.0
+        data.prob[3, 3] = 0.5
+        data.prob[1, 1] = 0.5
+        data.confirmed.hit(Pos(3, 3), 4)
+        dist = endgame.enemy_distribution(data.prob, data.confirmed)
+        self.assertAlmostEqual(1.0, dist.sum())
+        self.assertEqual(0.5, dist[endgame.enemy_index(3 * COL + 3, INITIAL_HP - 1)])
+        self.assertAlmostEqual(0.5 / INITIAL_HP, dist[endgame.enemy_index(1 * COL + 1, 1)])
+
+    def test_suggest_01(self):
+        data = BattleData(1)
+        data.my_grid[2, 2] = 3
+        data.my_grid[0, 4] = 1
+        data.my_alive_count = 2
+        data.opponent_alive_count = 1
+        data.prob[:, :] = 0.0
+        data.prob[3, 3] = 1.0
+
+        # 敵艦の位置が明らかでなければ扱わない
+        self.assertIsNone(endgame.suggest(data, 5))
+
+        data.tracking_cell = Pos(3, 3)
+        op, win_prob = endgame.suggest(data, 5)
+        self.assertTrue(op.is_attack())
+        self.assertEqual((Pos(3, 3), 5), (op.detail.attack_pos, op.turn_count))
+        self.assertGreaterEqual(win_prob, 1.0 / 3.0)
+
+        # 自軍が多すぎる場合は扱わない
+        data.my_grid[4, 0] = 3
+        data.my_alive_count = 3
+        self.assertIsNone(endgame.suggest(data, 5))
@@ -0,0 +1,69 @@
+from unittest import TestCase
+
+from . import invariant
+from . import placement
+from .invariant import ValidationLevel
+from .model import *
+
+
+class TestInvariant(TestCase):
+    def tearDown(self):
+        invariant.set_validation_level(ValidationLevel.Full)
+
+    def test_check_prob_sum_01(self):
+        m = np.full((5, 5), 4 / 25, dtype=np.float64)
+        invariant.check_prob_sum(m, 4)
+        with self.assertRaises(invariant.InvariantError):
+            invariant.check_prob_sum(m, 3)
+
+    def test_check_prob_sum_float32(self):
+        m = np.full((5, 5), 4 / 25, dtype=np.float32)
+        invariant.check_prob_sum(m, 4)
+
+    def test_check_sucked_one_submarine_01(self):
+        """
+        float64 の確率グリッドでは 1e-7 より大きい誤差を検出し、 float32 ではその精度に合わせて許容するはず。
+        """
+        invariant.check_sucked_one_submarine(1.0 + 1e-8, np.zeros((5, 5), dtype=np.float64))
+        with self.assertRaises(invariant.InvariantError):
+            invariant.check_sucked_one_submarine(1.0 + 1e-6, np.zeros((5, 5), dtype=np.float64))
+        invariant.check_sucked_one_submarine(1.0 + 1e-6, np.zeros((5, 5), dtype=np.float32))
+
+    def test_check_no_prob_lost_01(self):
+        invariant.check_no_prob_lost(1e-9)
+        with self.assertRaises(invariant.InvariantError):
+            invariant.check_no_prob_lost(0.25)
+
+    def test_validation_level_off(self):
+        invariant.set_validation_level(ValidationLevel.Off)
+        invariant.check_prob_sum(np.zeros((5, 5)), 4)
+        invariant.check_attackable(Pos(0, 0), set())
+
+    def test_validation_level_sampled(self):
+        invariant.set_validation_level(ValidationLevel.Sampled, sample_rate=0.0)
+        invariant.check_attackable(Pos(0, 0), set())
+        invariant.set_validation_level(ValidationLevel.Sampled, sample_rate=1.0)
+        with self.assertRaises(invariant.InvariantError):
+            invariant.check_attackable(Pos(0, 0), set())
+
+    def test_placement_candidates(self):
+        for mat in placement.top_candidates()[0]:
+            invariant.validate_placement(mat)
+        with self.assertRaises(invariant.InvariantError):
+            invariant.validate_placement([[0] * 5 for _ in range(5)])
+
+    def test_validate_placements_once_01(self):
+        """
+        同じ内容のリストは一度だけ検査し、内容が違えば (同じ id のリストでも) 検査するはず。
+        """
+        candidates = [np.array(mat) for mat in placement.top_candidates()[0][:2]]
+        invariant.validate_placements_once(candidates)
+        self.assertFalse(invariant.validate_placements_once(list(candidates)))
+        candidates[0] = np.zeros((5, 5), dtype=np.int32)
+        with self.assertRaises(invariant.InvariantError):
+            invariant.validate_placements_once(candidates)
+
+    def test_parse_validation_level(self):
+        self.assertIs(invariant.parse_validation_level("Sampled"), ValidationLevel.Sampled)
+        with self.assertRaises(ValueError):
+            invariant.parse_validation_level("foo")
@@ -0,0 +1,80 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import codec
+from . import invariant
+from . import loadtest
+from . import selfplay
+from .loadtest import LoadResult, RequestKind
+
+
+class TestLoadTest(TestCase):
+    def setUp(self):
+        # 判断の所要時間とレートを計測するので、本番と同じく不変条件は検査しない
+        invariant.set_validation_level(invariant.ValidationLevel.Off)
+        self.streams = loadtest.streams_from_specs(selfplay.make_specs(2, root_seed=5, max_turns=30))
+
+    def tearDown(self):
+        invariant.set_validation_level(invariant.ValidationLevel.Full)
+
+    def test_run_load_01(self):
+        """
+        記録を最後まで再生したら初期配置から再生し直し、判断は記録された操作と一致するはず。
+        """
+        stream = self.streams[0]
+        requests = 2 * (len(stream.turns) + 1)
+        result = loadtest.run_load([stream], requests)
+        my_turns = int(np.count_nonzero(stream.turns['side'] == codec.SIDE_ME))
+
+        self.assertEqual(result.requests, requests)
+        self.assertEqual(result.mismatches, 0)
+        self.assertEqual(int(np.count_nonzero(result.kinds == RequestKind.Start)), 2)
+        self.assertEqual(int(np.count_nonzero(result.kinds == RequestKind.Suggest)), 2 * my_turns)
+        self.assertTrue(np.all(result.latency_ns > 0))
+        self.assertIn("p999", result.format_summary())
+
+    def test_run_load_02(self):
+        """
+        レートを指定すれば、リクエストは予定時刻より前には処理されないはず。
+        """
+        result = loadtest.run_load(self.streams, 30, concurrency=3, rate=300)
+        self.assertEqual(result.requests, 30)
+        self.assertEqual(result.mismatches, 0)
+        self.assertGreaterEqual(result.elapsed_s, 29 / 300)
+
+    def test_thread_error_01(self):
+        """
+        スレッドで送出された例外は、 run_load() から送出されるはず。
+        """
+        broken = self.streams[0]._replace(turns=self.streams[0].turns[:0])
+        with self.assertRaises(IndexError):
+            loadtest.run_load([self.streams[0], broken], 10, concurrency=2)
+
+    def test_parallel_01(self):
+        """
+        並列度がプロセス数より小さければ ValueError を送出し、そうでなければ並列度は各プロセスに分けられるはず。
+        """
+        with self.assertRaises(ValueError):
+            loadtest.run_load_parallel(self.streams, 10, workers=2, concurrency=1)
+        result = loadtest.run_load_parallel(self.streams, 10, workers=2, concurrency=3)
+        self.assertEqual((result.requests, result.concurrency, result.mismatches), (10, 3, 0))
+
+    def test_saturation_01(self):
+        """
+        スループットがレートに届かなかった結果は飽和したとみなし、それより前のレートを飽和点とするはず。
+        """
+        def result(rate: float, elapsed_s: float) -> LoadResult:
+            return LoadResult(rate=rate, concurrency=1, kinds=np.zeros(100, dtype=np.int8),
+                              latency_ns=np.arange(1, 101, dtype=np.int64) * 1000, elapsed_s=elapsed_s,
+                              rss_growth=0, mismatches=0)
+
+        results = [result(50, 2.0), result(100, 1.0), result(200, 0.9)]
+        self.assertEqual([r.is_saturated() for r in results], [False, False, True])
+        self.assertEqual(loadtest.saturation_rate(results), 100)
+        self.assertIsNone(loadtest.saturation_rate(results[2:]))
+        self.assertEqual(results[0].quantile_us(0.5), 51.0)
+        self.assertEqual(results[0].quantile_us(0.999), 100.0)
+
+        merged = loadtest.merge(results[:2])
+        self.assertEqual((merged.rate, merged.requests, merged.elapsed_s), (150, 200, 2.0))
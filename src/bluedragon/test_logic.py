@@ -1,5 +1,6 @@
 from unittest import TestCase
 
+from . import invariant
 from . import logic
 from .model import *
 from .rule import set_of_around_cells
@@ -97,6 +98,27 @@ class TestUpdateProb(TestCase):
         self.assertEqual(m[p.row, p.col], 0)
         self.assertTrue(all(m[y, x] == 0 for y, x in set_of_around_cells(p)))
 
+    def test__update_prob_for_my_attack_nothing_02(self):
+        """
+        反応なしの範囲の外に確率が残っていなくても (反応と矛盾していても)、確率は失われずに範囲の外へ配分されるはず。
+        """
+        m = np.zeros((5, 5))
+        p = Pos(2, 2)
+        for y, x in set_of_around_cells(p):
+            m[y, x] = 1 / 8
+        logic._update_prob_for_my_attack_nothing(m, p, set())
+        self.assertAlmostEqual(m.sum(), 1)
+        self.assertTrue(all(m[y, x] == 0 for y, x in set_of_around_cells(p)))
+
+    def test__distribute_prob_01(self):
+        """
+        分配先が無いときに 0 でない確率を分配しようとするのは不変条件の違反のはず。
+        """
+        m = np.zeros((5, 5))
+        logic._distribute_prob(m, 0.0, set())
+        with self.assertRaises(invariant.InvariantError):
+            logic._distribute_prob(m, 0.5, set())
+
     def test__update_prob_something(self):
         m = create_initial_prob_grid(4)
         pX = Pos(3, 1)
@@ -141,6 +163,92 @@ class TestUpdateProb(TestCase):
         print(m)
         self.assertAlmostEqual(4.0, m.sum())
 
+    def test_exposure_01(self):
+        """
+        敵軍から見た自軍の存在確率は、敵軍の攻撃への自軍の反応と自軍の操作から更新される。
+        """
+        data = BattleData(4)
+        data.my_grid[2, 2] = 3
+        data.my_grid[4, 4] = 1
+        data.my_alive_count = 2
+        data.exposure[:, :] = 2 / 25
+
+        self.assertIs(Response.Near, logic.apply_opponent_op(data, OpInfo(AttackInfo(Pos(1, 1)), turn_count=1)))
+        self.assertEqual(0.0, data.exposure[1, 1])
+        self.assertAlmostEqual(2.0, data.exposure.sum())
+
+        self.assertIs(Response.Dead, logic.apply_opponent_op(data, OpInfo(AttackInfo(Pos(4, 4)), turn_count=3)))
+        self.assertEqual(0.0, data.exposure[4, 4])
+        self.assertAlmostEqual(1.0, data.exposure.sum())
+
+        # 自軍の攻撃で、敵軍には攻撃位置の周囲に自軍がいることが分かる
+        logic.apply_my_op(data, OpInfo(AttackInfo(Pos(2, 3)), turn_count=4))
+        self.assertGreater(sum(data.exposure[p] for p in set_of_around_cells(Pos(2, 3))), 0.99)
+
+        # 自軍の移動は、移動元を伏せた移動として敵軍の確率グリッドに反映される
+        before = data.exposure.copy()
+        logic.apply_my_op(data, OpInfo(MoveInfo(fromPos=Pos(2, 2), dirY=0, dirX=-2), turn_count=6))
+        expected = before.copy()
+        logic._update_prob_for_opponent_move(expected, MoveInfo(fromPos=None, dirY=0, dirX=-2))
+        self.assertTrue(np.allclose(expected, data.exposure))
+
+    def test_confirmed_01(self):
+        """
+        位置が確定している敵艦の索引は、命中・撃沈・移動で更新され、 HP は opponent_grid にも書き込まれる。
+        """
+        data = BattleData(2)
+        data.my_grid[2, 2] = 3
+        data.my_grid[0, 0] = 3
+
+        def attack(pos: Pos, resp: Response, turn: int):
+            logic.apply_my_op(data, OpInfo(AttackInfo(pos), turn_count=turn))
+            logic.apply_attack_response(data, resp)
+            logic.update_tracking_cell(data)
+
+        attack(Pos(1, 1), Response.Hit, 1)
+        self.assertIn(Pos(1, 1), data.confirmed)
+        self.assertEqual(2, data.opponent_grid[1, 1])
+        self.assertEqual(Pos(1, 1), data.tracking_cell)
+        attack(Pos(1, 1), Response.Hit, 3)
+        self.assertEqual(1, data.confirmed.get(Pos(1, 1)).hp)
+
+        # どちらの敵艦が移動したか分からないので見失う
+        logic.apply_opponent_op(data, OpInfo(MoveInfo(fromPos=None, dirY=0, dirX=1), turn_count=4))
+        self.assertEqual(0, len(data.confirmed))
+        self.assertEqual([Pos(1, 1)], [e.pos for e in data.confirmed.lost()])
+        self.assertEqual(0, data.opponent_grid.sum())
+
+        # 移動先を撃って外れたので移動はフェイントではなく、移動先で再び確定する (HP は引き継ぐ)
+        attack(Pos(1, 1), Response.Nothing, 5)
+        self.assertEqual(Pos(1, 2), data.tracking_cell)
+        self.assertEqual(1, data.confirmed.get(Pos(1, 2)).hp)
+
+        attack(Pos(1, 2), Response.Dead, 7)
+        self.assertNotIn(Pos(1, 2), data.confirmed)
+        self.assertIsNone(data.tracking_cell)
+
+        # 残り 1 隻の位置が確定していれば、移動しても確定したまま
+        attack(Pos(3, 3), Response.Hit, 9)
+        logic.apply_opponent_op(data, OpInfo(MoveInfo(fromPos=None, dirY=1, dirX=0), turn_count=10))
+        self.assertEqual([Pos(4, 3)], [e.pos for e in data.confirmed])
+        self.assertEqual(1.0, data.prob[4, 3])
+        self.assertAlmostEqual(1.0, data.prob.sum())
+
+        # 複数の敵艦が生存していても、移動先が盤面の外になる艦はその移動をできないので確定したまま
+        data = BattleData(2)
+        data.my_grid[1, 1] = 3
+        data.my_grid[4, 4] = 3
+        attack(Pos(0, 1), Response.Hit, 1)
+        logic.apply_opponent_op(data, OpInfo(MoveInfo(fromPos=None, dirY=-1, dirX=0), turn_count=2))
+        self.assertEqual([Pos(0, 1)], [e.pos for e in data.confirmed])
+        self.assertEqual([], data.confirmed.lost())
+        self.assertEqual(1.0, data.prob[0, 1])
+        self.assertEqual(Pos(0, 1), data.tracking_cell)
+        # 確定している艦からは確率を吸い出さないので、敵軍の攻撃の後も確率 1 のまま
+        logic.apply_opponent_op(data, OpInfo(AttackInfo(Pos(2, 2)), turn_count=4))
+        self.assertEqual(1.0, data.prob[0, 1])
+        self.assertIn(Pos(0, 1), data.confirmed)
+
     def test__calculate_next_tracking_cell_01(self):
         # 各要素: (current_tracking_cell, last_my_op, last_opponent_op, expected_tracking_cell)
         p0 = Pos(0, 0)
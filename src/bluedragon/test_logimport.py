@@ -0,0 +1,101 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from . import codec
+from . import logimport
+from .archive import Archive
+from .model import Response
+from .rule import Pos
+from .selfplay import Strategy
+from .telemetry import Branch
+
+# main.py が書き出すログの例 (先手, 敵艦 1 隻, 3 手で勝利)
+LOG = """\
+10:00:00 __main__           INFO     main() called
+10:00:00 __main__           DEBUG    argv: ['main.py', '-n', '1']
+10:00:00 __main__           INFO     `-n` オプションが指定され、敵艦の初期個数が 1 に設定されました。
+10:00:01 __main__           INFO     is_me_first = True
+10:00:01 bluedragon.io      INFO     
+   1  2  3  4  5
+A  .  3  .  .  .
+10:00:01 __main__           INFO     ---------------------- [Turn01] My turn ----------------------
+10:00:01 bluedragon.logic   INFO     初手 C3 への攻撃を選択しました
+10:00:01 __main__           INFO     自軍の操作: \033[93mAttack(to: C3) [turn01]\033[0m
+10:00:02 __main__           INFO     次の入力を受け取りました: \033[92mResponse.Near\033[0m
+10:00:02 bluedragon.io      INFO     
+[[0.04 0.04 0.04 0.04 0.04]
+ [0.04 0.04 0.04 0.04 0.04]]
+10:00:02 bluedragon.io      INFO     位置が明らかな敵艦: None
+10:00:02 bluedragon.io      INFO     自軍の生き残り艦数: 4
+10:00:02 bluedragon.io      INFO     敵軍の生き残り艦数: 1
+10:00:03 __main__           INFO     ------------------- [Turn02] Opponent turn -------------------
+10:00:03 __main__           INFO     次の入力を受け取りました: \033[92mMove(from: None, dir: Left(West), dist: 2) [turn02]\033[0m
+10:00:03 bluedragon.io      INFO     位置が明らかな敵艦: B2
+10:00:03 bluedragon.io      INFO     自軍の生き残り艦数: 4
+10:00:03 bluedragon.io      INFO     敵軍の生き残り艦数: 1
+10:00:04 __main__           INFO     ---------------------- [Turn03] My turn ----------------------
+10:00:04 bluedragon.logic   INFO     確率値がしきい値 0.3 より高いので B2 を攻撃します
+10:00:04 __main__           INFO     自軍の操作: \033[93mAttack(to: B2) [turn03]\033[0m
+10:00:05 __main__           INFO     次の入力を受け取りました: \033[92mResponse.Dead\033[0m
+10:00:05 __main__           INFO     We win!!
+10:01:00 __main__           INFO     main() called
+10:01:01 __main__           INFO     is_me_first = False
+10:01:01 __main__           INFO     ------------------- [Turn01] Opponent turn -------------------
+10:01:01 __main__           INFO     次の入力を受け取りました: \033[92mAttack(to: A2) [turn01]\033[0m
+10:01:01 __main__           INFO     敵が攻撃しました。 自軍への命中状況: \033[93mResponse.Hit\033[0m
+10:01:02 __main__           INFO     ---------------------- [Turn02] My turn ----------------------
+10:01:02 __main__           INFO     自軍の操作: \033[93mAttack(to: A1) [turn02]\033[0m
+"""
+
+
+class TestLogImport(TestCase):
+    def test_parse_lines_01(self):
+        results = list(logimport.parse_lines(LOG.splitlines(keepends=True)))
+        self.assertEqual(2, len(results))
+
+        game, turns = results[0]
+        self.assertEqual((0, 1, 1, codec.SIDE_ME, 3, Strategy.Human),
+                         (game['game'][0], game['n'][0], game['me_first'][0], game['winner'][0], game['turns'][0],
+                          game['opponent'][0]))
+        self.assertEqual([1, 2, 3], list(turns['turn']))
+        self.assertEqual([codec.SIDE_ME, codec.SIDE_OPPONENT, codec.SIDE_ME], list(turns['side']))
+        self.assertEqual([Branch.Opening, Branch.Unknown, Branch.ThresholdAttack], list(turns['branch']))
+
+        op = codec.read_op(turns[0])
+        self.assertEqual((Pos(2, 2), Response.Near), (op.detail.attack_pos, op.detail.resp))
+        op = codec.read_op(turns[1])
+        self.assertEqual((None, 0, -2), (op.detail.fromPos, op.detail.dirY, op.detail.dirX))
+        self.assertEqual(codec.KIND_ATTACK, turns['prev_opp_kind'][1])
+        self.assertEqual(codec.cell_index(Pos(1, 1)), turns['tracking'][2])
+        self.assertEqual(codec.KIND_MOVE, turns['prev_opp_kind'][2])
+
+        # 中断したゲーム: 応答の入力前に途切れた手は捨てる
+        game, turns = results[1]
+        self.assertEqual((1, 0, -1, 1), (game['game'][0], game['me_first'][0], game['winner'][0], game['turns'][0]))
+        self.assertEqual(Response.Hit, codec.read_op(turns[0]).detail.resp)
+        self.assertEqual((4, 4),
+                         (turns['my_alive'][0], turns['opp_alive'][0]))
+
+    def test_import_to_archive_01(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(tmp, "%d.log" % i))
+                with open(paths[-1], "w", encoding="utf-8") as f:
+                    f.write(LOG)
+            broken = os.path.join(tmp, "broken.log")
+            with open(broken, "w", encoding="utf-8") as f:
+                f.write("10:00:00 __main__           INFO     main() called\n"
+                        "10:00:01 __main__           INFO     ---------------------- [Turn01] My turn -----\n"
+                        "10:00:01 __main__           INFO     自軍の操作: Jump(to: A1)\n")
+
+            serial = list(logimport.import_logs(paths))
+            self.assertEqual(list(range(6)), [int(r.game['game'][0]) for r in serial])
+            parallel = list(logimport.import_logs(paths, workers=2))
+            self.assertEqual([r.turns.tobytes() for r in serial], [r.turns.tobytes() for r in parallel])
+
+            self.assertEqual(6, logimport.import_to_archive(paths + [broken], tmp + "/archive", shard="import"))
+            archive = Archive(tmp + "/archive")
+            self.assertEqual(6, sum(len(games) for games in archive.games()))
+            self.assertEqual(3, archive.count(branch=Branch.Opening))
@@ -0,0 +1,53 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from . import placement
+from .model import *
+
+
+class TestPlacement(TestCase):
+    def test_canonical_masks_01(self):
+        """
+        全 12650 通りの配置は、回転・反転で同一視すると類の大きさの総和が元の個数に一致するはず。
+        """
+        placements = placement.all_placements()
+        self.assertEqual(len(placements), 12650)
+        self.assertTrue(np.all(placements.sum(axis=1) == 4))
+        canon = placement.canonical_masks(placements)
+        reps, sizes = np.unique(canon, return_counts=True)
+        self.assertEqual(sizes.sum(), 12650)
+        self.assertTrue(np.all(np.isin(sizes, [1, 2, 4, 8])))
+        # 代表は自分自身の類の代表
+        self.assertTrue(np.array_equal(placement.canonical_masks(placement.from_masks(reps)), reps))
+
+    def test_transform_grid_01(self):
+        grid = np.zeros((5, 5), dtype=np.int32)
+        grid[0, 1] = 3
+        seen = set()
+        for symmetry in range(placement.SYMMETRY_COUNT):
+            transformed = placement.transform_grid(grid, symmetry)
+            self.assertEqual(transformed.sum(), 3)
+            seen.add(tuple(np.argwhere(transformed)[0]))
+        self.assertEqual(seen, {(0, 1), (1, 0), (0, 3), (3, 0), (4, 1), (1, 4), (4, 3), (3, 4)})
+
+    def test_evaluate_batch_01(self):
+        """
+        固まった配置は、散らばった配置より評価値が低いはず。
+        """
+        models = np.array(list(placement.attacker_models().values()))
+        clustered = np.zeros((1, 25), dtype=bool)
+        clustered[0, [6, 7, 11, 12]] = True
+        scattered = np.zeros((1, 25), dtype=bool)
+        scattered[0, [0, 4, 20, 24]] = True
+        scores = placement.evaluate_batch(np.concatenate([clustered, scattered]), models)
+        self.assertLess(scores[0], scores[1])
+
+    def test_load_table_01(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            built = placement.load_table(cache_dir)
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+            loaded = placement.load_table(cache_dir)
+            self.assertTrue(np.array_equal(built.masks, loaded.masks))
+            self.assertTrue(np.all(np.diff(loaded.scores) <= 0))
+            self.assertEqual(loaded.class_sizes.sum(), 12650)
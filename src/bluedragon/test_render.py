@@ -0,0 +1,86 @@
+from io import StringIO
+from unittest import TestCase
+
+from . import io
+from . import render
+from .model import *
+from .render import Renderer, Screen
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestRender(TestCase):
+    def setUp(self):
+        self.out = StringIO()
+        self.clock = FakeClock()
+        self.renderer = Renderer(out=self.out, fps=10, clock=self.clock)
+
+    def written(self) -> str:
+        s = self.out.getvalue()
+        self.out.seek(0)
+        self.out.truncate()
+        return s
+
+    def test_diff_01(self):
+        """
+        2 回目以降の描画では、変化したフィールドだけを書き込むはず。
+        """
+        screen = Screen()
+        screen.put(0, 0, "hello")
+        screen.put(1, 4, "abc")
+        self.renderer.draw(screen)
+        first = self.written()
+        self.assertIn(render.CLEAR_SCREEN, first)
+        self.assertIn("hello", first)
+
+        self.clock.now += 1
+        screen.put(1, 4, "x")
+        self.renderer.draw(screen)
+        second = self.written()
+        self.assertNotIn("hello", second)
+        # 短くなった分は空白で消す
+        self.assertEqual(render.move_cursor(1, 4) + "x  ", second)
+
+        self.clock.now += 1
+        self.renderer.draw(screen)
+        self.assertEqual("", self.written())
+
+    def test_throttle_01(self):
+        """
+        1/fps 秒以内のフレームは保留され、flush() で最新のフレームだけが描画されるはず。
+        """
+        for i in range(5):
+            screen = Screen()
+            screen.put(0, 0, "frame %d" % i)
+            self.renderer.draw(screen)
+            self.clock.now += 0.01
+        self.assertEqual(1, self.renderer.frames_drawn)
+        self.assertEqual(4, self.renderer.frames_skipped)
+        self.written()
+        self.renderer.flush()
+        self.assertEqual(render.move_cursor(0, 0) + "frame 4", self.written())
+
+    def test_visible_width_01(self):
+        self.assertEqual(3, render.visible_width(io.Color.red("abc")))
+        self.assertEqual(4, render.visible_width("自軍"))
+
+    def test_battle_screen_01(self):
+        me = BattleData(4)
+        me.my_grid[2, 3] = 3
+        screen = render.battle_screen(me, BattleData(4), 1)
+        self.renderer.draw(screen)
+        self.renderer.close()
+        self.assertIn(render.SHOW_CURSOR, self.out.getvalue())
+
+    def test_format_my_grid_01(self):
+        grid = np.zeros((5, 5), dtype=np.int32)
+        grid[0, 1] = 3
+        lines = io.format_my_grid(grid, color=False).splitlines()
+        self.assertEqual("   1  2  3  4  5", lines[0])
+        self.assertEqual("A  .  3  .  .  .", lines[1])
@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+from . import logic
+from . import scorer
+from .model import *
+
+
+def create_initial_prob_grid(submarine_count: int) -> np.ndarray:
+    return np.full((5, 5), submarine_count / 25, dtype=np.float64)
+
+
+class TestScorer(TestCase):
+    def test_attackable_mask_01(self):
+        data = BattleData(4)
+        data.my_grid[0, 0] = 3
+        data.my_grid[2, 2] = 3
+        mask = scorer.attackable_mask(data.my_grid)
+        expected = data.set_of_my_attackable_cells()
+        actual = set(Pos(y, x) for y in range(5) for x in range(5) if mask[y, x])
+        self.assertEqual(expected, actual)
+
+    def test_response_distribution_01(self):
+        """
+        どのマスについても反応の確率の総和は 1 になるはず。
+        """
+        m = create_initial_prob_grid(4)
+        m[1, 1] = 1.0
+        m[4, 4] = 0.0
+        dist = scorer.response_distribution(m)
+        self.assertTrue(np.allclose(dist.sum(axis=0), 1.0))
+        self.assertAlmostEqual(dist[0, 1, 1] + dist[1, 1, 1], 1.0)
+        # 確率1のマスの隣を攻撃したら、外れた場合は必ず Near
+        self.assertAlmostEqual(dist[2, 1, 2], 1.0 - m[1, 2])
+        self.assertAlmostEqual(dist[3, 1, 2], 0.0)
+
+    def test_score_cells_01(self):
+        """
+        周囲の確率が全てゼロで、そのマス自身の確率もゼロなら反応は必ず Nothing で情報量はゼロ。
+        """
+        m = np.zeros((5, 5), dtype=np.float64)
+        m[4, 4] = 1.0
+        attackable = np.ones((5, 5), dtype=bool)
+        attackable[2, 2] = False
+        score = scorer.score_cells(m, attackable)
+        self.assertAlmostEqual(score[0, 0], 0.0)
+        self.assertEqual(score[2, 2], -np.inf)
+        self.assertEqual(scorer.best_cell(score), Pos(4, 4))
+
+    def test_shifted_beliefs_01(self):
+        """
+        logic._update_prob_for_opponent_move() と同じ結果になるはず。 先頭のバッチ軸もそのまま扱える。
+        """
+        m = create_initial_prob_grid(4)
+        logic._update_prob_for_my_attack_near(m, Pos(2, 2), 4)
+        logic._update_prob_for_my_attack_hit(m, Pos(0, 4), 4)
+        shifted = scorer.shifted_beliefs(m, shift_ratio=0.5)
+        for i, (dy, dx) in enumerate(scorer.MOVE_DIRECTIONS):
+            expected = m.copy()
+            logic._update_prob_for_opponent_move(expected, MoveInfo(fromPos=None, dirY=dy, dirX=dx), 0.5)
+            self.assertTrue(np.allclose(expected, shifted[i]), (dy, dx))
+
+        batched = scorer.shifted_beliefs(np.stack([m, create_initial_prob_grid(2)]), shift_ratio=0.5)
+        self.assertEqual((len(scorer.MOVE_DIRECTIONS), 2, 5, 5), batched.shape)
+        self.assertTrue(np.allclose(shifted, batched[:, 0]))
+
+    def test_move_danger_01(self):
+        exposure = create_initial_prob_grid(2)
+        exposure[0, 0] = 1.0
+        exposure[4, 4] = 0.0
+        grid = np.zeros((5, 5), dtype=np.int32)
+        grid[0, 0] = 3
+        grid[0, 2] = 1
+        danger = scorer.move_danger(exposure, grid)
+
+        shifted = scorer.shifted_beliefs(exposure)
+        for i, (dy, dx) in enumerate(scorer.MOVE_DIRECTIONS):
+            for y in range(5):
+                for x in range(5):
+                    dest = Pos(y + dy, x + dx)
+                    if grid[y, x] <= 0 or not (0 <= dest.row < 5 and 0 <= dest.col < 5) or grid[dest] > 0:
+                        self.assertEqual(np.inf, danger[i, y, x])
+                        continue
+                    moved = grid.copy()
+                    moved[dest] = moved[y, x]
+                    moved[y, x] = 0
+                    self.assertAlmostEqual((shifted[i] * (moved > 0)).sum(), danger[i, y, x])
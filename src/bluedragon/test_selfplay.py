@@ -0,0 +1,78 @@
+import itertools
+from contextlib import redirect_stdout
+from io import StringIO
+from unittest import TestCase
+
+import numpy as np
+
+from . import io
+from . import selfplay
+from .params import DecisionParams
+from .selfplay import GameSpec, Strategy
+
+
+class TestSelfPlay(TestCase):
+    def test_strategy_option_01(self):
+        """
+        `--opponent` の直後の値だけを見て、不正な値ならエラーで終了するはず。
+        """
+        self.assertIs(selfplay.strategy_option(["-g", "10"]), Strategy.Logic)
+        self.assertIs(selfplay.strategy_option(["--opponent", "Random"]), Strategy.Random)
+        self.assertIs(selfplay.strategy_option(["--opponent", "logic", "--archive", "/tmp/random"]), Strategy.Logic)
+        with io.silenced():
+            for argv in (["--opponent", "human"], ["--opponent"], ["--opponent", "randomly"]):
+                with self.assertRaises(SystemExit):
+                    selfplay.strategy_option(argv)
+
+    def test_game_seed_01(self):
+        seeds = [selfplay.game_seed(7, i) for i in range(1000)]
+        self.assertEqual(len(seeds), len(set(seeds)))
+        self.assertEqual(seeds[10], selfplay.game_seed(7, 10))
+        self.assertNotEqual(selfplay.game_seed(7, 10), selfplay.game_seed(8, 10))
+        self.assertTrue(all(0 <= s < 2 ** 63 for s in seeds))
+
+    def test_reproducible_01(self):
+        """
+        対戦させる順序を変えても、各ゲームの結果は同じになるはず。
+        """
+        specs = selfplay.make_specs(6, root_seed=11, max_turns=60)
+        forward = {int(r.game['game'][0]): r for r in selfplay.play_games(specs)}
+        backward = {int(r.game['game'][0]): r for r in selfplay.play_games(reversed(specs))}
+        for game, result in forward.items():
+            self.assertTrue(np.array_equal(result.game, backward[game].game))
+            self.assertTrue(np.array_equal(result.turns, backward[game].turns))
+
+    def test_full_validation_01(self):
+        """
+        どの相手・隻数・設定の対戦でも、全ての呼び出しで不変条件を検査して違反が無いはず。
+        """
+        for root_seed, opponent, opponent_count, use_exposure in itertools.product(
+                (0, 7), (Strategy.Logic, Strategy.Random), (4, 2), (0, 1)):
+            params = DecisionParams(use_exposure=use_exposure)
+            specs = selfplay.make_specs(6, root_seed, opponent=opponent, opponent_count=opponent_count,
+                                        params=params)
+            for result in selfplay.play_games(specs):
+                self.assertGreater(len(result.turns), 0)
+
+    def test_watch_01(self):
+        """
+        観戦モードは 1 ゲームずつ対戦させて、終わったものから play_games() と同じ結果を返すはず。
+        """
+        specs = selfplay.make_specs(3, root_seed=4, max_turns=40)
+        with redirect_stdout(StringIO()):
+            results = selfplay.watch(specs, fps=0)
+            self.assertTrue(np.array_equal(next(results).turns, selfplay.play_game(specs[0]).turns))
+            rest = list(results)
+        self.assertEqual(2, len(rest))
+        for spec, result in zip(specs[1:], rest):
+            self.assertTrue(np.array_equal(result.turns, selfplay.play_game(spec).turns))
+
+    def test_replay_01(self):
+        """
+        アーカイブに記録されたシードだけから、1 ゲームを単独で再現できるはず。
+        """
+        spec = selfplay.make_specs(4, root_seed=3, opponent=Strategy.Random, max_turns=60)[3]
+        result = selfplay.play_game(spec)
+        replayed = selfplay.play_game(GameSpec(game=int(result.game['game'][0]), seed=int(result.game['seed'][0]),
+                                               opponent=Strategy.Random, me_first=spec.me_first, max_turns=60))
+        self.assertTrue(np.array_equal(result.turns, replayed.turns))
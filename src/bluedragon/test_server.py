@@ -0,0 +1,182 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from unittest import TestCase
+from unittest.mock import patch
+
+from . import endgame
+from . import invariant
+from . import io
+from . import logic
+from . import server
+from .model import Response
+from .rule import Pos, is_within_area
+from .server import SessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSessionStore(TestCase):
+    def test_lru_01(self):
+        """
+        上限を超えたら、最も長く使われていないセッションが破棄されるはず。
+        """
+        store = SessionStore(capacity=2, idle_seconds=100, clock=FakeClock())
+        a = store.create(seed=1)
+        b = store.create(seed=2)
+        self.assertIs(store.get(a.id), a)
+        c = store.create(seed=3)
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get(b.id))
+        self.assertIs(store.get(a.id), a)
+        self.assertIs(store.get(c.id), c)
+        self.assertEqual(store.evicted, 1)
+
+    def test_idle_01(self):
+        clock = FakeClock()
+        store = SessionStore(capacity=10, idle_seconds=100, clock=clock)
+        a = store.create(seed=1)
+        clock.now = 60
+        b = store.create(seed=2)
+        clock.now = 130
+        self.assertIsNone(store.get(a.id))
+        self.assertIs(store.get(b.id), b)
+        self.assertEqual(store.evicted, 1)
+
+
+class TestServer(TestCase):
+    def setUp(self):
+        io.set_silent(True)
+        self.server = server.make_server(port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.base = "http://127.0.0.1:%d" % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        io.set_silent(False)
+
+    def request(self, method: str, path: str, body=None):
+        payload = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self.base + path, data=payload, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=10) as res:
+                return res.status, json.loads(res.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    def test_game_01(self):
+        status, created = self.request("POST", "/sessions", {"n": 4, "me_first": True, "seed": 5})
+        self.assertEqual(status, 201)
+        sid = created["session"]
+        self.assertEqual(len(created["positions"]), 4)
+
+        status, res = self.request("POST", "/sessions/%s/suggest" % sid)
+        self.assertEqual(status, 200)
+        self.assertIn(res["op"]["kind"], ("attack", "move"))
+        if res["op"]["kind"] == "attack":
+            # 反応を受け取るまでは次の判断はできない
+            self.assertEqual(self.request("POST", "/sessions/%s/suggest" % sid)[0], 409)
+            self.assertEqual(self.request("POST", "/sessions/%s/response" % sid, {"response": "x"})[0], 200)
+
+        # 自軍の潜水艦がいるマスへの攻撃は Hit になるはず
+        target = created["positions"][0]
+        status, res = self.request("POST", "/sessions/%s/opponent" % sid, {"op": {"kind": "attack", "cell": target}})
+        self.assertEqual(status, 200)
+        self.assertEqual(res["response"], "Hit")
+
+        status, state = self.request("GET", "/sessions/%s" % sid)
+        self.assertEqual(state["turn"], 2)
+        self.assertEqual(self.request("DELETE", "/sessions/%s" % sid)[0], 200)
+        self.assertEqual(self.request("GET", "/sessions/%s" % sid)[0], 404)
+
+    def test_bad_request_01(self):
+        _, created = self.request("POST", "/sessions", {"seed": 1})
+        sid = created["session"]
+        self.assertEqual(self.request("POST", "/sessions/%s/response" % sid, {"response": "hit"})[0], 409)
+        self.assertEqual(self.request("POST", "/sessions/%s/opponent" % sid,
+                                      {"op": {"kind": "move", "dy": 1, "dx": 1}})[0], 400)
+        self.assertEqual(self.request("POST", "/sessions/%s/opponent" % sid,
+                                      {"op": {"kind": "move", "dy": True, "dx": 0}})[0], 400)
+        self.assertEqual(self.request("POST", "/sessions/%s/opponent" % sid,
+                                      {"op": {"kind": "attack", "cell": "F9"}})[0], 400)
+        status, stats = self.request("GET", "/stats")
+        self.assertEqual(status, 200)
+        self.assertEqual(stats["sessions"], 1)
+
+    def test_internal_error_01(self):
+        """
+        エンジンの内部エラーは 500 になり、ログに記録されるはず。
+        """
+        _, created = self.request("POST", "/sessions", {"me_first": False, "seed": 3})
+        sid = created["session"]
+        with patch.object(logic, "apply_opponent_op", side_effect=invariant.InvariantError("broken")), \
+                self.assertLogs(server.thisFileLogger, "ERROR"):
+            status, res = self.request("POST", "/sessions/%s/opponent" % sid, {"op": {"kind": "attack", "cell": "C3"}})
+        self.assertEqual(status, 500)
+        self.assertIn("broken", res["error"])
+        self.assertEqual(self.request("GET", "/sessions/%s" % sid)[1]["turn"], 0)
+
+    def test_turn_order_01(self):
+        """
+        手番でない側のイベントは 409 になり、状態は変わらないはず。
+        """
+        _, created = self.request("POST", "/sessions", {"me_first": False, "seed": 2})
+        sid = created["session"]
+        self.assertEqual(self.request("POST", "/sessions/%s/suggest" % sid)[0], 409)
+        move = {"op": {"kind": "move", "dy": 0, "dx": 1}}
+        self.assertEqual(self.request("POST", "/sessions/%s/opponent" % sid, move)[0], 200)
+        self.assertEqual(self.request("POST", "/sessions/%s/opponent" % sid, move)[0], 409)
+        self.assertEqual(self.request("GET", "/sessions/%s" % sid)[1]["turn"], 1)
+
+
+class TestSession(TestCase):
+    def setUp(self):
+        io.set_silent(True)
+
+    def tearDown(self):
+        io.set_silent(False)
+
+    def test_rejected_01(self):
+        """
+        残り 1 隻で位置が確定している敵艦ができない移動は SessionRejected になり、セッションの状態は変わらないはず。
+        """
+        session = SessionStore().create(opponent_count=1, seed=0)
+        op, _ = session.suggest()
+        session.respond(Response.Hit)
+        target = op.detail.attack_pos
+        dy, dx = next(d for d in ((-2, 0), (2, 0), (0, -2), (0, 2))
+                      if not is_within_area(Pos(target.row + d[0], target.col + d[1])))
+        before = session.to_json()
+        with self.assertRaises(server.SessionRejected):
+            session.opponent({"kind": "move", "dy": dy, "dx": dx})
+        self.assertEqual(session.to_json(), before)
+        # 盤面の内側への移動は受け付ける
+        session.opponent({"kind": "move", "dy": -dy // 2, "dx": -dx // 2})
+        self.assertNotEqual(session.to_json(), before)
+
+    def test_internal_error_01(self):
+        """
+        エンジンの内部エラーは SessionRejected にせずにそのまま送出し、セッションの状態は変わらないはず。
+        """
+        session = SessionStore().create(me_first=False, seed=0)
+        before = session.to_json()
+        with patch.object(logic, "apply_opponent_op", side_effect=invariant.InvariantError("broken")):
+            with self.assertRaises(invariant.InvariantError):
+                session.opponent({"kind": "attack", "cell": "C3"})
+        self.assertEqual(session.to_json(), before)
+
+    def test_warm_up_01(self):
+        """
+        suggest_my_op() は終盤の表を使わないので、 warm_up() も終盤の表を読み込まないはず。
+        """
+        with patch.object(endgame, "table", side_effect=AssertionError("loaded")):
+            server.warm_up()
@@ -0,0 +1,56 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import codec
+from . import logic
+from . import selfplay
+from .model import *
+from .shmbatch import BatchLayout, SharedBatch
+
+
+class TestSharedBatch(TestCase):
+    def setUp(self):
+        self.batch = SharedBatch.create(BatchLayout(capacity=3, max_turns=10))
+
+    def tearDown(self):
+        self.batch.close()
+        self.batch.unlink()
+
+    def test_layout_01(self):
+        layout = self.batch.layout
+        self.assertLessEqual(layout.size, self.batch.shm.size)
+        self.assertEqual(0, layout.games_offset % 64)
+        self.assertEqual(0, layout.turns_offset % 64)
+
+    def test_battle_data_view_01(self):
+        """
+        SharedBattleData への書込は、別に attach したプロセス側のビューからも見えるはず。
+        """
+        data = self.batch.battle_data(1, codec.SIDE_OPPONENT)
+        data.reset(4)
+        self.assertTrue(np.allclose(data.prob, 4 / 25))
+        logic.initialize_my_placement(data, np.random.default_rng(0))
+        data.my_alive_count -= 1
+        data.tracking_cell = Pos(2, 3)
+
+        other = SharedBatch.attach(self.batch.name, self.batch.layout)
+        view = other.battle_data(1, codec.SIDE_OPPONENT)
+        self.assertTrue(np.array_equal(data.my_grid, view.my_grid))
+        self.assertEqual(3, view.my_alive_count)
+        self.assertEqual(Pos(2, 3), view.tracking_cell)
+        self.assertEqual(0, other.state[0, 0]['my_alive'])
+        del view
+        other.close()
+
+    def test_play_games_parallel_01(self):
+        """
+        共有メモリを使った並列の対戦結果は、逐次の対戦結果と一致するはず。
+        """
+        specs = selfplay.make_specs(6, root_seed=9, max_turns=40)
+        expected = list(selfplay.play_games(specs))
+        actual = list(selfplay.play_games_parallel(specs, workers=2, capacity=4, chunk_size=2))
+        self.assertEqual(len(expected), len(actual))
+        for e, a in zip(expected, actual):
+            self.assertTrue(np.array_equal(e.game, a.game))
+            self.assertTrue(np.array_equal(e.turns, a.turns))
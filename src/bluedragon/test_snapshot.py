@@ -0,0 +1,71 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import logic
+from . import snapshot
+from .model import OpInfo, AttackInfo, MoveInfo, Response, BattleData
+from .rule import Pos
+
+
+class TestSnapshot(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "snapshot.npz")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def play_some_turns(self, rng: np.random.Generator) -> BattleData:
+        data = BattleData(4)
+        logic.initialize_my_placement(data, rng)
+        op = logic.suggest_my_op(data, 1, rng=rng)
+        logic.apply_my_op(data, op)
+        if op.is_attack():
+            logic.apply_attack_response(data, Response.Hit)
+        logic.update_tracking_cell(data)
+        logic.apply_opponent_op(data, OpInfo(MoveInfo(fromPos=None, dirY=0, dirX=-2), turn_count=2))
+        logic.apply_opponent_op(data, OpInfo(AttackInfo(attack_pos=Pos(2, 2)), turn_count=3))
+        return data
+
+    def test_round_trip_01(self):
+        rng = np.random.default_rng(3)
+        data = self.play_some_turns(rng)
+        snapshot.save(self.path, data, rng, True, 3)
+
+        restored, restored_rng, is_me_first, turn_count = snapshot.load(self.path)
+        self.assertTrue(is_me_first)
+        self.assertEqual(turn_count, 3)
+        self.assertEqual(restored.my_alive_count, data.my_alive_count)
+        self.assertEqual(restored.opponent_alive_count, data.opponent_alive_count)
+        self.assertEqual(restored.tracking_cell, data.tracking_cell)
+        np.testing.assert_array_equal(restored.my_grid, data.my_grid)
+        np.testing.assert_array_equal(restored.prob, data.prob)
+        np.testing.assert_array_equal(restored.exposure, data.exposure)
+        self.assertEqual(restored.my_history, data.my_history)
+        self.assertEqual(restored.opponent_history, data.opponent_history)
+        self.assertEqual(list(restored.confirmed), list(data.confirmed))
+        self.assertEqual(restored.confirmed.lost(), data.confirmed.lost())
+        self.assertEqual(list(restored.exposed), list(data.exposed))
+        np.testing.assert_array_equal(restored.opponent_grid, data.opponent_grid)
+
+        # 乱数生成器の状態も復元されるので、再開後の判断は元の対戦と同じになるはず
+        self.assertEqual(logic.suggest_my_op(restored, 4, rng=restored_rng), logic.suggest_my_op(data, 4, rng=rng))
+
+        # 一時ファイルは残らないはず
+        self.assertEqual(os.listdir(self.tmpdir.name), ["snapshot.npz"])
+        snapshot.discard(self.path)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_version_01(self):
+        rng = np.random.default_rng(0)
+        data = BattleData(4)
+        snapshot.save(self.path, data, rng, False, 0)
+        with np.load(self.path) as z:
+            arrays = dict(z)
+        arrays['meta'][0] = snapshot.SNAPSHOT_VERSION + 1
+        np.savez(self.path, **arrays)
+        with self.assertRaises(ValueError):
+            snapshot.load(self.path)
@@ -0,0 +1,74 @@
+import copy
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from . import io
+from . import logic
+from . import speculate
+from .model import OpInfo, AttackInfo, MoveInfo, BattleData
+
+
+class TestCaptured(TestCase):
+    def test_thread_local_01(self):
+        """
+        captured() は他のスレッドの出力を貯めないはず。
+        """
+        with io.silenced(), io.captured() as messages:
+            io.info("main", None)
+            other = threading.Thread(target=lambda: io.info("other", None))
+            other.start()
+            other.join()
+        self.assertEqual([m.msg for m in messages], ["main"])
+
+
+class TestSpeculator(TestCase):
+    def test_play_01(self):
+        """
+        投機的な計算の結果を使っても、普通に計算した場合と同じ操作と乱数生成器の状態になり、
+        分岐の統計には実際に使った判断だけが記録されるはず。
+        """
+        rng, opponent_rng = np.random.default_rng(7), np.random.default_rng(8)
+        me, opponent = BattleData(4), BattleData(4)
+        logic.initialize_my_placement(me, rng)
+        logic.initialize_my_placement(opponent, opponent_rng)
+        counts_before = sum(logic.branch_counters.counts)
+
+        my_turns = 0
+        with io.silenced(), speculate.Speculator() as speculator:
+            for turn in range(1, 41):
+                if me.has_game_finished():
+                    break
+                if turn % 2 == 1:
+                    my_turns += 1
+                    speculator.wait_idle(timeout=30)
+                    expected_data, expected_rng = copy.deepcopy(me), copy.deepcopy(rng)
+                    op = speculator.suggest(me, turn, rng)
+                    expected, _, _ = logic.decide_my_op(expected_data, turn, rng=expected_rng)
+                    self.assertEqual(op, expected)
+                    self.assertEqual(rng.bit_generator.state, expected_rng.bit_generator.state)
+
+                    logic.apply_my_op(me, op)
+                    if op.is_attack():
+                        speculator.expect_response(me, rng, turn + 2)
+                        resp = logic.apply_opponent_op(opponent, OpInfo(AttackInfo(op.detail.attack_pos), turn))
+                        logic.apply_attack_response(me, resp)
+                    else:
+                        logic.apply_opponent_op(opponent, OpInfo(MoveInfo(None, op.detail.dirY, op.detail.dirX), turn))
+                    logic.update_tracking_cell(me)
+                    speculator.expect_opponent_op(me, rng, turn + 2)
+                else:
+                    op, _, _ = logic.decide_my_op(opponent, turn, rng=opponent_rng)
+                    logic.apply_my_op(opponent, op)
+                    if op.is_attack():
+                        resp = logic.apply_opponent_op(me, OpInfo(AttackInfo(op.detail.attack_pos), turn))
+                        logic.apply_attack_response(opponent, resp)
+                    else:
+                        logic.apply_opponent_op(me, OpInfo(MoveInfo(None, op.detail.dirY, op.detail.dirX), turn))
+                    logic.update_tracking_cell(opponent)
+
+        self.assertEqual(speculator.hits + speculator.misses, my_turns)
+        # 初手以外は、敵軍の操作の全ての候補を計算済みなので必ず使えるはず
+        self.assertEqual(speculator.hits, my_turns - 1)
+        self.assertEqual(sum(logic.branch_counters.counts) - counts_before, my_turns)
@@ -0,0 +1,61 @@
+import math
+from unittest import TestCase
+
+from . import sprt
+from .params import DEFAULT_PARAMS
+from .sprt import Decision, PairedComparison, SequentialTest
+
+
+class TestSequentialTest(TestCase):
+    def test_bounds_01(self):
+        """
+        成功だけが続けば H1 を、失敗だけが続けば H0 を、境界を越えた時点で採択するはず。
+        """
+        test = SequentialTest(p0=0.5, p1=0.6, alpha=0.05, beta=0.05)
+        needed = math.ceil(test.upper / math.log(0.6 / 0.5))
+        for _ in range(needed - 1):
+            self.assertIs(test.push(True), Decision.Continue)
+        self.assertIs(test.push(True), Decision.AcceptH1)
+
+        test = SequentialTest(p0=0.5, p1=0.6, alpha=0.05, beta=0.05)
+        needed = math.ceil(test.lower / math.log(0.4 / 0.5))
+        for _ in range(needed - 1):
+            self.assertIs(test.push(False), Decision.Continue)
+        self.assertIs(test.push(False), Decision.AcceptH0)
+
+    def test_paired_01(self):
+        """
+        勝敗が同じ組は検定に影響しないはず。
+        """
+        comparison = PairedComparison(SequentialTest())
+        for _ in range(100):
+            self.assertIs(comparison.push(1.0, 1.0), Decision.Continue)
+            comparison.push(0.0, 0.0)
+        self.assertEqual(comparison.test.llr, 0.0)
+        self.assertEqual(comparison.confidence_interval(), (0.0, 0.0))
+
+        comparison.push(0.0, 1.0)
+        self.assertEqual(comparison.test.successes, 1)
+        lo, hi = comparison.confidence_interval()
+        self.assertLess(lo, comparison.diff.mean)
+        self.assertGreater(hi, comparison.diff.mean)
+
+
+class TestCompare(TestCase):
+    def test_same_params_01(self):
+        """
+        同じパラメータ同士なら、どの組も同じ勝敗になるはず。
+        """
+        result = sprt.compare(DEFAULT_PARAMS, DEFAULT_PARAMS, max_pairs=3, root_seed=2)
+        self.assertIs(result.decision, Decision.Continue)
+        self.assertEqual(result.pairs, 3)
+        self.assertEqual(result.games, 6)
+        self.assertEqual(result.win_rate_a, result.win_rate_b)
+
+    def test_parse_params_01(self):
+        params = sprt.parse_params("use_exposure=0,hit_weight=1.5")
+        self.assertEqual(params.use_exposure, 0)
+        self.assertEqual(params.hit_weight, 1.5)
+        self.assertEqual(params.info_weight, DEFAULT_PARAMS.info_weight)
+        with self.assertRaises(ValueError):
+            sprt.parse_params("no_such_param=1")
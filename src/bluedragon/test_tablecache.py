@@ -0,0 +1,72 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from . import tablecache
+
+
+class TestTableCache(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = self.tmpdir.name
+        self.builds = 0
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def build(self):
+        self.builds += 1
+        return {"a": np.arange(10, dtype=np.int64), "b": np.ones((3, 4), dtype=bool)}
+
+    def test_load_01(self):
+        """
+        2 回目以降は構築せずにメモリマップするはず。
+        """
+        built = tablecache.load("t", 1, self.build, {"k": 2}, self.cache_dir)
+        loaded = tablecache.load("t", 1, self.build, {"k": 2}, self.cache_dir)
+        self.assertEqual(self.builds, 1)
+        self.assertIsInstance(loaded["a"], np.memmap)
+        self.assertFalse(loaded["a"].flags.writeable)
+        np.testing.assert_array_equal(loaded["a"], built["a"])
+        np.testing.assert_array_equal(loaded["b"], np.ones((3, 4), dtype=bool))
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(tablecache.table_path(self.cache_dir, "t", 1,
+                                                                                             {"k": 2}))])
+
+        tablecache.load("t", 1, self.build, None, None)
+        self.assertEqual(self.builds, 2)
+
+    def test_invalidate_01(self):
+        """
+        バージョンやパラメータが変われば作り直し、古いキャッシュ (以前の npz 形式を含む) は削除されるはず。
+        """
+        open(os.path.join(self.cache_dir, "t-0123456789abcdef.npz"), "wb").close()
+        open(os.path.join(self.cache_dir, "other-0123456789abcdef.npz"), "wb").close()
+        tablecache.load("t", 1, self.build, {"k": 2}, self.cache_dir)
+        tablecache.load("t", 2, self.build, {"k": 2}, self.cache_dir)
+        tablecache.load("t", 2, self.build, {"k": 3}, self.cache_dir)
+        self.assertEqual(self.builds, 3)
+        self.assertEqual(sorted(os.listdir(self.cache_dir)),
+                         sorted(["other-0123456789abcdef.npz",
+                                 os.path.basename(tablecache.table_path(self.cache_dir, "t", 2, {"k": 3}))]))
+        self.assertNotEqual(tablecache.cache_key("t", 1), tablecache.cache_key("t", 2))
+        self.assertIn("hp", tablecache.key_fields("t", 1))
+
+    def test_configured_dir_01(self):
+        """
+        cache_dir を指定しなければ set_cache_dir() で設定したディレクトリを使い、
+        キャッシュを使えた場合も古いキャッシュは削除されるはず。
+        """
+        tablecache.set_cache_dir(self.cache_dir)
+        try:
+            self.assertEqual(tablecache.configured_cache_dir(), self.cache_dir)
+            tablecache.load("t", 1, self.build, {"k": 2})
+            os.makedirs(os.path.join(self.cache_dir, "t-0123456789abcdef"))
+            tablecache.load("t", 1, self.build, {"k": 2})
+        finally:
+            tablecache.set_cache_dir(None)
+        self.assertEqual(self.builds, 1)
+        self.assertEqual(os.listdir(self.cache_dir), [os.path.basename(tablecache.table_path(self.cache_dir, "t", 1,
+                                                                                             {"k": 2}))])
+        self.assertNotEqual(tablecache.configured_cache_dir(), self.cache_dir)
@@ -0,0 +1,88 @@
+import os
+import pickle
+import tempfile
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from . import codec
+from . import logic
+from . import selfplay
+from . import telemetry
+from .telemetry import Branch
+
+
+class TestTelemetry(TestCase):
+    def setUp(self):
+        logic.branch_counters.reset()
+
+    def tearDown(self):
+        logic.enable_decision_trace(0)
+
+    def test_branch_counters_01(self):
+        # 自己対戦では両陣営とも suggest_my_op() で判断するので、記録された全ての手が数えられる
+        turns = np.concatenate([r.turns for r in selfplay.play_games(selfplay.make_specs(3, root_seed=5))])
+        counts = np.bincount(turns['branch'], minlength=len(Branch))
+        self.assertEqual(list(counts), logic.branch_counters.counts)
+
+        snapshot = logic.branch_counters.snapshot()
+        self.assertEqual(len(turns), sum(s["count"] for s in snapshot.values()))
+        for s in snapshot.values():
+            self.assertLessEqual(s["mean_us"], s["max_us"])
+            self.assertLessEqual(s["p50_us"], s["p99_us"])
+        self.assertIn("Opening", logic.branch_counters.format_summary())
+
+        other = telemetry.BranchCounters(logic.branch_counters.names)
+        other.merge(logic.branch_counters)
+        other.merge(logic.branch_counters)
+        self.assertEqual([2 * c for c in logic.branch_counters.counts], other.counts)
+
+    def test_quantile_01(self):
+        counters = telemetry.BranchCounters(["a"])
+        for elapsed in [100] * 99 + [5000]:
+            counters.record(0, elapsed)
+        self.assertEqual(128, counters.quantile_ns(0, 0.5))
+        self.assertEqual(128, counters.quantile_ns(0, 0.99))
+        self.assertEqual(8192, counters.quantile_ns(0, 1.0))
+        self.assertEqual(5000, counters.max_ns[0])
+
+    def test_threads_01(self):
+        """
+        複数のスレッドから同時に記録しても、記録は失われないはず (プロセス間で受け渡すための pickle もできる)。
+        """
+        counters = telemetry.BranchCounters(["a", "b"])
+
+        def record():
+            for i in range(5000):
+                counters.record(i % 2, 100)
+
+        threads = [threading.Thread(target=record) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([20000, 20000], counters.counts)
+        self.assertEqual(40000, sum(sum(h) for h in counters.histogram))
+        self.assertEqual(counters.counts, pickle.loads(pickle.dumps(counters)).counts)
+
+    def test_decision_trace_01(self):
+        trace = logic.enable_decision_trace(8)
+        result = selfplay.play_game(selfplay.make_specs(1, root_seed=6)[0])
+        records = trace.records()
+
+        # 最後の 8 手が古い順に記録されている
+        self.assertEqual(min(8, len(result.turns)), len(records))
+        self.assertEqual(list(range(trace.recorded - len(records), trace.recorded)), list(records['seq']))
+        last = result.turns[-len(records):]
+        for col in ('turn', 'branch', 'kind', 'cell', 'dy', 'dx', 'my_alive', 'opp_alive', 'tracking'):
+            self.assertEqual(list(last[col]), list(records[col]), col)
+        self.assertTrue(np.all(records['prob'].sum(axis=(1, 2)) > 0))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "trace.npy")
+            trace.save(path)
+            loaded = telemetry.load_trace(path)
+        self.assertEqual(records.tobytes(), loaded.tobytes())
+        self.assertEqual(len(records), len(telemetry.format_trace(loaded, [b.name for b in Branch]).splitlines()))
+        self.assertEqual(codec.NO_RESPONSE, loaded['resp'].max())
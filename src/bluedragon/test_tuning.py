@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+import numpy as np
+
+from . import io
+from . import tuning
+from .params import DecisionParams, DEFAULT_PARAMS
+
+
+class TestTuning(TestCase):
+    def test_encode_decode(self):
+        params = tuning.decode(tuning.encode(DEFAULT_PARAMS))
+        for name, value in DEFAULT_PARAMS.to_dict().items():
+            self.assertAlmostEqual(value, params.to_dict()[name])
+
+    def test_from_dict_rounds_int(self):
+        params = DecisionParams.from_dict({"random_move_alive_count": 2.6})
+        self.assertEqual(3, params.random_move_alive_count)
+        self.assertIsInstance(params.random_move_alive_count, int)
+
+    def test_evaluator_cache(self):
+        with tuning.Evaluator(game_count=4, root_seed=1, chunk_size=2) as evaluator:
+            a = evaluator.evaluate(DEFAULT_PARAMS)
+            self.assertEqual(2, evaluator.evaluated_chunks)
+            b = evaluator.evaluate(DEFAULT_PARAMS)
+            self.assertEqual(2, evaluator.evaluated_chunks)
+            self.assertEqual(a, b)
+
+    def test_main_options_01(self):
+        """
+        `--method` と `--opponent` の値が不正ならエラーで終了するはず。
+        """
+        with io.silenced():
+            for argv in (["tuning", "--method", "grid"], ["tuning", "--method"], ["tuning", "--opponent", "human"]):
+                with self.assertRaises(SystemExit):
+                    tuning.main(argv)
+
+    def test_search(self):
+        with tuning.Evaluator(game_count=2, root_seed=1) as evaluator:
+            result = tuning.cross_entropy_search(evaluator, iterations=2, population=2)
+        self.assertEqual(4, len(result.history))
+        self.assertEqual(max(score for _, score in result.history), result.best_score)
+        self.assertTrue(np.isfinite(result.best_score))
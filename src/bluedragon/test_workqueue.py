@@ -0,0 +1,133 @@
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase
+from unittest.mock import patch
+
+import numpy as np
+
+from . import invariant
+from . import io
+from . import selfplay
+from . import workqueue
+from .archive import ArchiveWriter
+from .params import DecisionParams
+from .selfplay import Strategy
+from .workqueue import Job
+
+
+class TestWorkQueue(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_jobs_01(self):
+        """
+        ジョブに分けても、ゲームの設定は make_specs() と同じになるはず。
+        """
+        params = DecisionParams(hit_weight=2.0)
+        jobs = workqueue.make_jobs(10, root_seed=3, job_size=4, opponent=Strategy.Random, params=params)
+        self.assertEqual([job.game_count for job in jobs], [4, 4, 2])
+        self.assertEqual([spec for job in jobs for spec in job.specs()],
+                         selfplay.make_specs(10, root_seed=3, opponent=Strategy.Random, params=params))
+        self.assertEqual(Job.from_json(jobs[1].to_json()), jobs[1])
+
+    def test_reissue_01(self):
+        """
+        応答の無いワーカーのジョブは pending に戻され、そのワーカーの結果は捨てられるはず。
+        """
+        jobs = workqueue.make_jobs(2, root_seed=0, job_size=1, max_turns=20)
+        self.assertEqual(workqueue.submit(self.root, jobs), 2)
+        self.assertEqual(workqueue.submit(self.root, jobs), 0)
+
+        job, claimed_path = workqueue.claim(self.root, "slow")
+        self.assertEqual(job, jobs[0])
+        self.assertEqual(workqueue.status(self.root), workqueue.QueueStatus(1, 1, 0))
+        self.assertEqual(workqueue.reissue_stale(self.root, 60), 0)
+        self.assertEqual(workqueue.reissue_stale(self.root, 60, clock=lambda: time.time() + 61), 1)
+        self.assertEqual(workqueue.status(self.root), workqueue.QueueStatus(2, 0, 0))
+
+        with io.silenced():
+            self.assertFalse(workqueue.run_job(self.root, job, claimed_path))
+        self.assertEqual(os.listdir(os.path.join(self.root, workqueue.RESULTS_DIR)), [])
+
+    def test_failed_01(self):
+        """
+        対戦が例外を送出したジョブは failed に移され、その結果は捨てられ、ワーカーは次のジョブへ進むはず。
+        """
+        jobs = workqueue.make_jobs(4, root_seed=0, job_size=2, max_turns=20)
+        workqueue.submit(self.root, jobs)
+        play_game = selfplay.play_game
+
+        def poisoned(spec):
+            if spec.seed == jobs[0].specs()[1].seed:
+                raise invariant.InvariantError("poisoned")
+            return play_game(spec)
+
+        with io.silenced(), patch.object(selfplay, "play_game", poisoned):
+            self.assertEqual(workqueue.run_worker(self.root, "poisoned"), 2)
+        self.assertEqual(workqueue.status(self.root), workqueue.QueueStatus(0, 0, 1, 1))
+        self.assertTrue(workqueue.status(self.root).is_finished())
+        failed_dir = os.path.join(self.root, workqueue.FAILED_DIR)
+        self.assertEqual(sorted(os.listdir(failed_dir)),
+                         [jobs[0].name + ".poisoned.error", jobs[0].name + ".poisoned.json"])
+        with open(os.path.join(failed_dir, jobs[0].name + ".poisoned.error")) as fp:
+            self.assertIn("poisoned", fp.read())
+        self.assertEqual(os.listdir(os.path.join(self.root, workqueue.RESULTS_DIR)), [jobs[1].name + ".poisoned"])
+        self.assertEqual(workqueue.submit(self.root, jobs), 0)
+
+    def test_collect_garbage_01(self):
+        """
+        done にも claimed にも無いジョブのシャードだけが削除されるはず。
+        """
+        jobs = workqueue.make_jobs(3, root_seed=0, job_size=1, max_turns=20)
+        workqueue.submit(self.root, jobs)
+        results_dir = os.path.join(self.root, workqueue.RESULTS_DIR)
+
+        # 完了したジョブ
+        job, claimed_path = workqueue.claim(self.root, "done")
+        with io.silenced():
+            self.assertTrue(workqueue.run_job(self.root, job, claimed_path))
+        # 実行中のジョブ
+        _, claimed_path = workqueue.claim(self.root, "running")
+        running = os.path.basename(claimed_path)[:-len(".json")]
+        os.makedirs(os.path.join(results_dir, running))
+        # 落ちたワーカーのシャード (ジョブは pending に戻されている)
+        os.makedirs(os.path.join(results_dir, jobs[2].name + ".crashed"))
+
+        self.assertEqual(workqueue.collect_garbage(self.root), 1)
+        self.assertEqual(sorted(os.listdir(results_dir)), [jobs[0].name + ".done", running])
+        self.assertEqual(workqueue.collect_garbage(self.root), 0)
+
+    def test_workers_01(self):
+        """
+        複数のワーカープロセスで実行し、途中で落ちたワーカーがいても、結果は 1 プロセスで対戦させた場合と同じになるはず。
+        """
+        jobs = workqueue.make_jobs(8, root_seed=1, job_size=2, max_turns=40)
+        workqueue.submit(self.root, jobs)
+
+        # 1 ゲーム分だけ書いて落ちたワーカー
+        _, claimed_path = workqueue.claim(self.root, "crashed")
+        shard = os.path.basename(claimed_path)[:-len(".json")]
+        with io.silenced(), ArchiveWriter(os.path.join(self.root, workqueue.RESULTS_DIR), shard) as writer:
+            result = selfplay.play_game(jobs[0].specs()[0])
+            writer.append(result.game, result.turns)
+        workqueue.reissue_stale(self.root, 60, clock=lambda: time.time() + 61)
+
+        with ProcessPoolExecutor(max_workers=3, initializer=selfplay.configure_headless) as executor:
+            futures = [executor.submit(workqueue.run_worker, self.root) for _ in range(3)]
+            self.assertEqual(sum(f.result() for f in futures), 8)
+        self.assertTrue(workqueue.status(self.root).is_finished())
+
+        with io.silenced():
+            expected = list(selfplay.play_games(selfplay.make_specs(8, root_seed=1, max_turns=40)))
+        actual = sorted(workqueue.results(self.root), key=lambda r: int(r.game['game'][0]))
+        self.assertEqual(len(actual), len(expected))
+        for a, e in zip(actual, expected):
+            np.testing.assert_array_equal(a.game, e.game)
+            np.testing.assert_array_equal(a.turns, e.turns)
+        self.assertEqual(workqueue.merge(self.root).games, 8)
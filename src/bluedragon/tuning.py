@@ -0,0 +1,225 @@
+"""
+DecisionParams のハイパーパラメータ探索。
+
+候補のパラメータを、自己対戦 (selfplay) の勝率で評価する。
+どの候補も同じシードの組で対戦させる (共通乱数法) ので、候補間の比較の分散が小さくなる。
+評価はシードの組をチャンクに分けて複数のプロセスで並列に行い、(パラメータ, チャンク) ごとの結果をキャッシュする。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.tuning -g 200 -j 4 -i 10 -p 8 --method cem
+    $ python3 -m bluedragon.tuning -g 200 -n 2 --opponent random --method random
+"""
+import math
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import codec
+from . import invariant
+from . import io
+from . import selfplay
+from .params import DecisionParams, DEFAULT_PARAMS
+from .rule import INITIAL_SUBMARINE_COUNT
+from .selfplay import GameSpec, Strategy
+
+
+@dataclass(frozen=True)
+class Dimension:
+    """
+    探索空間の一つの軸。 log が True なら対数スケールで探索する。
+    """
+    name: str
+    lo: float
+    hi: float
+    log: bool = False
+
+    def decode(self, u: float) -> float:
+        """
+        [0, 1] の値をこの軸の値に変換する。
+        """
+        u = min(max(u, 0.0), 1.0)
+        if self.log:
+            return 10 ** (math.log10(self.lo) + u * (math.log10(self.hi) - math.log10(self.lo)))
+        return self.lo + u * (self.hi - self.lo)
+
+    def encode(self, v: float) -> float:
+        if self.log:
+            return (math.log10(v) - math.log10(self.lo)) / (math.log10(self.hi) - math.log10(self.lo))
+        return (v - self.lo) / (self.hi - self.lo)
+
+
+SEARCH_SPACE: List[Dimension] = [
+    Dimension("move_threshold_ratio", 0.02, 0.3),
+    Dimension("attack_threshold_ratio", 0.02, 0.3),
+    Dimension("random_move_alive_count", 0, 4),
+    Dimension("random_move_chance", 0.0, 1.0),
+    Dimension("zero_prob_tol", 1e-9, 1e-3, log=True),
+    Dimension("move_shift_ratio", 0.0, 1.0),
+    Dimension("hit_weight", 0.0, 2.0),
+    Dimension("info_weight", 0.0, 2.0),
+]
+
+
+def decode(u: np.ndarray, space: List[Dimension] = SEARCH_SPACE) -> DecisionParams:
+    return DecisionParams.from_dict({dim.name: dim.decode(float(x)) for dim, x in zip(space, u)})
+
+
+def encode(params: DecisionParams, space: List[Dimension] = SEARCH_SPACE) -> np.ndarray:
+    d = params.to_dict()
+    return np.array([dim.encode(d[dim.name]) for dim in space], dtype=np.float64)
+
+
+def _evaluate_chunk(params: DecisionParams, specs: List[GameSpec]) -> Tuple[float, int]:
+    """
+    specs のゲームを params で対戦させ、(勝ち点の合計, ゲーム数) を返す。勝ちは 1、引き分けは 0.5。
+    """
+    points = 0.0
+    with io.silenced():
+        for result in selfplay.play_games(replace(spec, params=params) for spec in specs):
+            winner = int(result.game['winner'][0])
+            points += 1.0 if winner == codec.SIDE_ME else (0.5 if winner < 0 else 0.0)
+    return points, len(specs)
+
+
+class Evaluator:
+    """
+    パラメータの候補を勝率で評価する。
+    全ての候補を同じ game_count 個のシードで対戦させ、チャンクごとの結果をキャッシュする。
+    """
+
+    def __init__(self, game_count: int, root_seed: int = 0, opponent: Strategy = Strategy.Logic,
+                 opponent_count: int = INITIAL_SUBMARINE_COUNT, workers: int = 1, chunk_size: int = 25):
+        specs = selfplay.make_specs(game_count, root_seed, opponent=opponent, opponent_count=opponent_count)
+        self._chunks = [specs[i:i + chunk_size] for i in range(0, len(specs), chunk_size)]
+        self._cache: Dict[Tuple[DecisionParams, int], Tuple[float, int]] = dict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        if workers > 1:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=selfplay.configure_headless)
+        self.evaluated_chunks = 0
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def evaluate_many(self, candidates: List[DecisionParams]) -> List[float]:
+        """
+        各候補の勝率 (引き分けは 0.5 勝) を返す。
+        キャッシュに無い (候補, チャンク) の組だけを、全候補分まとめて並列に評価する。
+        """
+        tasks = sorted(set(
+            (params, i)
+            for params in candidates for i in range(len(self._chunks))
+            if (params, i) not in self._cache
+        ), key=lambda t: (candidates.index(t[0]), t[1]))
+
+        if self._executor is None:
+            results = [_evaluate_chunk(params, self._chunks[i]) for params, i in tasks]
+        else:
+            futures = [self._executor.submit(_evaluate_chunk, params, self._chunks[i]) for params, i in tasks]
+            results = [f.result() for f in futures]
+        for task, result in zip(tasks, results):
+            self._cache[task] = result
+        self.evaluated_chunks += len(tasks)
+
+        scores = []
+        for params in candidates:
+            points, games = np.sum([self._cache[(params, i)] for i in range(len(self._chunks))], axis=0)
+            scores.append(points / games)
+        return scores
+
+    def evaluate(self, params: DecisionParams) -> float:
+        return self.evaluate_many([params])[0]
+
+
+class SearchResult(NamedTuple):
+    best_params: DecisionParams
+    best_score: float
+    history: List[Tuple[DecisionParams, float]]
+
+
+def random_search(evaluator: Evaluator, iterations: int, population: int, seed: int = 0,
+                  space: List[Dimension] = SEARCH_SPACE) -> SearchResult:
+    """
+    探索空間から一様に候補を選んで評価する。 最初の候補はデフォルトのパラメータ。
+    """
+    rng = np.random.default_rng(seed)
+    history: List[Tuple[DecisionParams, float]] = list()
+    for it in range(iterations):
+        candidates = [decode(rng.random(len(space)), space) for _ in range(population)]
+        if it == 0:
+            candidates[0] = DEFAULT_PARAMS
+        history.extend(zip(candidates, evaluator.evaluate_many(candidates)))
+        _report(it, history)
+    best = max(history, key=lambda h: h[1])
+    return SearchResult(best_params=best[0], best_score=best[1], history=history)
+
+
+def cross_entropy_search(evaluator: Evaluator, iterations: int, population: int, seed: int = 0,
+                         elite_ratio: float = 0.25, initial_std: float = 0.25, smoothing: float = 0.7,
+                         space: List[Dimension] = SEARCH_SPACE) -> SearchResult:
+    """
+    交差エントロピー法 (対角共分散の CMA-ES に近い)。
+    デフォルトのパラメータを中心とする正規分布から候補を生成し、上位 elite_ratio の候補に分布を近づけていく。
+    """
+    rng = np.random.default_rng(seed)
+    mean = encode(DEFAULT_PARAMS, space)
+    std = np.full(len(space), initial_std)
+    n_elite = max(1, int(population * elite_ratio))
+    history: List[Tuple[DecisionParams, float]] = list()
+
+    for it in range(iterations):
+        samples = np.clip(rng.normal(mean, std, size=(population, len(space))), 0.0, 1.0)
+        candidates = [decode(u, space) for u in samples]
+        scores = evaluator.evaluate_many(candidates)
+        history.extend(zip(candidates, scores))
+
+        elite = samples[np.argsort(scores)[::-1][:n_elite]]
+        mean = smoothing * elite.mean(axis=0) + (1 - smoothing) * mean
+        std = smoothing * elite.std(axis=0) + (1 - smoothing) * std
+        _report(it, history)
+
+    best = max(history, key=lambda h: h[1])
+    return SearchResult(best_params=best[0], best_score=best[1], history=history)
+
+
+def _report(iteration: int, history: List[Tuple[DecisionParams, float]]) -> None:
+    params, score = max(history, key=lambda h: h[1])
+    io.info("[iter %d] 評価済み %d 候補, 最高勝率 %.3f: %s" % (iteration, len(history), score, params.to_dict()), None)
+
+
+def main(argv: List[str]):
+    game_count = io.int_option(argv, "-g", 200)
+    workers = io.int_option(argv, "-j", 1)
+    iterations = io.int_option(argv, "-i", 10)
+    population = io.int_option(argv, "-p", 8)
+    seed = io.int_option(argv, "--seed", 0)
+    opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+    opponent = selfplay.strategy_option(argv)
+    method = io.choice_option(argv, "--method", ("cem", "random"), "cem")
+
+    invariant.set_validation_level(invariant.ValidationLevel.Off)
+    with Evaluator(game_count, root_seed=seed, opponent=opponent, opponent_count=opponent_count,
+                   workers=workers) as evaluator:
+        if method == "random":
+            result = random_search(evaluator, iterations, population, seed=seed)
+        else:
+            result = cross_entropy_search(evaluator, iterations, population, seed=seed)
+        baseline = evaluator.evaluate(DEFAULT_PARAMS)
+
+    io.success("デフォルトのパラメータの勝率: %.3f" % baseline, None)
+    io.success("最良のパラメータの勝率: %.3f" % result.best_score, None)
+    io.success("最良のパラメータ: %s" % result.best_params.to_dict(), None)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
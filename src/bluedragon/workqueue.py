@@ -0,0 +1,404 @@
+"""
+共有ディレクトリ (NFS など) を使った、複数ホストでの分散自己対戦。
+
+メッセージブローカーは使わず、ジョブのファイルを os.rename() で移動することで排他的に取得する
+(同じファイルシステム上の rename はアトミックなので、同じジョブを二つのワーカーが取得することはない)。
+
+ディレクトリ構成:
+    <root>/
+        pending/<job>.json           ... 未着手のジョブ (Job の JSON)
+        claimed/<job>.<token>.json   ... ワーカー token が実行中のジョブ。ワーカーは 1 ゲームごとに mtime を更新する
+        done/<job>.<token>.json      ... 完了したジョブ。結果は results/<job>.<token> のシャード
+        failed/<job>.<token>.json    ... 例外で失敗したジョブ。 <job>.<token>.error にその例外 (再実行はしない)
+        results/<job>.<token>/       ... 対戦結果のシャード (archive のシャードと同じ形式)
+
+ワーカーが落ちると claimed のファイルの mtime が更新されなくなるので、
+コーディネータは一定時間更新のないジョブを pending に戻して (reissue_stale)、別のワーカーにやり直させる。
+戻されたジョブのワーカーが実は生きていた場合、そのワーカーは claimed のファイルが無くなったことに気付いて結果を捨てる。
+完了したジョブの結果は done にあるものだけを集計するので、落ちたワーカーの書きかけのシャードは無視される
+(コーディネータは、 done にも claimed にも無いジョブのシャードを削除する)。
+ジョブの実行中に対戦が例外を送出した場合 (特定のシードで不変条件が破られるなど)、やり直しても同じ結果になるので
+ジョブは failed に移し、ワーカーは次のジョブへ進む。
+
+使用例:
+    $ cd src/
+    $ python3 -m bluedragon.workqueue submit /mnt/shared/queue -g 100000 --job-size 1000 --opponent random
+    $ python3 -m bluedragon.workqueue worker /mnt/shared/queue --wait         # 各ホストで (何個でも)
+    $ python3 -m bluedragon.workqueue coordinate /mnt/shared/queue --stale 600 --archive ~/.submarine-destroyer/archive
+    $ python3 -m bluedragon.workqueue status /mnt/shared/queue
+"""
+import json
+import os
+import secrets
+import shutil
+import socket
+import sys
+import time
+import traceback
+from logging import getLogger
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from . import analytics
+from . import io
+from . import selfplay
+from .archive import ArchiveWriter, Archive
+from .params import DecisionParams, DEFAULT_PARAMS
+from .selfplay import GameSpec, GameResult, Strategy
+from .sprt import parse_params
+from .rule import INITIAL_SUBMARINE_COUNT
+
+thisFileLogger = getLogger(__name__)
+
+PENDING_DIR = "pending"
+CLAIMED_DIR = "claimed"
+DONE_DIR = "done"
+FAILED_DIR = "failed"
+RESULTS_DIR = "results"
+
+DEFAULT_JOB_SIZE = 1000
+DEFAULT_STALE_SECONDS = 600.0
+DEFAULT_POLL_SECONDS = 5.0
+
+
+class Job(NamedTuple):
+    """
+    ゲーム番号 [first_game, first_game + game_count) の対戦。
+    各ゲームの設定は selfplay.make_specs() と同じ規則で作るので、ジョブの分け方によらず結果は再現できる。
+    """
+    name: str
+    root_seed: int
+    first_game: int
+    game_count: int
+    opponent: Strategy = Strategy.Logic
+    opponent_count: int = INITIAL_SUBMARINE_COUNT
+    max_turns: int = selfplay.DEFAULT_MAX_TURNS
+    params: DecisionParams = DEFAULT_PARAMS
+
+    def specs(self) -> List[GameSpec]:
+        return [
+            GameSpec(game=i, seed=selfplay.game_seed(self.root_seed, i), opponent=self.opponent,
+                     opponent_count=self.opponent_count, me_first=(i % 2 == 0), max_turns=self.max_turns,
+                     params=self.params)
+            for i in range(self.first_game, self.first_game + self.game_count)
+        ]
+
+    def to_json(self) -> str:
+        d = self._asdict()
+        d['opponent'] = int(self.opponent)
+        d['params'] = self.params.to_dict()
+        return json.dumps(d)
+
+    @staticmethod
+    def from_json(s: str) -> 'Job':
+        d = json.loads(s)
+        d['opponent'] = Strategy(d['opponent'])
+        d['params'] = DecisionParams.from_dict(d['params'])
+        return Job(**d)
+
+
+class QueueStatus(NamedTuple):
+    pending: int
+    claimed: int
+    done: int
+    failed: int = 0
+
+    def is_finished(self) -> bool:
+        return self.pending == 0 and self.claimed == 0
+
+    def format(self) -> str:
+        return "pending %d, claimed %d, done %d, failed %d" % self
+
+
+class ClaimLost(Exception):
+    """
+    実行中のジョブがコーディネータによって pending に戻された (ワーカーが落ちたとみなされた)。
+    """
+    pass
+
+
+def make_jobs(game_count: int, root_seed: int, job_size: int = DEFAULT_JOB_SIZE, prefix: str = "games",
+              opponent: Strategy = Strategy.Logic, opponent_count: int = INITIAL_SUBMARINE_COUNT,
+              max_turns: int = selfplay.DEFAULT_MAX_TURNS, params: DecisionParams = DEFAULT_PARAMS) -> List[Job]:
+    """
+    game_count 個のゲームを job_size 個ずつのジョブに分ける。
+    対戦相手の戦略や -n, パラメータの違う組み合わせを同じキューに入れる場合は prefix を変えること。
+    """
+    if "." in prefix:
+        raise ValueError("prefix must not contain '.': " + prefix)
+    return [
+        Job("%s-%08d" % (prefix, first), root_seed, first, min(job_size, game_count - first), opponent,
+            opponent_count, max_turns, params)
+        for first in range(0, game_count, job_size)
+    ]
+
+
+def _dir(root: str, name: str) -> str:
+    return os.path.join(root, name)
+
+
+def _atomic_write_text(path: str, text: str) -> None:
+    tmp = "%s.tmp.%d" % (path, os.getpid())
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def _job_files(root: str, name: str) -> List[str]:
+    path = _dir(root, name)
+    if not os.path.isdir(path):
+        return list()
+    return sorted(f for f in os.listdir(path) if f.endswith(".json") and ".tmp." not in f)
+
+
+def _split(file_name: str) -> Tuple[str, str]:
+    """
+    "<job>.<token>.json" を (job, token) にする。
+    """
+    job, _, rest = file_name.partition(".")
+    return job, rest[:-len(".json")]
+
+
+def submit(root: str, jobs: List[Job]) -> int:
+    """
+    jobs をキューに追加する。同じ名前のジョブが既にキューにあれば (どの状態でも) 追加しない。
+    追加したジョブ数を返す。
+    """
+    for name in (PENDING_DIR, CLAIMED_DIR, DONE_DIR, FAILED_DIR, RESULTS_DIR):
+        os.makedirs(_dir(root, name), exist_ok=True)
+    known = set(f[:-len(".json")] for f in _job_files(root, PENDING_DIR))
+    known |= set(_split(f)[0] for name in (CLAIMED_DIR, DONE_DIR, FAILED_DIR) for f in _job_files(root, name))
+    added = 0
+    for job in jobs:
+        if job.name in known:
+            continue
+        _atomic_write_text(os.path.join(_dir(root, PENDING_DIR), job.name + ".json"), job.to_json())
+        added += 1
+    return added
+
+
+def status(root: str) -> QueueStatus:
+    return QueueStatus(len(_job_files(root, PENDING_DIR)), len(_job_files(root, CLAIMED_DIR)),
+                       len(_job_files(root, DONE_DIR)), len(_job_files(root, FAILED_DIR)))
+
+
+def new_token() -> str:
+    """
+    ワーカーの識別子 (ホスト名・プロセス ID・乱数)。ファイル名に使うので '.' は含めない。
+    """
+    host = socket.gethostname().replace(".", "_")
+    return "%s-%d-%s" % (host, os.getpid(), secrets.token_hex(4))
+
+
+def claim(root: str, token: str) -> Optional[Tuple[Job, str]]:
+    """
+    pending のジョブを一つ取得して (ジョブ, claimed のファイルのパス) を返す。 pending が空なら None。
+    """
+    for f in _job_files(root, PENDING_DIR):
+        claimed_path = os.path.join(_dir(root, CLAIMED_DIR), "%s.%s.json" % (f[:-len(".json")], token))
+        try:
+            os.rename(os.path.join(_dir(root, PENDING_DIR), f), claimed_path)
+        except FileNotFoundError:
+            # 他のワーカーが先に取得した
+            continue
+        os.utime(claimed_path)
+        with open(claimed_path) as fp:
+            return Job.from_json(fp.read()), claimed_path
+    return None
+
+
+def _heartbeat(claimed_path: str) -> None:
+    try:
+        os.utime(claimed_path)
+    except FileNotFoundError:
+        raise ClaimLost(claimed_path)
+
+
+def run_job(root: str, job: Job, claimed_path: str) -> bool:
+    """
+    取得したジョブを実行し、結果を results/<job>.<token> に書き込んでから done に移す。
+    途中でジョブが pending に戻されていたら結果を捨てて False を返す。
+    対戦が例外を送出したら、結果を捨ててジョブを failed に移し (例外は <job>.<token>.error に書く)、 False を返す。
+    """
+    shard = os.path.basename(claimed_path)[:-len(".json")]
+    try:
+        with ArchiveWriter(_dir(root, RESULTS_DIR), shard) as writer:
+            for spec in job.specs():
+                result = selfplay.play_game(spec)
+                writer.append(result.game, result.turns)
+                _heartbeat(claimed_path)
+        os.rename(claimed_path, os.path.join(_dir(root, DONE_DIR), os.path.basename(claimed_path)))
+    except (ClaimLost, FileNotFoundError):
+        io.warn("ジョブ %s は他のワーカーにやり直されるので、結果を破棄します。" % job.name, thisFileLogger)
+        shutil.rmtree(os.path.join(_dir(root, RESULTS_DIR), shard), ignore_errors=True)
+        return False
+    except Exception:
+        io.fail("ジョブ %s が失敗したので failed に移します。" % job.name, thisFileLogger)
+        shutil.rmtree(os.path.join(_dir(root, RESULTS_DIR), shard), ignore_errors=True)
+        _fail_job(root, claimed_path, traceback.format_exc())
+        return False
+    return True
+
+
+def _fail_job(root: str, claimed_path: str, error: str) -> None:
+    failed_dir = _dir(root, FAILED_DIR)
+    os.makedirs(failed_dir, exist_ok=True)
+    name = os.path.basename(claimed_path)[:-len(".json")]
+    _atomic_write_text(os.path.join(failed_dir, name + ".error"), error)
+    try:
+        os.rename(claimed_path, os.path.join(failed_dir, name + ".json"))
+    except FileNotFoundError:
+        # 既に pending に戻されていた (他のワーカーがやり直す)
+        os.remove(os.path.join(failed_dir, name + ".error"))
+
+
+def run_worker(root: str, token: Optional[str] = None, wait: bool = False,
+               poll_seconds: float = DEFAULT_POLL_SECONDS) -> int:
+    """
+    pending のジョブが無くなるまで、ジョブを取得して実行する。完了したゲーム数を返す。
+    wait が True なら、pending が空でも他のワーカーが実行中のジョブがある間は
+    (それが pending に戻されるかもしれないので) poll_seconds ごとに確認しながら待つ。
+    """
+    if token is None:
+        token = new_token()
+    games = 0
+    while True:
+        claimed = claim(root, token)
+        if claimed is None:
+            if wait and not status(root).is_finished():
+                time.sleep(poll_seconds)
+                continue
+            return games
+        job, claimed_path = claimed
+        io.info("ジョブ %s (%d ゲーム) を実行します。" % (job.name, job.game_count), thisFileLogger)
+        if run_job(root, job, claimed_path):
+            games += job.game_count
+
+
+def reissue_stale(root: str, stale_seconds: float = DEFAULT_STALE_SECONDS,
+                  clock: Callable[[], float] = time.time) -> int:
+    """
+    stale_seconds 以上 mtime が更新されていない実行中のジョブを pending に戻す。戻したジョブ数を返す。
+    """
+    now = clock()
+    reissued = 0
+    for f in _job_files(root, CLAIMED_DIR):
+        path = os.path.join(_dir(root, CLAIMED_DIR), f)
+        try:
+            if now - os.path.getmtime(path) < stale_seconds:
+                continue
+            os.rename(path, os.path.join(_dir(root, PENDING_DIR), _split(f)[0] + ".json"))
+        except FileNotFoundError:
+            # 確認している間に完了した
+            continue
+        io.warn("ジョブ %s はワーカー %s の応答が無いので pending に戻しました。" % _split(f), thisFileLogger)
+        reissued += 1
+    return reissued
+
+
+def collect_garbage(root: str) -> int:
+    """
+    done にも claimed にも無いジョブのシャード (落ちたワーカーや、 pending に戻されたジョブの書きかけ) を削除する。
+    削除したシャードの数を返す。
+    """
+    results_dir = _dir(root, RESULTS_DIR)
+    if not os.path.isdir(results_dir):
+        return 0
+    # ワーカーはジョブを claimed に移してからシャードを作り、シャードを書き終えてから done に移すので、
+    # シャード → claimed → done の順に一覧すれば、実行中や完了したジョブのシャードを消すことはない
+    shards = sorted(os.listdir(results_dir))
+    live = set(f[:-len(".json")] for f in _job_files(root, CLAIMED_DIR))
+    live |= set(f[:-len(".json")] for f in _job_files(root, DONE_DIR))
+    removed = 0
+    for shard in shards:
+        if shard in live:
+            continue
+        shutil.rmtree(os.path.join(results_dir, shard), ignore_errors=True)
+        removed += 1
+    return removed
+
+
+def results(root: str) -> Iterator[GameResult]:
+    """
+    完了したジョブの結果をジョブ名の順に返す。落ちたワーカーが残した書きかけのシャードは含まない。
+    """
+    archive = Archive(_dir(root, RESULTS_DIR))
+    done = set(f[:-len(".json")] for f in _job_files(root, DONE_DIR))
+    archive.shards = [shard for shard in archive.shards if os.path.basename(shard.path) in done]
+    for game, turns in archive.iter_games():
+        yield GameResult(game=np.array(game), turns=np.array(turns))
+
+
+def coordinate(root: str, stale_seconds: float = DEFAULT_STALE_SECONDS,
+               poll_seconds: float = DEFAULT_POLL_SECONDS) -> QueueStatus:
+    """
+    全てのジョブが完了 (または失敗) するまで、応答の無いワーカーのジョブを pending に戻し、
+    不要になったシャードを削除しながら待つ。
+    """
+    while True:
+        reissue_stale(root, stale_seconds)
+        collect_garbage(root)
+        st = status(root)
+        if st.is_finished():
+            if st.failed > 0:
+                io.warn("%d 個のジョブが失敗しました (%s を確認してください)。" % (st.failed, _dir(root, FAILED_DIR)),
+                        thisFileLogger)
+            return st
+        io.info(st.format(), thisFileLogger)
+        time.sleep(poll_seconds)
+
+
+def merge(root: str, archive_root: Optional[str] = None) -> analytics.StreamingAggregator:
+    """
+    完了したジョブの結果を集計する。 archive_root が指定されていれば、一つのシャードにまとめて書き込む。
+    """
+    aggregator = analytics.StreamingAggregator()
+    writer = ArchiveWriter(archive_root, "merged-%d" % os.getpid()) if archive_root is not None else None
+    try:
+        for result in results(root):
+            aggregator.push(result.game, result.turns)
+            if writer is not None:
+                writer.append(result.game, result.turns)
+    finally:
+        if writer is not None:
+            writer.close()
+    return aggregator
+
+
+def main(argv: List[str]):
+    if len(argv) < 3 or argv[1] not in ("submit", "worker", "coordinate", "status"):
+        io.fail("Usage: python3 -m bluedragon.workqueue {submit|worker|coordinate|status} <root> [options]", None)
+        sys.exit(1)
+    command, root = argv[1], os.path.expanduser(argv[2])
+
+    if command == "submit":
+        game_count = io.int_option(argv, "-g", 1000)
+        job_size = io.int_option(argv, "--job-size", DEFAULT_JOB_SIZE)
+        opponent_count = io.int_option(argv, "-n", INITIAL_SUBMARINE_COUNT)
+        root_seed = io.int_option(argv, "--seed", 0)
+        opponent = selfplay.strategy_option(argv)
+        prefix = argv[argv.index("--prefix") + 1] if "--prefix" in argv else "games"
+        try:
+            params = parse_params(argv[argv.index("--params") + 1]) if "--params" in argv else DEFAULT_PARAMS
+        except (IndexError, ValueError) as e:
+            io.fail("パラメータの指定が不正です: %s" % e, None)
+            sys.exit(1)
+        jobs = make_jobs(game_count, root_seed, job_size, prefix, opponent, opponent_count, params=params)
+        io.success("%d 個のジョブを追加しました。" % submit(root, jobs), None)
+    elif command == "worker":
+        selfplay.configure_headless()
+        games = run_worker(root, wait="--wait" in argv)
+        print("%d games" % games)
+    elif command == "coordinate":
+        stale_seconds = io.int_option(argv, "--stale", int(DEFAULT_STALE_SECONDS))
+        archive_root = io.str_option(argv, "--archive")
+        archive_root = os.path.expanduser(archive_root) if archive_root is not None else None
+        coordinate(root, stale_seconds)
+        print(merge(root, archive_root).format_summary())
+    else:
+        print(status(root).format())
+
+
+if __name__ == "__main__":
+    main(sys.argv)
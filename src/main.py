@@ -5,9 +5,14 @@ import sys
 from datetime import datetime
 from typing import List
 
+import numpy as np
+
+from bluedragon import invariant
 from bluedragon import io
 from bluedragon import logic
 from bluedragon import model
+from bluedragon import snapshot
+from bluedragon import speculate
 
 log_directory = os.path.join(os.path.expanduser("~"), ".submarine-destroyer", "log")
 log_file = os.path.join(log_directory, datetime.now().strftime("%Y-%m-%d_%H:%M:%S.log"))
@@ -52,22 +57,69 @@ def main(argv: List[str]):
         io.info("敵艦の初期個数が指定されていないのでデフォルト値である 4 に設定します。", logger)
         opponent_initial_submarine_count = 4
 
-    # 初手・後手の入力
-    io.newline()
-    is_me_first = io.ask_yesno("私達のチームが先手ですか？ [y/n]: ")
-    logger.info("is_me_first = %s", is_me_first)
+    if "--validation" in argv:
+        i = argv.index("--validation") + 1
+        try:
+            level = invariant.parse_validation_level(argv[i] if i < len(argv) else "")
+        except ValueError:
+            io.newline()
+            io.fail("`--validation` オプションの値が不正です", logger=None)
+            io.info("Usage: `--validation <full|sampled|off>`", logger=None)
+            sys.exit(1)
+        invariant.set_validation_level(level)
+        io.success("`--validation` オプションが指定され、不変条件の検査レベルが %s に設定されました。" % level.name, logger)
+
+    trace_capacity = io.int_option(argv, "--trace", 0)
+    if trace_capacity > 0:
+        logic.enable_decision_trace(trace_capacity)
+        io.success("`--trace` オプションが指定され、直近 %d 回の判断を記録します。" % trace_capacity, logger)
+
+    # 入力待ちの間に次の判断を投機的に計算しておく
+    if "--no-speculate" in argv:
+        io.success("`--no-speculate` オプションが指定されたので、入力待ちの間の投機的な計算を行いません。", logger)
+        speculator = None
+    else:
+        speculator = speculate.Speculator()
+
+    if "--resume" in argv:
+        i = argv.index("--resume") + 1
+        snapshot_file = argv[i] if i < len(argv) and not argv[i].startswith("-") else snapshot.DEFAULT_SNAPSHOT_PATH
+        try:
+            battle_data, rng, is_me_first, turn_count = snapshot.load(snapshot_file)
+        except (OSError, ValueError, KeyError) as e:
+            io.newline()
+            io.fail("`%s` から対戦を再開できません: %s" % (snapshot_file, e), logger)
+            sys.exit(1)
+        io.newline()
+        io.success("`--resume` オプションが指定されたので `%s` から対戦を再開します (Turn%02d まで終了済み)。" %
+                   (snapshot_file, turn_count), logger)
+        logger.info("is_me_first = %s", is_me_first)
+        io.dump_battle_data(battle_data, should_show_my_positions)
+    else:
+        snapshot_file = snapshot.DEFAULT_SNAPSHOT_PATH
 
-    # 対戦データの初期化
-    battle_data = model.BattleData(opponent_initial_submarine_count)
-    logic.initialize_my_placement(battle_data)
+        # 初手・後手の入力
+        io.newline()
+        is_me_first = io.ask_yesno("私達のチームが先手ですか？ [y/n]: ")
+        logger.info("is_me_first = %s", is_me_first)
+
+        # 対戦データの初期化
+        # 乱数生成器の状態もスナップショットに保存するので、専用の乱数生成器を使う
+        rng = np.random.default_rng()
+        battle_data = model.BattleData(opponent_initial_submarine_count)
+        logic.initialize_my_placement(battle_data, rng)
+        turn_count = 0
 
-    # 初期配置の表示
-    if should_show_my_positions:
-        io.dump_my_grid(battle_data)
+        # 初期配置の表示
+        if should_show_my_positions:
+            io.dump_my_grid(battle_data)
 
     def my_turn(cur_turn_count: int):
         # 自軍の操作を計算させて取得, 表示, battle_data に反映
-        op = logic.suggest_my_op(battle_data, cur_turn_count)
+        if speculator is not None:
+            op = speculator.suggest(battle_data, cur_turn_count, rng)
+        else:
+            op = logic.suggest_my_op(battle_data, cur_turn_count, rng=rng)
 
         io.newline()
         io.success("自軍の操作: " + io.Color.yellow(op), logger)
@@ -77,6 +129,8 @@ def main(argv: List[str]):
 
         # 攻撃に対する敵軍の反応を入力
         if op.is_attack():
+            if speculator is not None:
+                speculator.expect_response(battle_data, rng, cur_turn_count + 2)
             response = io.read_response()
             io.success("次の入力を受け取りました: " + io.Color.green(response), logger)
             logic.apply_attack_response(battle_data, response)
@@ -84,7 +138,15 @@ def main(argv: List[str]):
         # 攻撃対象のマス位置を更新 (明確な敵艦の位置がわからなければ None になる)
         logic.update_tracking_cell(battle_data)
 
+        # 次の敵軍の操作の入力を待つ間 (「Enter を押してください」の間も含む) に、その次の自軍の判断を計算しておく
+        if speculator is not None and not battle_data.has_game_finished():
+            speculator.expect_opponent_op(battle_data, rng, cur_turn_count + 2)
+
     def opponent_turn(cur_turn_count: int):
+        # 自軍が後手の初手、または再開直後なら、ここで投機的な計算を始める
+        if speculator is not None and (cur_turn_count == 1 or cur_turn_count == resumed_turn_count + 1):
+            speculator.expect_opponent_op(battle_data, rng, cur_turn_count + 1)
+
         # 敵軍の操作を入力, 表示, battle_data に反映
         op = io.read_opponent_op(cur_turn_count)
         io.success("次の入力を受け取りました: " + io.Color.green(op), logger)
@@ -95,29 +157,52 @@ def main(argv: List[str]):
             assert resp_from_me is not None
             io.success("敵が攻撃しました。 自軍への命中状況: " + io.Color.yellow(resp_from_me), logger)
 
-    # 現在が自軍のターンなら True。 ループ毎にトグルする。
-    is_current_my_turn = is_me_first
-
-    # ターン数
-    turn_count = 0
-
-    # 自軍・敵軍のどちらかの潜水艦の数が 0 になるまでループを続ける
-    while not battle_data.has_game_finished():
-        turn_count += 1
-        if is_current_my_turn:
-            print("\n---------------------- [Turn%02d] My turn ----------------------" % turn_count)
-            logger.info("---------------------- [Turn%02d] My turn ----------------------" % turn_count)
-            my_turn(turn_count)
-        else:
-            print("\n------------------- [Turn%02d] Opponent turn -------------------" % turn_count)
-            logger.info("------------------- [Turn%02d] Opponent turn -------------------" % turn_count)
-            opponent_turn(turn_count)
+    def save_telemetry():
+        logger.info("suggest_my_op() の分岐ごとの統計:\n%s", logic.branch_counters.format_summary())
+        if speculator is not None:
+            logger.info("投機的に計算した判断を使った回数: %d / %d", speculator.hits, speculator.hits + speculator.misses)
+        if logic.decision_trace is not None:
+            trace_file = log_file[:-len(".log")] + ".trace.npy"
+            logic.decision_trace.save(trace_file)
+            logger.info("直近 %d 回の判断の記録を `%s` に保存しました",
+                        min(logic.decision_trace.recorded, logic.decision_trace.capacity), trace_file)
 
-        print("次へ進むにはEnterを押してください。", end='')
-        input()
+    resumed_turn_count = turn_count
 
-        is_current_my_turn = not is_current_my_turn
-        io.dump_battle_data(battle_data, should_show_my_positions)
+    # 現在が自軍のターンなら True。 ループ毎にトグルする。
+    is_current_my_turn = is_me_first == (turn_count % 2 == 0)
+
+    # 異常終了しても `--resume` で続きから再開できるように、ターンが終わるたびに状態を保存する
+    logger.info("対戦の状態を `%s` に保存します", snapshot_file)
+    snapshot.save(snapshot_file, battle_data, rng, is_me_first, turn_count)
+
+    try:
+        # 自軍・敵軍のどちらかの潜水艦の数が 0 になるまでループを続ける
+        while not battle_data.has_game_finished():
+            turn_count += 1
+            if is_current_my_turn:
+                print("\n---------------------- [Turn%02d] My turn ----------------------" % turn_count)
+                logger.info("---------------------- [Turn%02d] My turn ----------------------" % turn_count)
+                my_turn(turn_count)
+            else:
+                print("\n------------------- [Turn%02d] Opponent turn -------------------" % turn_count)
+                logger.info("------------------- [Turn%02d] Opponent turn -------------------" % turn_count)
+                opponent_turn(turn_count)
+            snapshot.save(snapshot_file, battle_data, rng, is_me_first, turn_count)
+
+            print("次へ進むにはEnterを押してください。", end='')
+            input()
+
+            is_current_my_turn = not is_current_my_turn
+            io.dump_battle_data(battle_data, should_show_my_positions)
+    finally:
+        # 異常終了した場合も、判断の統計と記録をログに残す
+        save_telemetry()
+        if speculator is not None:
+            speculator.close()
+
+    # 対戦が終了したので再開用のスナップショットは不要
+    snapshot.discard(snapshot_file)
 
     io.newline()
     if battle_data.my_alive_count <= 0: